@@ -3723,11 +3723,26 @@ def _EnsureJobQueueFile(file_name):
           " the queue directory '%s'", file_name, pathutils.QUEUE_DIR)
 
 
+def _RemoveJobJournal(file_name):
+  """Removes the journal of a job file, if there is one.
+
+  The journal only describes changes relative to a particular version of
+  the job file and is therefore stale once the job file was rewritten or
+  moved.
+
+  @type file_name: str
+  @param file_name: the name of a file in the queue directory
+
+  """
+  if constants.JOB_FILE_RE.match(os.path.basename(file_name)):
+    utils.RemoveLockedFile(file_name + constants.JOB_JOURNAL_SUFFIX)
+
+
 def JobQueueUpdate(file_name, content):
   """Updates a file in the queue directory.
 
   This is just a wrapper over L{utils.io.WriteFile}, with proper
-  checking.
+  checking. When a job file is written, its journal is removed.
 
   @type file_name: str
   @param file_name: the job file name
@@ -3746,11 +3761,84 @@ def JobQueueUpdate(file_name, content):
   utils.WriteFile(file_name, data=_Decompress(content), uid=getents.masterd_uid,
                   gid=getents.daemons_gid, mode=constants.JOB_QUEUE_FILES_PERMS)
 
+  _RemoveJobJournal(file_name)
+
+
+def _JobQueueAppend(file_name, content):
+  """Appends to a file in the queue directory.
+
+  This is just a wrapper over L{utils.io.AppendFile}, with proper
+  checking. Journals are only created by L{JobQueueUpdate}; appending to
+  a journal which was removed in the meantime, e.g. because the job file
+  was rewritten in full, would create a journal without a header and is
+  therefore skipped.
+
+  @type file_name: str
+  @param file_name: the job journal file name
+  @type content: str
+  @param content: the data to append
+
+  """
+  file_name = vcluster.LocalizeVirtualPath(file_name)
+
+  _EnsureJobQueueFile(file_name)
+  getents = runtime.GetEnts()
+
+  try:
+    utils.AppendFile(file_name, _Decompress(content), uid=getents.masterd_uid,
+                     gid=getents.daemons_gid,
+                     mode=constants.JOB_QUEUE_FILES_PERMS, create=False)
+  except EnvironmentError, err:
+    if err.errno != errno.ENOENT:
+      raise
+    logging.warning("Not appending to removed job queue file '%s'",
+                    file_name)
+
+
+def _JobQueueRemove(file_name):
+  """Removes a file from the queue directory.
+
+  Non-existing files are ignored. The file is locked while it is removed,
+  so that no data is appended to a removed journal, see L{_JobQueueAppend}.
+
+  @type file_name: str
+  @param file_name: the file name
+
+  """
+  file_name = vcluster.LocalizeVirtualPath(file_name)
+
+  _EnsureJobQueueFile(file_name)
+
+  utils.RemoveLockedFile(file_name)
+
+
+def JobQueueUpdateBatch(updates):
+  """Applies a batch of changes to files in the queue directory.
+
+  @type updates: list of tuples
+  @param updates: the changes as C{(operation, file_name, content)},
+      applied in order; C{operation} is one of L{constants.JQ_REPL_ALL}
+      and C{content} is ignored for removals
+
+  """
+  for (operation, _, _) in updates:
+    if operation not in constants.JQ_REPL_ALL:
+      _Fail("Unknown job queue operation '%s'", operation)
+
+  for (operation, file_name, content) in updates:
+    if operation == constants.JQ_REPL_UPDATE:
+      JobQueueUpdate(file_name, content)
+    elif operation == constants.JQ_REPL_APPEND:
+      _JobQueueAppend(file_name, content)
+    else:
+      _JobQueueRemove(file_name)
+
 
 def JobQueueRename(old, new):
   """Renames a job queue file.
 
-  This is just a wrapper over os.rename with proper checking.
+  This is just a wrapper over os.rename with proper checking. When a job
+  file is moved, e.g. to the archive, its journal is removed.
 
   @type old: str
   @param old: the old (actual) file name
@@ -3771,6 +3859,8 @@ def JobQueueRename(old, new):
   utils.RenameFile(old, new, mkdir=True, mkdir_mode=0750,
                    dir_uid=getents.masterd_uid, dir_gid=getents.daemons_gid)
 
+  _RemoveJobJournal(old)
+
 
 def BlockdevClose(instance_name, disks):
   """Closes the given block devices.
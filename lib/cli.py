@@ -136,6 +136,7 @@ __all__ = [
   "MASTER_NETDEV_OPT",
   "MASTER_NETMASK_OPT",
   "MAX_TRACK_OPT",
+  "MAX_RUNNING_PER_OPCODE_OPT",
   "MC_OPT",
   "MIGRATION_MODE_OPT",
   "MODIFY_ETCHOSTS_OPT",
@@ -1347,6 +1348,14 @@ MAX_TRACK_OPT = cli_option("--max-tracked-jobs", dest="max_tracked_jobs",
                                             "be tracked simultaneously for "
                                             "scheduling")
 
+MAX_RUNNING_PER_OPCODE_OPT = \
+    cli_option("--max-running-jobs-per-opcode",
+               dest="max_running_jobs_per_opcode", type="keyval",
+               default=None,
+               help="Set the maximal number of jobs to run simultaneously"
+                    " per opcode, as OP_ID=count[,OP_ID=count...]; an"
+                    " empty value removes all limits")
+
 COMPRESSION_TOOLS_OPT = \
     cli_option("--compression-tools",
                dest="compression_tools", type="string", default=None,
@@ -2207,14 +2216,9 @@ def GenericPollJob(job_id, cbs, report_cbs):
   @param report_cbs: Reporting callbacks
 
   """
-  prev_job_info = None
-  prev_logmsg_serial = None
-
   status = None
 
-  while True:
-    result = cbs.WaitForJobChangeOnce(job_id, ["status"], prev_job_info,
-                                      prev_logmsg_serial)
+  for result in cbs.WatchJob(job_id, ["status"], None, None):
     if not result:
       # job not found, go away!
       raise errors.JobLost("Job with id %s lost" % job_id)
@@ -2234,7 +2238,6 @@ def GenericPollJob(job_id, cbs, report_cbs):
         (serial, timestamp, log_type, message) = log_entry
         report_cbs.ReportLogMessage(job_id, serial, timestamp,
                                     log_type, message)
-        prev_logmsg_serial = max(prev_logmsg_serial, serial)
 
     # TODO: Handle canceled and archived jobs
     elif status in (constants.JOB_STATUS_SUCCESS,
@@ -2243,8 +2246,6 @@ def GenericPollJob(job_id, cbs, report_cbs):
                     constants.JOB_STATUS_CANCELED):
       break
 
-    prev_job_info = job_info
-
   jobs = cbs.QueryJobs([job_id], ["status", "opstatus", "opresult"])
   if not jobs:
     raise errors.JobLost("Job with id %s lost" % job_id)
@@ -2290,6 +2291,24 @@ class JobPollCbBase(object):
     """
     raise NotImplementedError()
 
+  def WatchJob(self, job_id, fields, prev_job_info, prev_log_serial):
+    """Returns an iterator over the changes of a job.
+
+    The changes are reported like by L{WaitForJobChangeOnce}. The iterator
+    may end once the job has been finalized. This implementation calls
+    L{WaitForJobChangeOnce} repeatedly and never ends.
+
+    """
+    while True:
+      result = self.WaitForJobChangeOnce(job_id, fields, prev_job_info,
+                                         prev_log_serial)
+      yield result
+
+      if result and result != constants.JOB_NOTCHANGED:
+        (prev_job_info, log_entries) = result
+        for (serial, _, _, _) in log_entries or []:
+          prev_log_serial = max(prev_log_serial, serial)
+
   def QueryJobs(self, job_ids, fields):
     """Returns the selected fields for the selected job IDs.
 
@@ -2345,6 +2364,12 @@ class _LuxiJobPollCb(JobPollCbBase):
     return self.cl.WaitForJobChangeOnce(job_id, fields,
                                         prev_job_info, prev_log_serial)
 
+  def WatchJob(self, job_id, fields, prev_job_info, prev_log_serial):
+    """Streams the changes of a job over a single request.
+
+    """
+    return self.cl.WatchJob(job_id, fields, prev_job_info, prev_log_serial)
+
   def QueryJobs(self, job_ids, fields):
     """Returns the selected fields for the selected job IDs.
 
@@ -556,6 +556,9 @@ def ShowClusterConfig(opts, args):
       ("maximal number of jobs simultaneously tracked by the scheduler",
        compat.TryToRoman(result["max_tracked_jobs"],
                          convert=opts.roman_integers)),
+      ("maximal number of jobs running simultaneously per opcode",
+       _FormatGroupedParams(result["max_running_jobs_per_opcode"],
+                            roman=opts.roman_integers)),
       ("mac prefix", result["mac_prefix"]),
       ("master netdev", result["master_netdev"]),
       ("master netmask", compat.TryToRoman(result["master_netmask"],
@@ -1157,6 +1160,7 @@ def SetClusterParams(opts, args):
           opts.candidate_pool_size is not None or
           opts.max_running_jobs is not None or
           opts.max_tracked_jobs is not None or
+          opts.max_running_jobs_per_opcode is not None or
           opts.uid_pool is not None or
           opts.maintain_node_health is not None or
           opts.add_uids is not None or
@@ -1222,6 +1226,11 @@ def SetClusterParams(opts, args):
   if ndparams is not None:
     utils.ForceDictType(ndparams, constants.NDS_PARAMETER_TYPES)
 
+  job_limits = opts.max_running_jobs_per_opcode
+  if job_limits is not None:
+    utils.ForceDictType(job_limits,
+                        dict.fromkeys(job_limits, constants.VTYPE_INT))
+
   ipolicy = CreateIPolicyFromOpts(
     minmax_ispecs=opts.ipolicy_bounds_specs,
     std_ispecs=opts.ipolicy_std_specs,
@@ -1282,6 +1291,7 @@ def SetClusterParams(opts, args):
     candidate_pool_size=opts.candidate_pool_size,
     max_running_jobs=opts.max_running_jobs,
     max_tracked_jobs=opts.max_tracked_jobs,
+    max_running_jobs_per_opcode=job_limits,
     maintain_node_health=mnh,
     modify_etc_hosts=opts.modify_etc_hosts,
     uid_pool=uid_pool,
@@ -1859,7 +1869,8 @@ def _GetConfigVersion():
       None otherwise
 
   """
-  config_data = serializer.LoadJson(utils.ReadFile(pathutils.CLUSTER_CONF_FILE))
+  config_data = \
+    serializer.LoadConfig(utils.ReadFile(pathutils.CLUSTER_CONF_FILE))
   try:
     config_version = config_data["version"]
   except KeyError:
@@ -2279,7 +2290,8 @@ commands = {
   "modify": (
     SetClusterParams, ARGS_NONE,
     [FORCE_OPT,
-     BACKEND_OPT, CP_SIZE_OPT, RQL_OPT, MAX_TRACK_OPT, INSTALL_IMAGE_OPT,
+     BACKEND_OPT, CP_SIZE_OPT, RQL_OPT, MAX_TRACK_OPT,
+     MAX_RUNNING_PER_OPCODE_OPT, INSTALL_IMAGE_OPT,
      INSTANCE_COMMUNICATION_NETWORK_OPT, ENABLED_HV_OPT, HVLIST_OPT,
      MAC_PREFIX_OPT, MASTER_NETDEV_OPT, MASTER_NETMASK_OPT, NIC_PARAMS_OPT,
      VG_NAME_OPT, MAINTAIN_NODE_HEALTH_OPT, UIDPOOL_OPT, ADD_UIDS_OPT,
@@ -74,19 +74,19 @@ class LUWConfdClient(object):
     self.lu = lu
 
   def TryUpdateLocks(self, req):
-    self.lu.wconfd.Client().TryUpdateLocks(self.lu.wconfdcontext, req)
-    self.lu.wconfdlocks = \
-      self.lu.wconfd.Client().ListLocks(self.lu.wconfdcontext)
+    client = self.lu.wconfd.GetClient()
+    client.TryUpdateLocks(self.lu.wconfdcontext, req)
+    self.lu.wconfdlocks = client.ListLocks(self.lu.wconfdcontext)
 
   def DownGradeLocksLevel(self, level):
-    self.lu.wconfd.Client().DownGradeLocksLevel(self.lu.wconfdcontext, level)
-    self.lu.wconfdlocks = \
-      self.lu.wconfd.Client().ListLocks(self.lu.wconfdcontext)
+    client = self.lu.wconfd.GetClient()
+    client.DownGradeLocksLevel(self.lu.wconfdcontext, level)
+    self.lu.wconfdlocks = client.ListLocks(self.lu.wconfdcontext)
 
   def FreeLocksLevel(self, level):
-    self.lu.wconfd.Client().FreeLocksLevel(self.lu.wconfdcontext, level)
-    self.lu.wconfdlocks = \
-      self.lu.wconfd.Client().ListLocks(self.lu.wconfdcontext)
+    client = self.lu.wconfd.GetClient()
+    client.FreeLocksLevel(self.lu.wconfdcontext, level)
+    self.lu.wconfdlocks = client.ListLocks(self.lu.wconfdcontext)
 
 
 class LogicalUnit(object):
@@ -335,7 +335,7 @@ class LUClusterDestroy(LogicalUnit):
                                                      master_params, ems)
     result.Warn("Error disabling the master IP address", self.LogWarning)
 
-    self.wconfd.Client().PrepareClusterDestruction(self.wconfdcontext)
+    self.wconfd.GetClient().PrepareClusterDestruction(self.wconfdcontext)
 
     # signal to the job queue that the cluster is gone
     LUClusterDestroy.clusterHasBeenDestroyed = True
@@ -497,6 +497,7 @@ class LUClusterQuery(NoHooksLU):
       "candidate_pool_size": cluster.candidate_pool_size,
       "max_running_jobs": cluster.max_running_jobs,
       "max_tracked_jobs": cluster.max_tracked_jobs,
+      "max_running_jobs_per_opcode": cluster.max_running_jobs_per_opcode,
       "mac_prefix": cluster.mac_prefix,
       "master_netdev": cluster.master_netdev,
       "master_netmask": cluster.master_netmask,
@@ -941,6 +942,14 @@ class LUClusterSetParams(LogicalUnit):
       CheckImageValidity(self.op.install_image,
                          "Install image must be an absolute path or a URL")
 
+    if self.op.max_running_jobs_per_opcode:
+      unknown = utils.NiceSort(set(self.op.max_running_jobs_per_opcode) -
+                               set(opcodes.OP_MAPPING))
+      if unknown:
+        raise errors.OpPrereqError("Unknown opcode(s) in the job limits: %s" %
+                                   utils.CommaJoin(unknown),
+                                   errors.ECODE_INVAL)
+
   def ExpandNames(self):
     # FIXME: in the future maybe other cluster params won't require checking on
     # all nodes to be modified.
@@ -1684,6 +1693,10 @@ class LUClusterSetParams(LogicalUnit):
     if self.op.max_tracked_jobs is not None:
       self.cluster.max_tracked_jobs = self.op.max_tracked_jobs
 
+    if self.op.max_running_jobs_per_opcode is not None:
+      self.cluster.max_running_jobs_per_opcode = \
+        self.op.max_running_jobs_per_opcode
+
     if self.op.maintain_node_health is not None:
       if self.op.maintain_node_health and not constants.ENABLE_CONFD:
         feedback_fn("Note: CONFD was disabled at build time, node health"
@@ -2680,7 +2693,7 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       for prinode, inst_uuids in n_img.sbp.items():
         needed_mem = 0
         for inst_uuid in inst_uuids:
-          bep = cluster_info.FillBE(all_insts[inst_uuid])
+          bep = cluster_info.FillBEView(all_insts[inst_uuid])
           if bep[constants.BE_AUTO_BALANCE]:
             needed_mem += bep[constants.BE_MINMEM]
         test = n_img.mfree < needed_mem
@@ -3231,19 +3244,19 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
           self._ErrorIf(True, constants.CV_ENODERPC, ninfo.name,
                         "node returned invalid LVM info, check LVM status")
 
-  def _CollectDiskInfo(self, node_uuids, node_image, instanceinfo):
-    """Gets per-disk status information for all instances.
+  def _CollectDiskInfo(self, arpc, node_uuids, node_image, instanceinfo):
+    """Starts getting per-disk status information for all instances.
 
+    @type arpc: L{rpc.RpcRunner}
+    @param arpc: Asynchronous RPC runner, see L{rpc.RpcRunner.GetAsync}
     @type node_uuids: list of strings
     @param node_uuids: Node UUIDs
     @type node_image: dict of (UUID, L{objects.Node})
     @param node_image: Node objects
     @type instanceinfo: dict of (UUID, L{objects.Instance})
     @param instanceinfo: Instance objects
-    @rtype: {instance: {node: [(succes, payload)]}}
-    @return: a dictionary of per-instance dictionaries with nodes as
-        keys and disk information as values; the disk information is a
-        list of tuples (success, payload)
+    @rtype: L{rpc.RpcFuture}
+    @return: the future of the result of L{_ProcessDiskInfo}
 
     """
     node_disks = {}
@@ -3281,9 +3294,35 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
     assert len(node_disks) == len(node_disks_dev_inst_only)
 
     # Collect data from all nodes with disks
-    result = self.rpc.call_blockdev_getmirrorstatus_multi(
+    result = arpc.call_blockdev_getmirrorstatus_multi(
                node_disks.keys(), node_disks_dev_inst_only)
 
+    return rpc.RpcFuture(lambda: self._ProcessDiskInfo(result.GetResult(),
+                                                       node_disks,
+                                                       diskless_instances,
+                                                       nodisk_instances,
+                                                       instanceinfo))
+
+  def _ProcessDiskInfo(self, result, node_disks, diskless_instances,
+                       nodisk_instances, instanceinfo):
+    """Processes the per-disk status information of all instances.
+
+    @type result: dict of (UUID, L{rpc.RpcResult})
+    @param result: the result of the C{blockdev_getmirrorstatus_multi} call
+    @type node_disks: dict of (UUID, list of tuples)
+    @param node_disks: the instance UUIDs and disks queried on every node
+    @type diskless_instances: set of strings
+    @param diskless_instances: UUIDs of the diskless instances
+    @type nodisk_instances: set of strings
+    @param nodisk_instances: UUIDs of other instances without disks
+    @type instanceinfo: dict of (UUID, L{objects.Instance})
+    @param instanceinfo: Instance objects
+    @rtype: {instance: {node: [(succes, payload)]}}
+    @return: a dictionary of per-instance dictionaries with nodes as
+        keys and disk information as values; the disk information is a
+        list of tuples (success, payload)
+
+    """
     assert len(result) == len(node_disks)
 
     instdisk = {}
@@ -3588,32 +3627,33 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       # locking the configuration for something but very fast, pure operations.
       cluster_name = self.cfg.GetClusterName()
       hvparams = self.cfg.GetClusterInfo().hvparams
-      all_nvinfo = self.rpc.call_node_verify(self.my_node_uuids,
+      # All calls to the nodes are started right away and run at the same
+      # time; their results are only waited for when they are needed
+      arpc = self.rpc.GetAsync()
+      all_nvinfo_fut = arpc.call_node_verify(self.my_node_uuids,
                                              node_verify_param,
                                              cluster_name,
                                              hvparams,
                                              node_group_uuids,
                                              groups_config)
-      nvinfo_endtime = time.time()
 
       if self.extra_lv_nodes and vg_name is not None:
         feedback_fn("* Gathering information about extra nodes (%s nodes)" %
                     len(self.extra_lv_nodes))
-        extra_lv_nvinfo = \
-            self.rpc.call_node_verify(self.extra_lv_nodes,
-                                      {constants.NV_LVLIST: vg_name},
-                                      self.cfg.GetClusterName(),
-                                      self.cfg.GetClusterInfo().hvparams,
-                                      node_group_uuids,
-                                      groups_config)
+        extra_lv_nvinfo_fut = \
+            arpc.call_node_verify(self.extra_lv_nodes,
+                                  {constants.NV_LVLIST: vg_name},
+                                  self.cfg.GetClusterName(),
+                                  self.cfg.GetClusterInfo().hvparams,
+                                  node_group_uuids,
+                                  groups_config)
       else:
-        extra_lv_nvinfo = {}
+        extra_lv_nvinfo_fut = None
 
       # If not all nodes are being checked, we need to make sure the master
       # node and a non-checked vm_capable node are in the list.
       absent_node_uuids = set(self.all_node_info).difference(self.my_node_info)
       if absent_node_uuids:
-        vf_nvinfo = all_nvinfo.copy()
         vf_node_info = list(self.my_node_info.values())
         additional_node_uuids = []
         if master_node_uuid not in self.my_node_info:
@@ -3631,21 +3671,38 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
         key = constants.NV_FILELIST
 
         feedback_fn("* Gathering information about the master node")
-        vf_nvinfo.update(self.rpc.call_node_verify(
+        vf_nvinfo_fut = arpc.call_node_verify(
            additional_node_uuids, {key: node_verify_param[key]},
            self.cfg.GetClusterName(), self.cfg.GetClusterInfo().hvparams,
            node_group_uuids,
-           groups_config))
+           groups_config)
       else:
-        vf_nvinfo = all_nvinfo
+        vf_nvinfo_fut = None
         vf_node_info = self.my_node_info.values()
 
-    all_drbd_map = self.cfg.ComputeDRBDMap()
+      # Only the result of the node_verify calls is waited for while the
+      # configuration is locked; the disk status call runs alongside them
+      feedback_fn("* Gathering disk information (%s nodes)" %
+                  len(self.my_node_uuids))
+      instdisk_fut = self._CollectDiskInfo(arpc, self.my_node_info.keys(),
+                                           node_image, self.my_inst_info)
+
+      all_nvinfo = all_nvinfo_fut.GetResult()
+      # The end of the time window is when the responses were received
+      nvinfo_endtime = all_nvinfo_fut.GetEndTime()
 
-    feedback_fn("* Gathering disk information (%s nodes)" %
-                len(self.my_node_uuids))
-    instdisk = self._CollectDiskInfo(self.my_node_info.keys(), node_image,
-                                     self.my_inst_info)
+      if extra_lv_nvinfo_fut is None:
+        extra_lv_nvinfo = {}
+      else:
+        extra_lv_nvinfo = extra_lv_nvinfo_fut.GetResult()
+
+      if vf_nvinfo_fut is None:
+        vf_nvinfo = all_nvinfo
+      else:
+        vf_nvinfo = all_nvinfo.copy()
+        vf_nvinfo.update(vf_nvinfo_fut.GetResult())
+
+    all_drbd_map = self.cfg.ComputeDRBDMap()
 
     feedback_fn("* Verifying configuration file consistency")
 
@@ -3736,6 +3793,8 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       self._UpdateNodeVolumes(self.all_node_info[node_uuid], result.payload,
                               node_image[node_uuid], vg_name)
 
+    instdisk = instdisk_fut.GetResult()
+
     feedback_fn("* Verifying instance status")
     for inst_uuid in self.my_inst_uuids:
       instance = self.my_inst_info[inst_uuid]
@@ -3748,7 +3807,7 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       if instance.disk_template not in constants.DTS_MIRRORED:
         i_non_redundant.append(instance)
 
-      if not cluster.FillBE(instance)[constants.BE_AUTO_BALANCE]:
+      if not cluster.FillBEView(instance)[constants.BE_AUTO_BALANCE]:
         i_non_a_balanced.append(instance)
 
     feedback_fn("* Verifying orphan volumes")
@@ -126,14 +126,57 @@ class LUInstanceQueryData(NoHooksLU):
 
     self.wanted_instances = instances.values()
 
-  def _ComputeBlockdevStatus(self, node_uuid, instance, dev):
+  def _FindBlockdevs(self, instance, disks):
+    """Finds the block devices of an instance on their nodes.
+
+    All devices on a node are looked up in a single batch of calls.
+
+    @attention: The devices have to be annotated already.
+    @rtype: dict
+    @return: The results of the lookups, keyed by node UUID and the
+      identity of the device
+
+    """
+    node_devs = {}
+
+    def _Collect(snode_uuid, dev):
+      # the same choice of nodes as in L{_ComputeDiskStatusInner}
+      if dev.dev_type in constants.DTS_DRBD:
+        if dev.logical_id[0] == instance.primary_node:
+          snode_uuid = dev.logical_id[1]
+        else:
+          snode_uuid = dev.logical_id[0]
+
+      for node_uuid in [instance.primary_node, snode_uuid]:
+        if node_uuid:
+          node_devs.setdefault(node_uuid, []).append(dev)
+
+      if dev.children:
+        for child in dev.children:
+          _Collect(snode_uuid, child)
+
+    for disk in disks:
+      _Collect(None, disk)
+
+    found = {}
+
+    for (node_uuid, devs) in node_devs.items():
+      results = self.rpc.call_batch(node_uuid,
+                                    [("blockdev_find", [(dev, instance)])
+                                     for dev in devs])
+      found.update(((node_uuid, id(dev)), result)
+                   for (dev, result) in zip(devs, results))
+
+    return found
+
+  def _ComputeBlockdevStatus(self, found, node_uuid, instance, dev):
     """Returns the status of a block device
 
     """
     if self.op.static or not node_uuid:
       return None
 
-    result = self.rpc.call_blockdev_find(node_uuid, (dev, instance))
+    result = found[(node_uuid, id(dev))]
     if result.offline:
       return None
 
@@ -147,17 +190,25 @@ class LUInstanceQueryData(NoHooksLU):
             status.sync_percent, status.estimated_time,
             status.is_degraded, status.ldisk_status)
 
-  def _ComputeDiskStatus(self, instance, node_uuid2name_fn, dev):
-    """Compute block device status.
+  def _ComputeDiskStatus(self, instance, node_uuid2name_fn):
+    """Compute the status of the block devices of an instance.
 
     """
-    (anno_dev,) = AnnotateDiskParams(instance, [dev], self.cfg)
+    disks = AnnotateDiskParams(instance,
+                               self.cfg.GetInstanceDisks(instance.uuid),
+                               self.cfg)
+
+    if self.op.static:
+      found = {}
+    else:
+      found = self._FindBlockdevs(instance, disks)
 
-    return self._ComputeDiskStatusInner(instance, None, node_uuid2name_fn,
-                                        anno_dev)
+    return map(compat.partial(self._ComputeDiskStatusInner, instance, None,
+                              node_uuid2name_fn, found),
+               disks)
 
   def _ComputeDiskStatusInner(self, instance, snode_uuid, node_uuid2name_fn,
-                              dev):
+                              found, dev):
     """Compute block device status.
 
     @attention: The device has to be annotated already.
@@ -183,14 +234,14 @@ class LUInstanceQueryData(NoHooksLU):
         "secret": dev.logical_id[5],
       }
 
-    dev_pstatus = self._ComputeBlockdevStatus(instance.primary_node,
+    dev_pstatus = self._ComputeBlockdevStatus(found, instance.primary_node,
                                               instance, dev)
-    dev_sstatus = self._ComputeBlockdevStatus(snode_uuid, instance, dev)
+    dev_sstatus = self._ComputeBlockdevStatus(found, snode_uuid, instance, dev)
 
     if dev.children:
       dev_children = map(compat.partial(self._ComputeDiskStatusInner,
                                         instance, snode_uuid,
-                                        node_uuid2name_fn),
+                                        node_uuid2name_fn, found),
                          dev.children)
     else:
       dev_children = []
@@ -225,7 +276,7 @@ class LUInstanceQueryData(NoHooksLU):
 
     for instance in self.wanted_instances:
       pnode = nodes[instance.primary_node]
-      hvparams = cluster.FillHV(instance, skip_globals=True)
+      hvparams = cluster.FillHVView(instance, skip_globals=True)
 
       if self.op.static or pnode.offline:
         remote_state = None
@@ -267,9 +318,7 @@ class LUInstanceQueryData(NoHooksLU):
       group2name_fn = lambda uuid: groups[uuid].name
       node_uuid2name_fn = lambda uuid: nodes[uuid].name
 
-      disks = map(compat.partial(self._ComputeDiskStatus, instance,
-                                 node_uuid2name_fn),
-                  self.cfg.GetInstanceDisks(instance.uuid))
+      disks = self._ComputeDiskStatus(instance, node_uuid2name_fn)
 
       secondary_nodes = self.cfg.GetInstanceSecondaryNodes(instance.uuid)
       snodes_group_uuids = [nodes[snode_uuid].group
@@ -295,9 +344,9 @@ class LUInstanceQueryData(NoHooksLU):
         "hv_instance": instance.hvparams,
         "hv_actual": hvparams,
         "be_instance": instance.beparams,
-        "be_actual": cluster.FillBE(instance),
+        "be_actual": cluster.FillBEView(instance),
         "os_instance": instance.osparams,
-        "os_actual": cluster.SimpleFillOS(instance.os, instance.osparams),
+        "os_actual": cluster.FillOSView(instance),
         "serial_no": instance.serial_no,
         "mtime": instance.mtime,
         "ctime": instance.ctime,
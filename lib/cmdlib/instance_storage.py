@@ -2429,9 +2429,11 @@ class TLReplaceDisks(Tasklet):
     for name, (_, old_lvs, _) in iv_names.iteritems():
       self.lu.LogInfo("Remove logical volumes for %s", name)
 
-      for lv in old_lvs:
-        msg = self.rpc.call_blockdev_remove(node_uuid, (lv, self.instance)) \
-                .fail_msg
+      results = self.rpc.call_batch(node_uuid,
+                                    [("blockdev_remove", [(lv, self.instance)])
+                                     for lv in old_lvs])
+      for result in results:
+        msg = result.fail_msg
         if msg:
           self.lu.LogWarning("Can't remove old LV: %s", msg,
                              hint="remove unused LVs manually")
@@ -2500,28 +2502,30 @@ class TLReplaceDisks(Tasklet):
                                 d.logical_id[1] + "_replaced-%s" % suff)
 
       # Build the rename list based on what LVs exist on the node
+      results = self.rpc.call_batch(self.target_node_uuid,
+                                    [("blockdev_find", [(to_ren,
+                                                         self.instance)])
+                                     for to_ren in old_lvs])
       rename_old_to_new = []
-      for to_ren in old_lvs:
-        result = self.rpc.call_blockdev_find(self.target_node_uuid,
-                                             (to_ren, self.instance))
+      for (to_ren, result) in zip(old_lvs, results):
         if not result.fail_msg and result.payload:
           # device exists
           rename_old_to_new.append((to_ren, ren_fn(to_ren, temp_suffix)))
 
-      self.lu.LogInfo("Renaming the old LVs on the target node")
-      result = self.rpc.call_blockdev_rename(self.target_node_uuid,
-                                             rename_old_to_new)
-      result.Raise("Can't rename old LVs on node %s" %
-                   self.cfg.GetNodeName(self.target_node_uuid))
-
-      # Now we rename the new LVs to the old LVs
-      self.lu.LogInfo("Renaming the new LVs on the target node")
+      # Then we rename the old LVs and, only if that succeeded, the new LVs
+      # to the old LVs
+      self.lu.LogInfo("Renaming the old and new LVs on the target node")
       rename_new_to_old = [(new, old.logical_id)
                            for old, new in zip(old_lvs, new_lvs)]
-      result = self.rpc.call_blockdev_rename(self.target_node_uuid,
-                                             rename_new_to_old)
-      result.Raise("Can't rename new LVs on node %s" %
-                   self.cfg.GetNodeName(self.target_node_uuid))
+      (old_result, new_result) = \
+        self.rpc.call_batch(self.target_node_uuid,
+                            [("blockdev_rename", [rename_old_to_new]),
+                             ("blockdev_rename", [rename_new_to_old])],
+                            fail_fast=True)
+      old_result.Raise("Can't rename old LVs on node %s" %
+                       self.cfg.GetNodeName(self.target_node_uuid))
+      new_result.Raise("Can't rename new LVs on node %s" %
+                       self.cfg.GetNodeName(self.target_node_uuid))
 
       # Intermediate steps of in memory modifications
       for old, new in zip(old_lvs, new_lvs):
@@ -2541,9 +2545,12 @@ class TLReplaceDisks(Tasklet):
                                                   (new_lvs, self.instance))
       msg = result.fail_msg
       if msg:
-        for new_lv in new_lvs:
-          msg2 = self.rpc.call_blockdev_remove(self.target_node_uuid,
-                                               (new_lv, self.instance)).fail_msg
+        results = self.rpc.call_batch(self.target_node_uuid,
+                                      [("blockdev_remove",
+                                        [(new_lv, self.instance)])
+                                       for new_lv in new_lvs])
+        for result in results:
+          msg2 = result.fail_msg
           if msg2:
             self.lu.LogWarning("Can't rollback device %s: %s", dev, msg2,
                                hint=("cleanup manually the unused logical"
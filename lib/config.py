@@ -56,6 +56,7 @@ from ganeti import utils
 from ganeti import constants
 import ganeti.wconfd as wc
 from ganeti import objects
+from ganeti import outils
 from ganeti import serializer
 from ganeti import uidpool
 from ganeti import netutils
@@ -102,7 +103,8 @@ def GetConfig(ec_id, livelock, **kwargs):
 
   """
   kwargs['wconfdcontext'] = GetWConfdContext(ec_id, livelock)
-  kwargs['wconfd'] = wc.Client()
+  kwargs['wconfd'] = wc.GetClient()
+  kwargs.setdefault('lock_timeout', constants.WCONFD_CONFIG_LOCK_TIMEOUT)
   return ConfigWriter(**kwargs)
 
 
@@ -120,6 +122,20 @@ def _ConfigSync(shared=0):
 # job id used for resource management at config upgrade time
 _UPGRADE_CONFIG_JID = "jid-cfg-upgrade"
 
+# the containers of L{objects.ConfigData} that are tracked for modifications,
+# in the order expected by WConfd.WriteConfigUpdate
+_CONFIG_CONTAINERS = ["nodes", "nodegroups", "instances", "networks", "disks"]
+
+# pseudo-container used for marking the cluster object as modified
+_CLUSTER = "cluster"
+
+# the name of the lock WConfd protects the configuration with
+_CONFIG_LOCK = "cluster/config"
+
+# initial delay, factor and maximum delay, in seconds, for polling the
+# configuration lock in processes not notified by WConfd
+_CONFIG_LOCK_POLL_DELAY = (0.01, 1.5, 0.1)
+
 
 def _ValidateConfig(data):
   """Verifies that a configuration dict looks valid.
@@ -144,12 +160,10 @@ class TemporaryReservationManager(object):
   """
   def __init__(self):
     self._ec_reserved = {}
+    self._all_reserved = set()
 
   def Reserved(self, resource):
-    for holder_reserved in self._ec_reserved.values():
-      if resource in holder_reserved:
-        return True
-    return False
+    return resource in self._all_reserved
 
   def Reserve(self, ec_id, resource):
     if self.Reserved(resource):
@@ -159,16 +173,15 @@ class TemporaryReservationManager(object):
       self._ec_reserved[ec_id] = set([resource])
     else:
       self._ec_reserved[ec_id].add(resource)
+    self._all_reserved.add(resource)
 
   def DropECReservations(self, ec_id):
     if ec_id in self._ec_reserved:
+      self._all_reserved.difference_update(self._ec_reserved[ec_id])
       del self._ec_reserved[ec_id]
 
   def GetReserved(self):
-    all_reserved = set()
-    for holder_reserved in self._ec_reserved.values():
-      all_reserved.update(holder_reserved)
-    return all_reserved
+    return set(self._all_reserved)
 
   def GetECReserved(self, ec_id):
     """ Used when you want to retrieve all reservations for a specific
@@ -184,16 +197,19 @@ class TemporaryReservationManager(object):
   def Generate(self, existing, generate_one_fn, ec_id):
     """Generate a new resource of this type
 
+    @param existing: the resources already in use, as a container supporting
+        membership tests (ideally a set, which makes the test cheap)
+
     """
     assert callable(generate_one_fn)
 
-    all_elems = self.GetReserved()
-    all_elems.update(existing)
     retries = 64
     while retries > 0:
       new_resource = generate_one_fn()
-      if new_resource is not None and new_resource not in all_elems:
+      if (new_resource is not None and new_resource not in existing and
+          not self.Reserved(new_resource)):
         break
+      retries -= 1
     else:
       raise errors.ConfigurationError("Not able generate new resource"
                                       " (last tried: %s)" % new_resource)
@@ -208,6 +224,464 @@ def _MatchNameComponentIgnoreCase(short_name, names):
   return utils.MatchNameComponent(short_name, names, case_sensitive=False)
 
 
+def _GetObjectNames(container):
+  """Returns the UUIDs and names of the objects in a container.
+
+  The objects of a L{outils.LazyObjectDict} aren't converted for this.
+
+  @rtype: list of tuples; (string, string)
+
+  """
+  if isinstance(container, outils.LazyObjectDict):
+    return [(container.GetAttribute(key, "uuid"),
+             container.GetAttribute(key, "name")) for key in container]
+  return [(obj.uuid, obj.name) for obj in container.values()]
+
+
+class _NameIndex(object):
+  """An index from object names to UUIDs.
+
+  Besides the exact names, all lowercased prefixes of the names ending
+  before a dot are indexed, so that short names can be expanded the same
+  way L{utils.text.MatchNameComponent} does it, without iterating over all
+  the objects.
+
+  """
+  def __init__(self, names=None):
+    """Initializes this class.
+
+    @type names: iterable of tuples; (string, string)
+    @param names: the UUIDs and names of the objects to index
+
+    """
+    self._names = {}
+    self._by_name = {}
+    self._by_prefix = {}
+    if names:
+      for (uuid, name) in names:
+        self.Add(uuid, name)
+
+  @staticmethod
+  def _Prefixes(name):
+    """Returns the lowercased prefixes a name can be expanded from.
+
+    """
+    lname = name.lower()
+    return [lname[:idx] for (idx, char) in enumerate(lname)
+            if char == "."] + [lname]
+
+  def Add(self, uuid, name):
+    """Adds or renames an object in the index.
+
+    """
+    if self._names.get(uuid, None) == name:
+      return
+    self.Remove(uuid)
+    self._names[uuid] = name
+    self._by_name[name] = uuid
+    for prefix in self._Prefixes(name):
+      self._by_prefix.setdefault(prefix, set()).add(uuid)
+
+  def Remove(self, uuid):
+    """Removes an object from the index, if it is present.
+
+    """
+    name = self._names.pop(uuid, None)
+    if name is None:
+      return
+    if self._by_name.get(name, None) == uuid:
+      del self._by_name[name]
+    for prefix in self._Prefixes(name):
+      uuids = self._by_prefix[prefix]
+      uuids.discard(uuid)
+      if not uuids:
+        del self._by_prefix[prefix]
+
+  def Lookup(self, name):
+    """Returns the UUID of the object with the given name, or None.
+
+    """
+    return self._by_name.get(name, None)
+
+  def Expand(self, short_name):
+    """Expands a short name into the UUID of an object.
+
+    This gives the same result as L{_MatchNameComponentIgnoreCase} on the
+    list of all the indexed names.
+
+    @rtype: string or None
+    @return: the UUID of the matching object, or None if no or multiple
+        objects match
+
+    """
+    uuid = self._by_name.get(short_name, None)
+    if uuid is not None:
+      return uuid
+    key = short_name.lower()
+    matches = self._by_prefix.get(key, frozenset())
+    exact = [uuid for uuid in matches if self._names[uuid].lower() == key]
+    if len(exact) == 1:
+      return exact[0]
+    if len(matches) == 1:
+      return iter(matches).next()
+    return None
+
+
+class _NodeInstanceIndex(object):
+  """An index from nodes to the instances placed on them.
+
+  For every node, the primary and the secondary instances are kept, as
+  well as the owning instance of every disk, so that the placement of an
+  instance can be updated when one of its disks changes.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._placement = {}
+    self._primary = {}
+    self._secondary = {}
+    self._disk_owner = {}
+
+  @staticmethod
+  def _Discard(index, node_uuid, inst_uuid):
+    """Removes an instance from the set of a node.
+
+    """
+    inst_uuids = index.get(node_uuid, None)
+    if inst_uuids is not None:
+      inst_uuids.discard(inst_uuid)
+      if not inst_uuids:
+        del index[node_uuid]
+
+  def SetInstance(self, inst_uuid, primary_node, secondary_nodes, disk_uuids):
+    """Adds an instance or updates its placement.
+
+    @type inst_uuid: string
+    @param inst_uuid: the UUID of the instance
+    @type primary_node: string
+    @param primary_node: the UUID of the primary node of the instance
+    @type secondary_nodes: iterable of strings
+    @param secondary_nodes: the UUIDs of the secondary nodes
+    @type disk_uuids: list of strings
+    @param disk_uuids: the UUIDs of the disks of the instance
+
+    """
+    self.RemoveInstance(inst_uuid)
+    secondary_nodes = frozenset(secondary_nodes)
+    self._placement[inst_uuid] = (primary_node, secondary_nodes,
+                                  tuple(disk_uuids))
+    self._primary.setdefault(primary_node, set()).add(inst_uuid)
+    for node_uuid in secondary_nodes:
+      self._secondary.setdefault(node_uuid, set()).add(inst_uuid)
+    for disk_uuid in disk_uuids:
+      self._disk_owner[disk_uuid] = inst_uuid
+
+  def RemoveInstance(self, inst_uuid):
+    """Removes an instance from the index, if it is present.
+
+    """
+    placement = self._placement.pop(inst_uuid, None)
+    if placement is None:
+      return
+    (primary_node, secondary_nodes, disk_uuids) = placement
+    self._Discard(self._primary, primary_node, inst_uuid)
+    for node_uuid in secondary_nodes:
+      self._Discard(self._secondary, node_uuid, inst_uuid)
+    for disk_uuid in disk_uuids:
+      if self._disk_owner.get(disk_uuid, None) == inst_uuid:
+        del self._disk_owner[disk_uuid]
+
+  def GetDiskOwner(self, disk_uuid):
+    """Returns the UUID of the instance a disk is attached to, or None.
+
+    """
+    return self._disk_owner.get(disk_uuid, None)
+
+  def GetPrimaryInstances(self, node_uuid):
+    """Returns the UUIDs of the primary instances of a node.
+
+    @rtype: frozenset
+
+    """
+    return frozenset(self._primary.get(node_uuid, frozenset()))
+
+  def GetSecondaryInstances(self, node_uuid):
+    """Returns the UUIDs of the secondary instances of a node.
+
+    @rtype: frozenset
+
+    """
+    return frozenset(self._secondary.get(node_uuid, frozenset()))
+
+
+class _ResourceIndex(object):
+  """A set of resources used by configuration objects.
+
+  The resources are recorded per owner, so that the resources of an object
+  can be replaced when it changes; a resource used by several objects is
+  kept until all of them release it.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._owned = {}
+    self._counts = {}
+
+  def SetOwned(self, owner, resources):
+    """Sets the resources used by an owner, replacing the previous ones.
+
+    """
+    self.RemoveOwner(owner)
+    resources = frozenset(resources)
+    if not resources:
+      return
+    self._owned[owner] = resources
+    for resource in resources:
+      self._Acquire(resource)
+
+  def RemoveOwner(self, owner):
+    """Releases all the resources used by an owner.
+
+    """
+    for resource in self._owned.pop(owner, frozenset()):
+      self._Release(resource)
+
+  def _Acquire(self, resource):
+    """Increases the usage count of a resource.
+
+    @rtype: int
+    @return: the new usage count
+
+    """
+    count = self._counts.get(resource, 0) + 1
+    self._counts[resource] = count
+    return count
+
+  def _Release(self, resource):
+    """Decreases the usage count of a resource.
+
+    @rtype: int
+    @return: the new usage count
+
+    """
+    count = self._counts[resource] - 1
+    if count:
+      self._counts[resource] = count
+    else:
+      del self._counts[resource]
+    return count
+
+  def GetOwners(self, resource):
+    """Returns the owners using a resource.
+
+    This needs to look at all the owners and is meant for error reporting.
+
+    @rtype: list
+
+    """
+    return [owner for (owner, resources) in self._owned.items()
+            if resource in resources]
+
+  def __contains__(self, resource):
+    return resource in self._counts
+
+  def __iter__(self):
+    return iter(self._counts)
+
+  def __len__(self):
+    return len(self._counts)
+
+
+class _DRBDMinorIndex(_ResourceIndex):
+  """The DRBD minors used by the instances.
+
+  The resources are C{(node_uuid, minor, disk_uuid)}, so that two disks of
+  the same instance using the same minor are still counted twice. Besides
+  that, a bitmap of the used minors is kept for every node, so that a free
+  minor can be found without looking at the disks, and the set of minors
+  used more than once is kept up to date.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    _ResourceIndex.__init__(self)
+    self._minor_counts = {}
+    self._bitmaps = {}
+    self._duplicates = set()
+
+  def _Acquire(self, resource):
+    count = _ResourceIndex._Acquire(self, resource)
+    (node_uuid, minor, _) = resource
+    key = (node_uuid, minor)
+    minor_count = self._minor_counts.get(key, 0) + 1
+    self._minor_counts[key] = minor_count
+    if minor_count == 1:
+      self._bitmaps[node_uuid] = self._bitmaps.get(node_uuid, 0) | (1 << minor)
+    elif minor_count == 2:
+      self._duplicates.add(key)
+    return count
+
+  def _Release(self, resource):
+    count = _ResourceIndex._Release(self, resource)
+    (node_uuid, minor, _) = resource
+    key = (node_uuid, minor)
+    minor_count = self._minor_counts[key] - 1
+    if minor_count == 0:
+      del self._minor_counts[key]
+      bitmap = self._bitmaps[node_uuid] & ~(1 << minor)
+      if bitmap:
+        self._bitmaps[node_uuid] = bitmap
+      else:
+        del self._bitmaps[node_uuid]
+    else:
+      self._minor_counts[key] = minor_count
+      if minor_count == 1:
+        self._duplicates.discard(key)
+    return count
+
+  def GetDuplicates(self):
+    """Returns the minors used more than once.
+
+    @rtype: list of tuples; (string, int)
+    @return: a sorted list of C{(node_uuid, minor)}
+
+    """
+    return sorted(self._duplicates)
+
+  def FindFree(self, node_uuid, reserved=None):
+    """Finds the lowest unused minor on a node.
+
+    @type node_uuid: string
+    @param node_uuid: the node to look at
+    @type reserved: iterable of int
+    @param reserved: minors to consider as used in addition to the recorded
+        ones
+    @rtype: int
+
+    """
+    bitmap = self._bitmaps.get(node_uuid, 0)
+    for minor in reserved or []:
+      bitmap |= 1 << minor
+    # "~bitmap & (bitmap + 1)" isolates the lowest zero bit of the bitmap;
+    # its position is the length of its binary representation ("0b1...")
+    # minus three
+    return len(bin(~bitmap & (bitmap + 1))) - 3
+
+  def GetUsage(self):
+    """Returns the owners of the used minors.
+
+    @rtype: dict
+    @return: a dictionary of node UUID to a dictionary of minor to the sorted
+        list of owners using it, an owner being listed once for every disk
+        using the minor
+
+    """
+    usage = {}
+    for (owner, resources) in self._owned.items():
+      for (node_uuid, minor, _) in resources:
+        usage.setdefault(node_uuid, {}).setdefault(minor, []).append(owner)
+    for minors in usage.values():
+      for owners in minors.values():
+        owners.sort()
+    return usage
+
+
+class _ConfigResources(object):
+  """The unique resources used by a configuration.
+
+  @ivar ids: all the UUIDs and LV names
+  @ivar macs: the MAC addresses of all the NICs
+  @ivar lvs: the LVs of all the instances, as C{vg_name/lv_name}
+  @ivar drbd_secrets: the secrets of all the DRBD disks
+  @ivar drbd_minors: the DRBD minors of all the instances
+
+  """
+  def __init__(self):
+    self.ids = _ResourceIndex()
+    self.macs = _ResourceIndex()
+    self.lvs = _ResourceIndex()
+    self.drbd_secrets = _ResourceIndex()
+    self.drbd_minors = _DRBDMinorIndex()
+
+
+def _VerifyParamTypes(result, owner, attr, value, template):
+  """Checks the types of a parameter dictionary.
+
+  @type result: list of strings
+  @param result: the list the error messages are appended to
+
+  """
+  try:
+    utils.ForceDictType(value, template)
+  except errors.GenericError, err:
+    result.append("%s has invalid %s: %s" % (owner, attr, err))
+
+
+def _VerifyNicParams(result, owner, params):
+  """Checks the syntax of NIC parameters.
+
+  """
+  try:
+    objects.NIC.CheckParameterSyntax(params)
+  except errors.ConfigurationError, err:
+    result.append("%s has invalid nicparams: %s" % (owner, err))
+
+
+def _VerifyISpecs(result, owner, parentkey, params):
+  """Checks the types of instance specs.
+
+  """
+  for (key, value) in params.items():
+    fullkey = "/".join([parentkey, key])
+    _VerifyParamTypes(result, owner, fullkey, value,
+                      constants.ISPECS_PARAMETER_TYPES)
+
+
+def _VerifyIPolicy(result, owner, ipolicy, iscluster):
+  """Checks an instance policy.
+
+  Integer values of float parameters are converted in place.
+
+  """
+  try:
+    objects.InstancePolicy.CheckParameterSyntax(ipolicy, iscluster)
+  except errors.ConfigurationError, err:
+    result.append("%s has invalid instance policy: %s" % (owner, err))
+  for key, value in ipolicy.items():
+    if key == constants.ISPECS_MINMAX:
+      for k in range(len(value)):
+        _VerifyISpecs(result, owner, "ipolicy/%s[%s]" % (key, k), value[k])
+    elif key == constants.ISPECS_STD:
+      _VerifyParamTypes(result, owner, "ipolicy/" + key, value,
+                        constants.ISPECS_PARAMETER_TYPES)
+    else:
+      # FIXME: assuming list type
+      if key in constants.IPOLICY_PARAMETERS:
+        exp_type = float
+        # if the value is int, it can be converted into float
+        convertible_types = [int]
+      else:
+        exp_type = list
+        convertible_types = []
+      # Try to convert from allowed types, if necessary.
+      if any(isinstance(value, ct) for ct in convertible_types):
+        try:
+          value = exp_type(value)
+          ipolicy[key] = value
+        except ValueError:
+          pass
+      if not isinstance(value, exp_type):
+        result.append("%s has invalid instance policy: for %s,"
+                      " expecting %s, got %s" %
+                      (owner, key, exp_type.__name__, type(value)))
+
+
 def _CheckInstanceDiskIvNames(disks):
   """Checks if instance's disks' C{iv_name} attributes are in order.
 
@@ -269,6 +743,27 @@ def _UpdateIvNames(base_idx, disks):
     disk.iv_name = "disk/%s" % (base_idx + idx)
 
 
+def _GetDiskDRBDMinors(disk, disk_uuid):
+  """Returns the DRBD minors used by a disk and its children.
+
+  @type disk: L{objects.Disk}
+  @type disk_uuid: string
+  @param disk_uuid: the UUID of the top-level disk
+  @rtype: list of tuples; (string, int, string)
+  @return: the minors as C{(node_uuid, minor, disk_uuid)}, see
+      L{_DRBDMinorIndex}
+
+  """
+  minors = []
+  if disk.dev_type in constants.DTS_DRBD:
+    (pnode, snode, _, pminor, sminor, _) = disk.logical_id
+    minors.append((pnode, pminor, disk_uuid))
+    minors.append((snode, sminor, disk_uuid))
+  for child in disk.children or []:
+    minors.extend(_GetDiskDRBDMinors(child, disk_uuid))
+  return minors
+
+
 class ConfigWriter(object):
   """The interface to the cluster configuration.
 
@@ -276,10 +771,24 @@ class ConfigWriter(object):
   Each thread must construct a separate instance.
 
   @ivar _all_rms: a list of all temporary reservation managers
+  @ivar _cfg_format: the file format used when writing the configuration
+      offline; if C{None}, the format the file was read in is kept
+  @ivar _lock_timeout: how long, in seconds, to wait for the exclusive
+      configuration lock; if C{None}, wait indefinitely
+  @ivar _lock_priority_fn: returns the priority with which the exclusive
+      configuration lock is requested, see L{SetLockPriorityFn}
+  @ivar _lazy: whether offline accesses with a shared lock load the
+      instances and disks lazily (see L{objects.ConfigData.FromDict}); such
+      accesses neither verify the configuration nor write its upgrades back,
+      see L{_UpgradeConfigInMemory}
 
   """
   def __init__(self, cfg_file=None, offline=False, _getents=runtime.GetEnts,
-               accept_foreign=False, wconfdcontext=None, wconfd=None):
+               accept_foreign=False, wconfdcontext=None, wconfd=None,
+               cfg_format=None, lock_timeout=None, lazy=False):
+    if not (cfg_format is None or cfg_format in serializer.CONFIG_FORMATS):
+      raise errors.ProgrammerError("Unknown configuration format '%s'" %
+                                   cfg_format)
     self.write_count = 0
     self._config_data = None
     self._SetConfigData(None)
@@ -291,18 +800,39 @@ class ConfigWriter(object):
     self._getents = _getents
     self._temporary_ids = TemporaryReservationManager()
     self._all_rms = [self._temporary_ids]
+    # DRBD minors allocated in offline mode, (node_uuid, minor): inst_uuid
+    self._temporary_drbds = {}
     # Note: in order to prevent errors when resolving our name later,
     # we compute it here once and reuse it; it's
     # better to raise an error before starting to modify the config
     # file than after it was modified
     self._my_hostname = netutils.Hostname.GetSysName()
     self._cfg_id = None
+    self._cfg_format = cfg_format
+    self._cfg_read_format = serializer.CONFIG_FORMAT_JSON
     self._wconfdcontext = wconfdcontext
     self._wconfd = wconfd
+    self._lock_timeout = lock_timeout
+    self._lock_priority_fn = None
+    self._lazy = lazy
     self._accept_foreign = accept_foreign
     self._lock_count = 0
     self._lock_current_shared = None
 
+  def SetLockPriorityFn(self, fn):
+    """Sets the function giving the priority of configuration lock requests.
+
+    Requests for the exclusive configuration lock are queued in WConfd
+    with the priority of the job they are made for, see
+    L{_LockConfigExclusive}.
+
+    @type fn: callable or None
+    @param fn: returns the current priority of the job using this
+        configuration, or C{None} for the default priority
+
+    """
+    self._lock_priority_fn = fn
+
   def _ConfigData(self):
     return self._config_data
 
@@ -311,6 +841,92 @@ class ConfigWriter(object):
 
   def _SetConfigData(self, cfg):
     self._config_data = cfg
+    self._ResetModified()
+    self._BuildNameIndexes()
+    self._node_instances = None
+    self._resources = None
+    if cfg is None:
+      self._ResetVerifyCache()
+    else:
+      self._PruneVerifyCache()
+
+  def _BuildNameIndexes(self):
+    """Rebuild the name indexes from the current configuration data.
+
+    """
+    data = self._ConfigData()
+    if data is None:
+      (instances, nodes, nodegroups, networks) = ({}, {}, {}, {})
+    else:
+      (instances, nodes, nodegroups, networks) = \
+        (data.instances, data.nodes, data.nodegroups, data.networks)
+    self._instance_names = _NameIndex(_GetObjectNames(instances))
+    self._node_names = _NameIndex(_GetObjectNames(nodes))
+    self._nodegroup_names = _NameIndex(_GetObjectNames(nodegroups))
+    self._network_names = _NameIndex(_GetObjectNames(networks))
+
+  def _ResetModified(self):
+    """Forget about all modifications of the configuration data.
+
+    """
+    self._modified = set()
+    self._modified_all = False
+
+  def _MarkModified(self, container, uuid=None):
+    """Record that an object of the configuration data has been modified.
+
+    Only the recorded objects are sent to WConfd when the configuration is
+    written, unless L{_MarkAllModified} has been called.
+
+    @type container: string
+    @param container: the L{objects.ConfigData} container holding the object,
+        one of L{_CONFIG_CONTAINERS}, or L{_CLUSTER} for the cluster object
+    @type uuid: string
+    @param uuid: the UUID of the object (not used for the cluster); the object
+        is considered removed if it isn't present in the container any more
+
+    """
+    if container == _CLUSTER:
+      uuid = None
+      # not all modifications of the cluster bump its serial number
+      objects.ForgetFilledViews()
+    else:
+      assert container in _CONFIG_CONTAINERS, \
+             "Invalid configuration container '%s'" % container
+      self._UnlockedUpdateResources(container, uuid)
+      self._InvalidateVerifyCache(container, uuid)
+    self._modified.add((container, uuid))
+
+  def _MarkAllModified(self):
+    """Record that the configuration has been modified in an untracked way.
+
+    The next write then sends the whole configuration.
+
+    """
+    self._modified_all = True
+
+  def _GetConfigUpdate(self):
+    """Compute the changes to be sent to WConfd.
+
+    @rtype: tuple
+    @return: the arguments for C{WConfd.WriteConfigUpdate} (except the
+        context): the cluster dict or None, and for each container in
+        L{_CONFIG_CONTAINERS} a list of (uuid, dict or None) pairs
+
+    """
+    data = self._ConfigData()
+    cluster = None
+    updates = dict((container, []) for container in _CONFIG_CONTAINERS)
+    for (container, uuid) in self._modified:
+      if container == _CLUSTER:
+        cluster = data.cluster.ToDict()
+      else:
+        obj = getattr(data, container).get(uuid, None)
+        if obj is not None:
+          obj = obj.ToDict()
+        updates[container].append((uuid, obj))
+    return tuple([cluster] + [updates[container]
+                              for container in _CONFIG_CONTAINERS])
 
   def _GetWConfdContext(self):
     return self._wconfdcontext
@@ -329,11 +945,12 @@ class ConfigWriter(object):
 
     @type node: L{objects.Node}
     @param node: The node we want to know the params for
-    @return: A dict with the filled in node params
+    @rtype: L{utils.FrozenDict}
+    @return: A read-only dict with the filled in node params
 
     """
     nodegroup = self._UnlockedGetNodeGroup(node.group)
-    return self._ConfigData().cluster.FillND(node, nodegroup)
+    return self._ConfigData().cluster.FillNDView(node, nodegroup)
 
   @_ConfigSync(shared=1)
   def GetNdGroupParams(self, nodegroup):
@@ -403,6 +1020,8 @@ class ConfigWriter(object):
     disk.UpgradeConfig()
     self._ConfigData().disks[disk.uuid] = disk
     self._ConfigData().cluster.serial_no += 1
+    self._MarkModified("disks", disk.uuid)
+    self._MarkModified(_CLUSTER)
 
   def _UnlockedAttachInstanceDisk(self, inst_uuid, disk_uuid, idx=None):
     """Attach a disk to an instance.
@@ -443,6 +1062,10 @@ class ConfigWriter(object):
     _UpdateIvNames(idx, instance_disks[idx:])
     instance.serial_no += 1
     instance.mtime = time.time()
+    self._UnlockedUpdateNodeInstanceIndex(inst_uuid)
+    self._MarkModified("instances", inst_uuid)
+    for disk in instance_disks[idx:]:
+      self._MarkModified("disks", disk.uuid)
 
   @_ConfigSync()
   def AddInstanceDisk(self, inst_uuid, disk, idx=None):
@@ -482,6 +1105,10 @@ class ConfigWriter(object):
     _UpdateIvNames(idx, instance_disks[idx:])
     instance.serial_no += 1
     instance.mtime = time.time()
+    self._UnlockedUpdateNodeInstanceIndex(inst_uuid)
+    self._MarkModified("instances", inst_uuid)
+    for disk in instance_disks[idx:]:
+      self._MarkModified("disks", disk.uuid)
 
   def _UnlockedRemoveDisk(self, disk_uuid):
     """Remove the disk from the configuration.
@@ -503,6 +1130,8 @@ class ConfigWriter(object):
     # Remove disk from config file
     del self._ConfigData().disks[disk_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._MarkModified("disks", disk_uuid)
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync()
   def RemoveInstanceDisk(self, inst_uuid, disk_uuid):
@@ -562,6 +1191,54 @@ class ConfigWriter(object):
       all_nodes.extend(disk.all_nodes)
     return (set(all_nodes), instance)
 
+  def _UnlockedGetNodeInstanceIndex(self):
+    """Returns the node to instances index, building it if needed.
+
+    The index is built lazily, as most users of the configuration never
+    need it; afterwards it is updated incrementally by the methods changing
+    the placement of instances (see L{_UnlockedUpdateNodeInstanceIndex}).
+
+    @rtype: L{_NodeInstanceIndex}
+
+    """
+    if self._node_instances is None:
+      index = _NodeInstanceIndex()
+      for inst_uuid in self._ConfigData().instances:
+        self._UnlockedIndexInstanceNodes(index, inst_uuid)
+      self._node_instances = index
+    return self._node_instances
+
+  def _UnlockedIndexInstanceNodes(self, index, inst_uuid):
+    """Updates the placement of an instance in a node to instances index.
+
+    """
+    instance = self._UnlockedGetInstanceInfo(inst_uuid)
+    if instance is None:
+      index.RemoveInstance(inst_uuid)
+      return
+    secondary_nodes = set()
+    for disk_uuid in instance.disks:
+      disk = self._UnlockedGetDiskInfo(disk_uuid)
+      if disk is not None:
+        secondary_nodes.update(disk.all_nodes)
+    secondary_nodes.discard(instance.primary_node)
+    index.SetInstance(inst_uuid, instance.primary_node, secondary_nodes,
+                      instance.disks)
+
+  def _UnlockedUpdateNodeInstanceIndex(self, inst_uuid):
+    """Updates the node to instances index after an instance changed.
+
+    This must be called whenever an instance is added or removed, or its
+    primary node or disks change. Nothing is done if the index hasn't
+    been built yet.
+
+    @type inst_uuid: string
+    @param inst_uuid: the UUID of the changed instance
+
+    """
+    if self._node_instances is not None:
+      self._UnlockedIndexInstanceNodes(self._node_instances, inst_uuid)
+
   def _UnlockedGetInstanceNodes(self, inst_uuid):
     """Get all disk-related nodes for an instance.
 
@@ -732,6 +1409,9 @@ class ConfigWriter(object):
       pool.Reserve(address)
     elif action == constants.RELEASE_ACTION:
       pool.Release(address)
+    nobj.serial_no += 1
+    nobj.mtime = time.time()
+    self._MarkModified("networks", net_uuid)
 
   def ReleaseIp(self, net_uuid, address, _ec_id):
     """Give a specific IP address back to an IP pool.
@@ -778,17 +1458,108 @@ class ConfigWriter(object):
     """
     return self._wconfd.GenerateDRBDSecret(self._GetWConfdContext())
 
+  def _UnlockedGetResources(self):
+    """Returns the resources used by the configuration.
+
+    The resources are collected lazily on first use and afterwards kept up
+    to date by L{_MarkModified}, which is called for every changed object.
+
+    @rtype: L{_ConfigResources}
+
+    """
+    if self._resources is None:
+      resources = _ConfigResources()
+      data = self._ConfigData()
+      if data.cluster.uuid:
+        resources.ids.SetOwned((_CLUSTER, None), [data.cluster.uuid])
+      for container in _CONFIG_CONTAINERS:
+        for uuid in getattr(data, container):
+          self._SetObjectResources(resources, container, uuid)
+      self._resources = resources
+    return self._resources
+
+  def _SetObjectResources(self, resources, container, uuid):
+    """Records the resources used by a single configuration object.
+
+    @type resources: L{_ConfigResources}
+    @param resources: the resources to update
+    @type container: string
+    @param container: the container of the object, see L{_MarkModified}
+    @type uuid: string
+    @param uuid: the UUID of the object; if the object doesn't exist any
+        more, its resources are released
+
+    """
+    owner = (container, uuid)
+    obj = getattr(self._ConfigData(), container).get(uuid, None)
+    if obj is None:
+      for index in (resources.ids, resources.macs, resources.lvs,
+                    resources.drbd_secrets, resources.drbd_minors):
+        index.RemoveOwner(owner)
+      return
+
+    ids = [uuid]
+    if container == "instances":
+      lvs = set()
+      for lv_list in self._UnlockedGetInstanceLVsByNode(uuid).values():
+        lvs.update(lv_list)
+      resources.lvs.SetOwned(owner, lvs)
+      resources.macs.SetOwned(owner, [nic.mac for nic in obj.nics])
+      resources.drbd_minors.SetOwned(owner,
+                                     self._ComputeInstanceDRBDMinors(obj))
+      ids.extend(lvs)
+      ids.extend(nic.uuid for nic in obj.nics if nic.uuid)
+    elif container == "disks":
+      secrets = []
+      def _AddSecrets(disk):
+        """Recursively gather secrets from this disk."""
+        if disk.dev_type == constants.DT_DRBD8:
+          secrets.append(disk.logical_id[5])
+        if disk.children:
+          for child in disk.children:
+            _AddSecrets(child)
+      _AddSecrets(obj)
+      resources.drbd_secrets.SetOwned(owner, secrets)
+    resources.ids.SetOwned(owner, ids)
+
+  def _ComputeInstanceDRBDMinors(self, instance):
+    """Computes the DRBD minors used by the disks of an instance.
+
+    @rtype: list of tuples; (string, int, string)
+    @return: see L{_DRBDMinorIndex}
+
+    """
+    minors = []
+    for disk_uuid in instance.disks:
+      disk = self._UnlockedGetDiskInfo(disk_uuid)
+      if disk is not None:
+        minors.extend(_GetDiskDRBDMinors(disk, disk_uuid))
+    return minors
+
+  def _UnlockedUpdateResources(self, container, uuid):
+    """Updates the used resources after an object has been changed.
+
+    Nothing is done if the resources haven't been collected yet.
+
+    """
+    if self._resources is None:
+      return
+    self._SetObjectResources(self._resources, container, uuid)
+    if container == "disks":
+      # the LVs are accounted to the instance owning the disk
+      owner = self._UnlockedGetNodeInstanceIndex().GetDiskOwner(uuid)
+      if owner is not None:
+        self._SetObjectResources(self._resources, "instances", owner)
+
   # FIXME: After _AllIDs is removed, move it to config_mock.py
   def _AllLVs(self):
-    """Compute the list of all LVs.
+    """Return all the LVs of the instances.
+
+    @rtype: L{_ResourceIndex}
+    @return: a container of the LVs, as C{vg_name/lv_name}
 
     """
-    lvnames = set()
-    for instance in self._ConfigData().instances.values():
-      node_data = self._UnlockedGetInstanceLVsByNode(instance.uuid)
-      for lv_list in node_data.values():
-        lvnames.update(lv_list)
-    return lvnames
+    return self._UnlockedGetResources().lvs
 
   def _AllNICs(self):
     """Compute the list of all NICs.
@@ -799,23 +1570,16 @@ class ConfigWriter(object):
       nics.extend(instance.nics)
     return nics
 
-  def _AllIDs(self, include_temporary):
-    """Compute the list of all UUIDs and names we have.
+  def _AllIDs(self):
+    """Return all the UUIDs and LV names we have.
+
+    The temporarily reserved IDs are not included.
 
-    @type include_temporary: boolean
-    @param include_temporary: whether to include the _temporary_ids set
-    @rtype: set
-    @return: a set of IDs
+    @rtype: L{_ResourceIndex}
+    @return: a container of IDs
 
     """
-    existing = set()
-    if include_temporary:
-      existing.update(self._temporary_ids.GetReserved())
-    existing.update(self._AllLVs())
-    existing.update(self._ConfigData().instances.keys())
-    existing.update(self._ConfigData().nodes.keys())
-    existing.update([i.uuid for i in self._AllUUIDObjects() if i.uuid])
-    return existing
+    return self._UnlockedGetResources().ids
 
   def _GenerateUniqueID(self, ec_id):
     """Generate an unique UUID.
@@ -827,8 +1591,7 @@ class ConfigWriter(object):
     @return: the unique id
 
     """
-    existing = self._AllIDs(include_temporary=False)
-    return self._temporary_ids.Generate(existing, utils.NewUUID, ec_id)
+    return self._temporary_ids.Generate(self._AllIDs(), utils.NewUUID, ec_id)
 
   @_ConfigSync(shared=1)
   def GenerateUniqueID(self, ec_id):
@@ -845,40 +1608,161 @@ class ConfigWriter(object):
   def _AllMACs(self):
     """Return all MACs present in the config.
 
-    @rtype: list
-    @return: the list of all MACs
+    @rtype: L{_ResourceIndex}
+    @return: a container of all MACs
 
     """
-    result = []
-    for instance in self._ConfigData().instances.values():
-      for nic in instance.nics:
-        result.append(nic.mac)
-
-    return result
+    return self._UnlockedGetResources().macs
 
   def _AllDRBDSecrets(self):
     """Return all DRBD secrets present in the config.
 
+    @rtype: L{_ResourceIndex}
+    @return: a container of all DRBD secrets
+
+    """
+    return self._UnlockedGetResources().drbd_secrets
+
+  def _ResetVerifyCache(self):
+    """Forget the results of previous configuration verifications.
+
+    """
+    self._verify_cache = {}
+    self._verify_deps = {}
+    self._verify_serials = {}
+    self._verify_cluster_params = None
+
+  def _GetVerifySerial(self, container, uuid):
+    """Returns the serial number of an object for the verification cache.
+
+    @rtype: int or None
+    @return: the serial number, or C{None} if the object doesn't exist
+
+    """
+    obj = getattr(self._ConfigData(), container).get(uuid, None)
+    return getattr(obj, "serial_no", None)
+
+  def _RecordVerifySerial(self, container, uuid):
+    """Records the serial number of an object a cached result depends on.
+
+    """
+    if container != _CLUSTER:
+      self._verify_serials[(container, uuid)] = \
+        self._GetVerifySerial(container, uuid)
+
+  def _PruneVerifyCache(self):
+    """Drop the cached verification results invalidated by a reload.
+
+    The cached results are kept when the configuration data is loaded again,
+    e.g. from WConfd when the configuration lock is acquired. Only the
+    results depending on objects whose serial number changed, or which
+    appeared or disappeared, are dropped.
+
+    """
+    for ((container, uuid), serial) in self._verify_serials.items():
+      if self._GetVerifySerial(container, uuid) != serial:
+        self._InvalidateVerifyCache(container, uuid)
+
+  def _AddVerifyDependency(self, key, container, uuid):
+    """Records that a cached verification result depends on another object.
+
+    @type key: tuple
+    @param key: the key of the cached result, see L{_GetVerifyEntry}
+    @type container: string
+    @param container: the container of the object, see L{_MarkModified}
+    @type uuid: string
+    @param uuid: the UUID of the object, which doesn't need to exist
+
+    """
+    self._verify_deps.setdefault((container, uuid), set()).add(key)
+    self._RecordVerifySerial(container, uuid)
+
+  def _InvalidateVerifyCache(self, container, uuid):
+    """Drop the cached verification results depending on a modified object.
+
+    The cluster parameters are not handled here; they are compared on every
+    verification instead, see L{_GetVerifyClusterParams}.
+
+    """
+    self._verify_cache.pop((container, uuid), None)
+    self._verify_serials.pop((container, uuid), None)
+    for key in self._verify_deps.pop((container, uuid), []):
+      self._verify_cache.pop(key, None)
+
+  def _GetVerifyClusterParams(self):
+    """Returns the cluster parameters the verification of objects depends on.
+
     @rtype: list
-    @return: the list of all DRBD secrets
 
     """
-    def helper(disk, result):
-      """Recursively gather secrets from this disk."""
-      if disk.dev_type == constants.DT_DRBD8:
-        result.append(disk.logical_id[5])
-      if disk.children:
-        for child in disk.children:
-          helper(child, result)
+    cluster = self._ConfigData().cluster
+    return [cluster.beparams, cluster.nicparams, cluster.ndparams,
+            cluster.ipolicy, cluster.diskparams,
+            cluster.enabled_disk_templates]
+
+  def _GetVerifyEntry(self, container, uuid, obj, compute_fn, refresh=False):
+    """Returns the verification results of a single object.
+
+    The results are computed using C{compute_fn(uuid, obj)} unless they're
+    still cached from a previous verification and C{refresh} isn't set.
+
+    """
+    key = (container, uuid)
+    entry = self._verify_cache.get(key, None)
+    if entry is None or refresh:
+      entry = compute_fn(uuid, obj)
+      self._verify_cache[key] = entry
+      self._RecordVerifySerial(container, uuid)
+    return entry
+
+  def _ComputeClusterVerifyEntry(self, _, cluster):
+    """Verifies the parameters of the cluster.
 
+    @rtype: list of strings
+    @return: the error messages
+
+    """
     result = []
-    for disk in self._ConfigData().disks.values():
-      helper(disk, result)
+    _VerifyParamTypes(result, "cluster", "beparams", cluster.SimpleFillBE({}),
+                      constants.BES_PARAMETER_TYPES)
+    _VerifyParamTypes(result, "cluster", "nicparams",
+                      cluster.SimpleFillNIC({}),
+                      constants.NICS_PARAMETER_TYPES)
+    _VerifyNicParams(result, "cluster", cluster.SimpleFillNIC({}))
+    _VerifyParamTypes(result, "cluster", "ndparams", cluster.SimpleFillND({}),
+                      constants.NDS_PARAMETER_TYPES)
+    _VerifyIPolicy(result, "cluster", cluster.ipolicy, True)
+
+    for disk_template in cluster.diskparams:
+      if disk_template not in constants.DTS_HAVE_ACCESS:
+        continue
 
+      access = cluster.diskparams[disk_template].get(constants.LDP_ACCESS,
+                                                     constants.DISK_KERNELSPACE)
+      if access not in constants.DISK_VALID_ACCESS_MODES:
+        result.append(
+          "Invalid value of '%s:%s': '%s' (expected one of %s)" % (
+            disk_template, constants.LDP_ACCESS, access,
+            utils.CommaJoin(constants.DISK_VALID_ACCESS_MODES)
+          )
+        )
     return result
 
   @staticmethod
-  def _VerifyDisks(data, result):
+  def _ComputeDiskVerifyEntry(disk_uuid, disk):
+    """Verifies a single disk.
+
+    @rtype: list of strings
+    @return: the error messages
+
+    """
+    result = ["disk %s error: %s" % (disk.uuid, msg) for msg in disk.Verify()]
+    if disk.uuid != disk_uuid:
+      result.append("disk '%s' is indexed by wrong UUID '%s'" %
+                    (disk.name, disk_uuid))
+    return result
+
+  def _VerifyDisks(self, data, result, refresh=False):
     """Per-disk verification checks
 
     Extends L{result} with diagnostic information about the disks.
@@ -889,23 +1773,195 @@ class ConfigWriter(object):
     @type result: list of strings
     @param result: list containing diagnostic messages
 
+    @type refresh: bool
+    @param refresh: whether to check the disks again even if their results
+        are cached
+
     """
-    instance_disk_uuids = [d for insts in data.instances.values()
-                           for d in insts.disks]
+    instance_disk_uuids = frozenset(d for insts in data.instances.values()
+                                    for d in insts.disks)
     for disk_uuid in data.disks:
       disk = data.disks[disk_uuid]
-      result.extend(["disk %s error: %s" % (disk.uuid, msg)
-                     for msg in disk.Verify()])
-      if disk.uuid != disk_uuid:
-        result.append("disk '%s' is indexed by wrong UUID '%s'" %
-                      (disk.name, disk_uuid))
+      result.extend(self._GetVerifyEntry("disks", disk_uuid, disk,
+                                         self._ComputeDiskVerifyEntry,
+                                         refresh=refresh))
       if disk.uuid not in instance_disk_uuids:
         result.append("disk '%s' is not attached to any instance" %
                       disk.uuid)
 
-  def _UnlockedVerifyConfig(self):
+  def _ComputeInstanceVerifyEntry(self, instance_uuid, instance):
+    """Verifies a single instance and collects its resources.
+
+    The checks involving other objects than the instance, its disks and
+    the cluster parameters are done by L{_UnlockedVerifyConfig}.
+
+    @rtype: tuple
+    @return: the error messages to be reported before the checks of the
+        primary and secondary nodes, the secondary nodes, a list of
+        (MAC, error messages) for the NICs, the error messages to be
+        reported after the NIC checks, a list of (port, (instance name,
+        description)) for the used ports and a list of (IP key,
+        description) for the used IP addresses
+
+    """
+    data = self._ConfigData()
+    cluster = data.cluster
+
+    for disk_uuid in instance.disks:
+      self._AddVerifyDependency(("instances", instance_uuid),
+                                "disks", disk_uuid)
+
+    head = []
+    if instance.uuid != instance_uuid:
+      head.append("instance '%s' is indexed by wrong UUID '%s'" %
+                  (instance.name, instance_uuid))
+    snodes = self._UnlockedGetInstanceSecondaryNodes(instance.uuid)
+
+    nics = []
+    for idx, nic in enumerate(instance.nics):
+      nic_result = []
+      if nic.nicparams:
+        filled = cluster.SimpleFillNIC(nic.nicparams)
+        owner = "instance %s nic %d" % (instance.name, idx)
+        _VerifyParamTypes(nic_result, owner, "nicparams",
+                          filled, constants.NICS_PARAMETER_TYPES)
+        _VerifyNicParams(nic_result, owner, filled)
+      nics.append((nic.mac, nic_result))
+
+    tail = []
+    # disk template checks
+    if not instance.disk_template in data.cluster.enabled_disk_templates:
+      tail.append("instance '%s' uses the disabled disk template '%s'." %
+                  (instance.name, instance.disk_template))
+
+    # parameter checks
+    if instance.beparams:
+      _VerifyParamTypes(tail, "instance %s" % instance.name, "beparams",
+                        cluster.FillBE(instance), constants.BES_PARAMETER_TYPES)
+
+    # check that disks exists
+    for disk_uuid in instance.disks:
+      if disk_uuid not in data.disks:
+        tail.append("Instance '%s' has invalid disk '%s'" %
+                    (instance.name, disk_uuid))
+
+    instance_disks = self._UnlockedGetInstanceDisks(instance.uuid)
+    # gather the drbd ports for duplicate checks
+    ports = []
+    for (idx, dsk) in enumerate(instance_disks):
+      if dsk.dev_type in constants.DTS_DRBD:
+        ports.append((dsk.logical_id[2],
+                      (instance.name, "drbd disk %s" % idx)))
+    # gather network port reservation
+    net_port = getattr(instance, "network_port", None)
+    if net_port is not None:
+      ports.append((net_port, (instance.name, "network port")))
+
+    wrong_names = _CheckInstanceDiskIvNames(instance_disks)
+    if wrong_names:
+      tmp = "; ".join(("name of disk %s should be '%s', but is '%s'" %
+                       (idx, exp_name, actual_name))
+                      for (idx, exp_name, actual_name) in wrong_names)
+
+      tail.append("Instance '%s' has wrongly named disks: %s" %
+                  (instance.name, tmp))
+
+    # gather the IP addresses for duplicate checks
+    default_nicparams = cluster.nicparams[constants.PP_DEFAULT]
+    ips = []
+    for idx, nic in enumerate(instance.nics):
+      if nic.ip is None:
+        continue
+
+      nicparams = objects.FillDict(default_nicparams, nic.nicparams)
+      nic_mode = nicparams[constants.NIC_MODE]
+      nic_link = nicparams[constants.NIC_LINK]
+
+      if nic_mode == constants.NIC_MODE_BRIDGED:
+        link = "bridge:%s" % nic_link
+      elif nic_mode == constants.NIC_MODE_ROUTED:
+        link = "route:%s" % nic_link
+      elif nic_mode == constants.NIC_MODE_OVS:
+        link = "ovs:%s" % nic_link
+      else:
+        raise errors.ProgrammerError("NIC mode '%s' not handled" % nic_mode)
+
+      ips.append(("%s/%s/%s" % (link, nic.ip, nic.network),
+                  "instance:%s/nic:%d" % (instance.name, idx)))
+
+    return (head, snodes, nics, tail, ports, ips)
+
+  def _ComputeNodeVerifyEntry(self, node_uuid, node):
+    """Verifies a single node.
+
+    @rtype: list of strings
+    @return: the error messages
+
+    """
+    data = self._ConfigData()
+    result = []
+    if node.uuid != node_uuid:
+      result.append("Node '%s' is indexed by wrong UUID '%s'" %
+                    (node.name, node_uuid))
+    if [node.master_candidate, node.drained, node.offline].count(True) > 1:
+      result.append("Node %s state is invalid: master_candidate=%s,"
+                    " drain=%s, offline=%s" %
+                    (node.name, node.master_candidate, node.drained,
+                     node.offline))
+    self._AddVerifyDependency(("nodes", node_uuid), "nodegroups", node.group)
+    if node.group not in data.nodegroups:
+      result.append("Node '%s' has invalid group '%s'" %
+                    (node.name, node.group))
+    else:
+      _VerifyParamTypes(result, "node %s" % node.name, "ndparams",
+                        data.cluster.FillND(node, data.nodegroups[node.group]),
+                        constants.NDS_PARAMETER_TYPES)
+    used_globals = constants.NDC_GLOBALS.intersection(node.ndparams)
+    if used_globals:
+      result.append("Node '%s' has some global parameters set: %s" %
+                    (node.name, utils.CommaJoin(used_globals)))
+    return result
+
+  def _ComputeNodeGroupVerifyEntry(self, nodegroup_uuid, nodegroup):
+    """Verifies a single node group.
+
+    @rtype: tuple
+    @return: the error messages to be reported before and after the check
+        for duplicate node group names
+
+    """
+    cluster = self._ConfigData().cluster
+    head = []
+    if nodegroup.uuid != nodegroup_uuid:
+      head.append("node group '%s' (uuid: '%s') indexed by wrong uuid '%s'"
+                  % (nodegroup.name, nodegroup.uuid, nodegroup_uuid))
+    if utils.UUID_RE.match(nodegroup.name.lower()):
+      head.append("node group '%s' (uuid: '%s') has uuid-like name" %
+                  (nodegroup.name, nodegroup.uuid))
+    tail = []
+    group_name = "group %s" % nodegroup.name
+    _VerifyIPolicy(tail, group_name,
+                   cluster.SimpleFillIPolicy(nodegroup.ipolicy), False)
+    if nodegroup.ndparams:
+      _VerifyParamTypes(tail, group_name, "ndparams",
+                        cluster.SimpleFillND(nodegroup.ndparams),
+                        constants.NDS_PARAMETER_TYPES)
+    return (head, tail)
+
+  def _UnlockedVerifyConfig(self, incremental=False):
     """Verify function.
 
+    The checks of single objects are cached, keyed by the objects' serial
+    numbers so that the results survive reloading the configuration (see
+    L{_PruneVerifyCache}). In incremental mode only the objects modified
+    (see L{_MarkModified}) since the last verification are checked again,
+    together with the checks involving several objects, which are computed
+    from the cached results. All objects are checked again if the cluster
+    parameters changed, or if not in incremental mode.
+
+    @type incremental: bool
+    @param incremental: whether to re-use the results of the previous
+        verification for the unmodified objects
     @rtype: list
     @return: a list of error messages; a non-empty list signifies
         configuration errors
@@ -913,11 +1969,15 @@ class ConfigWriter(object):
     """
     # pylint: disable=R0914
     result = []
-    seen_macs = []
+    seen_macs = set()
     ports = {}
     data = self._ConfigData()
     cluster = data.cluster
 
+    if self._verify_cluster_params != self._GetVerifyClusterParams():
+      self._ResetVerifyCache()
+    refresh = not incremental
+
     # First call WConfd to perform its checks, if we're not offline
     if not self._offline:
       try:
@@ -929,147 +1989,40 @@ class ConfigWriter(object):
         except IndexError:
           pass
 
-    def _helper(owner, attr, value, template):
-      try:
-        utils.ForceDictType(value, template)
-      except errors.GenericError, err:
-        result.append("%s has invalid %s: %s" % (owner, attr, err))
-
-    def _helper_nic(owner, params):
-      try:
-        objects.NIC.CheckParameterSyntax(params)
-      except errors.ConfigurationError, err:
-        result.append("%s has invalid nicparams: %s" % (owner, err))
-
-    def _helper_ipolicy(owner, ipolicy, iscluster):
-      try:
-        objects.InstancePolicy.CheckParameterSyntax(ipolicy, iscluster)
-      except errors.ConfigurationError, err:
-        result.append("%s has invalid instance policy: %s" % (owner, err))
-      for key, value in ipolicy.items():
-        if key == constants.ISPECS_MINMAX:
-          for k in range(len(value)):
-            _helper_ispecs(owner, "ipolicy/%s[%s]" % (key, k), value[k])
-        elif key == constants.ISPECS_STD:
-          _helper(owner, "ipolicy/" + key, value,
-                  constants.ISPECS_PARAMETER_TYPES)
-        else:
-          # FIXME: assuming list type
-          if key in constants.IPOLICY_PARAMETERS:
-            exp_type = float
-            # if the value is int, it can be converted into float
-            convertible_types = [int]
-          else:
-            exp_type = list
-            convertible_types = []
-          # Try to convert from allowed types, if necessary.
-          if any(isinstance(value, ct) for ct in convertible_types):
-            try:
-              value = exp_type(value)
-              ipolicy[key] = value
-            except ValueError:
-              pass
-          if not isinstance(value, exp_type):
-            result.append("%s has invalid instance policy: for %s,"
-                          " expecting %s, got %s" %
-                          (owner, key, exp_type.__name__, type(value)))
-
-    def _helper_ispecs(owner, parentkey, params):
-      for (key, value) in params.items():
-        fullkey = "/".join([parentkey, key])
-        _helper(owner, fullkey, value, constants.ISPECS_PARAMETER_TYPES)
-
     # check cluster parameters
-    _helper("cluster", "beparams", cluster.SimpleFillBE({}),
-            constants.BES_PARAMETER_TYPES)
-    _helper("cluster", "nicparams", cluster.SimpleFillNIC({}),
-            constants.NICS_PARAMETER_TYPES)
-    _helper_nic("cluster", cluster.SimpleFillNIC({}))
-    _helper("cluster", "ndparams", cluster.SimpleFillND({}),
-            constants.NDS_PARAMETER_TYPES)
-    _helper_ipolicy("cluster", cluster.ipolicy, True)
+    result.extend(self._GetVerifyEntry(_CLUSTER, None, cluster,
+                                       self._ComputeClusterVerifyEntry,
+                                       refresh=refresh))
 
-    for disk_template in cluster.diskparams:
-      if disk_template not in constants.DTS_HAVE_ACCESS:
-        continue
-
-      access = cluster.diskparams[disk_template].get(constants.LDP_ACCESS,
-                                                     constants.DISK_KERNELSPACE)
-      if access not in constants.DISK_VALID_ACCESS_MODES:
-        result.append(
-          "Invalid value of '%s:%s': '%s' (expected one of %s)" % (
-            disk_template, constants.LDP_ACCESS, access,
-            utils.CommaJoin(constants.DISK_VALID_ACCESS_MODES)
-          )
-        )
-
-    self._VerifyDisks(data, result)
+    self._VerifyDisks(data, result, refresh)
 
     # per-instance checks
+    instance_ips = []
     for instance_uuid in data.instances:
       instance = data.instances[instance_uuid]
-      if instance.uuid != instance_uuid:
-        result.append("instance '%s' is indexed by wrong UUID '%s'" %
-                      (instance.name, instance_uuid))
+      (head, snodes, nics, tail, instance_ports, ips) = \
+        self._GetVerifyEntry("instances", instance_uuid, instance,
+                             self._ComputeInstanceVerifyEntry,
+                             refresh=refresh)
+      result.extend(head)
       if instance.primary_node not in data.nodes:
         result.append("instance '%s' has invalid primary node '%s'" %
                       (instance.name, instance.primary_node))
-      for snode in self._UnlockedGetInstanceSecondaryNodes(instance.uuid):
+      for snode in snodes:
         if snode not in data.nodes:
           result.append("instance '%s' has invalid secondary node '%s'" %
                         (instance.name, snode))
-      for idx, nic in enumerate(instance.nics):
-        if nic.mac in seen_macs:
+      for idx, (mac, nic_result) in enumerate(nics):
+        if mac in seen_macs:
           result.append("instance '%s' has NIC %d mac %s duplicate" %
-                        (instance.name, idx, nic.mac))
+                        (instance.name, idx, mac))
         else:
-          seen_macs.append(nic.mac)
-        if nic.nicparams:
-          filled = cluster.SimpleFillNIC(nic.nicparams)
-          owner = "instance %s nic %d" % (instance.name, idx)
-          _helper(owner, "nicparams",
-                  filled, constants.NICS_PARAMETER_TYPES)
-          _helper_nic(owner, filled)
-
-      # disk template checks
-      if not instance.disk_template in data.cluster.enabled_disk_templates:
-        result.append("instance '%s' uses the disabled disk template '%s'." %
-                      (instance.name, instance.disk_template))
-
-      # parameter checks
-      if instance.beparams:
-        _helper("instance %s" % instance.name, "beparams",
-                cluster.FillBE(instance), constants.BES_PARAMETER_TYPES)
-
-      # check that disks exists
-      for disk_uuid in instance.disks:
-        if disk_uuid not in data.disks:
-          result.append("Instance '%s' has invalid disk '%s'" %
-                        (instance.name, disk_uuid))
-
-      instance_disks = self._UnlockedGetInstanceDisks(instance.uuid)
-      # gather the drbd ports for duplicate checks
-      for (idx, dsk) in enumerate(instance_disks):
-        if dsk.dev_type in constants.DTS_DRBD:
-          tcp_port = dsk.logical_id[2]
-          if tcp_port not in ports:
-            ports[tcp_port] = []
-          ports[tcp_port].append((instance.name, "drbd disk %s" % idx))
-      # gather network port reservation
-      net_port = getattr(instance, "network_port", None)
-      if net_port is not None:
-        if net_port not in ports:
-          ports[net_port] = []
-        ports[net_port].append((instance.name, "network port"))
-
-      wrong_names = _CheckInstanceDiskIvNames(instance_disks)
-      if wrong_names:
-        tmp = "; ".join(("name of disk %s should be '%s', but is '%s'" %
-                         (idx, exp_name, actual_name))
-                        for (idx, exp_name, actual_name) in wrong_names)
-
-        result.append("Instance '%s' has wrongly named disks: %s" %
-                      (instance.name, tmp))
+          seen_macs.add(mac)
+        result.extend(nic_result)
+      result.extend(tail)
+      for (port, owner) in instance_ports:
+        ports.setdefault(port, []).append(owner)
+      instance_ips.extend(ips)
 
     # cluster-wide pool of free ports
     for free_port in cluster.tcpudp_port_pool:
@@ -1103,53 +2056,51 @@ class ConfigWriter(object):
 
     # node checks
     for node_uuid, node in data.nodes.items():
-      if node.uuid != node_uuid:
-        result.append("Node '%s' is indexed by wrong UUID '%s'" %
-                      (node.name, node_uuid))
-      if [node.master_candidate, node.drained, node.offline].count(True) > 1:
-        result.append("Node %s state is invalid: master_candidate=%s,"
-                      " drain=%s, offline=%s" %
-                      (node.name, node.master_candidate, node.drained,
-                       node.offline))
-      if node.group not in data.nodegroups:
-        result.append("Node '%s' has invalid group '%s'" %
-                      (node.name, node.group))
-      else:
-        _helper("node %s" % node.name, "ndparams",
-                cluster.FillND(node, data.nodegroups[node.group]),
-                constants.NDS_PARAMETER_TYPES)
-      used_globals = constants.NDC_GLOBALS.intersection(node.ndparams)
-      if used_globals:
-        result.append("Node '%s' has some global parameters set: %s" %
-                      (node.name, utils.CommaJoin(used_globals)))
+      result.extend(self._GetVerifyEntry("nodes", node_uuid, node,
+                                         self._ComputeNodeVerifyEntry,
+                                         refresh=refresh))
 
     # nodegroups checks
     nodegroups_names = set()
     for nodegroup_uuid in data.nodegroups:
       nodegroup = data.nodegroups[nodegroup_uuid]
-      if nodegroup.uuid != nodegroup_uuid:
-        result.append("node group '%s' (uuid: '%s') indexed by wrong uuid '%s'"
-                      % (nodegroup.name, nodegroup.uuid, nodegroup_uuid))
-      if utils.UUID_RE.match(nodegroup.name.lower()):
-        result.append("node group '%s' (uuid: '%s') has uuid-like name" %
-                      (nodegroup.name, nodegroup.uuid))
+      (head, tail) = \
+        self._GetVerifyEntry("nodegroups", nodegroup_uuid, nodegroup,
+                             self._ComputeNodeGroupVerifyEntry,
+                             refresh=refresh)
+      result.extend(head)
       if nodegroup.name in nodegroups_names:
         result.append("duplicate node group name '%s'" % nodegroup.name)
       else:
         nodegroups_names.add(nodegroup.name)
-      group_name = "group %s" % nodegroup.name
-      _helper_ipolicy(group_name, cluster.SimpleFillIPolicy(nodegroup.ipolicy),
-                      False)
-      if nodegroup.ndparams:
-        _helper(group_name, "ndparams",
-                cluster.SimpleFillND(nodegroup.ndparams),
-                constants.NDS_PARAMETER_TYPES)
+      result.extend(tail)
 
     # drbd minors check
-    # FIXME: The check for DRBD map needs to be implemented in WConfd
+    # FIXME: The check for DRBD map needs to be implemented in WConfd,
+    # which also knows about the temporarily allocated minors
+    drbd_minors = self._UnlockedGetResources().drbd_minors
+    if drbd_minors.GetDuplicates():
+      usage = self._UnlockedGetDRBDMinorUsage()
+      for (node_uuid, minor) in drbd_minors.GetDuplicates():
+        node = data.nodes.get(node_uuid, None)
+        result.append("DRBD minor %d on node %s is assigned several times to"
+                      " instances %s" %
+                      (minor, getattr(node, "name", node_uuid),
+                       utils.CommaJoin(data.instances[inst_uuid].name
+                                       for inst_uuid in
+                                       usage[node_uuid][minor])))
+    if not incremental:
+      # the minor index is only updated for the objects passed to
+      # _MarkModified, so compare it to the minors of all the instances
+      full_minors = _DRBDMinorIndex()
+      for (inst_uuid, instance) in data.instances.items():
+        full_minors.SetOwned(("instances", inst_uuid),
+                             self._ComputeInstanceDRBDMinors(instance))
+      if full_minors.GetUsage() != drbd_minors.GetUsage():
+        result.append("the index of used DRBD minors doesn't match the"
+                      " instances' disks")
 
     # IP checks
-    default_nicparams = cluster.nicparams[constants.PP_DEFAULT]
     ips = {}
 
     def _AddIpAddress(ip, name):
@@ -1162,41 +2113,31 @@ class ConfigWriter(object):
       if node.secondary_ip != node.primary_ip:
         _AddIpAddress(node.secondary_ip, "node:%s/secondary" % node.name)
 
-    for instance in data.instances.values():
-      for idx, nic in enumerate(instance.nics):
-        if nic.ip is None:
-          continue
-
-        nicparams = objects.FillDict(default_nicparams, nic.nicparams)
-        nic_mode = nicparams[constants.NIC_MODE]
-        nic_link = nicparams[constants.NIC_LINK]
-
-        if nic_mode == constants.NIC_MODE_BRIDGED:
-          link = "bridge:%s" % nic_link
-        elif nic_mode == constants.NIC_MODE_ROUTED:
-          link = "route:%s" % nic_link
-        elif nic_mode == constants.NIC_MODE_OVS:
-          link = "ovs:%s" % nic_link
-        else:
-          raise errors.ProgrammerError("NIC mode '%s' not handled" % nic_mode)
-
-        _AddIpAddress("%s/%s/%s" % (link, nic.ip, nic.network),
-                      "instance:%s/nic:%d" % (instance.name, idx))
+    for (ip, name) in instance_ips:
+      _AddIpAddress(ip, name)
 
     for ip, owners in ips.items():
       if len(owners) > 1:
         result.append("IP address %s is used by multiple owners: %s" %
                       (ip, utils.CommaJoin(owners)))
 
+    # the ipolicy checks might have modified the cluster parameters; they're
+    # only copied if they changed, as copying them is expensive
+    if self._verify_cluster_params != self._GetVerifyClusterParams():
+      self._verify_cluster_params = \
+        copy.deepcopy(self._GetVerifyClusterParams())
+
     return result
 
-  def _UnlockedVerifyConfigAndLog(self, feedback_fn=None):
+  def _UnlockedVerifyConfigAndLog(self, feedback_fn=None, incremental=False):
     """Verify the configuration and log any errors.
 
     The errors get logged as critical errors and also to the feedback function,
     if given.
 
     @param feedback_fn: Callable feedback function
+    @type incremental: bool
+    @param incremental: see L{_UnlockedVerifyConfig}
     @rtype: list
     @return: a list of error messages; a non-empty list signifies
         configuration errors
@@ -1208,7 +2149,7 @@ class ConfigWriter(object):
     # configuration has already been modified, and we can't revert;
     # the best we can do is to warn the user and save as is, leaving
     # recovery to the user
-    config_errors = self._UnlockedVerifyConfig()
+    config_errors = self._UnlockedVerifyConfig(incremental=incremental)
     if config_errors:
       errmsg = ("Configuration data is not consistent: %s" %
                 (utils.CommaJoin(config_errors)))
@@ -1243,6 +2184,7 @@ class ConfigWriter(object):
       raise errors.ProgrammerError("Invalid type passed for port")
 
     self._ConfigData().cluster.tcpudp_port_pool.add(port)
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync(shared=1)
   def GetPortList(self):
@@ -1270,13 +2212,52 @@ class ConfigWriter(object):
                                         " than %s. Aborting." %
                                         constants.LAST_DRBD_PORT)
       self._ConfigData().cluster.highest_used_port = port
+    self._MarkModified(_CLUSTER)
     return port
 
+  def _UnlockedGetDRBDMinorUsage(self):
+    """Returns the instances using the DRBD minors, from the minor index.
+
+    @rtype: dict
+    @return: dictionary of node_uuid: dict of minor: list of instance_uuid,
+        an instance being listed once for every disk using the minor
+
+    """
+    usage = self._UnlockedGetResources().drbd_minors.GetUsage()
+    for minors in usage.values():
+      for (minor, owners) in minors.items():
+        minors[minor] = [uuid for (_, uuid) in owners]
+    return usage
+
+  def _UnlockedComputeDRBDMap(self):
+    """Compute the used DRBD minor/nodes from the minor index.
+
+    The minors allocated in offline mode are included.
+
+    @rtype: (dict, list)
+    @return: dictionary of node_uuid: dict of minor: instance_uuid, with
+        all the nodes in it, and a sorted list of (node_uuid, minor,
+        instance_uuids) for the minors used more than once
+
+    """
+    drbd_map = dict((node_uuid, {}) for node_uuid in self._ConfigData().nodes)
+    duplicates = []
+    for (node_uuid, minors) in self._UnlockedGetDRBDMinorUsage().items():
+      node_map = drbd_map.setdefault(node_uuid, {})
+      for (minor, inst_uuids) in minors.items():
+        node_map[minor] = inst_uuids[0]
+        if len(inst_uuids) > 1:
+          duplicates.append((node_uuid, minor, inst_uuids))
+    duplicates.sort()
+    for ((node_uuid, minor), inst_uuid) in self._temporary_drbds.items():
+      drbd_map.setdefault(node_uuid, {})[minor] = inst_uuid
+    return (drbd_map, duplicates)
+
   @_ConfigSync(shared=1)
   def ComputeDRBDMap(self):
     """Compute the used DRBD minor/nodes.
 
-    This is just a wrapper over a call to WConfd.
+    In online mode, this is just a wrapper over a call to WConfd.
 
     @return: dictionary of node_uuid: dict of minor: instance_uuid;
         the returned dict will have all the nodes in it (even if with
@@ -1284,15 +2265,41 @@ class ConfigWriter(object):
 
     """
     if self._offline:
-      raise errors.ProgrammerError("Can't call ComputeDRBDMap in offline mode")
+      (drbd_map, duplicates) = self._UnlockedComputeDRBDMap()
+      if duplicates:
+        raise errors.ConfigurationError("Duplicate DRBD minors detected: %s" %
+                                        duplicates)
+      return drbd_map
     else:
       return dict(map(lambda (k, v): (k, dict(v)),
                       self._wconfd.ComputeDRBDMap()))
 
+  @_ConfigSync()
+  def _AllocateDRBDMinorOffline(self, node_uuids, inst_uuid):
+    """Allocate drbd minors using the minor index.
+
+    @see: L{AllocateDRBDMinor}
+
+    """
+    index = self._UnlockedGetResources().drbd_minors
+    if index.GetDuplicates():
+      raise errors.ConfigurationError("Duplicate DRBD minors detected: %s" %
+                                      index.GetDuplicates())
+    result = []
+    for node_uuid in node_uuids:
+      reserved = [minor for (node, minor) in self._temporary_drbds
+                  if node == node_uuid]
+      minor = index.FindFree(node_uuid, reserved=reserved)
+      self._temporary_drbds[(node_uuid, minor)] = inst_uuid
+      result.append(minor)
+    return result
+
   def AllocateDRBDMinor(self, node_uuids, inst_uuid):
     """Allocate a drbd minor.
 
-    This is just a wrapper over a call to WConfd.
+    In online mode, this is just a wrapper over a call to WConfd. In offline
+    mode the minors are allocated using the minor index and kept until
+    L{ReleaseDRBDMinors} is called.
 
     The free minor will be automatically computed from the existing
     devices. A node can be given multiple times in order to allocate
@@ -1307,10 +2314,9 @@ class ConfigWriter(object):
            "Invalid argument '%s' passed to AllocateDRBDMinor" % inst_uuid
 
     if self._offline:
-      raise errors.ProgrammerError("Can't call AllocateDRBDMinor"
-                                   " in offline mode")
-
-    result = self._wconfd.AllocateDRBDMinor(inst_uuid, node_uuids)
+      result = self._AllocateDRBDMinorOffline(node_uuids, inst_uuid)
+    else:
+      result = self._wconfd.AllocateDRBDMinor(inst_uuid, node_uuids)
     logging.debug("Request to allocate drbd minors, input: %s, returning %s",
                   node_uuids, result)
     return result
@@ -1318,7 +2324,7 @@ class ConfigWriter(object):
   def _UnlockedReleaseDRBDMinors(self, inst_uuid):
     """Release temporary drbd minors allocated for a given instance.
 
-    This is just a wrapper over a call to WConfd.
+    In online mode, this is just a wrapper over a call to WConfd.
 
     @type inst_uuid: string
     @param inst_uuid: the instance for which temporary minors should be
@@ -1327,10 +2333,11 @@ class ConfigWriter(object):
     """
     assert isinstance(inst_uuid, basestring), \
            "Invalid argument passed to ReleaseDRBDMinors"
-    # in offline mode we allow the calls to release DRBD minors,
-    # because then nothing can be allocated anyway;
-    # this is useful for testing
-    if not self._offline:
+    if self._offline:
+      for (key, uuid) in self._temporary_drbds.items():
+        if uuid == inst_uuid:
+          del self._temporary_drbds[key]
+    else:
       self._wconfd.ReleaseDRBDMinors(inst_uuid)
 
   @_ConfigSync()
@@ -1535,6 +2542,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.install_image = install_image
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync(shared=1)
   def GetInstanceCommunicationNetwork(self):
@@ -1557,6 +2565,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.instance_communication_network = network_name
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync(shared=1)
   def GetZeroingImage(self):
@@ -1589,6 +2598,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.compression_tools = tools
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync()
   def AddNodeGroup(self, group, ec_id, check_uuid=True):
@@ -1637,6 +2647,9 @@ class ConfigWriter(object):
 
     self._ConfigData().nodegroups[group.uuid] = group
     self._ConfigData().cluster.serial_no += 1
+    self._nodegroup_names.Add(group.uuid, group.name)
+    self._MarkModified("nodegroups", group.uuid)
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync()
   def RemoveNodeGroup(self, group_uuid):
@@ -1656,6 +2669,9 @@ class ConfigWriter(object):
 
     del self._ConfigData().nodegroups[group_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._nodegroup_names.Remove(group_uuid)
+    self._MarkModified("nodegroups", group_uuid)
+    self._MarkModified(_CLUSTER)
 
   def _UnlockedLookupNodeGroup(self, target):
     """Lookup a node group's UUID.
@@ -1675,9 +2691,9 @@ class ConfigWriter(object):
         return self._ConfigData().nodegroups.keys()[0]
     if target in self._ConfigData().nodegroups:
       return target
-    for nodegroup in self._ConfigData().nodegroups.values():
-      if nodegroup.name == target:
-        return nodegroup.uuid
+    uuid = self._nodegroup_names.Lookup(target)
+    if uuid is not None:
+      return uuid
     raise errors.OpPrereqError("Node group '%s' not found" % target,
                                errors.ECODE_NOENT)
 
@@ -1798,6 +2814,10 @@ class ConfigWriter(object):
     instance.ctime = instance.mtime = time.time()
     self._ConfigData().instances[instance.uuid] = instance
     self._ConfigData().cluster.serial_no += 1
+    self._instance_names.Add(instance.uuid, instance.name)
+    self._UnlockedUpdateNodeInstanceIndex(instance.uuid)
+    self._MarkModified("instances", instance.uuid)
+    self._MarkModified(_CLUSTER)
     self._UnlockedReleaseDRBDMinors(instance.uuid)
     # FIXME: After RemoveInstance is moved to WConfd, use its internal
     # function from TempRes module instead.
@@ -1826,7 +2846,8 @@ class ConfigWriter(object):
     """
     if not item.uuid:
       raise errors.ConfigurationError("'%s' must have an UUID" % (item.name,))
-    if item.uuid in self._AllIDs(include_temporary=include_temporary):
+    if (item.uuid in self._AllIDs() or
+        (include_temporary and self._temporary_ids.Reserved(item.uuid))):
       raise errors.ConfigurationError("Cannot add '%s': UUID %s already"
                                       " in use" % (item.name, item.uuid))
 
@@ -1861,6 +2882,7 @@ class ConfigWriter(object):
       instance.admin_state_source = admin_state_source
       instance.serial_no += 1
       instance.mtime = time.time()
+      self._MarkModified("instances", inst_uuid)
     return instance
 
   @_ConfigSync()
@@ -1915,6 +2937,10 @@ class ConfigWriter(object):
 
     del self._ConfigData().instances[inst_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._instance_names.Remove(inst_uuid)
+    self._UnlockedUpdateNodeInstanceIndex(inst_uuid)
+    self._MarkModified("instances", inst_uuid)
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync()
   def RenameInstance(self, inst_uuid, new_name):
@@ -1930,6 +2956,9 @@ class ConfigWriter(object):
 
     inst = self._ConfigData().instances[inst_uuid]
     inst.name = new_name
+    inst.serial_no += 1
+    inst.mtime = time.time()
+    self._instance_names.Add(inst_uuid, new_name)
 
     instance_disks = self._UnlockedGetInstanceDisks(inst_uuid)
     for (_, disk) in enumerate(instance_disks):
@@ -1939,9 +2968,14 @@ class ConfigWriter(object):
         disk.logical_id = (disk.logical_id[0],
                            utils.PathJoin(file_storage_dir, inst.name,
                                           os.path.basename(disk.logical_id[1])))
+        disk.serial_no += 1
+        disk.mtime = time.time()
+        self._MarkModified("disks", disk.uuid)
 
     # Force update of ssconf files
     self._ConfigData().cluster.serial_no += 1
+    self._MarkModified("instances", inst_uuid)
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync()
   def MarkInstanceDown(self, inst_uuid):
@@ -2006,19 +3040,14 @@ class ConfigWriter(object):
     """
     return self._UnlockedGetInstanceList()
 
+  @_ConfigSync(shared=1)
   def ExpandInstanceName(self, short_name):
     """Attempt to expand an incomplete instance name.
 
     """
-    # Locking is done in L{ConfigWriter.GetAllInstancesInfo}
-    all_insts = self.GetAllInstancesInfo().values()
-    expanded_name = _MatchNameComponentIgnoreCase(
-                      short_name, [inst.name for inst in all_insts])
-
-    if expanded_name is not None:
-      # there has to be exactly one instance with that name
-      inst = (filter(lambda n: n.name == expanded_name, all_insts)[0])
-      return (inst.uuid, inst.name)
+    inst_uuid = self._instance_names.Expand(short_name)
+    if inst_uuid is not None:
+      return (inst_uuid, self._UnlockedGetInstanceName(inst_uuid))
     else:
       return (None, None)
 
@@ -2164,10 +3193,10 @@ class ConfigWriter(object):
     return self._UnlockedGetInstanceInfoByName(inst_name)
 
   def _UnlockedGetInstanceInfoByName(self, inst_name):
-    for inst in self._UnlockedGetAllInstancesInfo().values():
-      if inst.name == inst_name:
-        return inst
-    return None
+    inst_uuid = self._instance_names.Lookup(inst_name)
+    if inst_uuid is None:
+      return None
+    return self._UnlockedGetInstanceInfo(inst_uuid)
 
   def _UnlockedGetInstanceName(self, inst_uuid):
     inst_info = self._UnlockedGetInstanceInfo(inst_uuid)
@@ -2209,7 +3238,12 @@ class ConfigWriter(object):
     @type target_node_uuid: string
 
     """
-    self._UnlockedGetInstanceInfo(inst_uuid).primary_node = target_node_uuid
+    instance = self._UnlockedGetInstanceInfo(inst_uuid)
+    instance.primary_node = target_node_uuid
+    instance.serial_no += 1
+    instance.mtime = time.time()
+    self._UnlockedUpdateNodeInstanceIndex(inst_uuid)
+    self._MarkModified("instances", inst_uuid)
 
   def _UnlockedGetInstanceNames(self, inst_uuids):
     return [self._UnlockedGetInstanceName(uuid) for uuid in inst_uuids]
@@ -2231,6 +3265,9 @@ class ConfigWriter(object):
     assert node.uuid in self._ConfigData().nodegroups[node.group].members
     self._ConfigData().nodes[node.uuid] = node
     self._ConfigData().cluster.serial_no += 1
+    self._node_names.Add(node.uuid, node.name)
+    self._MarkModified("nodes", node.uuid)
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync()
   def AddNode(self, node, ec_id):
@@ -2255,20 +3292,18 @@ class ConfigWriter(object):
     self._UnlockedRemoveNodeFromGroup(self._ConfigData().nodes[node_uuid])
     del self._ConfigData().nodes[node_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._node_names.Remove(node_uuid)
+    self._MarkModified("nodes", node_uuid)
+    self._MarkModified(_CLUSTER)
 
+  @_ConfigSync(shared=1)
   def ExpandNodeName(self, short_name):
     """Attempt to expand an incomplete node name into a node UUID.
 
     """
-    # Locking is done in L{ConfigWriter.GetAllNodesInfo}
-    all_nodes = self.GetAllNodesInfo().values()
-    expanded_name = _MatchNameComponentIgnoreCase(
-                      short_name, [node.name for node in all_nodes])
-
-    if expanded_name is not None:
-      # there has to be exactly one node with that name
-      node = (filter(lambda n: n.name == expanded_name, all_nodes)[0])
-      return (node.uuid, node.name)
+    node_uuid = self._node_names.Expand(short_name)
+    if node_uuid is not None:
+      return (node_uuid, self._UnlockedGetNodeName(node_uuid))
     else:
       return (None, None)
 
@@ -2310,17 +3345,13 @@ class ConfigWriter(object):
     @param node_uuid: the node UUID
 
     @rtype: (list, list)
-    @return: a tuple with two lists: the primary and the secondary instances
+    @return: a tuple with two sorted lists: the primary and the secondary
+        instances
 
     """
-    pri = []
-    sec = []
-    for inst in self._ConfigData().instances.values():
-      if inst.primary_node == node_uuid:
-        pri.append(inst.uuid)
-      if node_uuid in self._UnlockedGetInstanceSecondaryNodes(inst.uuid):
-        sec.append(inst.uuid)
-    return (pri, sec)
+    index = self._UnlockedGetNodeInstanceIndex()
+    return (sorted(index.GetPrimaryInstances(node_uuid)),
+            sorted(index.GetSecondaryInstances(node_uuid)))
 
   @_ConfigSync(shared=1)
   def GetNodeGroupInstances(self, uuid, primary_only=False):
@@ -2332,15 +3363,17 @@ class ConfigWriter(object):
     @return: List of instance UUIDs in node group
 
     """
-    if primary_only:
-      nodes_fn = lambda inst: [inst.primary_node]
-    else:
-      nodes_fn = lambda inst: self._UnlockedGetInstanceNodes(inst.uuid)
+    group = self._UnlockedGetNodeGroup(uuid)
+    if group is None:
+      return frozenset()
 
-    return frozenset(inst.uuid
-                     for inst in self._ConfigData().instances.values()
-                     for node_uuid in nodes_fn(inst)
-                     if self._UnlockedGetNodeInfo(node_uuid).group == uuid)
+    index = self._UnlockedGetNodeInstanceIndex()
+    result = set()
+    for node_uuid in group.members:
+      result.update(index.GetPrimaryInstances(node_uuid))
+      if not primary_only:
+        result.update(index.GetSecondaryInstances(node_uuid))
+    return frozenset(result)
 
   def _UnlockedGetHvparamsString(self, hvname):
     """Return the string representation of the list of hyervisor parameters of
@@ -2462,10 +3495,10 @@ class ConfigWriter(object):
     return self._UnlockedGetAllNodesInfo()
 
   def _UnlockedGetNodeInfoByName(self, node_name):
-    for node in self._UnlockedGetAllNodesInfo().values():
-      if node.name == node_name:
-        return node
-    return None
+    node_uuid = self._node_names.Lookup(node_name)
+    if node_uuid is None:
+      return None
+    return self._UnlockedGetNodeInfo(node_uuid)
 
   @_ConfigSync(shared=1)
   def GetNodeInfoByName(self, node_name):
@@ -2489,10 +3522,10 @@ class ConfigWriter(object):
           information is available
 
     """
-    for nodegroup in self._UnlockedGetAllNodeGroupsInfo().values():
-      if nodegroup.name == nodegroup_name:
-        return nodegroup
-    return None
+    group_uuid = self._nodegroup_names.Lookup(nodegroup_name)
+    if group_uuid is None:
+      return None
+    return self._UnlockedGetNodeGroup(group_uuid)
 
   def _UnlockedGetNodeName(self, node_spec):
     if isinstance(node_spec, objects.Node):
@@ -2604,6 +3637,8 @@ class ConfigWriter(object):
         mod_list.append(node)
         node.master_candidate = True
         node.serial_no += 1
+        node.mtime = time.time()
+        self._MarkModified("nodes", node.uuid)
         mc_now += 1
       if mc_now != mc_max:
         # this should not happen
@@ -2611,6 +3646,7 @@ class ConfigWriter(object):
                         " fill the candidate pool (%d/%d)", mc_now, mc_max)
       if mod_list:
         self._ConfigData().cluster.serial_no += 1
+        self._MarkModified(_CLUSTER)
 
     return mod_list
 
@@ -2626,6 +3662,7 @@ class ConfigWriter(object):
       raise errors.OpExecError("Unknown node group: %s" % nodegroup_uuid)
     if node_uuid not in self._ConfigData().nodegroups[nodegroup_uuid].members:
       self._ConfigData().nodegroups[nodegroup_uuid].members.append(node_uuid)
+      self._MarkModified("nodegroups", nodegroup_uuid)
 
   def _UnlockedRemoveNodeFromGroup(self, node):
     """Remove a given node from its group.
@@ -2641,6 +3678,7 @@ class ConfigWriter(object):
                       " (while being removed from it)", node.uuid, nodegroup)
     else:
       nodegroup_obj.members.remove(node.uuid)
+      self._MarkModified("nodegroups", nodegroup)
 
   @_ConfigSync()
   def AssignGroupNodes(self, mods):
@@ -2709,9 +3747,14 @@ class ConfigWriter(object):
     for obj in frozenset(itertools.chain(*resmod)): # pylint: disable=W0142
       obj.serial_no += 1
       obj.mtime = now
+    for (node, old_group, new_group) in resmod:
+      self._MarkModified("nodes", node.uuid)
+      self._MarkModified("nodegroups", old_group.uuid)
+      self._MarkModified("nodegroups", new_group.uuid)
 
     # Force ssconf update
     self._ConfigData().cluster.serial_no += 1
+    self._MarkModified(_CLUSTER)
 
   def _BumpSerialNo(self):
     """Bump up the serial number of the config.
@@ -2766,12 +3809,14 @@ class ConfigWriter(object):
     # Read the configuration data. If offline, read the file directly.
     # If online, call WConfd.
     if self._offline:
+      lazy = shared and self._lazy
       try:
         raw_data = utils.ReadFile(self._cfg_file)
-        data_dict = serializer.Load(raw_data)
+        self._cfg_read_format = serializer.GetConfigFormat(raw_data)
+        data_dict = serializer.LoadConfig(raw_data)
         # Make sure the configuration has the right version
         _ValidateConfig(data_dict)
-        data = objects.ConfigData.FromDict(data_dict)
+        data = objects.ConfigData.FromDict(data_dict, lazy=lazy)
       except errors.ConfigVersionMismatch:
         raise
       except Exception, err:
@@ -2800,8 +3845,11 @@ class ConfigWriter(object):
 
       self._SetConfigData(data)
 
-      # Upgrade configuration if needed
-      self._UpgradeConfig(saveafter=True)
+      if lazy:
+        self._UpgradeConfigInMemory()
+      else:
+        # Upgrade configuration if needed
+        self._UpgradeConfig(saveafter=True)
     else:
       if shared:
         if self._config_data is None:
@@ -2811,15 +3859,7 @@ class ConfigWriter(object):
           logging.debug("My config copy is up to date.")
           dict_data = None
       else:
-        # poll until we acquire the lock
-        while True:
-          dict_data = \
-              self._wconfd.LockConfig(self._GetWConfdContext(), bool(shared))
-          logging.debug("Received config from WConfd.LockConfig [shared=%s]",
-                        bool(shared))
-          if dict_data is not None:
-            break
-          time.sleep(random.random())
+        dict_data = self._LockConfigExclusive()
 
       try:
         if dict_data is not None:
@@ -2828,6 +3868,70 @@ class ConfigWriter(object):
       except Exception, err:
         raise errors.ConfigurationError(err)
 
+  def _LockConfigExclusive(self):
+    """Acquires the configuration lock of WConfd exclusively.
+
+    If the process handles the notifications of WConfd, the request is
+    queued in WConfd, which hands the lock over to the waiting clients in
+    order, so that a released lock wakes up exactly one of them. Otherwise
+    the lock is polled for with an increasing delay.
+
+    @return: the configuration data, as a dictionary
+    @raise errors.LockError: if the lock couldn't be acquired within the
+        timeout given to the constructor
+
+    """
+    cid = self._GetWConfdContext()
+    start = time.time()
+
+    def _CheckTimeout():
+      """Returns the remaining time, raising an error if it is over.
+
+      """
+      if self._lock_timeout is None:
+        return None
+      remaining = start + self._lock_timeout - time.time()
+      if remaining <= 0:
+        raise errors.LockError("Couldn't acquire the configuration lock"
+                               " within %s seconds" % self._lock_timeout)
+      return remaining
+
+    if wc.LockNotificationsEnabled():
+      priority = None
+      if self._lock_priority_fn is not None:
+        priority = self._lock_priority_fn()
+      if priority is None:
+        priority = constants.OP_PRIO_DEFAULT
+
+      notifier = wc.GetLockNotifier()
+      # Notifications sent after this point refer to the new request
+      notifier.Clear()
+      self._wconfd.UpdateLocksWaiting(cid, priority,
+                                      [[_CONFIG_LOCK, "exclusive"]])
+      while self._wconfd.HasPendingRequest(cid):
+        # The pending request is dropped by _CloseConfig on errors
+        remaining = _CheckTimeout()
+        if remaining is None or remaining > wc.LOCK_NOTIFICATION_TIMEOUT:
+          remaining = wc.LOCK_NOTIFICATION_TIMEOUT
+        notifier.Wait(remaining)
+      dict_data = self._wconfd.ReadConfig()
+    else:
+      delay = _CONFIG_LOCK_POLL_DELAY[0]
+      while True:
+        dict_data = self._wconfd.LockConfig(cid, False)
+        if dict_data is not None:
+          break
+        remaining = _CheckTimeout()
+        if remaining is not None:
+          delay = min(delay, remaining)
+        time.sleep(delay)
+        delay = min(delay * _CONFIG_LOCK_POLL_DELAY[1],
+                    _CONFIG_LOCK_POLL_DELAY[2])
+
+    logging.debug("Acquired the configuration lock after %.3fs",
+                  time.time() - start)
+    return dict_data
+
   def _CloseConfig(self, save):
     """Release resources relating the config data.
 
@@ -2862,9 +3966,8 @@ class ConfigWriter(object):
         "safe" place.
 
     """
-    # Keep a copy of the persistent part of _config_data to check for changes
-    # Serialization doesn't guarantee order in dictionaries
-    oldconf = copy.deepcopy(self._ConfigData().ToDict())
+    # Keep a copy of _config_data to check for changes
+    oldconf = self._ConfigData().Copy()
 
     # In-object upgrades
     self._ConfigData().UpgradeConfig()
@@ -2886,7 +3989,16 @@ class ConfigWriter(object):
       # serializing/deserializing the object.
       self._UnlockedAddNodeToGroup(node.uuid, node.group)
 
-    modified = (oldconf != self._ConfigData().ToDict())
+    modified = (oldconf != self._ConfigData())
+    if modified:
+      self._MarkAllModified()
+      # UUIDs might have been generated during the upgrade
+      self._BuildNameIndexes()
+      self._node_instances = None
+      self._resources = None
+    else:
+      # only the (non-persistent) group membership has been touched
+      self._ResetModified()
     if modified and saveafter:
       self._WriteConfig()
       self._UnlockedDropECReservations(_UPGRADE_CONFIG_JID)
@@ -2894,6 +4006,32 @@ class ConfigWriter(object):
       if self._offline:
         self._UnlockedVerifyConfigAndLog()
 
+  def _UpgradeConfigInMemory(self):
+    """Run the in-object upgrade steps for read-only access.
+
+    Unlike L{_UpgradeConfig}, this neither writes the upgraded configuration
+    back nor verifies it, so that the objects of lazily loaded containers
+    (see L{objects.ConfigData.FromDict}) are only converted and upgraded once
+    they're accessed. Upgrades involving several objects, such as generating
+    missing UUIDs, are left to the next access loading the whole
+    configuration.
+
+    """
+    self._ConfigData().UpgradeConfig()
+    for node in self._ConfigData().nodes.values():
+      if node.group:
+        # the members list of a node group isn't serialized
+        self._UnlockedAddNodeToGroup(node.uuid, node.group)
+    self._ResetModified()
+
+  def _GetWriteFormat(self):
+    """Returns the file format for writing the configuration offline.
+
+    """
+    if self._cfg_format is None:
+      return self._cfg_read_format
+    return self._cfg_format
+
   def _WriteConfig(self, destination=None):
     """Write the configuration data to persistent storage.
 
@@ -2905,8 +4043,9 @@ class ConfigWriter(object):
     # If online, call WConfd.
     if self._offline:
       self._BumpSerialNo()
-      txt = serializer.DumpJson(
+      txt = serializer.DumpConfig(
         self._ConfigData().ToDict(_with_private=True),
+        fmt=self._GetWriteFormat(),
         private_encoder=serializer.EncodeWithPrivateFields
       )
 
@@ -2924,13 +4063,20 @@ class ConfigWriter(object):
         os.close(fd)
     else:
       try:
-        self._wconfd.WriteConfig(self._GetWConfdContext(),
-                                 self._ConfigData().ToDict())
+        if self._modified_all:
+          self._wconfd.WriteConfig(self._GetWConfdContext(),
+                                   self._ConfigData().ToDict())
+        elif self._modified:
+          self._wconfd.WriteConfigUpdate(self._GetWConfdContext(),
+                                         *self._GetConfigUpdate())
+        else:
+          logging.debug("Configuration not modified, skipping write")
       except errors.LockError:
         raise errors.ConfigurationError("The configuration file has been"
                                         " modified since the last write, cannot"
                                         " update")
 
+    self._ResetModified()
     self.write_count += 1
 
   def _GetAllHvparamsStrings(self, hypervisors):
@@ -3078,6 +4224,7 @@ class ConfigWriter(object):
     """
     self._ConfigData().cluster.volume_group_name = vg_name
     self._ConfigData().cluster.serial_no += 1
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync(shared=1)
   def GetDRBDHelper(self):
@@ -3093,6 +4240,7 @@ class ConfigWriter(object):
     """
     self._ConfigData().cluster.drbd_usermode_helper = drbd_helper
     self._ConfigData().cluster.serial_no += 1
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync(shared=1)
   def GetMACPrefix(self):
@@ -3133,8 +4281,9 @@ class ConfigWriter(object):
     This function must be called when an object (as returned by
     GetInstanceInfo, GetNodeInfo, GetCluster) has been updated and the
     caller wants the modifications saved to the backing store. Note
-    that all modified objects will be saved, but the target argument
-    is the one the caller wants to ensure that it's saved.
+    that only the target (and objects modified through the other methods
+    of this class) is sent to WConfd, so each modified object has to be
+    passed to this function.
 
     @param target: an instance of either L{objects.Cluster},
         L{objects.Node} or L{objects.Instance} which is existing in
@@ -3162,27 +4311,53 @@ class ConfigWriter(object):
     if isinstance(target, objects.Cluster):
       check_serial(target, self._ConfigData().cluster)
       self._ConfigData().cluster = target
+      container = _CLUSTER
     elif isinstance(target, objects.Node):
       replace_in(target, self._ConfigData().nodes)
       update_serial = True
+      container = "nodes"
     elif isinstance(target, objects.Instance):
       replace_in(target, self._ConfigData().instances)
+      container = "instances"
     elif isinstance(target, objects.NodeGroup):
       replace_in(target, self._ConfigData().nodegroups)
+      container = "nodegroups"
     elif isinstance(target, objects.Network):
       replace_in(target, self._ConfigData().networks)
+      container = "networks"
     elif isinstance(target, objects.Disk):
       replace_in(target, self._ConfigData().disks)
+      container = "disks"
     else:
       raise errors.ProgrammerError("Invalid object type (%s) passed to"
                                    " ConfigWriter.Update" % type(target))
     target.serial_no += 1
     target.mtime = now = time.time()
+    self._MarkModified(container, target.uuid)
+
+    # the name of the object might have been changed
+    name_index = {
+      "nodes": self._node_names,
+      "instances": self._instance_names,
+      "nodegroups": self._nodegroup_names,
+      "networks": self._network_names,
+      }.get(container, None)
+    if name_index is not None:
+      name_index.Add(target.uuid, target.name)
+
+    # the placement of an instance might have been changed
+    if isinstance(target, objects.Instance):
+      self._UnlockedUpdateNodeInstanceIndex(target.uuid)
+    elif isinstance(target, objects.Disk) and self._node_instances is not None:
+      owner = self._node_instances.GetDiskOwner(target.uuid)
+      if owner is not None:
+        self._UnlockedUpdateNodeInstanceIndex(owner)
 
     if update_serial:
       # for node updates, we need to increase the cluster serial too
       self._ConfigData().cluster.serial_no += 1
       self._ConfigData().cluster.mtime = now
+      self._MarkModified(_CLUSTER)
 
     if isinstance(target, objects.Instance):
       self._UnlockedReleaseDRBDMinors(target.uuid)
@@ -3195,7 +4370,7 @@ class ConfigWriter(object):
 
     # Just verify the configuration with our feedback function.
     # It will get written automatically by the decorator.
-    self._UnlockedVerifyConfigAndLog(feedback_fn=feedback_fn)
+    self._UnlockedVerifyConfigAndLog(feedback_fn=feedback_fn, incremental=True)
 
   def _UnlockedDropECReservations(self, _ec_id):
     """Drop per-execution-context reservations
@@ -3294,6 +4469,9 @@ class ConfigWriter(object):
     net.ctime = net.mtime = time.time()
     self._ConfigData().networks[net.uuid] = net
     self._ConfigData().cluster.serial_no += 1
+    self._network_names.Add(net.uuid, net.name)
+    self._MarkModified("networks", net.uuid)
+    self._MarkModified(_CLUSTER)
 
   def _UnlockedLookupNetwork(self, target):
     """Lookup a network's UUID.
@@ -3309,9 +4487,9 @@ class ConfigWriter(object):
       return None
     if target in self._ConfigData().networks:
       return target
-    for net in self._ConfigData().networks.values():
-      if net.name == target:
-        return net.uuid
+    net_uuid = self._network_names.Lookup(target)
+    if net_uuid is not None:
+      return net_uuid
     raise errors.OpPrereqError("Network '%s' not found" % target,
                                errors.ECODE_NOENT)
 
@@ -3344,6 +4522,9 @@ class ConfigWriter(object):
 
     del self._ConfigData().networks[network_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._network_names.Remove(network_uuid)
+    self._MarkModified("networks", network_uuid)
+    self._MarkModified(_CLUSTER)
 
   def _UnlockedGetGroupNetParams(self, net_uuid, node_uuid):
     """Get the netparams (mode, link) of a network.
@@ -3434,6 +4615,7 @@ class ConfigWriter(object):
           warn_fn("Overriding differing certificate digest for node %s"
                   % node_uuid)
     cluster.candidate_certs[node_uuid] = cert_digest
+    self._MarkModified(_CLUSTER)
 
   @_ConfigSync()
   def RemoveNodeFromCandidateCerts(self, node_uuid,
@@ -3453,6 +4635,7 @@ class ConfigWriter(object):
                 " in the candidate map." % node_uuid)
       return
     del cluster.candidate_certs[node_uuid]
+    self._MarkModified(_CLUSTER)
 
   def FlushConfig(self):
     """Force the distribution of configuration to master candidates.
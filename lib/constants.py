@@ -75,6 +75,19 @@ EXT_PLUGIN_MASK = re.compile("^[a-zA-Z0-9_-]+$")
 
 JOB_ID_TEMPLATE = r"\d+"
 JOB_FILE_RE = re.compile(r"^job-(%s)$" % JOB_ID_TEMPLATE)
+JOB_JOURNAL_SUFFIX = ".journal"
+JOB_JOURNAL_RE = re.compile(r"^job-(%s)%s$" % (JOB_ID_TEMPLATE,
+                                              re.escape(JOB_JOURNAL_SUFFIX)))
+
+# Changes to job queue files replicated in a batch
+JQ_REPL_UPDATE = "update"
+JQ_REPL_APPEND = "append"
+JQ_REPL_REMOVE = "remove"
+JQ_REPL_ALL = frozenset([
+  JQ_REPL_UPDATE,
+  JQ_REPL_APPEND,
+  JQ_REPL_REMOVE,
+  ])
 
 # HVC_DEFAULTS contains one value 'HV_VNC_PASSWORD_FILE' which is not
 # a constant because it depends on an environment variable that is
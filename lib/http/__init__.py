@@ -114,6 +114,15 @@ class HttpSessionHandshakeUnexpectedEOF(HttpError):
   """
 
 
+class HttpIdleConnectionClosed(HttpError):
+  """Internal exception for a connection closed before a message was sent.
+
+  This is raised when the peer closes a persistent connection while it is
+  idle, i.e. between two messages.
+
+  """
+
+
 class HttpSocketTimeout(Exception):
   """Internal exception for socket timeouts.
 
@@ -805,6 +814,7 @@ class HttpMessageReader(object):
 
     buf = ""
     eof = False
+    received = False
     while self.parser_status != self.PS_COMPLETE:
       # TODO: Don't read more than necessary (Content-Length), otherwise
       # data might be lost and/or an error could occur
@@ -812,6 +822,7 @@ class HttpMessageReader(object):
 
       if data:
         buf += data
+        received = True
       else:
         eof = True
 
@@ -823,6 +834,8 @@ class HttpMessageReader(object):
       if (eof and
           self.parser_status in (self.PS_START_LINE,
                                  self.PS_HEADERS)):
+        if not received:
+          raise HttpIdleConnectionClosed("Connection closed prematurely")
         raise HttpError("Connection closed prematurely")
 
     # Parse rest
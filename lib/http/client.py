@@ -32,6 +32,7 @@
 """
 
 import logging
+import os
 import pycurl
 import threading
 from cStringIO import StringIO
@@ -130,13 +131,18 @@ class HttpClientRequest(object):
     return "https://%s%s" % (address, self.path)
 
 
-def _StartRequest(curl, req):
+def _StartRequest(curl, req, session_cache=False, configure=True):
   """Starts a request on a cURL object.
 
   @type curl: pycurl.Curl
   @param curl: cURL object
   @type req: L{HttpClientRequest}
   @param req: HTTP request
+  @type session_cache: bool
+  @param session_cache: Whether to cache SSL session IDs
+  @type configure: bool
+  @param configure: Whether to call the request's configuration function;
+    not necessary if the cURL object has been configured by it before
 
   """
   logging.debug("Starting request %r", req)
@@ -170,14 +176,14 @@ def _StartRequest(curl, req):
   else:
     curl.setopt(pycurl.TIMEOUT, int(req.read_timeout))
 
-  # Disable SSL session ID caching (pycurl >= 7.16.0)
+  # Enable or disable SSL session ID caching (pycurl >= 7.16.0)
   if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
-    curl.setopt(pycurl.SSL_SESSIONID_CACHE, False)
+    curl.setopt(pycurl.SSL_SESSIONID_CACHE, session_cache)
 
   curl.setopt(pycurl.WRITEFUNCTION, resp_buffer.write)
 
   # Pass cURL object to external config function
-  if req.curl_config_fn:
+  if req.curl_config_fn and configure:
     req.curl_config_fn(curl)
 
   return _PendingRequest(curl, req, resp_buffer.getvalue)
@@ -304,6 +310,342 @@ class _PendingRequestMonitor(object):
     return result
 
 
+class CurlPool(object):
+  """Pool of cURL objects kept across calls to L{ProcessRequests}.
+
+  Finished cURL objects are kept per host and port, together with the
+  function used to configure them, so that later requests to the same host
+  don't have to configure them again. The multi objects, which hold the
+  cache of open connections, are kept as well, so that connections are
+  reused by later requests to the same host. All cURL objects share their
+  SSL session and DNS caches.
+
+  The pool can be used by several threads, but not across C{fork(2)}; a
+  forked child starts with an empty pool.
+
+  Connections and SSL sessions keep the certificates they were opened
+  with. Hence the pool can be given the files the cURL objects are
+  configured with, e.g. certificates; whenever one of them changes, all
+  pooled objects are closed and objects in use are closed once returned.
+
+  """
+  #: Maximum number of idle cURL objects kept per host and port
+  MAX_IDLE_PER_HOST = 4
+
+  #: Maximum number of connections kept open by a multi object
+  MAX_CONNECTIONS = 256
+
+  def __init__(self, files_fn=None, _curl=pycurl.Curl,
+               _curl_multi=pycurl.CurlMulti,
+               _curl_share=getattr(pycurl, "CurlShare", None)):
+    """Initializes this class.
+
+    @type files_fn: callable or None
+    @param files_fn: Function returning the paths of the files used to
+      configure the cURL objects, see above
+
+    """
+    self._files_fn = files_fn
+    self._curl_fn = _curl
+    self._curl_multi_fn = _curl_multi
+    self._curl_share_fn = _curl_share
+    self._lock = threading.Lock()
+    self._inherited = []
+    self._Reset()
+
+  def _Reset(self):
+    """Forgets all pooled objects.
+
+    """
+    self._pid = os.getpid()
+    self._idle = {}
+    self._multis = []
+    self._share = None
+    self._files_state = None
+    self._generation = 0
+    self._in_use = {}
+
+  def _CheckProcess(self):
+    """Forgets the objects of the parent after a fork.
+
+    The connections are shared with the parent, hence they must not be
+    used or closed by the child. The objects are kept referenced so that
+    they aren't closed when garbage collected.
+
+    """
+    if self._pid != os.getpid():
+      self._inherited.append((self._idle, self._multis, self._share))
+      self._Reset()
+
+  def _CheckFiles(self):
+    """Forgets all pooled objects if any of the configured files changed.
+
+    @rtype: list
+    @return: the forgotten objects, to be closed by the caller
+
+    """
+    if self._files_fn is None:
+      return []
+
+    state = []
+    for path in self._files_fn():
+      try:
+        st = os.stat(path)
+      except EnvironmentError:
+        state.append(None)
+      else:
+        state.append((st.st_dev, st.st_ino, st.st_size, st.st_mtime))
+
+    if self._files_state is None or self._files_state == state:
+      self._files_state = state
+      return []
+
+    logging.info("Files used by the cURL objects changed, closing all pooled"
+                 " cURL objects")
+
+    objects = [curl for idle in self._idle.values() for (curl, _) in idle]
+    objects.extend(self._multis)
+
+    # The share object is still used by the objects in use; it is closed
+    # once it's no longer referenced
+    self._idle = {}
+    self._multis = []
+    self._share = None
+    self._files_state = state
+    self._generation += 1
+
+    return objects
+
+  def _ReleaseUnlocked(self, obj):
+    """Checks whether an object being returned may be pooled again.
+
+    Objects taken out before the configured files last changed must be
+    closed instead.
+
+    """
+    return self._in_use.pop(id(obj), None) == self._generation
+
+  def _GetShare(self):
+    """Returns the share object for SSL sessions and DNS, if supported.
+
+    """
+    if self._share is None and self._curl_share_fn is not None:
+      share = self._curl_share_fn()
+      for name in ["LOCK_DATA_SSL_SESSION", "LOCK_DATA_DNS"]:
+        if hasattr(pycurl, name):
+          share.setopt(pycurl.SH_SHARE, getattr(pycurl, name))
+      self._share = share
+
+    return self._share
+
+  def StartRequest(self, req):
+    """Starts a request on a pooled cURL object.
+
+    @type req: L{HttpClientRequest}
+    @param req: HTTP request
+    @rtype: L{_PendingRequest}
+
+    """
+    self._lock.acquire()
+    try:
+      self._CheckProcess()
+
+      curl = None
+      share = None
+      idle = self._idle.get((req.host, req.port), [])
+      for (idx, (handle, config_fn)) in enumerate(idle):
+        if config_fn is req.curl_config_fn:
+          curl = handle
+          del idle[idx]
+          break
+
+      if curl is None:
+        share = self._GetShare()
+        curl = self._curl_fn()
+        configure = True
+      else:
+        configure = False
+
+      self._in_use[id(curl)] = self._generation
+    finally:
+      self._lock.release()
+
+    if share is not None:
+      curl.setopt(pycurl.SHARE, share)
+
+    return _StartRequest(curl, req, session_cache=True, configure=configure)
+
+  def ReleaseHandle(self, req, curl, reusable):
+    """Returns a cURL object after its request finished.
+
+    @type req: L{HttpClientRequest}
+    @param req: The finished request
+    @type curl: pycurl.Curl
+    @param curl: cURL object used for the request
+    @type reusable: bool
+    @param reusable: Whether the cURL object can be used again, which is
+      not the case e.g. after a connection failure
+
+    """
+    self._lock.acquire()
+    try:
+      self._CheckProcess()
+
+      if self._ReleaseUnlocked(curl) and reusable:
+        idle = self._idle.setdefault((req.host, req.port), [])
+        if len(idle) < self.MAX_IDLE_PER_HOST:
+          idle.append((curl, req.curl_config_fn))
+          return
+    finally:
+      self._lock.release()
+
+    curl.close()
+
+  def GetMulti(self):
+    """Returns a multi object for processing requests.
+
+    This is also where the pool checks whether the configured files
+    changed.
+
+    """
+    self._lock.acquire()
+    try:
+      self._CheckProcess()
+
+      stale = self._CheckFiles()
+
+      if self._multis:
+        multi = self._multis.pop()
+      else:
+        multi = None
+    finally:
+      self._lock.release()
+
+    _CloseCurlObjects(stale)
+
+    if multi is None:
+      multi = self._curl_multi_fn()
+      if hasattr(pycurl, "M_MAXCONNECTS"):
+        multi.setopt(pycurl.M_MAXCONNECTS, self.MAX_CONNECTIONS)
+
+    self._lock.acquire()
+    try:
+      self._in_use[id(multi)] = self._generation
+    finally:
+      self._lock.release()
+
+    return multi
+
+  def ReleaseMulti(self, multi, reusable=True):
+    """Returns a multi object after all its requests finished.
+
+    @type reusable: bool
+    @param reusable: Whether the multi object can be used again, which is
+      not the case if processing its requests failed
+
+    """
+    self._lock.acquire()
+    try:
+      self._CheckProcess()
+
+      if self._ReleaseUnlocked(multi) and reusable:
+        self._multis.append(multi)
+        return
+    finally:
+      self._lock.release()
+
+    multi.close()
+
+  def Clear(self):
+    """Closes all pooled objects and their connections.
+
+    """
+    self._lock.acquire()
+    try:
+      self._CheckProcess()
+      handles = [curl for idle in self._idle.values() for (curl, _) in idle]
+      multis = self._multis
+      share = self._share
+      self._Reset()
+    finally:
+      self._lock.release()
+
+    if share is not None:
+      multis.append(share)
+
+    _CloseCurlObjects(handles + multis)
+
+
+def _CloseCurlObjects(objects):
+  """Closes cURL objects, multi objects and share objects.
+
+  """
+  for obj in objects:
+    obj.close()
+
+
+def _AbortCurlRequests(multi, pending, curl_pool):
+  """Aborts the pending requests after processing them failed.
+
+  The requests are finished with an error. Their cURL objects and the
+  multi object are in an unknown state and are closed instead of being
+  used again.
+
+  @type multi: C{pycurl.CurlMulti}
+  @param multi: cURL multi object
+  @type pending: dict
+  @param pending: cURL objects mapped to their L{_PendingRequest}; it is
+    emptied
+  @type curl_pool: L{CurlPool} or None
+  @param curl_pool: Pool the cURL objects were taken from
+
+  """
+  for (curl, client) in pending.items():
+    try:
+      multi.remove_handle(curl)
+    except pycurl.error:
+      pass
+
+    client.Done("Processing of the request was aborted")
+
+    if curl_pool is None:
+      curl.close()
+    else:
+      curl_pool.ReleaseHandle(client.GetCurrentRequest(), curl, False)
+
+  pending.clear()
+
+  if curl_pool is None:
+    multi.close()
+  else:
+    curl_pool.ReleaseMulti(multi, reusable=False)
+
+
+def _ReadCurlMessages(multi):
+  """Reads the completed requests of a cURL multi object.
+
+  This generator yields a tuple for every completed request, as described for
+  L{_ProcessCurlRequests}, after removing its handle from the multi object.
+
+  @type multi: C{pycurl.CurlMulti}
+  @param multi: cURL multi object
+
+  """
+  while True:
+    (remaining_messages, successful, failed) = multi.info_read()
+
+    for curl in successful:
+      multi.remove_handle(curl)
+      yield (curl, None)
+
+    for curl, errnum, errmsg in failed:
+      multi.remove_handle(curl)
+      yield (curl, "Error %s: %s" % (errnum, errmsg))
+
+    if remaining_messages == 0:
+      break
+
+
 def _ProcessCurlRequests(multi, requests):
   """cURL request processor.
 
@@ -328,19 +670,8 @@ def _ProcessCurlRequests(multi, requests):
       # cURL wants to be called again
       continue
 
-    while True:
-      (remaining_messages, successful, failed) = multi.info_read()
-
-      for curl in successful:
-        multi.remove_handle(curl)
-        yield (curl, None)
-
-      for curl, errnum, errmsg in failed:
-        multi.remove_handle(curl)
-        yield (curl, "Error %s: %s" % (errnum, errmsg))
-
-      if remaining_messages == 0:
-        break
+    for result in _ReadCurlMessages(multi):
+      yield result
 
     if active == 0:
       # No active handles anymore
@@ -352,14 +683,17 @@ def _ProcessCurlRequests(multi, requests):
     multi.select(1.0)
 
 
-def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
-                    _curl_multi=pycurl.CurlMulti,
+def ProcessRequests(requests, lock_monitor_cb=None, curl_pool=None,
+                    _curl=pycurl.Curl, _curl_multi=pycurl.CurlMulti,
                     _curl_process=_ProcessCurlRequests):
   """Processes any number of HTTP client requests.
 
   @type requests: list of L{HttpClientRequest}
   @param requests: List of all requests
   @param lock_monitor_cb: Callable for registering with lock monitor
+  @type curl_pool: L{CurlPool} or None
+  @param curl_pool: Pool to take cURL objects from and return them to; if
+    not given, new cURL objects are used and connections are closed
 
   """
   assert compat.all((req.error is None and
@@ -369,9 +703,16 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
                     for req in requests)
 
   # Prepare all requests
+  if curl_pool is None:
+    start_fn = lambda req: _StartRequest(_curl(), req)
+    multi = _curl_multi()
+  else:
+    start_fn = curl_pool.StartRequest
+    multi = curl_pool.GetMulti()
+
   curl_to_client = \
     dict((client.GetCurlHandle(), client)
-         for client in map(lambda req: _StartRequest(_curl(), req), requests))
+         for client in map(start_fn, requests))
 
   assert len(curl_to_client) == len(requests)
 
@@ -383,15 +724,35 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
     monitor = _NoOpRequestMonitor
 
   # Process all requests and act based on the returned values
-  for (curl, msg) in _curl_process(_curl_multi(), curl_to_client.keys()):
-    monitor.acquire(shared=0)
-    try:
-      curl_to_client.pop(curl).Done(msg)
-    finally:
-      monitor.release()
+  done = False
+  try:
+    for (curl, msg) in _curl_process(multi, curl_to_client.keys()):
+      monitor.acquire(shared=0)
+      try:
+        client = curl_to_client.pop(curl)
+        client.Done(msg)
+      finally:
+        monitor.release()
+
+      if curl_pool is not None:
+        curl_pool.ReleaseHandle(client.GetCurrentRequest(), curl,
+                                msg is None)
+
+    done = True
+  finally:
+    if not done:
+      monitor.acquire(shared=0)
+      try:
+        _AbortCurlRequests(multi, curl_to_client, curl_pool)
+      finally:
+        monitor.release()
+      monitor.Disable()
 
   assert not curl_to_client, "Not all requests were processed"
 
+  if curl_pool is not None:
+    curl_pool.ReleaseMulti(multi)
+
   # Don't try to read information anymore as all requests have been processed
   monitor.Disable()
 
@@ -400,3 +761,137 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
                      req.resp_status_code is not None and
                      req.resp_body is not None)
                     for req in requests)
+
+
+class AsyncRequestProcessor(object):
+  """Processes HTTP client requests started at different times.
+
+  Unlike L{ProcessRequests}, this doesn't wait for the requests when they
+  are started. All requests are processed in a single cURL multi loop,
+  which runs while waiting for some of the requests to finish; all other
+  pending requests make progress at the same time.
+
+  Instances are not thread-safe and must not be used across C{fork(2)}.
+
+  """
+  def __init__(self, lock_monitor_cb=None, curl_pool=None,
+               _curl=pycurl.Curl, _curl_multi=pycurl.CurlMulti):
+    """Initializes this class.
+
+    @param lock_monitor_cb: Callable for registering with lock monitor
+    @type curl_pool: L{CurlPool} or None
+    @param curl_pool: Pool to take cURL objects from and return them to; if
+      not given, new cURL objects are used and connections are closed
+
+    """
+    self._curl_pool = curl_pool
+    self._curl_fn = _curl
+    self._curl_multi_fn = _curl_multi
+    self._multi = None
+    self._pending = {}
+
+    if lock_monitor_cb:
+      self._monitor = _PendingRequestMonitor(threading.currentThread(),
+                                             self._pending.values)
+      lock_monitor_cb(self._monitor)
+    else:
+      self._monitor = _NoOpRequestMonitor
+
+  def StartRequests(self, requests):
+    """Starts HTTP client requests without waiting for them.
+
+    @type requests: list of L{HttpClientRequest}
+    @param requests: List of requests
+
+    """
+    assert compat.all((req.error is None and
+                       req.success is None and
+                       req.resp_status_code is None and
+                       req.resp_body is None)
+                      for req in requests)
+
+    if not requests:
+      return
+
+    if self._multi is None:
+      if self._curl_pool is None:
+        self._multi = self._curl_multi_fn()
+      else:
+        self._multi = self._curl_pool.GetMulti()
+
+    for req in requests:
+      if self._curl_pool is None:
+        client = _StartRequest(self._curl_fn(), req)
+      else:
+        client = self._curl_pool.StartRequest(req)
+
+      curl = client.GetCurlHandle()
+
+      self._monitor.acquire(shared=0)
+      try:
+        self._pending[curl] = client
+      finally:
+        self._monitor.release()
+
+      self._multi.add_handle(curl)
+
+  def _FinishRequest(self, curl, msg):
+    """Finishes a request after cURL is done with it.
+
+    """
+    self._monitor.acquire(shared=0)
+    try:
+      client = self._pending.pop(curl)
+      client.Done(msg)
+    finally:
+      self._monitor.release()
+
+    if self._curl_pool is not None:
+      self._curl_pool.ReleaseHandle(client.GetCurrentRequest(), curl,
+                                    msg is None)
+
+  def WaitForRequests(self, requests):
+    """Processes all pending requests until the given ones finished.
+
+    @type requests: list of L{HttpClientRequest}
+    @param requests: List of requests started by L{StartRequests}
+
+    """
+    is_done_fn = lambda: compat.all(req.success is not None
+                                    for req in requests)
+
+    done = False
+    try:
+      while not is_done_fn():
+        assert self._pending, "Waiting for requests which were not started"
+
+        (ret, _) = self._multi.perform()
+        assert ret in (pycurl.E_MULTI_OK, pycurl.E_CALL_MULTI_PERFORM)
+
+        if ret == pycurl.E_CALL_MULTI_PERFORM:
+          # cURL wants to be called again
+          continue
+
+        for (curl, msg) in _ReadCurlMessages(self._multi):
+          self._FinishRequest(curl, msg)
+
+        if not is_done_fn():
+          # Wait for I/O, see L{_ProcessCurlRequests}
+          self._multi.select(1.0)
+
+      done = True
+    finally:
+      if not done and self._multi is not None:
+        # All pending requests are aborted, not only the given ones
+        self._monitor.acquire(shared=0)
+        try:
+          _AbortCurlRequests(self._multi, self._pending, self._curl_pool)
+        finally:
+          self._monitor.release()
+        self._multi = None
+
+    if not self._pending and self._multi is not None:
+      # The multi object is only kept while requests are pending
+      if self._curl_pool is not None:
+        self._curl_pool.ReleaseMulti(self._multi)
+      self._multi = None
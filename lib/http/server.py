@@ -35,16 +35,21 @@ import BaseHTTPServer
 import cgi
 import logging
 import os
+import select
 import socket
 import time
 import signal
 import asyncore
+import threading
+
+import OpenSSL
 
 from ganeti import http
 from ganeti import utils
 from ganeti import netutils
 from ganeti import compat
 from ganeti import errors
+from ganeti import workerpool
 
 
 WEEKDAYNAME = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
@@ -277,13 +282,16 @@ class HttpResponder(object):
     """
     self._handler = handler
 
-  def __call__(self, fn):
+  def __call__(self, fn, keep_alive=False):
     """Handles a request.
 
     @type fn: callable
     @param fn: Callback for retrieving HTTP request, must return a tuple
       containing request message (L{http.HttpMessage}) and C{None} or the
       message reader (L{_HttpClientToServerMessageReader})
+    @type keep_alive: bool
+    @param keep_alive: Whether the connection may be kept open for another
+      request if the client asks for it
 
     """
     response_msg = http.HttpMessage()
@@ -315,8 +323,15 @@ class HttpResponder(object):
       # Only wait for client to close if we didn't have any exception.
       force_close = False
 
+    # The body of the request must have been read completely for another
+    # request to follow on the same connection
+    keep_alive = (keep_alive and not force_close and
+                  req_msg_reader is not None and
+                  not req_msg_reader.peer_will_close and
+                  len(request_msg.body) == req_msg_reader.content_length)
+
     return (request_msg, req_msg_reader, force_close,
-            self._Finalize(self.responses, response_msg))
+            self._Finalize(self.responses, response_msg, keep_alive))
 
   @staticmethod
   def _SetError(responses, handler, response_msg, err):
@@ -356,15 +371,25 @@ class HttpResponder(object):
     response_msg.body = body
 
   @staticmethod
-  def _Finalize(responses, msg):
+  def _Finalize(responses, msg, keep_alive=False):
     assert msg.start_line.reason is None
 
     if not msg.headers:
       msg.headers = {}
 
+    if keep_alive:
+      connection = "keep-alive"
+
+      # Without a length the client would have to wait for the connection
+      # to be closed to know the end of the response
+      if msg.start_line.code not in (http.HTTP_NO_CONTENT,
+                                     http.HTTP_NOT_MODIFIED):
+        msg.headers[http.HTTP_CONTENT_LENGTH] = len(msg.body or "")
+    else:
+      connection = "close"
+
     msg.headers.update({
-      # TODO: Keep-alive is not supported
-      http.HTTP_CONNECTION: "close",
+      http.HTTP_CONNECTION: connection,
       http.HTTP_DATE: _DateTimeHeader(),
       http.HTTP_SERVER: http.HTTP_GANETI_VERSION,
       })
@@ -388,7 +413,7 @@ class HttpServerRequestExecutor(object):
   This class implements the server side of HTTP. It's based on code of
   Python's BaseHTTPServer, from both version 2.4 and 3k. It does not
   support non-ASCII character encodings. Keep-alive connections are
-  not supported.
+  supported if enabled on the server, but requests can not be pipelined.
 
   """
   # Timeouts in seconds for socket layer
@@ -396,6 +421,12 @@ class HttpServerRequestExecutor(object):
   READ_TIMEOUT = 10
   CLOSE_TIMEOUT = 1
 
+  #: How long to wait for another request on a persistent connection
+  KEEP_ALIVE_TIMEOUT = 15
+
+  #: Maximum number of requests handled on one persistent connection
+  KEEP_ALIVE_MAX_REQUESTS = 1000
+
   def __init__(self, server, handler, sock, client_addr):
     """Initializes this class.
 
@@ -424,9 +455,28 @@ class HttpServerRequestExecutor(object):
             # Ignore rest
             return
 
-        (request_msg, request_msg_reader, force_close, response_msg) = \
-          responder(compat.partial(self._ReadRequest, sock, self.READ_TIMEOUT))
-        if response_msg:
+        keep_alive = server.IsKeepAliveAllowed()
+        count = 0
+
+        while True:
+          count += 1
+
+          try:
+            (request_msg, request_msg_reader, force_close, response_msg) = \
+              responder(compat.partial(self._ReadRequest, sock,
+                                       self.READ_TIMEOUT),
+                        keep_alive=(keep_alive and
+                                    count < self.KEEP_ALIVE_MAX_REQUESTS))
+          except http.HttpIdleConnectionClosed:
+            if count == 1:
+              raise
+            # The client closed the persistent connection
+            request_msg_reader = None
+            break
+
+          if not response_msg:
+            break
+
           # HttpMessage.start_line can be of different types
           # Instance of 'HttpClientToServerStartLine' has no 'code' member
           # pylint: disable=E1103,E1101
@@ -434,6 +484,11 @@ class HttpServerRequestExecutor(object):
                        request_msg.start_line, response_msg.start_line.code)
           self._SendResponse(sock, request_msg, response_msg,
                              self.WRITE_TIMEOUT)
+
+          connection = response_msg.headers.get(http.HTTP_CONNECTION)
+          if not (connection == "keep-alive" and
+                  self._WaitForRequest(sock, self.KEEP_ALIVE_TIMEOUT)):
+            break
       finally:
         http.ShutdownConnection(sock, self.CLOSE_TIMEOUT, self.WRITE_TIMEOUT,
                                 request_msg_reader, force_close)
@@ -442,6 +497,19 @@ class HttpServerRequestExecutor(object):
     finally:
       logging.debug("Disconnected %s:%s", client_addr[0], client_addr[1])
 
+  @staticmethod
+  def _WaitForRequest(sock, timeout):
+    """Waits for the client to send another request.
+
+    @rtype: bool
+    @return: Whether data arrived before the timeout
+
+    """
+    if isinstance(sock, OpenSSL.SSL.ConnectionType) and sock.pending():
+      return True
+
+    return utils.WaitForFdCondition(sock, select.POLLIN, timeout) is not None
+
   @staticmethod
   def _ReadRequest(sock, timeout):
     """Reads a request sent by client.
@@ -471,15 +539,34 @@ class HttpServerRequestExecutor(object):
       raise http.HttpError("Error sending response: %s" % err)
 
 
+class _HttpServerWorker(workerpool.BaseWorker):
+  """Worker thread handling connections of an L{HttpServer}.
+
+  """
+  # pylint: disable=W0221
+  def RunTask(self, server, connection, client_addr):
+    """Handles a connection.
+
+    """
+    server._HandleConnectionInThread(connection, # pylint: disable=W0212
+                                     client_addr)
+
+
 class HttpServer(http.HttpBase, asyncore.dispatcher):
   """Generic HTTP server class
 
+  By default, every connection is handled by a forked child process. If a
+  number of worker threads is given, connections are instead handled by a
+  pool of threads in the server process, avoiding the cost of forking for
+  every connection. Handlers must be thread-safe in that case.
+
   """
   MAX_CHILDREN = 20
 
   def __init__(self, mainloop, local_address, port, handler,
                ssl_params=None, ssl_verify_peer=False,
-               request_executor_class=None, ssl_verify_callback=None):
+               request_executor_class=None, ssl_verify_callback=None,
+               keep_alive=False, worker_threads=None):
     """Initializes the HTTP server
 
     @type mainloop: ganeti.daemon.Mainloop
@@ -496,6 +583,12 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     @type request_executor_class: class
     @param request_executor_class: a class derived from the
         HttpServerRequestExecutor class
+    @type keep_alive: bool
+    @param keep_alive: Whether to keep connections open for further requests
+        if the client asks for it
+    @type worker_threads: int or None
+    @param worker_threads: Number of threads handling connections, or
+        C{None} to fork a child process for every connection
 
     """
     http.HttpBase.__init__(self)
@@ -510,6 +603,8 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     self.local_address = local_address
     self.port = port
     self.handler = handler
+    self.keep_alive = keep_alive
+    self.worker_threads = worker_threads
     family = netutils.IPAddress.GetAddressFamily(local_address)
     self.socket = self._CreateSocket(ssl_params, ssl_verify_peer, family,
                                      ssl_verify_callback)
@@ -518,6 +613,9 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
     self._children = []
+    self._workers = None
+    self._active_lock = threading.Lock()
+    self._active_connections = 0
     self.set_socket(self.socket)
     self.accepting = True
     mainloop.RegisterSignal(self)
@@ -526,12 +624,41 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     self.socket.bind((self.local_address, self.port))
     self.socket.listen(1024)
 
+    if self.worker_threads is not None:
+      self._workers = workerpool.WorkerPool("HttpServer", self.worker_threads,
+                                            _HttpServerWorker)
+
   def Stop(self):
     self.socket.close()
 
+    if self._workers is not None:
+      self._workers.TerminateWorkers()
+      self._workers = None
+
   def handle_accept(self):
     self._IncomingConnection()
 
+  def IsKeepAliveAllowed(self):
+    """Whether the connection being handled may be kept open.
+
+    Every connection is handled by a child process, which is kept for as
+    long as the connection is open. Persistent connections are therefore
+    only allowed while less than half of the children are in use, so that
+    idle connections don't make new connections wait.
+
+    In the threaded mode, persistent connections are likewise only allowed
+    while less than half of the worker threads are in use.
+
+    """
+    if not self.keep_alive:
+      return False
+
+    if self.worker_threads is None:
+      return len(self._children) < self.MAX_CHILDREN / 2
+
+    # The connection being handled is counted as well
+    return self._active_connections <= self.worker_threads / 2
+
   def OnSignal(self, signum):
     if signum == signal.SIGCHLD:
       self._CollectChildren(True)
@@ -572,6 +699,10 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     # pylint: disable=W0212
     (connection, client_addr) = self.socket.accept()
 
+    if self._workers is not None:
+      self._workers.AddTask((self, connection, client_addr))
+      return
+
     self._CollectChildren(False)
 
     pid = os.fork()
@@ -600,6 +731,33 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     else:
       self._children.append(pid)
 
+  def _HandleConnectionInThread(self, connection, client_addr):
+    """Handles a connection in a worker thread.
+
+    """
+    self._active_lock.acquire()
+    try:
+      self._active_connections += 1
+    finally:
+      self._active_lock.release()
+
+    try:
+      try:
+        self.request_executor(self, self.handler, connection, client_addr)
+      except Exception: # pylint: disable=W0703
+        logging.exception("Error while handling request from %s:%s",
+                          client_addr[0], client_addr[1])
+    finally:
+      # Unlike a child process, the thread doesn't close the connection on
+      # exit
+      connection.close()
+
+      self._active_lock.acquire()
+      try:
+        self._active_connections -= 1
+      finally:
+        self._active_lock.release()
+
 
 class HttpServerHandler(object):
   """Base class for handling HTTP server requests.
@@ -79,6 +79,18 @@ from ganeti.cmdlib import cluster
 
 JOBQUEUE_THREADS = 1
 
+#: Number of journal entries after which a job file is rewritten in full
+#: even if the job isn't finalized yet, to bound the replay effort
+_JOURNAL_MAX_ENTRIES = 1024
+
+#: Time (in seconds) during which changes to job queue files are collected
+#: before they are replicated to the master candidates in one batch
+_REPLICATION_DELAY = 0.2
+
+#: Interval (in seconds) at which the job queue replication counters are
+#: logged while changes are being replicated
+_REPLICATION_STATS_INTERVAL = 60.0
+
 # member lock names to be passed to @ssynchronized decorator
 _LOCK = "_lock"
 _QUEUE = "_queue"
@@ -203,13 +215,18 @@ class _QueuedJob(object):
   @ivar start_timestmap: the timestamp for start of execution
   @ivar end_timestamp: the timestamp for end of execution
   @ivar writable: Whether the job is allowed to be modified
+  @type replication: dict or None
+  @ivar replication: the replication counters of the job process when the
+      job was finalized, see L{_JobQueueReplicator.GetStatistics}
+  @type journal: L{_JobJournal} or None
+  @ivar journal: the changes since the job file was last written in full
 
   """
   # pylint: disable=W0212
   __slots__ = ["queue", "id", "ops", "log_serial", "ops_iter", "cur_opctx",
                "received_timestamp", "start_timestamp", "end_timestamp",
                "processor_lock", "writable", "archived",
-               "livelock", "process_id",
+               "livelock", "process_id", "replication", "journal",
                "__weakref__"]
 
   def AddReasons(self, pickup=False):
@@ -261,6 +278,7 @@ class _QueuedJob(object):
     self.archived = False
     self.livelock = None
     self.process_id = None
+    self.replication = None
 
     self._InitInMemory(self, writable)
 
@@ -274,6 +292,7 @@ class _QueuedJob(object):
     obj.writable = writable
     obj.ops_iter = None
     obj.cur_opctx = None
+    obj.journal = None
 
     # Read-only jobs are not processed and therefore don't need a lock
     if writable:
@@ -315,6 +334,7 @@ class _QueuedJob(object):
     obj.process_id = state.get("process_id", None)
     if obj.process_id is not None:
       obj.process_id = int(obj.process_id)
+    obj.replication = state.get("replication", None)
 
     obj.ops = []
     obj.log_serial = 0
@@ -328,75 +348,45 @@ class _QueuedJob(object):
 
     return obj
 
-  def Serialize(self):
-    """Serialize the _JobQueue instance.
+  def SerializeFields(self):
+    """Serialize the job-level fields, i.e. everything but the opcodes.
 
     @rtype: dict
-    @return: the serialized state
+    @return: the serialized fields
 
     """
     return {
       "id": self.id,
-      "ops": [op.Serialize() for op in self.ops],
       "start_timestamp": self.start_timestamp,
       "end_timestamp": self.end_timestamp,
       "received_timestamp": self.received_timestamp,
       "livelock": self.livelock,
       "process_id": self.process_id,
+      "replication": self.replication,
       }
 
-  def CalcStatus(self):
-    """Compute the status of this job.
+  def Serialize(self):
+    """Serialize the _JobQueue instance.
 
-    This function iterates over all the _QueuedOpCodes in the job and
-    based on their status, computes the job status.
+    @rtype: dict
+    @return: the serialized state
 
-    The algorithm is:
-      - if we find a cancelled, or finished with error, the job
-        status will be the same
-      - otherwise, the last opcode with the status one of:
-          - waitlock
-          - canceling
-          - running
+    """
+    state = self.SerializeFields()
+    state["ops"] = [op.Serialize() for op in self.ops]
+    return state
 
-        will determine the job status
+  def CalcStatus(self):
+    """Compute the status of this job.
 
-      - otherwise, it means either all opcodes are queued, or success,
-        and the job status will be the same
+    This function iterates over all the _QueuedOpCodes in the job and
+    based on their status, computes the job status, see
+    L{jstore.CalcJobStatus}.
 
     @return: the job status
 
     """
-    status = constants.JOB_STATUS_QUEUED
-
-    all_success = True
-    for op in self.ops:
-      if op.status == constants.OP_STATUS_SUCCESS:
-        continue
-
-      all_success = False
-
-      if op.status == constants.OP_STATUS_QUEUED:
-        pass
-      elif op.status == constants.OP_STATUS_WAITING:
-        status = constants.JOB_STATUS_WAITING
-      elif op.status == constants.OP_STATUS_RUNNING:
-        status = constants.JOB_STATUS_RUNNING
-      elif op.status == constants.OP_STATUS_CANCELING:
-        status = constants.JOB_STATUS_CANCELING
-        break
-      elif op.status == constants.OP_STATUS_ERROR:
-        status = constants.JOB_STATUS_ERROR
-        # The whole job fails if one opcode failed
-        break
-      elif op.status == constants.OP_STATUS_CANCELED:
-        status = constants.OP_STATUS_CANCELED
-        break
-
-    if all_success:
-      status = constants.JOB_STATUS_SUCCESS
-
-    return status
+    return jstore.CalcJobStatus([op.status for op in self.ops])
 
   def CalcPriority(self):
     """Gets the current priority for this job.
@@ -552,6 +542,165 @@ class _QueuedJob(object):
       logging.warning("Can set pid only for queued/waiting jobs")
 
 
+def _JobFingerprint(data):
+  """Computes the fingerprint of a job file's contents.
+
+  The fingerprint ties a journal to the job file it was started for.
+
+  @type data: str
+  @param data: the contents of the job file
+  @rtype: str
+
+  """
+  return utils.Sha1Hmac("", data)
+
+
+def _ApplyJobJournal(state, base, journal):
+  """Applies a job journal to the serialized state of a job.
+
+  Journals started for a different version of the job file, e.g. when
+  the job file was rewritten in full but the journal couldn't be
+  removed afterwards, are ignored. So are journals without a header,
+  which are logged, and an incomplete last entry.
+
+  @type state: dict
+  @param state: the serialized job, as read from the job file; it is
+      modified in place
+  @type base: str
+  @param base: the contents of the job file
+  @type journal: str
+  @param journal: the contents of the journal file
+  @rtype: dict
+  @return: the updated serialized job
+
+  """
+  lines = journal.split("\n")[:-1]
+  if not lines:
+    return state
+
+  header = serializer.LoadJson(lines[0])
+  if "base" not in header:
+    logging.warning("Ignoring journal without header for job %s", state["id"])
+    return state
+
+  if header.get("base") != _JobFingerprint(base):
+    logging.debug("Ignoring stale journal for job %s", state["id"])
+    return state
+
+  for line in lines[1:]:
+    entry = serializer.LoadJson(line)
+    state.update(entry.get("job", {}))
+    for (idx, fields) in entry.get("ops", []):
+      state["ops"][idx].update(fields)
+    for (idx, log_entries) in entry.get("log", []):
+      state["ops"][idx]["log"].extend(log_entries)
+
+  return state
+
+
+class _JobJournal(object):
+  """Changes made to a job since its file was last written in full.
+
+  Rewriting the whole job file on every update makes jobs with many
+  log messages quadratic in the amount of data written. Instead, the
+  changes are appended to a journal next to the job file, which is only
+  compacted into the job file when the job is finalized. The journal of
+  a running job always exists, so that it can be watched. The first line
+  of a journal contains the fingerprint of the job file it applies to,
+  every further line is one entry with the changed job fields
+  (C{job}), the changed opcodes (C{ops}) and the new log entries
+  (C{log}), the latter two indexed by the position of the opcode.
+
+  @type header: str
+  @ivar header: the first line of the journal
+  @type entries: int
+  @ivar entries: the number of entries in the local journal
+  @type pending: list of strings
+  @ivar pending: journal data not yet replicated to the master candidates,
+      only kept if they got the job file
+  @type replicated: bool
+  @ivar replicated: whether the master candidates got the job file this
+      journal applies to
+
+  """
+  def __init__(self, job, data, replicated):
+    """Initializes this class.
+
+    @type job: L{_QueuedJob}
+    @param job: the job
+    @type data: str
+    @param data: the job file just written for the job
+    @type replicated: bool
+    @param replicated: whether the job file was replicated
+
+    """
+    self.entries = 0
+    self.pending = []
+    self.replicated = replicated
+    self.header = serializer.DumpJson({"base": _JobFingerprint(data)})
+    self._fields = serializer.DumpJson(job.SerializeFields())
+    self._ops = [(self._EncodeOp(op.Serialize()), len(op.log))
+                 for op in job.ops]
+
+  @staticmethod
+  def _EncodeOp(state):
+    """Encodes an opcode's serialized state, except for its log.
+
+    """
+    return serializer.DumpJson(dict((key, value)
+                                    for (key, value) in state.items()
+                                    if key != "log"))
+
+  def Update(self, job):
+    """Records the changes made to the job since the last update.
+
+    @type job: L{_QueuedJob}
+    @param job: the job
+    @rtype: str or None
+    @return: the data to be appended to the journal, or C{None} if
+        nothing changed
+
+    """
+    assert len(job.ops) == len(self._ops)
+
+    entry = {}
+
+    fields = job.SerializeFields()
+    encoded = serializer.DumpJson(fields)
+    if encoded != self._fields:
+      entry["job"] = fields
+      self._fields = encoded
+
+    changed_ops = []
+    new_log = []
+    for (idx, op) in enumerate(job.ops):
+      (old_encoded, old_log_len) = self._ops[idx]
+      state = op.Serialize()
+      encoded = self._EncodeOp(state)
+      if encoded != old_encoded:
+        del state["log"]
+        changed_ops.append((idx, state))
+      if len(op.log) > old_log_len:
+        new_log.append((idx, op.log[old_log_len:]))
+      self._ops[idx] = (encoded, len(op.log))
+
+    if changed_ops:
+      entry["ops"] = changed_ops
+    if new_log:
+      entry["log"] = new_log
+
+    if not entry:
+      return None
+
+    data = serializer.DumpJson(entry)
+
+    self.entries += 1
+    if self.replicated:
+      self.pending.append(data)
+
+    return data
+
+
 class _OpExecCallbacks(mcpu.OpExecCbBase):
 
   def __init__(self, queue, job, op):
@@ -1380,6 +1529,238 @@ class _JobDependencyManager:
       self._enqueue_fn(jobs)
 
 
+def _CoalesceReplication(old, new):
+  """Combines two consecutive changes to the same job queue file.
+
+  @type old: tuple; (string, string or None)
+  @param old: the pending change, as C{(operation, content)}
+  @type new: tuple; (string, string or None)
+  @param new: the following change
+  @rtype: tuple; (string, string or None)
+  @return: a single change with the same effect as both
+
+  """
+  (old_op, old_content) = old
+  (new_op, new_content) = new
+
+  if new_op != constants.JQ_REPL_APPEND:
+    # Updates and removals replace whatever was there before
+    return new
+  elif old_op == constants.JQ_REPL_REMOVE:
+    return (constants.JQ_REPL_UPDATE, new_content)
+  else:
+    return (old_op, old_content + new_content)
+
+
+class _JobQueueReplicator(object):
+  """Replicates changes of job queue files to the master candidates.
+
+  Changes are collected for a short time by a background thread and then
+  sent as one batch, combining all changes to the same file into one.
+  Changes which must be durable before continuing are sent
+  synchronously using L{Flush}. The replication counters are logged
+  regularly while batches are being sent and recorded in the job when it
+  is finalized, see L{GetStatistics}.
+
+  """
+  def __init__(self, send_fn, delay=_REPLICATION_DELAY,
+               stats_interval=_REPLICATION_STATS_INTERVAL,
+               _time_fn=time.time):
+    """Initializes this class.
+
+    @type send_fn: callable
+    @param send_fn: function sending a batch of changes, receiving a list
+        of C{(operation, file_name, content)} tuples
+    @type delay: float
+    @param delay: time during which changes are collected
+    @type stats_interval: float
+    @param stats_interval: minimum time between two logs of the replication
+        counters
+
+    """
+    self._send_fn = send_fn
+    self._delay = delay
+    self._stats_interval = stats_interval
+    self._time_fn = _time_fn
+
+    self._lock = threading.Lock()
+    self._cond = threading.Condition(self._lock)
+    # Batches must be sent in order
+    self._send_lock = threading.Lock()
+
+    # File names in order of their first pending change
+    self._order = []
+    # File name to (operation, content, time of first pending change)
+    self._pending = {}
+
+    self._thread = None
+    self._stopped = False
+
+    self._stats = {
+      "changes": 0,
+      "coalesced": 0,
+      "batches": 0,
+      "files": 0,
+      "max_batch_size": 0,
+      "total_lag": 0.0,
+      "max_lag": 0.0,
+      }
+    self._stats_logged = _time_fn()
+
+  def Add(self, operation, file_name, content=None):
+    """Queues a change for replication.
+
+    @type operation: string
+    @param operation: one of L{constants.JQ_REPL_ALL}
+    @type file_name: string
+    @param file_name: the path of the file
+    @type content: string or None
+    @param content: the new contents or the data to append
+
+    """
+    assert operation in constants.JQ_REPL_ALL
+
+    self._lock.acquire()
+    try:
+      self._stats["changes"] += 1
+
+      pending = self._pending.get(file_name, None)
+      if pending is None:
+        self._order.append(file_name)
+        queued = self._time_fn()
+      else:
+        self._stats["coalesced"] += 1
+        (old_op, old_content, queued) = pending
+        (operation, content) = _CoalesceReplication((old_op, old_content),
+                                                    (operation, content))
+
+      self._pending[file_name] = (operation, content, queued)
+
+      if self._thread is None and not self._stopped:
+        self._thread = threading.Thread(target=self._Run,
+                                        name="JobQueueReplicator")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+      self._cond.notify()
+    finally:
+      self._lock.release()
+
+  def _Run(self):
+    """Background thread sending batches.
+
+    """
+    while True:
+      self._lock.acquire()
+      try:
+        while not (self._order or self._stopped):
+          self._cond.wait()
+
+        if self._stopped:
+          return
+      finally:
+        self._lock.release()
+
+      # Give further changes a chance to join the batch
+      time.sleep(self._delay)
+
+      try:
+        self.Flush()
+      except Exception: # pylint: disable=W0703
+        logging.exception("Error while replicating the job queue")
+
+  def Flush(self):
+    """Sends all pending changes and waits for them to be replicated.
+
+    """
+    self._send_lock.acquire()
+    try:
+      self._lock.acquire()
+      try:
+        batch = [(name, ) + self._pending[name] for name in self._order]
+        self._order = []
+        self._pending = {}
+      finally:
+        self._lock.release()
+
+      if not batch:
+        return
+
+      now = self._time_fn()
+      lags = [now - queued for (_, _, _, queued) in batch]
+
+      self._lock.acquire()
+      try:
+        self._stats["batches"] += 1
+        self._stats["files"] += len(batch)
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"],
+                                            len(batch))
+        self._stats["total_lag"] += sum(lags)
+        self._stats["max_lag"] = max(self._stats["max_lag"], max(lags))
+        if now - self._stats_logged >= self._stats_interval:
+          self._stats_logged = now
+          stats = self._stats.copy()
+        else:
+          stats = None
+      finally:
+        self._lock.release()
+
+      logging.debug("Replicating %s job queue file(s), delayed by up to"
+                    " %.3f seconds", len(batch), max(lags))
+      self._send_fn([(operation, name, content)
+                     for (name, operation, content, _) in batch])
+    finally:
+      self._send_lock.release()
+
+    if stats is not None:
+      self._LogStatistics(stats)
+
+  @staticmethod
+  def _LogStatistics(stats):
+    """Logs the replication counters.
+
+    @type stats: dict
+    @param stats: the counters, see L{GetStatistics}
+
+    """
+    logging.info("Job queue replication statistics: %s", stats)
+
+  def Stop(self):
+    """Sends all pending changes and stops the background thread.
+
+    """
+    self._lock.acquire()
+    try:
+      self._stopped = True
+      self._cond.notify()
+      thread = self._thread
+    finally:
+      self._lock.release()
+
+    if thread is not None:
+      thread.join()
+
+    self.Flush()
+
+  def GetStatistics(self):
+    """Returns the replication counters.
+
+    @rtype: dict
+    @return: the number of queued changes (C{changes}), how many of them
+        were combined with an already pending change (C{coalesced}), the
+        number of batches sent (C{batches}), the number of files in all
+        batches (C{files}), the largest batch (C{max_batch_size}) and the
+        total and maximum time in seconds by which the replication of a
+        file was delayed (C{total_lag}, C{max_lag})
+
+    """
+    self._lock.acquire()
+    try:
+      return self._stats.copy()
+    finally:
+      self._lock.release()
+
+
 class JobQueue(object):
   """Queue used to manage the jobs.
 
@@ -1431,6 +1812,8 @@ class JobQueue(object):
     self._UpdateQueueSizeUnlocked()
     assert ht.TInt(self._queue_size)
 
+    self._replicator = _JobQueueReplicator(self._ReplicateChanges)
+
     # Job dependencies
     self.depmgr = _JobDependencyManager(self._GetJobStatusForDependencies,
                                         self._EnqueueJobs)
@@ -1517,7 +1900,12 @@ class JobQueue(object):
       return
 
     # Upload the whole queue excluding archived jobs
-    files = [self._GetJobPath(job_id) for job_id in self._GetJobIDsUnlocked()]
+    files = []
+    for job_id in self._GetJobIDsUnlocked():
+      files.append(self._GetJobPath(job_id))
+      journal = self._GetJobJournalPath(job_id)
+      if os.path.exists(journal):
+        files.append(journal)
 
     # Upload current serial file
     files.append(pathutils.JOB_QUEUE_SERIAL_FILE)
@@ -1618,9 +2006,74 @@ class JobQueue(object):
                     mode=constants.JOB_QUEUE_FILES_PERMS)
 
     if replicate:
-      names, addrs = self._GetNodeIp()
-      result = _CallJqUpdate(self._GetRpc(addrs), names, file_name, data)
-      self._CheckRpcResult(result, self._nodes, "Updating %s" % file_name)
+      self._replicator.Add(constants.JQ_REPL_UPDATE, file_name, data)
+
+  def _AppendJobQueueFile(self, file_name, data, replicate_data):
+    """Appends to a file locally and on all other nodes.
+
+    @type file_name: str
+    @param file_name: the path of the file
+    @type data: str or None
+    @param data: the data to append locally
+    @type replicate_data: str or None
+    @param replicate_data: the data to append on the remote nodes; this
+        differs from C{data} if earlier appends haven't been replicated
+    @raise EnvironmentError: with C{ENOENT} if the file doesn't exist
+        locally, e.g. because it was removed concurrently
+
+    """
+    if data:
+      getents = runtime.GetEnts()
+      utils.AppendFile(file_name, data, uid=getents.masterd_uid,
+                       gid=getents.daemons_gid,
+                       mode=constants.JOB_QUEUE_FILES_PERMS, create=False)
+
+    if replicate_data:
+      self._replicator.Add(constants.JQ_REPL_APPEND, file_name, replicate_data)
+
+  def _RemoveJobQueueFile(self, file_name, replicate):
+    """Removes a file locally and then on all other nodes.
+
+    Non-existing files are ignored.
+
+    @type file_name: str
+    @param file_name: the path of the file to be removed
+    @type replicate: boolean
+    @param replicate: whether to remove the file on the remote nodes
+
+    """
+    utils.RemoveLockedFile(file_name)
+
+    if replicate:
+      self._replicator.Add(constants.JQ_REPL_REMOVE, file_name)
+
+  def _ReplicateChanges(self, updates):
+    """Sends a batch of changes to job queue files to all other nodes.
+
+    @type updates: list of tuples
+    @param updates: the changes as C{(operation, file_name, content)}
+
+    """
+    updates = [(operation, vcluster.MakeVirtualPath(file_name), content)
+               for (operation, file_name, content) in updates]
+
+    # The set of nodes can change while a batch is being sent
+    nodes = self._nodes.items()
+    names = [name for (name, _) in nodes]
+    addrs = [addr for (_, addr) in nodes]
+
+    result = self._GetRpc(addrs).call_jobqueue_update_batch(names, updates)
+    self._CheckRpcResult(result, names,
+                         "Replicating %s job queue file(s)" % len(updates))
+
+  def GetReplicationStatistics(self):
+    """Returns the counters of the job queue replication.
+
+    @rtype: dict
+    @see: L{_JobQueueReplicator.GetStatistics}
+
+    """
+    return self._replicator.GetStatistics()
 
   def _RenameFilesUnlocked(self, rename):
     """Renames a file locally and then replicate the change.
@@ -1632,6 +2085,9 @@ class JobQueue(object):
     @param rename: List containing tuples mapping old to new names
 
     """
+    # Pending changes must arrive before the files are renamed
+    self._replicator.Flush()
+
     # Rename them locally
     for old, new in rename:
       utils.RenameFile(old, new, mkdir=True)
@@ -1653,6 +2109,18 @@ class JobQueue(object):
     """
     return utils.PathJoin(pathutils.QUEUE_DIR, "job-%s" % job_id)
 
+  @classmethod
+  def _GetJobJournalPath(cls, job_id):
+    """Returns the journal file for a given job id.
+
+    @type job_id: str
+    @param job_id: the job identifier
+    @rtype: str
+    @return: the path to the journal file, see L{_JobJournal}
+
+    """
+    return cls._GetJobPath(job_id) + constants.JOB_JOURNAL_SUFFIX
+
   @staticmethod
   def _GetArchivedJobPath(job_id):
     """Returns the archived job file for a give job id.
@@ -1702,10 +2170,15 @@ class JobQueue(object):
     jlist = []
 
     for path in cls._DetermineJobDirectories(archived):
+      dir_jids = set()
       for filename in utils.ListVisibleFiles(path):
         m = constants.JOB_FILE_RE.match(filename)
         if m:
-          jlist.append(int(m.group(1)))
+          dir_jids.add(int(m.group(1)))
+      if path != pathutils.QUEUE_DIR:
+        # Archived jobs may have been packed, see L{jstore.PackArchive}
+        dir_jids.update(entry[0] for entry in jstore.ReadPackedIndex(path))
+      jlist.extend(dir_jids)
 
     if sort:
       jlist.sort()
@@ -1786,6 +2259,10 @@ class JobQueue(object):
       else:
         break
 
+    if not raw_data and try_archived:
+      logging.debug("Looking for job %s in the packed archive", job_id)
+      raw_data = jstore.ReadPackedJob(job_id)
+
     if not raw_data:
       logging.debug("No data available for job %s", job_id)
       if int(job_id) == self.primary_jid:
@@ -1802,8 +2279,18 @@ class JobQueue(object):
     if writable is None:
       writable = not archived
 
+    raw_journal = None
+    if not archived:
+      try:
+        raw_journal = utils.ReadFile(self._GetJobJournalPath(job_id))
+      except EnvironmentError, err:
+        if err.errno != errno.ENOENT:
+          raise
+
     try:
       data = serializer.LoadJson(raw_data)
+      if raw_journal:
+        data = _ApplyJobJournal(data, raw_data, raw_journal)
       job = _QueuedJob.Restore(self, data, writable, archived)
     except Exception, err: # pylint: disable=W0703
       raise errors.JobFileCorrupted(err)
@@ -1931,7 +2418,9 @@ class JobQueue(object):
 
     After a job has been modified, this function needs to be called in
     order to write the changes to disk and replicate them to the other
-    nodes.
+    nodes. Changes to unfinished jobs are appended to the job's journal
+    (see L{_JobJournal}); the job file is rewritten when the job is
+    finalized.
 
     @type job: L{_QueuedJob}
     @param job: the changed job
@@ -1945,10 +2434,52 @@ class JobQueue(object):
       assert job.writable, "Can't update read-only job"
       assert not job.archived, "Can't update archived job"
 
-    filename = self._GetJobPath(job.id)
-    data = serializer.DumpJson(job.Serialize())
-    logging.debug("Writing job %s to %s", job.id, filename)
-    self._UpdateJobQueueFile(filename, data, replicate)
+    journal = job.journal
+    journal_path = self._GetJobJournalPath(job.id)
+
+    if (journal is None or
+        (replicate and not journal.replicated) or
+        journal.entries >= _JOURNAL_MAX_ENTRIES or
+        job.CalcStatus() in constants.JOBS_FINALIZED):
+      # Compact the changes into the job file
+      filename = self._GetJobPath(job.id)
+      if job.CalcStatus() in constants.JOBS_FINALIZED:
+        job.replication = self.GetReplicationStatistics()
+      data = serializer.DumpJson(job.Serialize())
+      logging.debug("Writing job %s to %s", job.id, filename)
+      self._UpdateJobQueueFile(filename, data, replicate)
+      if job.CalcStatus() in constants.JOBS_FINALIZED:
+        self._RemoveJobQueueFile(journal_path, replicate)
+        job.journal = None
+        # The final state must be replicated before the job is reported
+        # to be done
+        if replicate:
+          self._replicator.Flush()
+      else:
+        job.journal = _JobJournal(job, data, replicate)
+        self._UpdateJobQueueFile(journal_path, job.journal.header, replicate)
+      return
+
+    data = journal.Update(job)
+    if replicate:
+      replicate_data = "".join(journal.pending)
+      journal.pending = []
+    else:
+      replicate_data = None
+
+    if data or replicate_data:
+      logging.debug("Appending changes of job %s to %s", job.id, journal_path)
+      try:
+        self._AppendJobQueueFile(journal_path, data, replicate_data)
+      except EnvironmentError, err:
+        if err.errno != errno.ENOENT:
+          raise
+        # The journal was removed, e.g. by luxid rewriting the job file; as
+        # the job file contains all changes, write it in full instead
+        logging.warning("Journal of job %s was removed, writing the job"
+                        " file instead", job.id)
+        job.journal = None
+        self.UpdateJobUnlocked(job, replicate=replicate)
 
   def HasJobBeenFinalized(self, job_id):
     """Checks if a job has been finalized.
@@ -2071,6 +2602,11 @@ class JobQueue(object):
     # TODO: What if 1..n files fail to rename?
     self._RenameFilesUnlocked(rename_files)
 
+    # Journals of finalized jobs should have been removed already; remote
+    # nodes remove them when renaming the job files
+    for job in archive_jobs:
+      utils.RemoveLockedFile(self._GetJobJournalPath(job.id))
+
     logging.debug("Successfully archived job(s) %s",
                   utils.CommaJoin(job.id for job in archive_jobs))
 
@@ -2163,3 +2699,7 @@ class JobQueue(object):
 
     """
     self._wpool.TerminateWorkers()
+
+    self._replicator.Stop()
+    logging.info("Job queue replication statistics: %s",
+                 self.GetReplicationStatistics())
@@ -32,12 +32,21 @@
 
 The complete protocol of initializing a job is described in the haskell
 module Ganeti.Query.Exec
+
+When started with C{--zygote}, the module instead runs a job zygote: a
+long-lived process that has all the modules needed for executing jobs
+already loaded and forks a new job process for every connection to its
+socket.
 """
 
 import contextlib
+import errno
 import logging
 import os
+import random
+import select
 import signal
+import socket
 import sys
 import time
 
@@ -46,8 +55,19 @@ from ganeti.server import masterd
 from ganeti.rpc import transport
 from ganeti import utils
 from ganeti import pathutils
+from ganeti import wconfd
 from ganeti.utils import livelock
 
+import ganeti.rpc.node as rpc
+
+# Not used directly, but loaded in advance for the job processes forked by
+# the zygote
+from ganeti import hypervisor # pylint: disable=W0611
+
+
+#: Number of connections the zygote's socket queues up
+_ZYGOTE_BACKLOG = 128
+
 
 def _GetMasterInfo():
   """Retrieves the job id and lock file name from the master process
@@ -66,15 +86,38 @@ def _GetMasterInfo():
   return (job_id, livelock_name)
 
 
-def main():
+def _ZygoteHandshake():
+  """Registers a job process forked by the zygote with the master process.
 
-  debug = int(os.environ["GNT_DEBUG"])
+  This replaces what the forked Haskell process does in the regular case:
+  the job process receives its job id, locks a livelock file and sends
+  its process id and the name of the livelock file to the master process.
 
-  logname = pathutils.GetLogFilename("jobs")
-  utils.SetupLogging(logname, "job-startup", debug=debug)
+  @return: the livelock, which must be kept open while the job runs
+
+  """
+  with contextlib.closing(transport.FdTransport((os.dup(0),
+                                                 os.dup(1)))) as trans:
+    job_id = int(trans.Recv())
+    lock = livelock.LiveLock("job_%06d" % job_id)
+    try:
+      trans.Send(str(os.getpid()))
+      trans.Send(lock.GetPath())
+      # Wait for the master process to record the livelock in the job
+      trans.Recv()
+    except:
+      lock.close()
+      raise
+  return lock
 
-  (job_id, livelock_name) = _GetMasterInfo()
 
+def _RunJob(job_id, livelock_name, logname, debug):
+  """Executes a job in the current process.
+
+  @rtype: int
+  @return: the exit code for the process
+
+  """
   utils.SetupLogging(logname, "job-%s" % (job_id,), debug=debug)
 
   exit_code = 1
@@ -95,8 +138,9 @@ def main():
     def _HupHandler(signum, _frame):
       logging.debug("Received signal %d, old flag was %s, will set to True",
                     signum, mcpu.sighupReceived)
-      mcpu.sighupReceived[0] = True
+      mcpu.NotifyLockWaiters()
     signal.signal(signal.SIGHUP, _HupHandler)
+    wconfd.EnableLockNotifications()
 
     def _User1Handler(signum, _frame):
       logging.info("Received signal %d, indicating priority change", signum)
@@ -141,10 +185,148 @@ def main():
     logging.exception("Exception when trying to run job %d", job_id)
   finally:
     logging.debug("Job %d finalized", job_id)
+    for (method, stats) in sorted(wconfd.GetClientStatistics().items()):
+      logging.info("WConfD call %s: %d calls, %.3fs total, histogram %s",
+                   method, stats["count"], stats["total_time"],
+                   stats["histogram"])
+    for (procedure, stats) in sorted(rpc.GetEncodingStatistics().items()):
+      logging.info("RPC encoding of %s: %d calls to %d nodes, %d bodies"
+                   " encoded, %.3fs total, %d bytes saved", procedure,
+                   stats["calls"], stats["nodes"], stats["encoded"],
+                   stats["total_time"], stats["bytes_saved"])
     logging.debug("Removing livelock file %s", livelock_name.GetPath())
     os.remove(livelock_name.GetPath())
 
-  sys.exit(exit_code)
+  return exit_code
+
+
+def _RunForkedJob(conn, logname, debug):
+  """Runs a job in a process forked by the zygote.
+
+  @type conn: socket.socket
+  @param conn: the connection from the master process
+
+  """
+  # Undo the zygote's settings; job processes wait for their children
+  signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+  random.seed()
+
+  os.dup2(conn.fileno(), 0)
+  os.dup2(conn.fileno(), 1)
+  conn.close()
+
+  utils.SetupLogging(logname, "job-startup", debug=debug)
+
+  lock = _ZygoteHandshake()
+  try:
+    (job_id, livelock_name) = _GetMasterInfo()
+    # Like for job processes started directly, show the job ID in the
+    # command line when listing processes
+    utils.SetProcessTitle("%s %s" % (sys.argv[0], job_id))
+    return _RunJob(job_id, livelock_name, logname, debug)
+  finally:
+    lock.lockfile.close()
+
+
+def _ReapChildren(_signum, _frame):
+  """Waits for all job processes of the zygote which have exited.
+
+  """
+  while True:
+    try:
+      (pid, status) = os.waitpid(-1, os.WNOHANG)
+    except OSError, err:
+      if err.errno == errno.ECHILD:
+        break
+      raise
+
+    if pid == 0:
+      break
+
+    logging.debug("Job process %s exited with status %s", pid, status)
+
+
+def _RunZygote(socket_path, logname, debug):
+  """Runs the job zygote.
+
+  The zygote forks a job process for every connection to its socket. It
+  exits once its standard input is closed, i.e., when the master process
+  is gone.
+
+  @type socket_path: str
+  @param socket_path: the path of the socket to listen on
+
+  """
+  utils.SetupLogging(logname, "job-zygote", debug=debug)
+
+  # The master process can't wait for the forked job processes, as they
+  # aren't its children
+  signal.signal(signal.SIGCHLD, _ReapChildren)
+
+  utils.RemoveFile(socket_path)
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    # Create the socket accessible by the owner only; changing its mode after
+    # binding would leave a window in which others could connect
+    old_umask = os.umask(077)
+    try:
+      sock.bind(socket_path)
+    finally:
+      os.umask(old_umask)
+    sock.listen(_ZYGOTE_BACKLOG)
+    logging.info("Job zygote listening on %s", socket_path)
+
+    while True:
+      try:
+        (readable, _, _) = select.select([0, sock], [], [])
+      except select.error, err:
+        if err.args[0] == errno.EINTR:
+          continue
+        raise
+
+      if 0 in readable and not utils.RetryOnSignal(os.read, 0, 4096):
+        logging.info("Master process is gone, stopping the job zygote")
+        break
+
+      if sock in readable:
+        try:
+          (conn, _) = sock.accept()
+        except socket.error, err:
+          if err.args[0] == errno.EINTR:
+            continue
+          raise
+        pid = os.fork()
+        if pid == 0:
+          sock.close()
+          exit_code = 1
+          try:
+            exit_code = _RunForkedJob(conn, logname, debug)
+          except: # pylint: disable=W0702
+            logging.exception("Job process forked by the zygote failed")
+          logging.shutdown()
+          os._exit(exit_code) # pylint: disable=W0212
+        conn.close()
+        logging.debug("Forked job process %s", pid)
+  finally:
+    sock.close()
+    utils.RemoveFile(socket_path)
+
+
+def main():
+
+  debug = int(os.environ["GNT_DEBUG"])
+
+  logname = pathutils.GetLogFilename("jobs")
+
+  if len(sys.argv) == 3 and sys.argv[1] == "--zygote":
+    _RunZygote(sys.argv[2], logname, debug)
+    sys.exit(0)
+
+  utils.SetupLogging(logname, "job-startup", debug=debug)
+
+  (job_id, livelock_name) = _GetMasterInfo()
+
+  sys.exit(_RunJob(job_id, livelock_name, logname, debug))
 
 if __name__ == '__main__':
   main()
@@ -31,17 +31,34 @@
 """Module implementing the job queue handling."""
 
 import errno
+import logging
 import os
+import zlib
 
 from ganeti import constants
 from ganeti import errors
+from ganeti import opcodes
 from ganeti import runtime
+from ganeti import serializer
 from ganeti import utils
 from ganeti import pathutils
 
 
 JOBS_PER_ARCHIVE_DIRECTORY = constants.JSTORE_JOBS_PER_ARCHIVE_DIRECTORY
 
+#: Segment file holding the packed jobs of an archive directory
+PACKED_SEGMENT_FILE = "packed"
+
+#: Table with the position of each job in the segment file
+PACKED_OFFSETS_FILE = "packed.offsets"
+
+#: Index with one line per packed job
+PACKED_INDEX_FILE = "packed.index"
+
+#: Format of a slot in the offsets table (offset and length of a record)
+_PACKED_SLOT_FORMAT = "%012d%012d"
+_PACKED_SLOT_SIZE = len(_PACKED_SLOT_FORMAT % (0, 0))
+
 
 def _ReadNumericFile(file_name):
   """Reads a file containing a number.
@@ -233,3 +250,316 @@ def ParseJobId(job_id):
     return int(job_id)
   except (ValueError, TypeError):
     raise errors.ParameterError("Invalid job ID '%s'" % job_id)
+
+
+def CalcJobStatus(op_statuses):
+  """Computes the status of a job from the status of its opcodes.
+
+  The algorithm is:
+    - if we find a cancelled, or finished with error, the job
+      status will be the same
+    - otherwise, the last opcode with the status one of:
+        - waitlock
+        - canceling
+        - running
+
+      will determine the job status
+
+    - otherwise, it means either all opcodes are queued, or success,
+      and the job status will be the same
+
+  @type op_statuses: list
+  @param op_statuses: the status of each opcode, in order
+  @return: the job status
+
+  """
+  status = constants.JOB_STATUS_QUEUED
+
+  all_success = True
+  for op_status in op_statuses:
+    if op_status == constants.OP_STATUS_SUCCESS:
+      continue
+
+    all_success = False
+
+    if op_status == constants.OP_STATUS_QUEUED:
+      pass
+    elif op_status == constants.OP_STATUS_WAITING:
+      status = constants.JOB_STATUS_WAITING
+    elif op_status == constants.OP_STATUS_RUNNING:
+      status = constants.JOB_STATUS_RUNNING
+    elif op_status == constants.OP_STATUS_CANCELING:
+      status = constants.JOB_STATUS_CANCELING
+      break
+    elif op_status == constants.OP_STATUS_ERROR:
+      status = constants.JOB_STATUS_ERROR
+      # The whole job fails if one opcode failed
+      break
+    elif op_status == constants.OP_STATUS_CANCELED:
+      status = constants.OP_STATUS_CANCELED
+      break
+
+  if all_success:
+    status = constants.JOB_STATUS_SUCCESS
+
+  return status
+
+
+def _GetPackedSlot(job_id):
+  """Returns the position of a job's slot in the offsets table.
+
+  @type job_id: int
+  @param job_id: the job identifier
+
+  """
+  return (job_id % JOBS_PER_ARCHIVE_DIRECTORY) * _PACKED_SLOT_SIZE
+
+
+def _GetPackedJobInfo(data):
+  """Computes the fields of a serialized job kept in the packed index.
+
+  @type data: dict
+  @param data: the serialized job
+  @rtype: list
+  @return: status, received, start and end timestamp and the summary of
+    the opcodes
+
+  """
+  ops = data["ops"]
+  return [CalcJobStatus([op["status"] for op in ops]),
+          data.get("received_timestamp", None),
+          data.get("start_timestamp", None),
+          data.get("end_timestamp", None),
+          [opcodes.OpCode.LoadOpCode(op["input"]).Summary() for op in ops]]
+
+
+def ReadPackedIndex(directory):
+  """Reads the index of the jobs packed in an archive directory.
+
+  Every entry of the index is a list of the job ID, the name of the
+  segment file, the offset and length of the job's record in it and the
+  fields returned by L{_GetPackedJobInfo}. This allows answering queries
+  for archived jobs without reading their records.
+
+  @type directory: str
+  @param directory: the archive directory
+  @rtype: list
+  @return: list of index entries
+
+  """
+  try:
+    contents = utils.ReadFile(utils.PathJoin(directory, PACKED_INDEX_FILE))
+  except EnvironmentError, err:
+    if err.errno == errno.ENOENT:
+      return []
+    raise
+
+  # An incomplete last line is the result of an interrupted append
+  return [serializer.LoadJson(line)
+          for line in contents.splitlines(True) if line.endswith("\n")]
+
+
+def ReadPackedJob(job_id, archive_dir=pathutils.JOB_QUEUE_ARCHIVE_DIR):
+  """Reads a packed job from the archive.
+
+  @type job_id: int
+  @param job_id: the job identifier
+  @type archive_dir: str
+  @param archive_dir: the job archive directory
+  @rtype: str or None
+  @return: the serialized job or None if the job isn't packed
+
+  """
+  directory = utils.PathJoin(archive_dir, GetArchiveDirectory(job_id))
+
+  try:
+    fh = open(utils.PathJoin(directory, PACKED_OFFSETS_FILE), "rb")
+    try:
+      fh.seek(_GetPackedSlot(job_id))
+      slot = fh.read(_PACKED_SLOT_SIZE)
+    finally:
+      fh.close()
+  except EnvironmentError, err:
+    if err.errno == errno.ENOENT:
+      return None
+    raise
+
+  # Unused slots are either past the end of the file or zero-filled
+  if len(slot) != _PACKED_SLOT_SIZE or not slot.strip("\0"):
+    return None
+
+  try:
+    offset = int(slot[:_PACKED_SLOT_SIZE / 2])
+    length = int(slot[_PACKED_SLOT_SIZE / 2:])
+  except ValueError:
+    raise errors.JobFileCorrupted("Invalid offsets table slot for job %s" %
+                                  job_id)
+
+  fh = open(utils.PathJoin(directory, PACKED_SEGMENT_FILE), "rb")
+  try:
+    fh.seek(offset)
+    record = fh.read(length)
+  finally:
+    fh.close()
+
+  try:
+    return zlib.decompress(record)
+  except zlib.error, err:
+    raise errors.JobFileCorrupted("Can't decompress packed job %s: %s" %
+                                  (job_id, err))
+
+
+def _WritePackedSlots(file_name, slots, mode, uid, gid):
+  """Writes slots of an offsets table.
+
+  @type slots: list of tuples
+  @param slots: job ID, offset and length of each record
+
+  """
+  fd = os.open(file_name, os.O_WRONLY | os.O_CREAT, mode)
+  try:
+    if uid != -1 or gid != -1:
+      os.fchown(fd, uid, gid)
+    for (job_id, offset, length) in slots:
+      os.lseek(fd, _GetPackedSlot(job_id), os.SEEK_SET)
+      os.write(fd, _PACKED_SLOT_FORMAT % (offset, length))
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+
+def _RemoveIncompleteLine(file_name):
+  """Removes an incomplete last line, left by an interrupted append.
+
+  """
+  try:
+    contents = utils.ReadFile(file_name)
+  except EnvironmentError, err:
+    if err.errno == errno.ENOENT:
+      return
+    raise
+
+  if contents and not contents.endswith("\n"):
+    fd = os.open(file_name, os.O_WRONLY)
+    try:
+      os.ftruncate(fd, contents.rfind("\n") + 1)
+      os.fsync(fd)
+    finally:
+      os.close(fd)
+
+
+def PackArchiveDirectory(directory, uid=-1, gid=-1):
+  """Packs the job files of an archive directory.
+
+  The jobs are compressed individually and appended to the segment
+  file. Then their offsets are recorded, the index is extended and
+  finally the job files are removed, so that readers always find a job
+  either as a file or in the segment. Files which can't be parsed are
+  left in place.
+
+  @type directory: str
+  @param directory: the archive directory
+  @type uid: int
+  @param uid: the owner of the created files
+  @type gid: int
+  @param gid: the group of the created files
+  @rtype: int
+  @return: the number of packed jobs
+
+  """
+  packed = frozenset(entry[0] for entry in ReadPackedIndex(directory))
+
+  records = []
+  packed_jobs = []
+  remove = []
+
+  job_files = []
+  for filename in utils.ListVisibleFiles(directory):
+    m = constants.JOB_FILE_RE.match(filename)
+    if m:
+      job_files.append((int(m.group(1)), filename))
+
+  for (job_id, filename) in sorted(job_files):
+    path = utils.PathJoin(directory, filename)
+    if job_id in packed:
+      # Interrupted after updating the index
+      remove.append(path)
+      continue
+
+    raw_data = utils.ReadFile(path)
+    try:
+      data = serializer.LoadJson(raw_data)
+      if int(data["id"]) != job_id:
+        raise errors.JobFileCorrupted("Job ID doesn't match file name")
+      info = _GetPackedJobInfo(data)
+    except Exception: # pylint: disable=W0703
+      logging.exception("Can't parse archived job file %s, not packing it",
+                        path)
+      continue
+
+    records.append(zlib.compress(raw_data))
+    packed_jobs.append((job_id, info))
+    remove.append(path)
+
+  if records:
+    segment_path = utils.PathJoin(directory, PACKED_SEGMENT_FILE)
+    try:
+      offset = os.stat(segment_path).st_size
+    except EnvironmentError, err:
+      if err.errno != errno.ENOENT:
+        raise
+      offset = 0
+
+    utils.AppendFile(segment_path, "".join(records),
+                     mode=constants.JOB_QUEUE_FILES_PERMS, uid=uid, gid=gid)
+
+    slots = []
+    entries = []
+    for ((job_id, info), record) in zip(packed_jobs, records):
+      slots.append((job_id, offset, len(record)))
+      entries.append([job_id, PACKED_SEGMENT_FILE, offset, len(record)] + info)
+      offset += len(record)
+
+    _WritePackedSlots(utils.PathJoin(directory, PACKED_OFFSETS_FILE), slots,
+                      constants.JOB_QUEUE_FILES_PERMS, uid, gid)
+
+    index_path = utils.PathJoin(directory, PACKED_INDEX_FILE)
+    _RemoveIncompleteLine(index_path)
+    utils.AppendFile(index_path, "".join(map(serializer.DumpJson, entries)),
+                     mode=constants.JOB_QUEUE_FILES_PERMS, uid=uid, gid=gid)
+
+  for path in remove:
+    utils.RemoveFile(path)
+
+  return len(packed_jobs)
+
+
+def PackArchive(archive_dir=pathutils.JOB_QUEUE_ARCHIVE_DIR):
+  """Packs the job files of all archive directories.
+
+  Archived jobs are never modified, so they can be packed at any time.
+  This is done independently on every node holding a copy of the queue.
+
+  @type archive_dir: str
+  @param archive_dir: the job archive directory
+  @rtype: int
+  @return: the number of packed jobs
+
+  """
+  try:
+    names = utils.ListVisibleFiles(archive_dir)
+  except EnvironmentError, err:
+    if err.errno == errno.ENOENT:
+      return 0
+    raise
+
+  getents = runtime.GetEnts()
+
+  count = 0
+  for name in names:
+    directory = utils.PathJoin(archive_dir, name)
+    if os.path.isdir(directory):
+      count += PackArchiveDirectory(directory, uid=getents.masterd_uid,
+                                    gid=getents.daemons_gid)
+
+  return count
@@ -55,6 +55,7 @@ REQ_SUBMIT_JOB_TO_DRAINED_QUEUE = constants.LUXI_REQ_SUBMIT_JOB_TO_DRAINED_QUEUE
 REQ_SUBMIT_MANY_JOBS = constants.LUXI_REQ_SUBMIT_MANY_JOBS
 REQ_PICKUP_JOB = constants.LUXI_REQ_PICKUP_JOB
 REQ_WAIT_FOR_JOB_CHANGE = constants.LUXI_REQ_WAIT_FOR_JOB_CHANGE
+REQ_WATCH_JOB = constants.LUXI_REQ_WATCH_JOB
 REQ_CANCEL_JOB = constants.LUXI_REQ_CANCEL_JOB
 REQ_ARCHIVE_JOB = constants.LUXI_REQ_ARCHIVE_JOB
 REQ_CHANGE_JOB_PRIORITY = constants.LUXI_REQ_CHANGE_JOB_PRIORITY
@@ -185,6 +186,45 @@ class Client(cl.AbstractClient):
         break
     return result
 
+  def WatchJob(self, job_id, fields, prev_job_info, prev_log_serial):
+    """Streams the changes of a job until it is finalized.
+
+    Only one request is sent; the master daemon answers it with a
+    response for every change of the job, and one at least every
+    L{WFJC_TIMEOUT} seconds, over the same connection.
+
+    @param job_id: Job ID
+    @type fields: list
+    @param fields: List of field names to be observed
+    @type prev_job_info: None or list
+    @param prev_job_info: Previously received job information
+    @type prev_log_serial: None or int/long
+    @param prev_log_serial: Highest log serial number previously received
+    @return: an iterator over the changes, each either
+      L{constants.JOB_NOTCHANGED} or a tuple of the field values and the new
+      log entries, as returned by L{WaitForJobChangeOnce}; the last change
+      is reported after the job was finalized
+
+    """
+    job_id = Client._PrepareJobId(REQ_WATCH_JOB, job_id)
+    request = cl.FormatRequest(REQ_WATCH_JOB,
+                               (job_id, fields, prev_job_info,
+                                prev_log_serial),
+                               version=self.version)
+    finished = False
+    self._InitTransport()
+    try:
+      self.transport.Send(request)
+      while not finished:
+        (update, finished) = cl.ProcessResponse(self.transport.Recv(),
+                                                version=self.version)
+        yield update
+    finally:
+      if not finished:
+        # The rest of the stream would be mistaken for the responses to
+        # later requests
+        self._CloseTransport()
+
   def Query(self, what, fields, qfilter):
     """Query for resources/items.
 
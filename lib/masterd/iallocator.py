@@ -419,10 +419,12 @@ class IAllocator(object):
 
     self._BuildInputData(req)
 
-  def _ComputeClusterDataNodeInfo(self, disk_templates, node_list,
+  def _ComputeClusterDataNodeInfo(self, arpc, disk_templates, node_list,
                                   cluster_info, hypervisor_name):
-    """Prepare and execute node info call.
+    """Prepare and start node info call.
 
+    @type arpc: L{rpc.RpcRunner}
+    @param arpc: Asynchronous RPC runner, see L{rpc.RpcRunner.GetAsync}
     @type disk_templates: list of string
     @param disk_templates: the disk templates of the instances to be allocated
     @type node_list: list of strings
@@ -431,15 +433,15 @@ class IAllocator(object):
     @param cluster_info: the cluster's information from the config
     @type hypervisor_name: string
     @param hypervisor_name: the hypervisor name
-    @rtype: same as the result of the node info RPC call
-    @return: the result of the node info RPC call
+    @rtype: L{rpc.RpcFuture}
+    @return: the future of the result of the node info RPC call
 
     """
     storage_units_raw = utils.storage.GetStorageUnits(self.cfg, disk_templates)
     storage_units = rpc.PrepareStorageUnitsForNodes(self.cfg, storage_units_raw,
                                                     node_list)
     hvspecs = [(hypervisor_name, cluster_info.hvparams[hypervisor_name])]
-    return self.rpc.call_node_info(node_list, storage_units, hvspecs)
+    return arpc.call_node_info(node_list, storage_units, hvspecs)
 
   def _ComputeClusterData(self, disk_template=None):
     """Compute the generic allocator input data.
@@ -461,7 +463,7 @@ class IAllocator(object):
     ginfo = cfg.GetAllNodeGroupsInfo()
     ninfo = cfg.GetAllNodesInfo()
     iinfo = cfg.GetAllInstancesInfo()
-    i_list = [(inst, cluster_info.FillBE(inst)) for inst in iinfo.values()]
+    i_list = [(inst, cluster_info.FillBEView(inst)) for inst in iinfo.values()]
 
     # node data
     node_list = [n.uuid for n in ninfo.values() if n.vm_capable]
@@ -479,19 +481,25 @@ class IAllocator(object):
     if not disk_template:
       disk_template = cluster_info.enabled_disk_templates[0]
 
-    node_data = self._ComputeClusterDataNodeInfo([disk_template], node_list,
-                                                 cluster_info, hypervisor_name)
+    # Both calls are made at the same time, and the configuration data is
+    # computed while waiting for them
+    arpc = self.rpc.GetAsync()
+
+    node_data = self._ComputeClusterDataNodeInfo(arpc, [disk_template],
+                                                 node_list, cluster_info,
+                                                 hypervisor_name)
 
     node_iinfo = \
-      self.rpc.call_all_instances_info(node_list,
-                                       cluster_info.enabled_hypervisors,
-                                       cluster_info.hvparams)
+      arpc.call_all_instances_info(node_list,
+                                   cluster_info.enabled_hypervisors,
+                                   cluster_info.hvparams)
 
     data["nodegroups"] = self._ComputeNodeGroupData(cluster_info, ginfo)
 
     config_ndata = self._ComputeBasicNodeData(cfg, ninfo, node_whitelist)
     data["nodes"] = self._ComputeDynamicNodeData(
-        ninfo, node_data, node_iinfo, i_list, config_ndata, disk_template)
+        ninfo, node_data.GetResult(), node_iinfo.GetResult(), i_list,
+        config_ndata, disk_template)
     assert len(data["nodes"]) == len(ninfo), \
         "Incomplete node data computed"
 
@@ -82,6 +82,16 @@ class LockAcquireTimeout(Exception):
   """
 
 
+def NotifyLockWaiters():
+  """Notifies the threads waiting for locks that locks became available.
+
+  This is to be called from the SIGHUP handler of job processes.
+
+  """
+  sighupReceived[0] = True
+  wconfd.NotifyLockWaiters()
+
+
 def _CalculateLockAttemptTimeouts():
   """Calculate timeouts for lock attempts.
 
@@ -336,12 +346,27 @@ class Processor(object):
     self._ec_id = ec_id
     self._cbs = None
     self.cfg = context.GetConfig(ec_id)
+    self.cfg.SetLockPriorityFn(self._GetPriority)
     self.rpc = context.GetRpc(self.cfg)
     self.hmclass = hooksmaster.HooksMaster
     self._enable_locks = enable_locks
     self.wconfd = wconfd # Indirection to allow testing
     self._wconfdcontext = context.GetWConfdContext(ec_id)
 
+  def _GetPriority(self):
+    """Returns the current priority of the job being processed.
+
+    """
+    if self._cbs:
+      priority = self._cbs.CurrentPriority()
+    else:
+      priority = None
+
+    if priority is None:
+      priority = constants.OP_PRIO_DEFAULT
+
+    return priority
+
   def _CheckLocksEnabled(self):
     """Checks if locking is enabled.
 
@@ -371,13 +396,7 @@ class Processor(object):
     """
     self._CheckLocksEnabled()
 
-    if self._cbs:
-      priority = self._cbs.CurrentPriority() # pylint: disable=W0612
-    else:
-      priority = None
-
-    if priority is None:
-      priority = constants.OP_PRIO_DEFAULT
+    priority = self._GetPriority()
 
     if names == locking.ALL_SET:
       if opportunistic:
@@ -421,24 +440,27 @@ class Processor(object):
       ## to acquire locks opportunistically.
       logging.info("Definitely requesting %s for %s",
                    request, self._wconfdcontext)
+      notifier = wconfd.GetLockNotifier()
+      client = self.wconfd.GetClient()
       ## The only way to be sure of not getting starved is to sequentially
       ## acquire the locks one by one (in lock order).
       for r in request:
         logging.debug("Definite request %s for %s", r, self._wconfdcontext)
-        self.wconfd.Client().UpdateLocksWaiting(self._wconfdcontext, priority,
-                                                [r])
-        while True:
-          pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
-          if not pending:
-            break
-          time.sleep(10.0 * random.random())
+        # Notifications sent after this point refer to the new request
+        notifier.Clear()
+        client.UpdateLocksWaiting(self._wconfdcontext, priority, [r])
+        while client.HasPendingRequest(self._wconfdcontext):
+          # WConfD notifies us once the request might have been granted;
+          # the timeout only guards against lost notifications
+          notifier.Wait(wconfd.LOCK_NOTIFICATION_TIMEOUT)
 
     elif opportunistic:
       logging.debug("For %ss trying to opportunistically acquire"
                     "  at least %d of %s for %s.",
                     timeout, opportunistic_count, locks, self._wconfdcontext)
+      client = self.wconfd.GetClient()
       locks = utils.SimpleRetry(
-        lambda l: l != [], self.wconfd.Client().GuardedOpportunisticLockUnion,
+        lambda l: l != [], client.GuardedOpportunisticLockUnion,
         2.0, timeout, args=[opportunistic_count, self._wconfdcontext, request])
       logging.debug("Managed to get the following locks: %s", locks)
       if locks == []:
@@ -452,23 +474,26 @@ class Processor(object):
       sighupReceived[0] = False
 
       # Request locks
-      self.wconfd.Client().UpdateLocksWaiting(self._wconfdcontext, priority,
-                                              request)
-      pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
+      notifier = wconfd.GetLockNotifier()
+      notifier.Clear()
+      client = self.wconfd.GetClient()
+      client.UpdateLocksWaiting(self._wconfdcontext, priority, request)
+      pending = client.HasPendingRequest(self._wconfdcontext)
 
       if pending:
         def _HasPending():
           if sighupReceived[0]:
-            return self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
+            return client.HasPendingRequest(self._wconfdcontext)
           else:
             return True
 
-        pending = utils.SimpleRetry(False, _HasPending, 0.05, timeout)
+        pending = utils.SimpleRetry(False, _HasPending, 1.0, timeout,
+                                    wait_fn=notifier.Wait)
 
         signal = sighupReceived[0]
 
         if pending:
-          pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
+          pending = client.HasPendingRequest(self._wconfdcontext)
 
         if pending and signal:
           logging.warning("Ignoring unexpected SIGHUP")
@@ -478,7 +503,7 @@ class Processor(object):
       if pending:
         # drop the pending request and all locks potentially obtained in the
         # time since the last poll.
-        self.wconfd.Client().FreeLocksLevel(self._wconfdcontext, levelname)
+        client.FreeLocksLevel(self._wconfdcontext, levelname)
         raise LockAcquireTimeout()
 
     return locks
@@ -594,14 +619,14 @@ class Processor(object):
         self._AcquireLocks(level, needed_locks, share, opportunistic,
                            calc_timeout(),
                            opportunistic_count=opportunistic_count)
-        lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
+        lu.wconfdlocks = self.wconfd.GetClient().ListLocks(self._wconfdcontext)
 
         result = self._LockAndExecLU(lu, level + 1, calc_timeout)
       finally:
         levelname = locking.LEVEL_NAMES[level]
         logging.debug("Freeing locks at level %s for %s",
                       levelname, self._wconfdcontext)
-        self.wconfd.Client().FreeLocksLevel(self._wconfdcontext, levelname)
+        self.wconfd.GetClient().FreeLocksLevel(self._wconfdcontext, levelname)
     else:
       result = self._LockAndExecLU(lu, level + 1, calc_timeout)
 
@@ -663,7 +688,7 @@ class Processor(object):
 
       lu = lu_class(self, op, self.context, self.cfg, self.rpc,
                     self._wconfdcontext, self.wconfd)
-      lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
+      lu.wconfdlocks = self.wconfd.GetClient().ListLocks(self._wconfdcontext)
       lu.ExpandNames()
       assert lu.needed_locks is not None, "needed_locks not set by LU"
 
@@ -674,7 +699,7 @@ class Processor(object):
         if self._ec_id:
           self.cfg.DropECReservations(self._ec_id)
     finally:
-      self.wconfd.Client().FreeLocksLevel(
+      self.wconfd.GetClient().FreeLocksLevel(
         self._wconfdcontext, locking.LEVEL_NAMES[locking.LEVEL_CLUSTER])
       self._cbs = None
 
@@ -67,6 +67,30 @@ __all__ = ["ConfigObject", "ConfigData", "NIC", "Disk", "Instance",
 _TIMESTAMPS = ["ctime", "mtime"]
 _UUID = ["uuid"]
 
+#: Types whose values can be shared between copies of an object
+_IMMUTABLE_TYPES = frozenset([type(None), bool, int, long, float, str,
+                              unicode])
+
+#: Cache of the slot information of L{ConfigObject} subclasses, see
+#: L{ConfigObject._GetSlotInfo}
+_SLOT_INFO = {}
+
+#: Maximum number of filled parameter dicts cached, see
+#: L{Cluster._GetFilledView}
+_FILLED_VIEWS_SIZE = 16384
+
+#: Cache of filled parameter dicts
+_FILLED_VIEWS = utils.LRUCache(_FILLED_VIEWS_SIZE)
+
+
+def ForgetFilledViews():
+  """Drops all cached filled parameter views.
+
+  @see: L{Cluster._GetFilledView}
+
+  """
+  _FILLED_VIEWS.Clear()
+
 
 def FillDict(defaults_dict, custom_dict, skip_keys=None):
   """Basic function to apply settings on top a default dict.
@@ -184,6 +208,73 @@ def UpgradeNDParams(ndparams):
   return FillDict(constants.NDC_DEFAULTS, ndparams)
 
 
+def _CopyValue(value):
+  """Makes a deep copy of a value stored in a configuration object.
+
+  Configuration objects are copied using L{ConfigObject.Copy}, the standard
+  containers are copied directly and anything else is passed to
+  C{copy.deepcopy}.
+
+  """
+  vtype = type(value)
+  if vtype in _IMMUTABLE_TYPES:
+    return value
+  elif vtype is dict:
+    return dict((key, _CopyValue(val)) for (key, val) in value.iteritems())
+  elif vtype is list:
+    return [_CopyValue(val) for val in value]
+  elif vtype is tuple:
+    return tuple(_CopyValue(val) for val in value)
+  elif vtype in (set, frozenset):
+    # elements of sets are hashable, hence (for our purposes) immutable
+    return vtype(value)
+  elif isinstance(value, ConfigObject):
+    return value.Copy()
+  elif vtype is outils.LazyObjectDict:
+    return value.Copy(_CopyValue)
+  else:
+    return copy.deepcopy(value)
+
+
+def _UpgradeObject(obj):
+  """Calls the L{ConfigObject.UpgradeConfig} method of an object.
+
+  """
+  obj.UpgradeConfig()
+
+
+def _UpgradeContainer(container):
+  """Upgrades all the objects of a dictionary.
+
+  The objects of a L{outils.LazyObjectDict} are upgraded only once they're
+  converted.
+
+  """
+  if isinstance(container, outils.LazyObjectDict):
+    container.ApplyToAll(_UpgradeObject)
+  else:
+    for obj in container.values():
+      _UpgradeObject(obj)
+
+
+def _FreezeParams(params):
+  """Returns a hashable representation of a parameter dict.
+
+  @rtype: tuple or None
+  @return: the sorted items of the dict, or C{None} if not all values are
+      hashable
+
+  """
+  if not params:
+    return ()
+  result = tuple(sorted(params.items()))
+  try:
+    hash(result)
+  except TypeError:
+    return None
+  return result
+
+
 def MakeEmptyIPolicy():
   """Create empty IPolicy dictionary.
 
@@ -206,14 +297,37 @@ class ConfigObject(outils.ValidatedSlots):
   """
   __slots__ = []
 
+  #: Slots which are only kept in memory; they are ignored when comparing
+  #: objects
+  _VOLATILE_SLOTS = frozenset()
+
+  @classmethod
+  def _GetSlotInfo(cls):
+    """Returns the cached slot information of the class.
+
+    @rtype: tuple; (tuple, frozenset, tuple)
+    @return: all the slots of the class, the same as a set, and the slots
+        compared by L{__eq__}
+
+    """
+    try:
+      return _SLOT_INFO[cls]
+    except KeyError:
+      slots = tuple(cls.GetAllSlots())
+      info = (slots, frozenset(slots),
+              tuple(name for name in slots
+                    if name not in cls._VOLATILE_SLOTS))
+      _SLOT_INFO[cls] = info
+      return info
+
   def __getattr__(self, name):
-    if name not in self.GetAllSlots():
+    if name not in self._GetSlotInfo()[1]:
       raise AttributeError("Invalid object attribute %s.%s" %
                            (type(self).__name__, name))
     return None
 
   def __setstate__(self, state):
-    slots = self.GetAllSlots()
+    slots = self._GetSlotInfo()[1]
     for name in state:
       if name in slots:
         setattr(self, name, state[name])
@@ -284,9 +398,18 @@ class ConfigObject(outils.ValidatedSlots):
   def Copy(self):
     """Makes a deep copy of the current object and its children.
 
+    The copy is done slot by slot, without converting the object to a
+    dict and back.
+
     """
-    dict_form = self.ToDict()
-    clone_obj = self.__class__.FromDict(dict_form)
+    cls = self.__class__
+    clone_obj = cls.__new__(cls)
+    for name in self._GetSlotInfo()[0]:
+      try:
+        value = object.__getattribute__(self, name)
+      except AttributeError:
+        continue
+      setattr(clone_obj, name, _CopyValue(value))
     return clone_obj
 
   def __repr__(self):
@@ -294,8 +417,22 @@ class ConfigObject(outils.ValidatedSlots):
     return repr(self.ToDict())
 
   def __eq__(self, other):
-    """Implement __eq__ for ConfigObjects."""
-    return isinstance(other, self.__class__) and self.ToDict() == other.ToDict()
+    """Implement __eq__ for ConfigObjects.
+
+    Objects are compared slot by slot; unset slots are equal to slots set
+    to C{None} and slots in L{_VOLATILE_SLOTS} are ignored.
+
+    """
+    if not isinstance(other, self.__class__):
+      return False
+    for name in self._GetSlotInfo()[2]:
+      if not getattr(self, name, None) == getattr(other, name, None):
+        return False
+    return True
+
+  def __ne__(self, other):
+    """Implement __ne__ for ConfigObjects."""
+    return not self == other
 
   def UpgradeConfig(self):
     """Fill defaults for missing configuration values.
@@ -433,19 +570,30 @@ class ConfigData(ConfigObject):
     return mydict
 
   @classmethod
-  def FromDict(cls, val):
+  def FromDict(cls, val, lazy=False):
     """Custom function for top-level config data
 
+    @type lazy: bool
+    @param lazy: whether to convert the instances and disks, the containers
+        growing with the size of the cluster, only when they're accessed (see
+        L{outils.LazyObjectDict}); read-only users looking at a few objects
+        are spared the conversion of the whole configuration
+
     """
     obj = super(ConfigData, cls).FromDict(val)
     obj.cluster = Cluster.FromDict(obj.cluster)
     obj.nodes = outils.ContainerFromDicts(obj.nodes, dict, Node)
-    obj.instances = \
-      outils.ContainerFromDicts(obj.instances, dict, Instance)
     obj.nodegroups = \
       outils.ContainerFromDicts(obj.nodegroups, dict, NodeGroup)
     obj.networks = outils.ContainerFromDicts(obj.networks, dict, Network)
-    obj.disks = outils.ContainerFromDicts(obj.disks, dict, Disk)
+    if lazy:
+      obj.instances = outils.LazyObjectDict(obj.instances or {},
+                                            Instance.FromDict)
+      obj.disks = outils.LazyObjectDict(obj.disks or {}, Disk.FromDict)
+    else:
+      obj.instances = \
+        outils.ContainerFromDicts(obj.instances, dict, Instance)
+      obj.disks = outils.ContainerFromDicts(obj.disks, dict, Disk)
     return obj
 
   def HasAnyDiskOfType(self, dev_type):
@@ -469,8 +617,7 @@ class ConfigData(ConfigObject):
     self.cluster.UpgradeConfig()
     for node in self.nodes.values():
       node.UpgradeConfig()
-    for instance in self.instances.values():
-      instance.UpgradeConfig()
+    _UpgradeContainer(self.instances)
     self._UpgradeEnabledDiskTemplates()
     if self.nodegroups is None:
       self.nodegroups = {}
@@ -485,8 +632,7 @@ class ConfigData(ConfigObject):
       self.networks = {}
     for network in self.networks.values():
       network.UpgradeConfig()
-    for disk in self.disks.values():
-      disk.UpgradeConfig()
+    _UpgradeContainer(self.disks)
 
   def _UpgradeEnabledDiskTemplates(self):
     """Upgrade the cluster's enabled disk templates by inspecting the currently
@@ -556,6 +702,8 @@ class Disk(ConfigObject):
     "dynamic_params"
     ] + _UUID + _TIMESTAMPS
 
+  _VOLATILE_SLOTS = frozenset(["dynamic_params"])
+
   def _ComputeAllNodes(self):
     """Compute the list of all nodes covered by a device and its children."""
     def _Helper(nodes, device):
@@ -1496,6 +1644,8 @@ class NodeGroup(TaggableObject):
     "networks",
     ] + _TIMESTAMPS + _UUID
 
+  _VOLATILE_SLOTS = frozenset(["members"])
+
   def ToDict(self, _with_private=False):
     """Custom function for nodegroup.
 
@@ -1620,6 +1770,7 @@ class Cluster(TaggableObject):
     "candidate_certs",
     "max_running_jobs",
     "max_tracked_jobs",
+    "max_running_jobs_per_opcode",
     "install_image",
     "instance_communication_network",
     "zeroing_image",
@@ -1768,6 +1919,9 @@ class Cluster(TaggableObject):
     if self.max_tracked_jobs is None:
       self.max_tracked_jobs = constants.LUXID_MAXIMAL_TRACKED_JOBS_DEFAULT
 
+    if self.max_running_jobs_per_opcode is None:
+      self.max_running_jobs_per_opcode = {}
+
     if self.instance_communication_network is None:
       self.instance_communication_network = ""
 
@@ -1895,6 +2049,42 @@ class Cluster(TaggableObject):
     return self.SimpleFillHV(instance.hypervisor, instance.os,
                              instance.hvparams, skip_globals)
 
+  def _GetFilledView(self, key, fill_fn):
+    """Returns a cached read-only view of filled parameters.
+
+    The views are cached by the cluster's serial number, so they must not
+    be requested while the cluster has been modified without updating it
+    in the configuration. Modifications not bumping the serial number need
+    to call L{ForgetFilledViews}.
+
+    @type key: tuple
+    @param key: everything apart from the cluster the parameters depend on;
+        if it contains C{None}, the parameters aren't cached
+    @type fill_fn: callable
+    @param fill_fn: function computing the filled parameters
+    @rtype: L{utils.FrozenDict}
+
+    """
+    if None in key or self.uuid is None or self.serial_no is None:
+      return utils.FrozenDict(fill_fn())
+    key = (self.uuid, self.serial_no) + key
+    view = _FILLED_VIEWS.Get(key)
+    if view is None:
+      view = utils.FrozenDict(fill_fn())
+      _FILLED_VIEWS.Set(key, view)
+    return view
+
+  def FillHVView(self, instance, skip_globals=False):
+    """Like L{FillHV}, but returns a cached read-only view.
+
+    @rtype: L{utils.FrozenDict}
+
+    """
+    return self._GetFilledView(("hv", instance.hypervisor, instance.os,
+                                skip_globals,
+                                _FreezeParams(instance.hvparams)),
+                               lambda: self.FillHV(instance, skip_globals))
+
   def SimpleFillBE(self, beparams):
     """Fill a given beparams dict with cluster defaults.
 
@@ -1919,6 +2109,15 @@ class Cluster(TaggableObject):
     """
     return self.SimpleFillBE(instance.beparams)
 
+  def FillBEView(self, instance):
+    """Like L{FillBE}, but returns a cached read-only view.
+
+    @rtype: L{utils.FrozenDict}
+
+    """
+    return self._GetFilledView(("be", _FreezeParams(instance.beparams)),
+                               lambda: self.FillBE(instance))
+
   def SimpleFillNIC(self, nicparams):
     """Fill a given nicparams dict with cluster defaults.
 
@@ -2018,6 +2217,19 @@ class Cluster(TaggableObject):
                  secret=formatter(params_secret & duplicate_keys))
       raise errors.OpPrereqError(msg)
 
+  def FillOSView(self, instance):
+    """Returns a cached read-only view of an instance's public OS parameters
+    filled with the cluster defaults.
+
+    @see: L{SimpleFillOS}
+    @rtype: L{utils.FrozenDict}
+
+    """
+    return self._GetFilledView(("os", instance.os,
+                                _FreezeParams(instance.osparams)),
+                               lambda: self.SimpleFillOS(instance.os,
+                                                         instance.osparams))
+
   @staticmethod
   def SimpleFillHvState(hv_state):
     """Fill an hv_state sub dict with cluster defaults.
@@ -2044,6 +2256,16 @@ class Cluster(TaggableObject):
     """
     return self.SimpleFillND(nodegroup.FillND(node))
 
+  def FillNDView(self, node, nodegroup):
+    """Like L{FillND}, but returns a cached read-only view.
+
+    @rtype: L{utils.FrozenDict}
+
+    """
+    return self._GetFilledView(("nd", _FreezeParams(nodegroup.ndparams),
+                                _FreezeParams(node.ndparams)),
+                               lambda: self.FillND(node, nodegroup))
+
   def FillNDGroup(self, nodegroup):
     """Return filled out ndparams for just L{objects.NodeGroup}
 
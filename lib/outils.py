@@ -29,6 +29,7 @@
 
 """Module for object related utils."""
 
+import itertools
 
 #: Supported container types for serialization/de-serialization (must be a
 #: tuple as it's used as a parameter for C{isinstance})
@@ -119,14 +120,15 @@ def ContainerToDicts(container):
   """Convert the elements of a container to standard Python types.
 
   This method converts a container with elements to standard Python types. If
-  the input container is of the type C{dict}, only its values are touched.
+  the input container is of the type C{dict} (or L{LazyObjectDict}), only its
+  values are touched.
   Those values, as well as all elements of input sequences, must support a
   C{ToDict} method returning a serialized version.
 
   @type container: dict or sequence (see L{_SEQUENCE_TYPES})
 
   """
-  if isinstance(container, dict):
+  if isinstance(container, (dict, LazyObjectDict)):
     ret = dict([(k, v.ToDict()) for k, v in container.items()])
   elif isinstance(container, _SEQUENCE_TYPES):
     ret = [elem.ToDict() for elem in container]
@@ -165,3 +167,215 @@ def ContainerFromDicts(source, c_type, e_type):
     raise TypeError("Unknown container type '%s'" % c_type)
 
   return ret
+
+
+def _CopyRawValue(value):
+  """Makes a deep copy of a value made of standard Python types.
+
+  Only dicts and lists are copied, everything else is considered immutable,
+  which is the case for deserialized JSON data.
+
+  """
+  if isinstance(value, dict):
+    return dict((key, _CopyRawValue(val)) for (key, val) in value.iteritems())
+  elif isinstance(value, list):
+    return [_CopyRawValue(val) for val in value]
+  else:
+    return value
+
+
+class LazyObjectDict(object):
+  """A dictionary of objects converted from standard Python types on demand.
+
+  The dictionary keeps the serialized form of its values and converts a value
+  only when it's first accessed, so that large containers of which only a few
+  elements are used don't need to be converted as a whole. Apart from that,
+  it behaves like the dictionary L{ContainerFromDicts} would return.
+
+  """
+  __slots__ = ["_loaded", "_raw", "_from_dict_fn", "_load_fns"]
+
+  def __init__(self, source, from_dict_fn):
+    """Initializes this class.
+
+    @type source: dict
+    @param source: the serialized values; they are not modified
+    @type from_dict_fn: callable
+    @param from_dict_fn: function converting a serialized value
+
+    """
+    self._loaded = {}
+    self._raw = dict(source)
+    self._from_dict_fn = from_dict_fn
+    self._load_fns = []
+
+  def _Load(self, key):
+    """Converts the value of a key, if it hasn't been converted yet.
+
+    """
+    try:
+      raw = self._raw.pop(key)
+    except KeyError:
+      return
+    # the serialized value might be shared with copies of this dictionary
+    value = self._from_dict_fn(_CopyRawValue(raw))
+    for fn in self._load_fns:
+      fn(value)
+    self._loaded[key] = value
+
+  def LoadAll(self):
+    """Converts all the values which haven't been converted yet.
+
+    """
+    for key in self._raw.keys():
+      self._Load(key)
+
+  def IsLoaded(self, key):
+    """Returns whether the value of a key has been converted.
+
+    """
+    return key not in self._raw
+
+  def GetAttribute(self, key, name):
+    """Returns an attribute of a value without converting it.
+
+    @type name: string
+    @param name: the name of the attribute, which must be stored in the
+        serialized value under the same name
+
+    """
+    try:
+      return self._raw[key].get(name, None)
+    except KeyError:
+      return getattr(self._loaded[key], name)
+
+  def ApplyToAll(self, fn):
+    """Calls a function for every value.
+
+    The function is called right away for the converted values and as soon
+    as they are converted for all the others.
+
+    @type fn: callable
+    @param fn: function taking a converted value as its only argument
+
+    """
+    for value in self._loaded.values():
+      fn(value)
+    self._load_fns.append(fn)
+
+  def Copy(self, copy_fn):
+    """Makes a deep copy of this dictionary.
+
+    The serialized values are shared with the copy.
+
+    @type copy_fn: callable
+    @param copy_fn: function copying a converted value
+
+    """
+    other = LazyObjectDict({}, self._from_dict_fn)
+    other._raw = self._raw.copy() # pylint: disable=W0212
+    other._loaded = dict((key, copy_fn(value))
+                         for (key, value) in self._loaded.iteritems())
+    other._load_fns = self._load_fns[:] # pylint: disable=W0212
+    return other
+
+  def __getitem__(self, key):
+    self._Load(key)
+    return self._loaded[key]
+
+  def __setitem__(self, key, value):
+    self._raw.pop(key, None)
+    self._loaded[key] = value
+
+  def __delitem__(self, key):
+    if self._raw.pop(key, None) is None:
+      del self._loaded[key]
+
+  def __contains__(self, key):
+    return key in self._loaded or key in self._raw
+
+  has_key = __contains__
+
+  def __len__(self):
+    return len(self._loaded) + len(self._raw)
+
+  def __iter__(self):
+    return itertools.chain(self._loaded.keys(), self._raw.keys())
+
+  iterkeys = __iter__
+
+  def keys(self):
+    return self._loaded.keys() + self._raw.keys()
+
+  def get(self, key, default=None):
+    if key in self:
+      return self[key]
+    return default
+
+  def pop(self, key, *args):
+    self._Load(key)
+    return self._loaded.pop(key, *args)
+
+  def setdefault(self, key, default=None):
+    if key not in self:
+      self[key] = default
+    return self[key]
+
+  def update(self, other):
+    for (key, value) in other.items():
+      self[key] = value
+
+  def clear(self):
+    self._loaded.clear()
+    self._raw.clear()
+
+  def values(self):
+    self.LoadAll()
+    return self._loaded.values()
+
+  def items(self):
+    self.LoadAll()
+    return self._loaded.items()
+
+  def itervalues(self):
+    return iter(self.values())
+
+  def iteritems(self):
+    return iter(self.items())
+
+  def __eq__(self, other):
+    """Compares with another dictionary.
+
+    Values which haven't been converted on both sides are equal if they share
+    the same serialized value and the same conversion functions, without
+    converting them.
+
+    """
+    if isinstance(other, LazyObjectDict):
+      if len(self) != len(other):
+        return False
+      for key in self:
+        if key not in other:
+          return False
+        # pylint: disable=W0212
+        if (not (self.IsLoaded(key) or other.IsLoaded(key)) and
+            self._raw[key] is other._raw[key] and
+            self._load_fns == other._load_fns):
+          continue
+        if not self[key] == other[key]:
+          return False
+      return True
+    elif isinstance(other, dict):
+      return dict(self.items()) == other
+    return NotImplemented
+
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    if result is NotImplemented:
+      return result
+    return not result
+
+  __hash__ = None
+
+  def __repr__(self):
+    return repr(dict(self.items()))
@@ -154,6 +154,8 @@ MASTER_SOCKET = SOCKET_DIR + "/ganeti-master"
 QUERY_SOCKET = SOCKET_DIR + "/ganeti-query"
 #: WConfD socket
 WCONFD_SOCKET = SOCKET_DIR + "/ganeti-wconfd"
+#: Socket of the job zygote, which forks job processes for luxid
+JOB_ZYGOTE_SOCKET = SOCKET_DIR + "/ganeti-job-zygote"
 
 LOG_OS_DIR = LOG_DIR + "/os"
 LOG_ES_DIR = LOG_DIR + "/extstorage"
@@ -1135,7 +1135,7 @@ class NodeQueryData(object):
       if group is None:
         self.ndparams = None
       else:
-        self.ndparams = self.cluster.FillND(node, group)
+        self.ndparams = self.cluster.FillNDView(node, group)
       if self.live_data:
         self.curlive_data = self.live_data.get(node.uuid, None)
       else:
@@ -1250,7 +1250,7 @@ def _GetNdParams(ctx, node, ng):
   @param ng: The node group this node belongs to
 
   """
-  return ctx.cluster.SimpleFillND(ng.FillND(node))
+  return ctx.cluster.FillNDView(node, ng)
 
 
 def _GetLiveNodeField(field, kind, ctx, node):
@@ -1479,9 +1479,9 @@ class InstanceQueryData(object):
 
     """
     for inst in self.instances:
-      self.inst_hvparams = self.cluster.FillHV(inst, skip_globals=True)
-      self.inst_beparams = self.cluster.FillBE(inst)
-      self.inst_osparams = self.cluster.SimpleFillOS(inst.os, inst.osparams)
+      self.inst_hvparams = self.cluster.FillHVView(inst, skip_globals=True)
+      self.inst_beparams = self.cluster.FillBEView(inst)
+      self.inst_osparams = self.cluster.FillOSView(inst)
       self.inst_nicparams = [self.cluster.SimpleFillNIC(nic.nicparams)
                              for nic in inst.nics]
 
@@ -1536,7 +1536,7 @@ def _GetInstLiveData(name):
 
 
 def _GetLiveInstStatus(ctx, instance, instance_state):
-  hvparams = ctx.cluster.FillHV(instance, skip_globals=True)
+  hvparams = ctx.cluster.FillHVView(instance, skip_globals=True)
 
   allow_userdown = \
       ctx.cluster.enabled_user_shutdown and \
@@ -2591,6 +2591,16 @@ def _PerJobOp(fn):
   return _JobUnavail(compat.partial(_PerJobOpInner, fn))
 
 
+def _GetJobReplication(job):
+  """Returns the replication counters of a job.
+
+  """
+  if job.replication is None:
+    return _FS_UNAVAIL
+  else:
+    return job.replication
+
+
 def _JobTimestampInner(fn, job):
   """Converts unavailable timestamp to L{_FS_UNAVAIL}.
 
@@ -2652,6 +2662,11 @@ def _BuildJobFields():
     (_MakeField("summary", "Summary", QFT_OTHER,
                 "List of per-opcode summaries"),
      None, 0, _PerJobOp(lambda op: op.input.Summary())),
+    (_MakeField("replication", "Replication", QFT_OTHER,
+                "Counters of the replication of the job queue to the master"
+                " candidates, recorded by the job process when the job was"
+                " finalized"),
+     None, 0, _JobUnavail(_GetJobReplication)),
     ]
 
   # Timestamp fields
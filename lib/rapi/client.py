@@ -64,6 +64,8 @@ HTTP_GET = "GET"
 HTTP_PUT = "PUT"
 HTTP_POST = "POST"
 HTTP_OK = 200
+HTTP_UNAUTHORIZED = 401
+HTTP_FORBIDDEN = 403
 HTTP_NOT_FOUND = 404
 HTTP_APP_JSON = "application/json"
 
@@ -1475,7 +1477,8 @@ class GanetiRapiClient(object): # pylint: disable=R0904
                              "/%s/jobs/%s" % (GANETI_RAPI_VERSION, job_id),
                              None, None)
 
-  def WaitForJobCompletion(self, job_id, period=5, retries=-1):
+  def WaitForJobCompletion(self, job_id, period=5, retries=-1,
+                           long_poll=False):
     """Polls cluster for job status until completion.
 
     Completion is defined as any of the following states listed in
@@ -1488,6 +1491,12 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     @type retries: int
     @param retries: how many time to poll before giving up
                     (optional, default -1 means unlimited)
+    @type long_poll: bool
+    @param long_poll: whether to wait for the job to change on the server
+                      using L{WaitForJobChange} instead of polling; every
+                      wait counts as a retry and returns as soon as the job
+                      changed, so C{period} is ignored. Polling is used if
+                      the credentials don't allow waiting.
 
     @rtype: bool
     @return: C{True} if job succeeded or C{False} if failed/status timeout
@@ -1496,15 +1505,38 @@ class GanetiRapiClient(object): # pylint: disable=R0904
       does not use polling
 
     """
+    prev_job_info = None
+    prev_log_serial = None
+
     while retries != 0:
-      job_result = self.GetJobStatus(job_id)
+      if long_poll:
+        try:
+          result = self.WaitForJobChange(job_id, ["status"], prev_job_info,
+                                         prev_log_serial)
+        except GanetiApiError, err:
+          if err.code not in (HTTP_UNAUTHORIZED, HTTP_FORBIDDEN):
+            raise
+          logging.debug("Waiting for job changes is not allowed (%s),"
+                        " polling instead", err)
+          long_poll = False
+          continue
+
+        if result:
+          prev_job_info = result["job_info"]
+          for (serial, _, _, _) in result["log_entries"]:
+            prev_log_serial = max(prev_log_serial, serial)
+
+        status = prev_job_info and prev_job_info[0]
+      else:
+        job_result = self.GetJobStatus(job_id)
+        status = job_result and job_result["status"]
 
-      if job_result and job_result["status"] == JOB_STATUS_SUCCESS:
+      if status == JOB_STATUS_SUCCESS:
         return True
-      elif not job_result or job_result["status"] in JOB_STATUS_FINALIZED:
+      elif not status or status in JOB_STATUS_FINALIZED:
         return False
 
-      if period:
+      if period and not long_poll:
         time.sleep(period)
 
       if retries > 0:
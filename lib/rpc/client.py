@@ -143,6 +143,15 @@ def CallRPCMethod(transport_cb, method, args, version=None):
   # Send request and wait for response
   response_msg = transport_cb(request_msg)
 
+  return ProcessResponse(response_msg, version=version)
+
+
+def ProcessResponse(response_msg, version=None):
+  """Parses a response message and returns its result.
+
+  Errors reported in the response are raised as exceptions.
+
+  """
   (success, result, resp_version) = ParseResponse(response_msg)
 
   # Verify version if there was one in the response
@@ -46,6 +46,7 @@ import pycurl
 import threading
 import copy
 import os
+import time
 
 from ganeti import utils
 from ganeti import objects
@@ -76,6 +77,16 @@ _RPC_CLIENT_HEADERS = [
 #: Special value to describe an offline host
 _OFFLINE = object()
 
+#: Pool of cURL objects, keeping connections to the nodes open between calls;
+#: it is flushed when the certificates change, e.g. after renewing them
+_CURL_POOL = http.client.CurlPool(
+  files_fn=lambda: [pathutils.NODED_CERT_FILE,
+                    pathutils.NODED_CLIENT_CERT_FILE])
+
+#: Statistics about the encoding of request bodies, per procedure
+_encoding_stats = {}
+_encoding_stats_lock = threading.Lock()
+
 
 def Init():
   """Initializes the module-global HTTP client manager.
@@ -102,9 +113,90 @@ def Shutdown():
   running.
 
   """
+  _CURL_POOL.Clear()
+
   pycurl.global_cleanup()
 
 
+class _EncodingStatistics(object):
+  """Statistics about the encoding of the request bodies of a procedure.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self.calls = 0
+    self.nodes = 0
+    self.encoded = 0
+    self.total_time = 0.0
+    self.bytes_saved = 0
+
+  def Add(self, nodes, encoded, duration, bytes_saved):
+    """Records the encoding of the bodies of a call.
+
+    @type nodes: int
+    @param nodes: number of nodes the call is made to
+    @type encoded: int
+    @param encoded: number of bodies actually encoded
+    @type duration: float
+    @param duration: how long the encoding took, in seconds
+    @type bytes_saved: int
+    @param bytes_saved: size of the bodies which didn't need to be encoded
+      as the body was shared
+
+    """
+    self.calls += 1
+    self.nodes += nodes
+    self.encoded += encoded
+    self.total_time += duration
+    self.bytes_saved += bytes_saved
+
+  def ToDict(self):
+    """Returns the statistics as a dictionary.
+
+    """
+    return {
+      "calls": self.calls,
+      "nodes": self.nodes,
+      "encoded": self.encoded,
+      "total_time": self.total_time,
+      "bytes_saved": self.bytes_saved,
+      }
+
+
+def _RecordEncoding(procedure, nodes, encoded, duration, bytes_saved):
+  """Records the encoding of the bodies of a call.
+
+  @see: L{_EncodingStatistics.Add}
+
+  """
+  _encoding_stats_lock.acquire()
+  try:
+    stats = _encoding_stats.get(procedure)
+    if stats is None:
+      stats = _encoding_stats[procedure] = _EncodingStatistics()
+    stats.Add(nodes, encoded, duration, bytes_saved)
+  finally:
+    _encoding_stats_lock.release()
+
+
+def GetEncodingStatistics():
+  """Returns the statistics about the encoding of request bodies.
+
+  @rtype: dict
+  @return: dictionary from procedure name to its statistics, see
+    L{_EncodingStatistics.ToDict}
+
+  """
+  _encoding_stats_lock.acquire()
+  try:
+    return dict((procedure, stats.ToDict())
+                for (procedure, stats) in _encoding_stats.items())
+  finally:
+    _encoding_stats_lock.release()
+
+
 def _ConfigRpcCurl(curl):
   noded_cert = str(pathutils.NODED_CERT_FILE)
   noded_client_cert = str(pathutils.NODED_CLIENT_CERT_FILE)
@@ -266,6 +358,66 @@ class RpcResult(object):
     feedback_fn(msg)
 
 
+class RpcFuture(object):
+  """Result of an RPC call which may not have been received yet.
+
+  @see: L{_RpcClientBase.GetAsync}
+
+  """
+  def __init__(self, result_fn, postproc_fn=None):
+    """Initializes this class.
+
+    @type result_fn: callable
+    @param result_fn: Function waiting for and returning the result
+    @type postproc_fn: callable or None
+    @param postproc_fn: Function converting the value returned by
+      C{result_fn} into the result after the call finished
+
+    """
+    self._result_fn = result_fn
+    self._postproc_fn = postproc_fn
+    self._result = None
+    self._end_time = None
+
+  def GetResult(self):
+    """Waits for the call to finish and returns its result.
+
+    @return: What the RPC wrapper returns when not called asynchronously
+
+    """
+    if self._result_fn is not None:
+      result = self._result_fn()
+      self._end_time = time.time()
+
+      if self._postproc_fn is not None:
+        result = self._postproc_fn(result)
+
+      self._result = result
+      self._result_fn = None
+      self._postproc_fn = None
+
+    return self._result
+
+  def GetEndTime(self):
+    """Waits for the call to finish and returns the time it finished at.
+
+    The time is taken as soon as the responses were received, before they
+    are post-processed.
+
+    @rtype: float
+
+    """
+    self.GetResult()
+
+    return self._end_time
+
+  def __getitem__(self, key):
+    """Returns a future for an item of the result, e.g. for one node.
+
+    """
+    return RpcFuture(self.GetResult, lambda result: result[key])
+
+
 def _SsconfResolver(ssconf_ips, node_list, _,
                     ssc=ssconf.SimpleStore,
                     nslookup_fn=netutils.Hostname.GetIP):
@@ -436,6 +588,17 @@ class _RpcProcessor:
 
     return results
 
+  def _ResolveAndPrepare(self, nodes, procedure, body, read_timeout,
+                         resolver_opts):
+    """Resolves the nodes and prepares the requests to them.
+
+    """
+    assert read_timeout is not None, \
+      "Missing RPC read timeout for procedure '%s'" % procedure
+
+    return self._PrepareRequests(self._resolver(nodes, resolver_opts),
+                                 self._port, procedure, body, read_timeout)
+
   def __call__(self, nodes, procedure, body, read_timeout, resolver_opts,
                _req_process_fn=None):
     """Makes an RPC request to a number of nodes.
@@ -452,15 +615,13 @@ class _RpcProcessor:
     @return: a dictionary mapping host names to rpc.RpcResult objects
 
     """
-    assert read_timeout is not None, \
-      "Missing RPC read timeout for procedure '%s'" % procedure
-
     if _req_process_fn is None:
-      _req_process_fn = http.client.ProcessRequests
+      _req_process_fn = compat.partial(http.client.ProcessRequests,
+                                       curl_pool=_CURL_POOL)
 
     (results, requests) = \
-      self._PrepareRequests(self._resolver(nodes, resolver_opts), self._port,
-                            procedure, body, read_timeout)
+      self._ResolveAndPrepare(nodes, procedure, body, read_timeout,
+                              resolver_opts)
 
     _req_process_fn(requests.values(), lock_monitor_cb=self._lock_monitor_cb)
 
@@ -468,6 +629,109 @@ class _RpcProcessor:
 
     return self._CombineResults(results, requests, procedure)
 
+  def Start(self, nodes, procedure, body, read_timeout, resolver_opts,
+            async_proc):
+    """Starts an RPC request to a number of nodes without waiting for it.
+
+    @type async_proc: L{http.client.AsyncRequestProcessor}
+    @param async_proc: Processor for the HTTP requests
+    @rtype: callable
+    @return: Function waiting for the request to finish and returning the
+      same as L{__call__}; see there for the other parameters
+
+    """
+    (results, requests) = \
+      self._ResolveAndPrepare(nodes, procedure, body, read_timeout,
+                              resolver_opts)
+
+    async_proc.StartRequests(requests.values())
+
+    def _Wait():
+      async_proc.WaitForRequests(requests.values())
+      return self._CombineResults(results, requests, procedure)
+
+    return _Wait
+
+
+class _DeferredRequestProcessor(object):
+  """Processes asynchronously started requests with a blocking function.
+
+  This offers the interface of L{http.client.AsyncRequestProcessor} for a
+  custom function processing requests, e.g. in tests. The requests are
+  processed, together with all other pending requests, when waited for.
+
+  """
+  def __init__(self, process_fn, lock_monitor_cb):
+    """Initializes this class.
+
+    """
+    self._process_fn = process_fn
+    self._lock_monitor_cb = lock_monitor_cb
+    self._pending = []
+
+  def StartRequests(self, requests):
+    """Queues requests.
+
+    """
+    self._pending.extend(requests)
+
+  def WaitForRequests(self, _):
+    """Processes all queued requests.
+
+    """
+    (pending, self._pending) = (self._pending, [])
+    if pending:
+      self._process_fn(pending, lock_monitor_cb=self._lock_monitor_cb)
+
+
+def _SplitBatchResult(result, cdefs, fail_fast):
+  """Splits the result of a batch of calls into the results of the calls.
+
+  @type result: L{RpcResult} or None
+  @param result: Result of the call executing the batch, C{None} if the
+    batch was empty
+  @type cdefs: list of tuples
+  @param cdefs: Definitions of the batched calls, in order
+  @type fail_fast: bool
+  @param fail_fast: Whether the batch was executed in fail-fast mode
+  @rtype: list of L{RpcResult}
+
+  """
+  def _Fail(procedure, msg):
+    return RpcResult(data=msg, failed=True, offline=result.offline,
+                     node=result.node, call=procedure)
+
+  if result is None:
+    assert not cdefs
+    return []
+
+  if result.fail_msg:
+    # The batch as a whole failed, e.g. because the node is offline
+    return [_Fail(cdef[0], result.fail_msg) for cdef in cdefs]
+
+  payload = result.payload
+  if (not isinstance(payload, list) or len(payload) > len(cdefs) or
+      (len(payload) < len(cdefs) and not fail_fast)):
+    return [_Fail(cdef[0], "RPC layer error: invalid batch result")
+            for cdef in cdefs]
+
+  results = []
+
+  for (idx, cdef) in enumerate(cdefs):
+    (procedure, _, _, _, _, _, postproc_fn, _) = cdef
+
+    if idx < len(payload):
+      host_result = RpcResult(data=payload[idx], node=result.node,
+                              call=procedure)
+      if postproc_fn:
+        host_result = postproc_fn(host_result)
+    else:
+      host_result = _Fail(procedure, "Not executed after an earlier failure")
+
+    results.append(host_result)
+
+  return results
+
 
 class _RpcClientBase:
   def __init__(self, resolver, encoder_fn, lock_monitor_cb=None,
@@ -479,7 +743,34 @@ class _RpcClientBase:
                          netutils.GetDaemonPort(constants.NODED),
                          lock_monitor_cb=lock_monitor_cb)
     self._proc = compat.partial(proc, _req_process_fn=_req_process_fn)
+    self._start = proc.Start
     self._encoder = compat.partial(self._EncodeArg, encoder_fn)
+    self._lock_monitor_cb = lock_monitor_cb
+    self._req_process_fn = _req_process_fn
+    self._async_proc = None
+
+  def GetAsync(self):
+    """Returns a copy of this client whose calls don't wait for results.
+
+    The RPC wrappers of the copy return L{RpcFuture} objects instead of
+    results. The requests of all calls made through the copy are processed
+    in a single loop, which runs while waiting for the result of any of the
+    futures; the requests of all outstanding calls make progress at the same
+    time. The results of all futures should be retrieved.
+
+    """
+    if self._req_process_fn is None:
+      async_proc = \
+        http.client.AsyncRequestProcessor(lock_monitor_cb=self._lock_monitor_cb,
+                                          curl_pool=_CURL_POOL)
+    else:
+      async_proc = _DeferredRequestProcessor(self._req_process_fn,
+                                             self._lock_monitor_cb)
+
+    client = copy.copy(self)
+    client._async_proc = async_proc # pylint: disable=W0212
+
+    return client
 
   @staticmethod
   def _EncodeArg(encoder_fn, node, (argkind, value)):
@@ -511,30 +802,119 @@ class _RpcClientBase:
     if len(args) != len(argdefs):
       raise errors.ProgrammerError("Number of passed arguments doesn't match")
 
-    if prep_fn is None:
-      prep_fn = lambda _, args: args
-    assert callable(prep_fn)
-
-    # encode the arguments for each node individually, pass them and the node
-    # name to the prep_fn, and serialise its return value
+    argkinds = map(compat.snd, argdefs)
     encode_args_fn = lambda node: map(compat.partial(self._encoder, node),
-                                      zip(map(compat.snd, argdefs), args))
-    pnbody = dict(
-      (n,
-       serializer.DumpJson(prep_fn(n, encode_args_fn(n)),
-                           private_encoder=serializer.EncodeWithPrivateFields))
-      for n in node_list
-    )
+                                      zip(argkinds, args))
+    start = time.time()
+
+    if (prep_fn is None and node_list and
+        compat.all(kind in _NODE_INDEPENDENT_ENCODINGS for kind in argkinds)):
+      # the body is the same for all nodes, hence it is encoded only once and
+      # shared by all requests
+      body = serializer.DumpJson(
+        encode_args_fn(None),
+        private_encoder=serializer.EncodeWithPrivateFields)
+      pnbody = dict.fromkeys(node_list, body)
+      encoded = 1
+      bytes_saved = len(body) * (len(pnbody) - 1)
+    else:
+      if prep_fn is None:
+        prep_fn = lambda _, args: args
+      assert callable(prep_fn)
+
+      # encode the arguments for each node individually, pass them and the
+      # node name to the prep_fn, and serialise its return value
+      pnbody = dict(
+        (n, serializer.DumpJson(
+              prep_fn(n, encode_args_fn(n)),
+              private_encoder=serializer.EncodeWithPrivateFields))
+        for n in node_list
+      )
+      encoded = len(pnbody)
+      bytes_saved = 0
+
+    _RecordEncoding(procedure, len(pnbody), encoded, time.time() - start,
+                    bytes_saved)
+
+    if self._async_proc is not None:
+      wait_fn = self._start(node_list, procedure, pnbody, read_timeout,
+                            req_resolver_opts, self._async_proc)
+      return RpcFuture(wait_fn, compat.partial(self._PostProcess, postproc_fn))
 
     result = self._proc(node_list, procedure, pnbody, read_timeout,
                         req_resolver_opts)
 
+    return self._PostProcess(postproc_fn, result)
+
+  @staticmethod
+  def _PostProcess(postproc_fn, result):
+    """Applies the post-processing function of a call to its results.
+
+    """
     if postproc_fn:
       return dict(map(lambda (key, value): (key, postproc_fn(value)),
                       result.items()))
     else:
       return result
 
+  def call_batch(self, node, calls, fail_fast=False):
+    """Executes several procedures on a node in a single request.
+
+    The arguments of every procedure are encoded, and its result is
+    post-processed, as for a call of its own. In fail-fast mode, the node
+    stops at the first failed procedure and the results of the following
+    ones report that they were not executed.
+
+    @type node: string
+    @param node: Node name
+    @type calls: list of tuples
+    @param calls: List of (procedure name, list of arguments) tuples, in the
+      order in which the procedures are executed
+    @type fail_fast: bool
+    @param fail_fast: Whether to stop at the first failed procedure
+    @rtype: list of L{RpcResult}
+    @return: The results of the procedures, in the order of C{calls}; for
+      clients returned by L{GetAsync}, an L{RpcFuture} of them
+
+    """
+    cdefs = []
+    body = []
+
+    for (procedure, args) in calls:
+      cdef = rpc_defs.ALL_CALLS.get(procedure)
+      if cdef is None:
+        raise errors.ProgrammerError("Unknown RPC procedure '%s'" % procedure)
+
+      (_, _, _, _, argdefs, prep_fn, _, _) = cdef
+
+      if len(args) != len(argdefs):
+        raise errors.ProgrammerError("Number of arguments passed to '%s'"
+                                     " doesn't match" % procedure)
+
+      encoded = map(compat.partial(self._encoder, node),
+                    zip(map(compat.snd, argdefs), args))
+      if prep_fn is not None:
+        encoded = prep_fn(node, encoded)
+
+      cdefs.append(cdef)
+      body.append((procedure, encoded))
+
+    if body:
+      result = \
+        self._Call(rpc_defs.BATCH_CALL, [node], [body, fail_fast])[node]
+    else:
+      # Empty batches are not sent
+      result = None
+
+    if self._async_proc is None:
+      return _SplitBatchResult(result, cdefs, fail_fast)
+    elif result is None:
+      return RpcFuture(lambda: [])
+    else:
+      return RpcFuture(result.GetResult,
+                       lambda value: _SplitBatchResult(value, cdefs,
+                                                       fail_fast))
+
 
 def _ObjectToDict(_, value):
   """Converts an object to a dictionary.
@@ -779,6 +1159,37 @@ def PrepareStorageUnitsForNodes(cfg, storage_units, node_uuids):
   return dict(zip(node_uuids, flags))
 
 
+def _EncodeJobQueueUpdates(_, updates):
+  """Encodes a batch of changes to job queue files.
+
+  @type updates: list of tuples
+  @param updates: the changes as C{(operation, file_name, content)}
+
+  """
+  result = []
+  for (operation, file_name, content) in updates:
+    if content is not None:
+      content = _Compress(None, content)
+    result.append((operation, file_name, content))
+  return result
+
+
+#: Argument kinds whose encoding is the same for every node; the body of a
+#: call with only such arguments and without a preparation function is
+#: encoded once for all nodes
+_NODE_INDEPENDENT_ENCODINGS = compat.UniqueFrozenset([
+  None,
+  rpc_defs.ED_OBJECT_DICT,
+  rpc_defs.ED_OBJECT_DICT_LIST,
+  rpc_defs.ED_FILE_DETAILS,
+  rpc_defs.ED_FINALIZE_EXPORT_DISKS,
+  rpc_defs.ED_COMPRESS,
+  rpc_defs.ED_BLOCKDEV_RENAME,
+  rpc_defs.ED_NIC_DICT,
+  rpc_defs.ED_DEVICE_DICT,
+  rpc_defs.ED_JOBQUEUE_UPDATES,
+  ])
+
 #: Generic encoders
 _ENCODERS = {
   rpc_defs.ED_OBJECT_DICT: _ObjectToDict,
@@ -786,6 +1197,7 @@ _ENCODERS = {
   rpc_defs.ED_COMPRESS: _Compress,
   rpc_defs.ED_FINALIZE_EXPORT_DISKS: _PrepareFinalizeExportDisks,
   rpc_defs.ED_BLOCKDEV_RENAME: _EncodeBlockdevRename,
+  rpc_defs.ED_JOBQUEUE_UPDATES: _EncodeJobQueueUpdates,
   }
 
 
@@ -885,15 +1297,15 @@ class RpcRunner(_RpcClientBase,
     """
     idict = instance.ToDict()
     cluster = self._cfg.GetClusterInfo()
-    idict["hvparams"] = cluster.FillHV(instance)
+    idict["hvparams"] = dict(cluster.FillHVView(instance))
     idict["secondary_nodes"] = \
       self._cfg.GetInstanceSecondaryNodes(instance.uuid)
     if hvp is not None:
       idict["hvparams"].update(hvp)
-    idict["beparams"] = cluster.FillBE(instance)
+    idict["beparams"] = dict(cluster.FillBEView(instance))
     if bep is not None:
       idict["beparams"].update(bep)
-    idict["osparams"] = cluster.SimpleFillOS(instance.os, instance.osparams)
+    idict["osparams"] = dict(cluster.FillOSView(instance))
     if osp is not None:
       idict["osparams"].update(osp)
     disks = self._cfg.GetInstanceDisks(instance.uuid)
@@ -82,7 +82,8 @@ ACCEPT_OFFLINE_NODE = object()
  ED_MULTI_DISKS_DICT_DP,
  ED_SINGLE_DISK_DICT_DP,
  ED_NIC_DICT,
- ED_DEVICE_DICT) = range(1, 17)
+ ED_DEVICE_DICT,
+ ED_JOBQUEUE_UPDATES) = range(1, 18)
 
 
 def _Prepare(calls):
@@ -182,6 +183,24 @@ def _TestDelayTimeout((duration, )):
   return int(duration + 5)
 
 
+def _BatchTimeout((calls, _)):
+  """Calculate timeout for "batch" RPC.
+
+  The timeout is the sum of the timeouts of the batched calls. Timeouts
+  calculated from the arguments receive the encoded arguments.
+
+  """
+  total = 0
+
+  for (procedure, args) in calls:
+    timeout = ALL_CALLS[procedure][3]
+    if callable(timeout):
+      timeout = timeout(args)
+    total += timeout
+
+  return total
+
+
 _FILE_STORAGE_CALLS = [
   ("file_storage_dir_create", SINGLE, None, constants.RPC_TMO_FAST, [
     ("file_storage_dir", None, "File storage directory"),
@@ -592,6 +611,10 @@ CALLS = {
       ("file_name", None, None),
       ("content", ED_COMPRESS, None),
       ], None, None, "Update job queue file"),
+    ("jobqueue_update_batch", MULTI, None, constants.RPC_TMO_URGENT, [
+      ("updates", ED_JOBQUEUE_UPDATES,
+       "List of (operation, file name, content) tuples"),
+      ], None, None, "Apply a batch of changes to job queue files"),
     ("jobqueue_purge", SINGLE, None, constants.RPC_TMO_NORMAL, [], None, None,
      "Purge job queue"),
     ("jobqueue_rename", MULTI, None, constants.RPC_TMO_URGENT, [
@@ -662,3 +685,13 @@ CALLS = {
       ], None, None, "Write ssconf files"),
     ]),
   }
+
+#: All call definitions by name
+ALL_CALLS = dict(item for calls in CALLS.values() for item in calls.items())
+
+#: Call executing several calls on one node in a single request; it is not
+#: generated, but used by L{rpc.node._RpcClientBase.call_batch}
+BATCH_CALL = ("batch", SINGLE, None, _BatchTimeout, [
+  ("calls", None, "List of (procedure, encoded arguments) tuples"),
+  ("fail_fast", None, "Whether to stop at the first failed procedure"),
+  ], None, None, "Execute several procedures in order")
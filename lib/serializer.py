@@ -39,6 +39,7 @@ backend (currently json).
 # function and not a constant
 
 import re
+import zlib
 
 # Python 2.6 and above contain a JSON module based on simplejson. Unfortunately
 # the standard library version is significantly slower than the external
@@ -47,12 +48,33 @@ import re
 # too.
 import simplejson
 
+from ganeti import compat
 from ganeti import errors
 from ganeti import utils
 from ganeti import constants
 
 _RE_EOLSP = re.compile("[ \t]+$", re.MULTILINE)
 
+#: Plain JSON configuration file format, see L{DumpConfig}
+CONFIG_FORMAT_JSON = "json"
+
+#: Compressed configuration file format, version 1: a header line followed
+#: by zlib-compressed, compact JSON
+CONFIG_FORMAT_ZLIB1 = "zlib1"
+
+CONFIG_FORMATS = compat.UniqueFrozenset([
+  CONFIG_FORMAT_JSON,
+  CONFIG_FORMAT_ZLIB1,
+  ])
+
+#: Prefix of the header line of configuration files not stored as plain JSON;
+#: a JSON document can't start with it, so the format can be auto-detected
+_CONFIG_HEADER_PREFIX = "#ganeti-config "
+
+#: zlib compression level for configuration files; higher levels are
+#: considerably slower while hardly reducing the size any further
+_CONFIG_ZLIB_LEVEL = 6
+
 
 def DumpJson(data, private_encoder=None):
   """Serialize a given object.
@@ -224,6 +246,85 @@ def LoadAndVerifyJson(raw, verify_fn):
   return data
 
 
+def DumpConfig(data, fmt=CONFIG_FORMAT_JSON, private_encoder=None):
+  """Serializes configuration data in the given file format.
+
+  @param data: the data to serialize
+  @type fmt: string
+  @param fmt: one of L{CONFIG_FORMATS}
+  @param private_encoder: see L{DumpJson}
+  @rtype: string
+
+  """
+  if fmt == CONFIG_FORMAT_JSON:
+    return DumpJson(data, private_encoder=private_encoder)
+
+  if fmt == CONFIG_FORMAT_ZLIB1:
+    if private_encoder is None:
+      private_encoder = EncodeWithoutPrivateFields
+    # Neither indentation nor the whitespace cleanup of L{DumpJson} are
+    # useful for compressed data
+    encoded = simplejson.dumps(data, default=private_encoder,
+                               separators=(",", ":"))
+    return "%s%s\n%s" % (_CONFIG_HEADER_PREFIX, fmt,
+                         zlib.compress(encoded, _CONFIG_ZLIB_LEVEL))
+
+  raise errors.ProgrammerError("Unknown configuration format '%s'" % fmt)
+
+
+def _SplitConfigHeader(raw):
+  """Splits serialized configuration data into format and payload.
+
+  @type raw: string
+  @rtype: tuple; (string, string)
+  @raise errors.ConfigurationError: if the format isn't supported
+
+  """
+  if not raw.startswith(_CONFIG_HEADER_PREFIX):
+    return (CONFIG_FORMAT_JSON, raw)
+
+  (header, _, payload) = raw.partition("\n")
+  fmt = header[len(_CONFIG_HEADER_PREFIX):]
+  if fmt not in CONFIG_FORMATS or fmt == CONFIG_FORMAT_JSON:
+    raise errors.ConfigurationError("Unsupported configuration file format"
+                                    " '%s'" % fmt)
+
+  return (fmt, payload)
+
+
+def GetConfigFormat(raw):
+  """Detects the file format of serialized configuration data.
+
+  @type raw: string
+  @rtype: string
+  @return: one of L{CONFIG_FORMATS}
+
+  """
+  return _SplitConfigHeader(raw)[0]
+
+
+def LoadConfig(raw):
+  """Unserializes configuration data, auto-detecting its file format.
+
+  @type raw: string
+  @param raw: data as written by L{DumpConfig}
+  @return: the original data
+  @raise errors.ConfigurationError: if the format isn't supported or the
+      compressed data is corrupted
+
+  """
+  (fmt, payload) = _SplitConfigHeader(raw)
+
+  if fmt == CONFIG_FORMAT_ZLIB1:
+    try:
+      payload = zlib.decompress(payload)
+    except zlib.error, err:
+      raise errors.ConfigurationError("Can't decompress configuration data:"
+                                      " %s" % err)
+
+  return LoadJson(payload)
+
+
 Dump = DumpJson
 Load = LoadJson
 DumpSigned = DumpSignedJson
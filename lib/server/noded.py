@@ -187,8 +187,22 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     if method is None:
       raise http.HttpNotFound()
 
+    result = self._ExecuteCall(
+      lambda: method(serializer.LoadJson(req.request_body)))
+
+    return serializer.DumpJson(result)
+
+  def _ExecuteCall(self, fn):
+    """Executes an RPC procedure.
+
+    @type fn: callable
+    @param fn: Function executing the procedure
+    @rtype: tuple
+    @return: (success, payload) tuple
+
+    """
     try:
-      result = (True, method(serializer.LoadJson(req.request_body)))
+      result = (True, fn())
 
     except backend.RPCFail, err:
       # our custom failure exception; str(err) works fine if the
@@ -207,7 +221,34 @@ class NodeRequestHandler(http.server.HttpServerHandler):
       logging.exception("Error in RPC call")
       result = (False, "Error while executing backend function: %s" % str(err))
 
-    return serializer.DumpJson(result)
+    return result
+
+  # batches of calls ---------------------
+
+  def perspective_batch(self, params):
+    """Executes several procedures in order.
+
+    In fail-fast mode, the procedures following the first failed one are
+    not executed and no results are returned for them.
+
+    """
+    (calls, fail_fast) = params
+
+    results = []
+    for (procedure, args) in calls:
+      method = getattr(self, "perspective_%s" % procedure, None)
+      if method is None or procedure == "batch":
+        result = (False, "Unknown procedure '%s'" % procedure)
+      else:
+        # pylint: disable=W0640
+        result = self._ExecuteCall(lambda: method(args))
+
+      results.append(result)
+
+      if fail_fast and not result[0]:
+        break
+
+    return results
 
   # the new block devices  --------------------------
 
@@ -1107,6 +1148,15 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     (file_name, content) = params
     return backend.JobQueueUpdate(file_name, content)
 
+  @staticmethod
+  @_RequireJobQueueLock
+  def perspective_jobqueue_update_batch(params):
+    """Apply a batch of changes to the job queue.
+
+    """
+    (updates, ) = params
+    return backend.JobQueueUpdateBatch(updates)
+
   @staticmethod
   @_RequireJobQueueLock
   def perspective_jobqueue_purge(params):
@@ -1317,7 +1367,7 @@ def PrepNoded(options, _):
     http.server.HttpServer(mainloop, options.bind_address, options.port,
                            handler, ssl_params=ssl_params, ssl_verify_peer=True,
                            request_executor_class=request_executor_class,
-                           ssl_verify_callback=SSLVerifyPeer)
+                           ssl_verify_callback=SSLVerifyPeer, keep_alive=True)
   server.Start()
 
   return (mainloop, server)
@@ -318,6 +318,10 @@ def CheckRapi(options, args):
                           sys.argv[0])
     sys.exit(constants.EXIT_FAILURE)
 
+  if options.worker_threads is not None and options.worker_threads < 1:
+    print >> sys.stderr, "The number of worker threads must be at least 1"
+    sys.exit(constants.EXIT_FAILURE)
+
   ssconf.CheckMaster(options.debug)
 
   # Read SSL certificate (this is a little hackish to read the cert as root)
@@ -344,10 +348,14 @@ def PrepRapi(options, _):
 
   users.Load(pathutils.RAPI_USERS_FILE)
 
+  # Connections are only kept open by worker threads, a child process for
+  # every idle connection would be too expensive
   server = \
     http.server.HttpServer(mainloop, options.bind_address, options.port,
                            handler,
-                           ssl_params=options.ssl_params, ssl_verify_peer=False)
+                           ssl_params=options.ssl_params, ssl_verify_peer=False,
+                           keep_alive=(options.worker_threads is not None),
+                           worker_threads=options.worker_threads)
   server.Start()
 
   return (mainloop, server)
@@ -377,6 +385,10 @@ def Main():
                     default=False, action="store_true",
                     help=("Disable anonymous HTTP requests and require"
                           " authentication"))
+  parser.add_option("--worker-threads", dest="worker_threads",
+                    default=None, type="int", metavar="NUM",
+                    help=("Handle connections in a pool of NUM threads"
+                          " instead of a child process per connection"))
 
   daemon.GenericMain(constants.RAPI, parser, CheckRapi, PrepRapi, ExecRapi,
                      default_ssl_cert=pathutils.RAPI_CERT_FILE,
@@ -95,7 +95,8 @@ def EnsureQueueDir(path, mode, uid, gid):
 
   """
   for filename in utils.ListVisibleFiles(path):
-    if constants.JOB_FILE_RE.match(filename):
+    if (constants.JOB_FILE_RE.match(filename) or
+        constants.JOB_JOURNAL_RE.match(filename)):
       utils.EnforcePermission(utils.PathJoin(path, filename), mode, uid=uid,
                               gid=gid)
 
@@ -32,8 +32,11 @@
 """
 
 import re
+import copy
 import time
 import itertools
+import threading
+import collections
 
 from ganeti import compat
 from ganeti.utils import text
@@ -330,3 +333,108 @@ class RunningTimeout(object):
       return max(0.0, remaining_timeout)
 
     return remaining_timeout
+
+
+class FrozenDict(dict):
+  """A dictionary which can't be modified.
+
+  Copies made with L{copy.copy} or L{copy.deepcopy} are normal, modifiable
+  dictionaries. Note that the values themselves aren't protected.
+
+  """
+  def _ReadOnly(self, *_, **__):
+    raise TypeError("'%s' object does not support modifications" %
+                    self.__class__.__name__)
+
+  __setitem__ = __delitem__ = _ReadOnly
+  clear = pop = popitem = setdefault = update = _ReadOnly
+
+  def __copy__(self):
+    return dict(self)
+
+  def __deepcopy__(self, memo):
+    return copy.deepcopy(dict(self), memo)
+
+  def __reduce__(self):
+    return (self.__class__, (dict(self), ))
+
+
+class LRUCache(object):
+  """A cache discarding the least recently used entries.
+
+  Every use of an entry appends it to a queue of uses, together with a
+  counter identifying the use. Outdated uses are skipped when looking for
+  the least recently used entry and dropped when the queue grows too large.
+
+  The cache is thread-safe.
+
+  """
+  def __init__(self, size):
+    """Initializes this class.
+
+    @type size: int
+    @param size: the maximum number of entries
+
+    """
+    if size < 1:
+      raise ValueError("Cache size must be positive, got %r" % size)
+    self._size = size
+    self._entries = {}
+    self._uses = collections.deque()
+    self._counter = itertools.count()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def _Use(self, key, value):
+    """Stores an entry and records it as the most recently used one.
+
+    """
+    use = self._counter.next()
+    self._entries[key] = (value, use)
+    self._uses.append((use, key))
+    if len(self._uses) > 2 * self._size:
+      self._uses = collections.deque(sorted((u, k) for (k, (_, u))
+                                            in self._entries.items()))
+
+  def Get(self, key, default=None):
+    """Returns the value of an entry and marks it as recently used.
+
+    """
+    self._lock.acquire()
+    try:
+      try:
+        (value, _) = self._entries[key]
+      except KeyError:
+        return default
+      self._Use(key, value)
+      return value
+    finally:
+      self._lock.release()
+
+  def Set(self, key, value):
+    """Adds or replaces an entry, discarding the least recently used one if
+    the cache is full.
+
+    """
+    self._lock.acquire()
+    try:
+      self._Use(key, value)
+      while len(self._entries) > self._size:
+        (use, oldest) = self._uses.popleft()
+        if self._entries[oldest][1] == use:
+          del self._entries[oldest]
+    finally:
+      self._lock.release()
+
+  def Clear(self):
+    """Removes all entries.
+
+    """
+    self._lock.acquire()
+    try:
+      self._entries.clear()
+      self._uses.clear()
+    finally:
+      self._lock.release()
@@ -33,6 +33,7 @@
 
 import os
 import re
+import fcntl
 import logging
 import shutil
 import tempfile
@@ -332,6 +333,95 @@ def SafeWriteFile(file_name, file_id, **kwargs):
     os.close(fd)
 
 
+def AppendFile(file_name, data, mode=None, uid=-1, gid=-1, create=True):
+  """Appends data to a file, creating it if necessary.
+
+  Contrary to L{WriteFile} this is not atomic; the data is written with
+  C{O_APPEND} and synced to disk before returning, so after a crash
+  only the last record can be incomplete. Owner, group and mode are
+  only set if the file was empty.
+
+  The data is written while holding an exclusive POSIX lock on the file.
+  Writers removing the file while holding the same lock can therefore be
+  sure that nothing is appended to it after its removal; if the file was
+  removed before the lock was acquired, C{ENOENT} is raised.
+
+  @type file_name: str
+  @param file_name: the target filename
+  @type data: str
+  @param data: the data to append
+  @type mode: int
+  @param mode: file mode
+  @type uid: int
+  @param uid: the owner of the file
+  @type gid: int
+  @param gid: the group of the file
+  @type create: boolean
+  @param create: whether to create the file if it doesn't exist; if not,
+      C{ENOENT} is raised for missing files
+
+  @raise errors.ProgrammerError: if the path is not absolute
+
+  """
+  if not os.path.isabs(file_name):
+    raise errors.ProgrammerError("Path passed to AppendFile is not"
+                                 " absolute: '%s'" % file_name)
+
+  if isinstance(data, unicode):
+    data = data.encode()
+  assert isinstance(data, str)
+
+  flags = os.O_WRONLY | os.O_APPEND
+  if create:
+    flags |= os.O_CREAT
+
+  fd = os.open(file_name, flags, 0600)
+  try:
+    fcntl.lockf(fd, fcntl.LOCK_EX)
+    st = os.fstat(fd)
+    if st.st_nlink == 0:
+      raise EnvironmentError(errno.ENOENT, "File '%s' was removed" % file_name)
+    if st.st_size == 0:
+      if uid != -1 or gid != -1:
+        os.fchown(fd, uid, gid)
+      if mode:
+        os.fchmod(fd, mode)
+    to_write = len(data)
+    offset = 0
+    while offset < to_write:
+      written = os.write(fd, buffer(data, offset))
+      assert written >= 0
+      assert written <= to_write - offset
+      offset += written
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+
+def RemoveLockedFile(file_name):
+  """Removes a file while holding an exclusive POSIX lock on it.
+
+  Used together with L{AppendFile}, this ensures no data is appended to
+  the file once it has been removed. Missing files are ignored.
+
+  @type file_name: str
+  @param file_name: the file to remove
+
+  """
+  try:
+    fd = os.open(file_name, os.O_WRONLY)
+  except EnvironmentError, err:
+    if err.errno == errno.ENOENT:
+      return
+    raise
+
+  try:
+    fcntl.lockf(fd, fcntl.LOCK_EX)
+    RemoveFile(file_name)
+  finally:
+    os.close(fd)
+
+
 def ReadOneLineFile(file_name, strict=False):
   """Return the first non-empty line from a file.
 
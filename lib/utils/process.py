@@ -43,6 +43,12 @@ import resource
 
 from cStringIO import StringIO
 
+try:
+  # pylint: disable=F0401
+  import ctypes
+except ImportError:
+  ctypes = None
+
 from ganeti import errors
 from ganeti import constants
 from ganeti import compat
@@ -1083,3 +1089,41 @@ def CloseFDs(noclose_fds=None):
     if noclose_fds and fd in noclose_fds:
       continue
     utils_wrapper.CloseFdNoError(fd)
+
+
+def SetProcessTitle(title, _ctypes=ctypes):
+  """Sets the title of the current process as shown by ps(1).
+
+  The command line of the process is overwritten in place, so the title is
+  cut to the length of the original command line. This requires the
+  C{ctypes} module; failures are logged and otherwise ignored.
+
+  @type title: str
+  @param title: the new title
+
+  """
+  if _ctypes is None:
+    logging.debug("Can't set the process title, ctypes module not found")
+    return
+
+  argc = _ctypes.c_int()
+  argv = _ctypes.POINTER(_ctypes.c_char_p)()
+  try:
+    _ctypes.pythonapi.Py_GetArgcArgv(_ctypes.byref(argc), _ctypes.byref(argv))
+  except AttributeError, err:
+    logging.debug("Can't set the process title: %s", err)
+    return
+
+  if argc.value < 1:
+    return
+
+  # Only arguments stored one after the other can be overwritten together
+  addresses = _ctypes.cast(argv, _ctypes.POINTER(_ctypes.c_void_p))
+  size = len(argv[0]) + 1
+  for idx in range(1, argc.value):
+    if addresses[idx] != addresses[0] + size:
+      break
+    size += len(argv[idx]) + 1
+
+  _ctypes.memset(addresses[0], 0, size)
+  _ctypes.memmove(addresses[0], title, min(len(title), size - 1))
@@ -61,6 +61,7 @@ from ganeti import objects
 from ganeti import ssconf
 from ganeti import ht
 from ganeti import pathutils
+from ganeti import jstore
 
 import ganeti.rapi.client # pylint: disable=W0611
 from ganeti.rapi.client import UsesRapiClient
@@ -668,6 +669,18 @@ def _ArchiveJobs(cl, age):
   logging.debug("Archived %s jobs, left %s", arch_count, left_count)
 
 
+def _PackArchivedJobs():
+  """Packs the archived job files into segment files.
+
+  """
+  try:
+    count = jstore.PackArchive()
+  except (EnvironmentError, errors.GenericError), err:
+    logging.error("Failed to pack archived jobs: %s", err)
+  else:
+    logging.debug("Packed %s archived jobs", count)
+
+
 def _CheckMaster(cl):
   """Ensures current host is master node.
 
@@ -692,6 +705,9 @@ def _GlobalWatcher(opts):
   if nodemaint.NodeMaintenance.ShouldRun(): # pylint: disable=E0602
     nodemaint.NodeMaintenance().Exec() # pylint: disable=E0602
 
+  # Every node keeping a copy of the job queue packs its own archive
+  _PackArchivedJobs()
+
   try:
     client = GetLuxiClient(True)
   except NotMasterError:
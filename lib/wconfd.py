@@ -32,14 +32,19 @@
 
 """
 
+import errno
 import logging
+import os
 import random
+import select
+import threading
 import time
 
 import ganeti.rpc.client as cl
 import ganeti.rpc.stub.wconfd as stub
 from ganeti.rpc.transport import Transport
 from ganeti.rpc import errors
+from ganeti import utils
 
 
 class Client(cl.AbstractStubClient, stub.ClientRpcStub):
@@ -69,3 +74,263 @@ class Client(cl.AbstractStubClient, stub.ClientRpcStub):
           raise
         logging.debug("Will retry")
         time.sleep(try_no * 10 + 10 * random.random())
+
+
+#: How long to wait for a notification from WConfD before checking the
+#: state of a lock request anyway
+LOCK_NOTIFICATION_TIMEOUT = 10.0
+
+#: Upper bounds, in seconds, of the buckets of the call latency histograms;
+#: slower calls are counted in an additional last bucket
+_LATENCY_BUCKETS = [0.001, 0.01, 0.1, 1.0, 10.0]
+
+
+class _CallStatistics(object):
+  """Number and latency of the calls of a method.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self.count = 0
+    self.total_time = 0.0
+    self.histogram = [0] * (len(_LATENCY_BUCKETS) + 1)
+
+  def Add(self, duration):
+    """Records a call.
+
+    @type duration: float
+    @param duration: how long the call took, in seconds
+
+    """
+    self.count += 1
+    self.total_time += duration
+
+    for (idx, bound) in enumerate(_LATENCY_BUCKETS):
+      if duration <= bound:
+        break
+    else:
+      idx = len(_LATENCY_BUCKETS)
+    self.histogram[idx] += 1
+
+  def ToDict(self):
+    """Returns the statistics as a dictionary.
+
+    The histogram is a list of pairs of bucket upper bound (None for the
+    last bucket) and number of calls.
+
+    """
+    return {
+      "count": self.count,
+      "total_time": self.total_time,
+      "histogram": zip(_LATENCY_BUCKETS + [None], self.histogram),
+      }
+
+
+class SharedClient(Client):
+  """WConfD client shared by all threads of a process.
+
+  Calls are serialized over a single connection, which is re-established
+  transparently if WConfD closes it. The number and the latency of the
+  calls are recorded per method.
+
+  """
+  def __init__(self, timeouts=None, transport=Transport):
+    """Constructor for the SharedClient class.
+
+    Arguments are the same as for L{Client}.
+
+    """
+    Client.__init__(self, timeouts=timeouts, transport=transport)
+    self._lock = threading.Lock()
+    self._stats = {}
+
+  def CallMethod(self, method, args):
+    """Sends a request and returns the response, see L{Client.CallMethod}.
+
+    """
+    self._lock.acquire()
+    try:
+      start = time.time()
+      try:
+        return Client.CallMethod(self, method, args)
+      finally:
+        stats = self._stats.get(method)
+        if stats is None:
+          stats = self._stats[method] = _CallStatistics()
+        stats.Add(time.time() - start)
+    finally:
+      self._lock.release()
+
+  def GetStatistics(self):
+    """Returns the call statistics.
+
+    @rtype: dict
+    @return: dictionary from method name to its statistics, see
+      L{_CallStatistics.ToDict}
+
+    """
+    self._lock.acquire()
+    try:
+      return dict((method, stats.ToDict())
+                  for (method, stats) in self._stats.items())
+    finally:
+      self._lock.release()
+
+
+#: The client shared by the current process, together with the process ID
+#: it was created in; a forked child must not use the connection of its
+#: parent
+_shared_client = [None, None]
+_shared_client_lock = threading.Lock()
+
+
+def GetClient():
+  """Returns the WConfD client shared by the current process.
+
+  The client is created on first use.
+
+  @rtype: L{SharedClient}
+
+  """
+  _shared_client_lock.acquire()
+  try:
+    (pid, client) = _shared_client
+    if client is None or pid != os.getpid():
+      client = SharedClient()
+      _shared_client[:] = [os.getpid(), client]
+    return client
+  finally:
+    _shared_client_lock.release()
+
+
+def GetClientStatistics():
+  """Returns the call statistics of the client shared by this process.
+
+  @rtype: dict
+  @return: see L{SharedClient.GetStatistics}; empty if the process doesn't
+    have a shared client
+
+  """
+  (pid, client) = _shared_client
+  if client is None or pid != os.getpid():
+    return {}
+  return client.GetStatistics()
+
+
+class LockNotifier(object):
+  """Wakes up threads waiting for locks.
+
+  WConfD sends SIGHUP to a job process when locks it is waiting for may
+  have become available. The signal handler calls L{Notify}, which writes
+  to a pipe, so that a thread blocked in L{Wait} resumes immediately.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    (self._read_fd, self._write_fd) = os.pipe()
+    for fd in [self._read_fd, self._write_fd]:
+      utils.SetNonblockFlag(fd, True)
+      utils.SetCloseOnExecFlag(fd, True)
+
+  def Notify(self):
+    """Wakes up the waiting threads.
+
+    This is safe to call from a signal handler.
+
+    """
+    try:
+      os.write(self._write_fd, "\0")
+    except OSError, err:
+      # If the pipe is full, a notification is pending anyway
+      if err.errno != errno.EAGAIN:
+        raise
+
+  def Clear(self):
+    """Discards all pending notifications.
+
+    """
+    while True:
+      try:
+        if not os.read(self._read_fd, 4096):
+          break
+      except OSError, err:
+        if err.errno == errno.EAGAIN:
+          break
+        raise
+
+  def Wait(self, timeout):
+    """Waits for a notification.
+
+    @type timeout: float
+    @param timeout: maximum time to wait
+    @rtype: bool
+    @return: whether a notification was received
+
+    """
+    try:
+      (readable, _, _) = select.select([self._read_fd], [], [], timeout)
+    except select.error, err:
+      if err.args[0] != errno.EINTR:
+        raise
+      # Interrupted by a signal; its handler might have notified us
+      (readable, _, _) = select.select([self._read_fd], [], [], 0)
+
+    self.Clear()
+
+    return bool(readable)
+
+
+#: The notifier of the current process
+_lock_notifier = [None]
+_lock_notifier_lock = threading.Lock()
+
+#: Whether the current process handles the notifications of WConfD
+_lock_notifications = [False]
+
+
+def GetLockNotifier():
+  """Returns the process-wide L{LockNotifier}, creating it if necessary.
+
+  """
+  if _lock_notifier[0] is None:
+    _lock_notifier_lock.acquire()
+    try:
+      if _lock_notifier[0] is None:
+        _lock_notifier[0] = LockNotifier()
+    finally:
+      _lock_notifier_lock.release()
+  return _lock_notifier[0]
+
+
+def NotifyLockWaiters():
+  """Wakes up the threads waiting for locks, see L{LockNotifier.Notify}.
+
+  """
+  notifier = _lock_notifier[0]
+  if notifier is not None:
+    notifier.Notify()
+
+
+def EnableLockNotifications():
+  """Declares that this process handles the notifications of WConfD.
+
+  WConfD notifies a process by sending it SIGHUP, which terminates
+  processes that don't handle it. Only processes that call this function
+  after installing their handler may therefore wait in the queue of a
+  WConfD lock, see L{LockNotificationsEnabled}.
+
+  """
+  _lock_notifications[0] = True
+
+
+def LockNotificationsEnabled():
+  """Returns whether this process handles the notifications of WConfD.
+
+  @rtype: bool
+
+  """
+  return _lock_notifications[0]
@@ -35,8 +35,11 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 module Ganeti.Config
     ( LinkIpMap
     , NdParamObject(..)
+    , ConfigFormat(..)
     , loadConfig
+    , loadConfigWithFormat
     , saveConfig
+    , saveConfigAs
     , getNodeInstances
     , getNodeRole
     , getNodeNdParams
@@ -81,6 +84,9 @@ module Ganeti.Config
 import Control.Applicative
 import Control.Monad
 import Control.Monad.State
+import qualified Data.ByteString.Lazy as BL
+import qualified Data.ByteString.Lazy.Char8 as BLC
+import qualified Data.ByteString.Lazy.UTF8 as UTF8L
 import qualified Data.Foldable as F
 import Data.List (foldl', nub)
 import Data.Monoid
@@ -90,6 +96,7 @@ import qualified Text.JSON as J
 import System.IO
 
 import Ganeti.BasicTypes
+import Ganeti.Codec (compressZlib, decompressZlib)
 import qualified Ganeti.Constants as C
 import Ganeti.Errors
 import Ganeti.JSON
@@ -102,9 +109,39 @@ type LinkIpMap = M.Map String (M.Map String String)
 
 -- * Operations on the whole configuration
 
--- | Reads the config file.
+-- | Prefix of the header line of configuration files that aren't stored as
+-- plain JSON, see @serializer.DumpConfig@ in the Python code.
+configHeaderPrefix :: BL.ByteString
+configHeaderPrefix = BLC.pack "#ganeti-config "
+
+-- | Header line of configuration files stored as zlib-compressed JSON.
+zlibConfigHeader :: BL.ByteString
+zlibConfigHeader = BL.append configHeaderPrefix (BLC.pack "zlib1\n")
+
+-- | The file formats of the configuration file, see
+-- @serializer.CONFIG_FORMATS@ in the Python code.
+data ConfigFormat = ConfigFormatJson  -- ^ Plain JSON
+                  | ConfigFormatZlib1 -- ^ Header line and compressed JSON
+                    deriving (Eq, Show)
+
+-- | Reads the config file, decompressing it if necessary, and returns its
+-- contents together with the detected file format.
+readConfigWithFormat :: FilePath -> IO (Result (String, ConfigFormat))
+readConfigWithFormat path = runResultT $ do
+  contents <- liftIO $ BL.readFile path
+  decodeContents contents
+  where
+    decodeContents contents
+      | zlibConfigHeader `BL.isPrefixOf` contents = do
+          json <- decompressZlib $ BL.drop (BL.length zlibConfigHeader) contents
+          return (UTF8L.toString json, ConfigFormatZlib1)
+      | configHeaderPrefix `BL.isPrefixOf` contents =
+          failError "Unsupported configuration file format"
+      | otherwise = return (UTF8L.toString contents, ConfigFormatJson)
+
+-- | Reads the config file, decompressing it if necessary.
 readConfig :: FilePath -> IO (Result String)
-readConfig = runResultT . liftIO . readFile
+readConfig = fmap (fmap fst) . readConfigWithFormat
 
 -- | Parses the configuration file.
 parseConfig :: String -> Result ConfigData
@@ -118,9 +155,23 @@ encodeConfig = J.encodeStrict
 loadConfig :: FilePath -> IO (Result ConfigData)
 loadConfig = fmap (>>= parseConfig) . readConfig
 
+-- | Loads the configuration and returns the file format it was stored in,
+-- so that it can be written back in the same format.
+loadConfigWithFormat :: FilePath -> IO (Result (ConfigData, ConfigFormat))
+loadConfigWithFormat =
+  fmap (>>= \(str, fmt) -> flip (,) fmt <$> parseConfig str)
+  . readConfigWithFormat
+
+-- | Writes the configuration to a handle in the given file format.
+saveConfigAs :: ConfigFormat -> Handle -> ConfigData -> IO ()
+saveConfigAs ConfigFormatJson fh = hPutStr fh . encodeConfig
+saveConfigAs ConfigFormatZlib1 fh =
+  BL.hPut fh . BL.append zlibConfigHeader . compressZlib . UTF8L.fromString
+  . encodeConfig
+
 -- | Wrapper over 'hPutStr' and 'encodeConfig'.
 saveConfig :: Handle -> ConfigData -> IO ()
-saveConfig fh = hPutStr fh . encodeConfig
+saveConfig = saveConfigAs ConfigFormatJson
 
 -- * Query functions
 
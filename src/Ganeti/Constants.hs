@@ -4096,6 +4096,12 @@ luxidMaximalRunningJobsDefault = 20
 luxidMaximalTrackedJobsDefault :: Int
 luxidMaximalTrackedJobsDefault = 25
 
+-- | The time in seconds after which the priority of a queued job is raised by
+-- one level when choosing the jobs to run, so that jobs with a low priority
+-- are not starved by a continuous stream of jobs with a higher priority.
+luxidJobAgingInterval :: Int
+luxidJobAgingInterval = 60
+
 -- | The number of retries when trying to @fork@ a new job.
 -- Due to a bug in GHC, this can fail even though we synchronize all forks
 -- and restrain from other @IO@ operations in the thread.
@@ -4126,6 +4132,12 @@ wconfdDefCtmo = 10
 wconfdDefRwto :: Int
 wconfdDefRwto = 60
 
+-- | How long, in seconds, a job waits for the exclusive configuration
+-- lock before giving up. Configuration updates are short, so not
+-- getting the lock within this time means its holder is stuck.
+wconfdConfigLockTimeout :: Int
+wconfdConfigLockTimeout = 600
+
 -- | The prefix of the WConfD livelock file name
 wconfdLivelockPrefix :: String
 wconfdLivelockPrefix = "wconf-daemon"
@@ -4694,6 +4706,9 @@ luxiReqSubmitManyJobs = "SubmitManyJobs"
 luxiReqWaitForJobChange :: String
 luxiReqWaitForJobChange = "WaitForJobChange"
 
+luxiReqWatchJob :: String
+luxiReqWatchJob = "WatchJob"
+
 luxiReqPickupJob :: String
 luxiReqPickupJob = "PickupJob"
 
@@ -4772,6 +4787,7 @@ luxiReqAll =
   , luxiReqSubmitJobToDrainedQueue
   , luxiReqSubmitManyJobs
   , luxiReqWaitForJobChange
+  , luxiReqWatchJob
   , luxiReqPickupJob
   ]
 
@@ -42,9 +42,15 @@ module Ganeti.JQScheduler
   , enqueueNewJobs
   , dequeueJob
   , setJobPriority
+  -- * Internals exported for testing
+  , JobWithStat(..)
+  , Queue(..)
+  , unreadJob
+  , unfinishedJobIds
+  , jobEligible
+  , selectJobsToRun
   ) where
 
-import Control.Applicative (liftA2)
 import Control.Arrow
 import Control.Concurrent
 import Control.Exception
@@ -54,14 +60,18 @@ import Data.Function (on)
 import Data.Functor ((<$))
 import Data.IORef
 import Data.List
+import qualified Data.Map as M
 import Data.Maybe
 import qualified Data.Set as S
 import System.INotify
+import System.Posix.Types (UserID)
 
 import Ganeti.BasicTypes
 import Ganeti.Constants as C
 import Ganeti.Errors
+import Ganeti.JQScheduler.Policy
 import Ganeti.JQueue as JQ
+import Ganeti.JSON (fromContainer)
 import Ganeti.Lens hiding (chosen)
 import Ganeti.Logging
 import Ganeti.Objects
@@ -74,6 +84,10 @@ import Ganeti.Utils.MVarLock
 data JobWithStat = JobWithStat { jINotify :: Maybe INotify
                                , jStat :: FStat
                                , jJob :: QueuedJob
+                               , jSubmitter :: Maybe UserID
+                                 -- ^ the user of the process that submitted
+                                 -- the job, if known; this is only kept in
+                                 -- memory and used for scheduling
                                }
 
 $(makeCustomLenses' ''JobWithStat ['jJob])
@@ -123,7 +137,8 @@ onQueuedJobs = over qEnqueuedL
 
 -- | Obtain a JobWithStat from a QueuedJob.
 unreadJob :: QueuedJob -> JobWithStat
-unreadJob job = JobWithStat {jJob=job, jStat=nullFStat, jINotify=Nothing}
+unreadJob job = JobWithStat { jJob=job, jStat=nullFStat, jINotify=Nothing
+                             , jSubmitter=Nothing }
 
 -- | Reload interval for polling the running jobs for updates in microseconds.
 watchInterval :: Int
@@ -148,6 +163,19 @@ getMaxRunningJobs = getConfigValue clusterMaxRunningJobs 1
 getMaxTrackedJobs :: JQStatus -> IO Int
 getMaxTrackedJobs = getConfigValue clusterMaxTrackedJobs 1
 
+-- | Get the scheduling policy for the current time. If the configuration
+-- is not available, the number of running jobs per opcode class is not
+-- limited.
+getSchedulingPolicy :: JQStatus -> IO SchedulingPolicy
+getSchedulingPolicy qstate = do
+  now <- currentTimestamp
+  limits <- getConfigValue (fromContainer . clusterMaxRunningJobsPerOpcode)
+              M.empty qstate
+  return SchedulingPolicy { spNow = now
+                          , spAgingInterval = C.luxidJobAgingInterval
+                          , spClassLimits = limits
+                          }
+
 -- | Get the number of jobs currently running.
 getRQL :: JQStatus -> IO Int
 getRQL = liftM (length . qRunning) . readIORef . jqJobs
@@ -297,20 +325,31 @@ attachWatcher state jWS = when (isNothing $ jINotify jWS) $ do
                    ++ (show . fromJobId . qjId $ jJob jWS)
                    ++ ", run queue length is " ++ show rql
 
+-- | The IDs of the enqueued and running jobs. Jobs leave the queue once
+-- they are finalized, so these are the jobs other jobs may still have to
+-- wait for. As before, jobs being manipulated don't block other jobs.
+unfinishedJobIds :: Queue -> S.Set JobId
+unfinishedJobIds queue =
+  S.fromList . map (qjId . jJob) $ qRunning queue ++ qEnqueued queue
+
 -- | For a queued job, determine whether it is eligible to run, i.e.,
--- if no jobs it depends on are either enqueued or running.
-jobEligible :: Queue -> JobWithStat -> Bool
-jobEligible queue jWS =
-  let jdeps = getJobDependencies $ jJob jWS
-      blocks = flip elem jdeps . qjId . jJob
-  in not . any blocks . liftA2 (++) qRunning qEnqueued $ queue
+-- if none of the jobs it depends on is unfinished. The set of unfinished
+-- jobs is computed once per scheduling round, so that checking all
+-- queued jobs doesn't take time quadratic in the length of the queue.
+jobEligible :: S.Set JobId -> JobWithStat -> Bool
+jobEligible unfinished =
+  not . any (`S.member` unfinished) . getJobDependencies . jJob
 
 -- | Decide on which jobs to schedule next for execution. This is the
--- pure function doing the scheduling.
-selectJobsToRun :: Int -> Queue -> (Queue, [JobWithStat])
-selectJobsToRun count queue =
+-- pure function doing the scheduling; the order in which the eligible
+-- jobs are chosen is determined by the scheduling policy.
+selectJobsToRun :: SchedulingPolicy -> Int -> Queue -> (Queue, [JobWithStat])
+selectJobsToRun policy count queue =
   let n = count - length (qRunning queue) - length (qManipulated queue)
-      chosen = take n . filter (jobEligible queue) $ qEnqueued queue
+      chosen = selectJobsByPolicy policy jJob jSubmitter n
+                 (qRunning queue ++ qManipulated queue)
+                 . filter (jobEligible $ unfinishedJobIds queue)
+                 $ qEnqueued queue
       remain = deleteFirstsBy ((==) `on` (qjId . jJob)) (qEnqueued queue) chosen
   in (queue {qEnqueued=remain, qRunning=qRunning queue ++ chosen}, chosen)
 
@@ -364,7 +403,8 @@ failJobs cfg qstate jobs = do
 scheduleSomeJobs :: JQStatus -> IO ()
 scheduleSomeJobs qstate = do
   count <- getMaxRunningJobs qstate
-  chosen <- atomicModifyIORef (jqJobs qstate) (selectJobsToRun count)
+  policy <- getSchedulingPolicy qstate
+  chosen <- atomicModifyIORef (jqJobs qstate) (selectJobsToRun policy count)
   let jobs = map jJob chosen
   unless (null chosen) . logInfo . (++) "Starting jobs: " . commaJoin
     $ map (show . fromJobId . qjId) jobs
@@ -471,30 +511,35 @@ initJQScheduler qstate = do
   _ <- forkIO $ onTimeWatcher qstate
   return ()
 
--- | Enqueue new jobs. This will guarantee that the jobs will be executed
+-- | Enqueue jobs. This will guarantee that the jobs will be executed
 -- eventually.
-enqueueNewJobs :: JQStatus -> [QueuedJob] -> IO ()
-enqueueNewJobs state jobs = do
+enqueueJobs :: JQStatus -> [JobWithStat] -> IO ()
+enqueueJobs state jobs = do
   logInfo . (++) "New jobs enqueued: " . commaJoin
-    $ map (show . fromJobId . qjId) jobs
-  let jobs' = map unreadJob jobs
-      insertFn = insertBy (compare `on` fromJobId . qjId . jJob)
-      addJobs oldjobs = foldl (flip insertFn) oldjobs jobs'
+    $ map (show . fromJobId . qjId . jJob) jobs
+  let insertFn = insertBy (compare `on` fromJobId . qjId . jJob)
+      addJobs oldjobs = foldl (flip insertFn) oldjobs jobs
   modifyJobs state (onQueuedJobs addJobs)
   scheduleSomeJobs state
 
+-- | Enqueue new jobs submitted by a process of the given user, if known.
+-- This will guarantee that the jobs will be executed eventually.
+enqueueNewJobs :: JQStatus -> Maybe UserID -> [QueuedJob] -> IO ()
+enqueueNewJobs state submitter =
+  enqueueJobs state . map (\job -> (unreadJob job) { jSubmitter = submitter })
+
 -- | Pure function for removing a queued job from the job queue by
 -- atomicModifyIORef. The answer is Just the job if the job could be removed
 -- before being handed over to execution, Nothing if it already was started
 -- and a Bad result if the job is not found in the queue.
-rmJob :: JobId -> Queue -> (Queue, Result (Maybe QueuedJob))
+rmJob :: JobId -> Queue -> (Queue, Result (Maybe JobWithStat))
 rmJob jid q =
   let isJid = (jid ==) . qjId . jJob
       (found, queued') = partition isJid $ qEnqueued q
       isRunning = any isJid $ qRunning q
       sJid = (++) "Job " . show $ fromJobId jid
   in case (found, isRunning) of
-    ([job], _) -> (q {qEnqueued = queued'}, Ok . Just $ jJob job)
+    ([job], _) -> (q {qEnqueued = queued'}, Ok $ Just job)
     (_:_, _) -> (q, Bad $ "Queue in inconsistent state."
                            ++ sJid ++ " queued multiple times")
     (_, True) -> (q, Ok Nothing)
@@ -523,9 +568,9 @@ setJobPriority state jid prio = runResultT $ do
   maybeJob <- mkResultT . atomicModifyIORef (jqJobs state) $ rmJob jid
   case maybeJob of
     Nothing -> return Nothing
-    Just job -> do
-      let job' = changeJobPriority prio job
+    Just jWS -> do
+      let job' = changeJobPriority prio $ jJob jWS
       qDir <- liftIO queueDir
       mkResultT $ writeJobToDisk qDir job'
-      liftIO $ enqueueNewJobs state [job']
+      liftIO $ enqueueNewJobs state (jSubmitter jWS) [job']
       return $ Just job'
@@ -0,0 +1,136 @@
+{-| The policy deciding which queued jobs to run next.
+
+Among the queued jobs that are eligible to run, the scheduler repeatedly
+picks the job with the best aged priority; ties are broken in favour of
+the submitter with the fewest jobs running, and then by the order of
+submission. Jobs that contain an opcode whose class has reached its
+limit of running jobs are skipped.
+
+The submitter of a job is given by the caller; luxid identifies it by
+the user of the process that submitted the job, as recorded by the
+kernel for its Luxi connection, so a job's own data can't claim a share
+it is not entitled to.
+
+-}
+
+{-
+
+Copyright (C) 2014 Google Inc.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+1. Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in the
+documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+-}
+
+module Ganeti.JQScheduler.Policy
+  ( SchedulingPolicy(..)
+  , jobOpCodeClasses
+  , agedJobPriority
+  , selectJobsByPolicy
+  ) where
+
+import Data.List
+import qualified Data.Map as Map
+import Data.Ord (comparing)
+
+import qualified Ganeti.Constants as C
+import Ganeti.JQueue (calcJobPriority)
+import Ganeti.JQueue.Objects
+import Ganeti.OpCodes
+
+-- | The parameters of the scheduling policy.
+data SchedulingPolicy = SchedulingPolicy
+  { spNow :: Timestamp
+    -- ^ the current time
+  , spAgingInterval :: Int
+    -- ^ the number of seconds of waiting that raise the priority of a job
+    -- by one level; aging is disabled if not positive
+  , spClassLimits :: Map.Map String Int
+    -- ^ the maximal number of running jobs per opcode class
+  } deriving (Show, Eq)
+
+-- | The meta opcodes of a job that could be parsed.
+jobMetaOpCodes :: QueuedJob -> [MetaOpCode]
+jobMetaOpCodes job = [ mopc | ValidOpCode mopc <- map qoInput $ qjOps job ]
+
+-- | The opcode classes, i.e., the distinct opcode IDs, of a job.
+jobOpCodeClasses :: QueuedJob -> [String]
+jobOpCodeClasses = nub . map (opID . metaOpCode) . jobMetaOpCodes
+
+-- | The priority of a job, raised by one level for every aging interval
+-- it has been waiting since it was received, up to the highest priority.
+agedJobPriority :: SchedulingPolicy -> QueuedJob -> Int
+agedJobPriority policy job =
+  let interval = spAgingInterval policy
+      waited = maybe 0 ((fst (spNow policy) -) . fst) $ qjReceivedTimestamp job
+      levels = if interval > 0 then max 0 waited `div` interval else 0
+  in max C.opPrioHighest (calcJobPriority job - levels)
+
+-- | The number of running jobs per submitter and per opcode class.
+type RunningCounts s = (Map.Map s Int, Map.Map String Int)
+
+-- | Account for an additional running job of a submitter.
+addRunning :: (Ord s) => RunningCounts s -> (s, QueuedJob) -> RunningCounts s
+addRunning (submitters, classes) (submitter, job) =
+  ( Map.insertWith (+) submitter 1 submitters
+  , foldl' (\m cls -> Map.insertWith (+) cls 1 m) classes
+      $ jobOpCodeClasses job )
+
+-- | Whether starting a job keeps all its opcode classes within their limits.
+withinLimits :: SchedulingPolicy -> RunningCounts s -> QueuedJob -> Bool
+withinLimits policy (_, classes) =
+  let running cls = Map.findWithDefault 0 cls classes
+      allowed cls = maybe True (running cls <) . Map.lookup cls
+                      $ spClassLimits policy
+  in all allowed . jobOpCodeClasses
+
+-- | Choose up to the given number of jobs to run, in the order they should
+-- be started. The queued jobs must be eligible to run and be given in the
+-- order of their submission.
+selectJobsByPolicy :: (Ord s)
+                   => SchedulingPolicy
+                   -> (a -> QueuedJob) -- ^ how to obtain the job
+                   -> (a -> s)         -- ^ how to obtain the submitter
+                   -> Int              -- ^ number of jobs to choose
+                   -> [a]              -- ^ running jobs
+                   -> [a]              -- ^ queued jobs
+                   -> [a]
+selectJobsByPolicy policy getJob getSubmitter count running queued =
+  let submitted x = (getSubmitter x, getJob x)
+      start = foldl' addRunning (Map.empty, Map.empty) $ map submitted running
+      rank (submitters, _) (idx, x) =
+        ( agedJobPriority policy $ getJob x
+        , Map.findWithDefault 0 (getSubmitter x) submitters
+        , idx )
+      pick n counts candidates
+        | n <= 0 = []
+        | otherwise =
+            case filter (withinLimits policy counts . getJob . snd)
+                   candidates of
+              [] -> []
+              allowed ->
+                let (idx, x) = minimumBy (comparing $ rank counts) allowed
+                in x : pick (n - 1) (addRunning counts $ submitted x)
+                         (filter ((/= idx) . fst) candidates)
+  in pick count start $ zip [(0 :: Int)..] queued
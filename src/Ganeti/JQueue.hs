@@ -56,11 +56,17 @@ module Ganeti.JQueue
     , calcJobPriority
     , jobFileName
     , liveJobFile
+    , liveJobJournalFile
     , archivedJobFile
+    , packedIndexFile
+    , PackedJobInfo(..)
+    , readPackedIndex
+    , readPackedJobInfos
     , determineJobDirectories
     , getJobIDs
     , sortJobIDs
     , loadJobFromDisk
+    , applyJobJournal
     , noSuchJob
     , readSerialFromDisk
     , allocateJobIds
@@ -91,16 +97,25 @@ import Control.Monad
 import Control.Monad.IO.Class
 import Control.Monad.Trans (lift)
 import Control.Monad.Trans.Maybe
+import qualified Data.ByteString as B
+import qualified Data.ByteString.Char8 as BC
+import qualified Data.ByteString.Lazy as BL
+import qualified Data.ByteString.Lazy.UTF8 as UTF8L
 import Data.Functor ((<$))
 import Data.List
+import qualified Data.Map as Map
 import Data.Maybe
 import Data.Ord (comparing)
+import qualified Data.Set as Set
 -- workaround what seems to be a bug in ghc 7.4's TH shadowing code
 import Prelude hiding (id, log)
 import System.Directory
 import System.FilePath
+import System.IO (IOMode(..), SeekMode(..), hSeek, withBinaryFile)
 import System.IO.Error (isDoesNotExistError)
 import System.Posix.Files
+import System.Posix.IO (OpenMode(..), LockRequest(WriteLock), closeFd,
+                        defaultFileFlags, openFd, waitToSetLock)
 import System.Posix.Signals (sigHUP, sigTERM, sigUSR1, signalProcess)
 import System.Posix.Types (ProcessID)
 import System.Time
@@ -108,9 +123,11 @@ import qualified Text.JSON
 import Text.JSON.Types
 
 import Ganeti.BasicTypes
+import Ganeti.Codec (decompressZlib)
 import qualified Ganeti.Config as Config
 import qualified Ganeti.Constants as C
 import Ganeti.Errors (ErrorResult, ResultG)
+import Ganeti.Hash (computeMac)
 import Ganeti.JQueue.Lens (qoInputL, validOpCodeL)
 import Ganeti.JQueue.Objects
 import Ganeti.JSON
@@ -199,6 +216,7 @@ queuedJobFromOpCodes jobid ops = do
                    , qjEndTimestamp = Nothing
                    , qjLivelock = Nothing
                    , qjProcessId = Nothing
+                   , qjReplication = Nothing
                    }
 
 -- | Attach a received timestamp to a Queued Job.
@@ -318,12 +336,84 @@ parseJobFileId path =
 liveJobFile :: FilePath -> JobId -> FilePath
 liveJobFile rootdir jid = rootdir </> jobFileName jid
 
+-- | Suffix of the journal kept next to the file of a running job.
+jobJournalSuffix :: String
+jobJournalSuffix = ".journal"
+
+-- | Computes the full path to the journal of a live job. The journal
+-- holds the changes made by the job process since it last wrote the
+-- whole job file.
+liveJobJournalFile :: FilePath -> JobId -> FilePath
+liveJobJournalFile rootdir jid = liveJobFile rootdir jid ++ jobJournalSuffix
+
 -- | Computes the full path to an archives job. BROKEN.
 archivedJobFile :: FilePath -> JobId -> FilePath
 archivedJobFile rootdir jid =
   let subdir = show (fromJobId jid `div` C.jstoreJobsPerArchiveDirectory)
   in rootdir </> jobQueueArchiveSubDir </> subdir </> jobFileName jid
 
+-- | Segment file holding the packed jobs of an archive directory, see
+-- @jstore.PackArchive@ in the Python code.
+packedSegmentFile :: FilePath
+packedSegmentFile = "packed"
+
+-- | Table with the offset and length of each job in the segment file,
+-- indexed by the job ID modulo the number of jobs per directory.
+packedOffsetsFile :: FilePath
+packedOffsetsFile = "packed.offsets"
+
+-- | Index with one line per packed job, see 'PackedJobInfo'.
+packedIndexFile :: FilePath
+packedIndexFile = "packed.index"
+
+-- | Size of a slot in the offsets table, holding two 12-digit numbers.
+packedSlotSize :: Int
+packedSlotSize = 24
+
+-- | The entry of a packed job in the index of its archive directory.
+-- Besides the position of the job in the segment file, it holds the
+-- fields needed to answer queries without reading the job itself.
+data PackedJobInfo = PackedJobInfo
+  { pjiId                :: JobId
+  , pjiSegment           :: FilePath
+  , pjiOffset            :: Int
+  , pjiLength            :: Int
+  , pjiStatus            :: JobStatus
+  , pjiReceivedTimestamp :: Maybe Timestamp
+  , pjiStartTimestamp    :: Maybe Timestamp
+  , pjiEndTimestamp      :: Maybe Timestamp
+  , pjiSummary           :: [String]
+  } deriving (Show, Eq)
+
+-- | Index entries are serialised as JSON lists, in the order of the
+-- fields of 'PackedJobInfo'.
+instance Text.JSON.JSON PackedJobInfo where
+  showJSON info =
+    JSArray [ Text.JSON.showJSON $ pjiId info
+            , Text.JSON.showJSON $ pjiSegment info
+            , Text.JSON.showJSON $ pjiOffset info
+            , Text.JSON.showJSON $ pjiLength info
+            , Text.JSON.showJSON $ pjiStatus info
+            , Text.JSON.showJSON $ pjiReceivedTimestamp info
+            , Text.JSON.showJSON $ pjiStartTimestamp info
+            , Text.JSON.showJSON $ pjiEndTimestamp info
+            , Text.JSON.showJSON $ pjiSummary info
+            ]
+  readJSON (JSArray [jid, segment, offset, len, status, received, start,
+                     end, summary]) = do
+    jid' <- Text.JSON.readJSON jid
+    segment' <- Text.JSON.readJSON segment
+    offset' <- Text.JSON.readJSON offset
+    len' <- Text.JSON.readJSON len
+    status' <- Text.JSON.readJSON status
+    received' <- Text.JSON.readJSON received
+    start' <- Text.JSON.readJSON start
+    end' <- Text.JSON.readJSON end
+    summary' <- Text.JSON.readJSON summary
+    return $ PackedJobInfo jid' segment' offset' len' status' received'
+                           start' end' summary'
+  readJSON v = Text.JSON.Error $ "Invalid packed index entry: " ++ show v
+
 -- | Map from opcode status to job status.
 opStatusToJob :: OpStatus -> JobStatus
 opStatusToJob OP_STATUS_QUEUED    = JOB_STATUS_QUEUED
@@ -420,11 +510,85 @@ getJobIDs = runResultT . liftM concat . mapM getDirJobIDs
 sortJobIDs :: [JobId] -> [JobId]
 sortJobIDs = sortBy (comparing fromJobId)
 
--- | Computes the list of jobs in a given directory.
+-- | Computes the list of jobs in a given directory, including the jobs
+-- packed into its segment file.
 getDirJobIDs :: FilePath -> ResultT IOError IO [JobId]
-getDirJobIDs path =
-  withErrorLogAt WARNING ("Failed to list job directory " ++ path) .
-    liftM (mapMaybe parseJobFileId) $ liftIO (getDirectoryContents path)
+getDirJobIDs path = do
+  files <- withErrorLogAt WARNING ("Failed to list job directory " ++ path) .
+             liftM (mapMaybe parseJobFileId) $
+               liftIO (getDirectoryContents path)
+  packed <- liftIO $ readPackedJobIDs path
+  return . Set.toList . Set.fromList $ files ++ packed
+
+-- | Reads the index of a packed archive directory. Every complete line
+-- of the index holds one entry; an incomplete last line is the result
+-- of an interrupted append and is ignored.
+readPackedIndex :: FilePath -> IO [PackedJobInfo]
+readPackedIndex dir = do
+  let path = dir </> packedIndexFile
+  contents <- (readFile path >>= \str -> length str `seq` return str)
+                `Control.Exception.catch`
+                ignoreIOError "" True ("Failed to read job index " ++ path)
+  let entries = lines contents
+      complete = if "\n" `isSuffixOf` contents
+                   then entries
+                   else take (length entries - 1) entries
+      parseEntry line = case Text.JSON.decode line of
+                          Text.JSON.Ok info -> return $ Just info
+                          Text.JSON.Error msg -> do
+                            logWarning $ "Invalid entry in job index " ++
+                                         path ++ ": " ++ msg
+                            return Nothing
+  liftM catMaybes $ mapM parseEntry complete
+
+-- | Reads the IDs of the jobs in the index of a packed archive
+-- directory.
+readPackedJobIDs :: FilePath -> IO [JobId]
+readPackedJobIDs = liftM (map pjiId) . readPackedIndex
+
+-- | Reads the index entries of the given jobs, for those which have
+-- been packed. Jobs still in the live queue are never packed and are
+-- skipped, so only the indices of the archive directories the archived
+-- jobs belong to are read.
+readPackedJobInfos :: FilePath -> [JobId] -> IO (Map.Map JobId PackedJobInfo)
+readPackedJobInfos rootdir jids = do
+  archived <- filterM (liftM not . doesFileExist . liveJobFile rootdir) jids
+  let dirs = Set.toList . Set.fromList $
+               map (takeDirectory . archivedJobFile rootdir) archived
+      wanted = Set.fromList archived
+  infos <- liftM concat $ mapM readPackedIndex dirs
+  return . Map.fromList . filter ((`Set.member` wanted) . fst) $
+    map (\info -> (pjiId info, info)) infos
+
+-- | Reads a job packed into the segment file of its archive directory.
+readPackedJob :: FilePath -> JobId -> IO (Maybe String)
+readPackedJob rootdir jid = do
+  let dir = takeDirectory $ archivedJobFile rootdir jid
+      slot = fromJobId jid `mod` C.jstoreJobsPerArchiveDirectory
+      readRange :: FilePath -> Int -> Int -> IO B.ByteString
+      readRange path offset len =
+        withBinaryFile path ReadMode $ \h -> do
+          hSeek h AbsoluteSeek (fromIntegral offset)
+          B.hGet h len
+      readRecord = do
+        slotData <- readRange (dir </> packedOffsetsFile)
+                      (slot * packedSlotSize) packedSlotSize
+        let (offStr, lenStr) = splitAt (packedSlotSize `div` 2) $
+                                 BC.unpack slotData
+        -- unused slots are zero-filled or past the end of the table
+        case liftA2 (,) (tryRead "offset" offStr) (tryRead "length" lenStr) of
+          Just (offset, len) | len > 0 -> do
+            record <- readRange (dir </> packedSegmentFile) offset len
+            case decompressZlib (BL.fromChunks [record]) of
+              Ok str -> return . Just $ UTF8L.toString str
+              Bad msg -> do
+                logWarning $ "Can't decompress packed job " ++
+                             show (fromJobId jid) ++ ": " ++ msg
+                return Nothing
+          _ -> return Nothing
+  readRecord `Control.Exception.catch`
+    ignoreIOError Nothing True
+      ("Failed to read packed job " ++ show (fromJobId jid))
 
 -- | Reads the job data from disk.
 readJobDataFromDisk :: FilePath -> Bool -> JobId -> IO (Maybe (String, Bool))
@@ -434,36 +598,159 @@ readJobDataFromDisk rootdir archived jid = do
       all_paths = if archived
                     then [(live_path, False), (archived_path, True)]
                     else [(live_path, False)]
-  foldM (\state (path, isarchived) ->
-           liftM (\r -> Just (r, isarchived)) (readFile path)
-             `Control.Exception.catch`
-             ignoreIOError state True
-               ("Failed to read job file " ++ path)) Nothing all_paths
+  found <- foldM (\state (path, isarchived) ->
+                    liftM (\r -> Just (r, isarchived)) (readFile path)
+                      `Control.Exception.catch`
+                      ignoreIOError state True
+                        ("Failed to read job file " ++ path)) Nothing all_paths
+  -- archived jobs may have been packed
+  case found of
+    Nothing | archived ->
+      liftM (fmap (\r -> (r, True))) $ readPackedJob rootdir jid
+    _ -> return found
+
+-- | Checks that a journal starts with a header, unless the header
+-- hasn't been written completely yet.
+journalHasHeader :: String -> Bool
+journalHasHeader journal =
+  case break (== '\n') journal of
+    (_, []) -> True
+    (header, _) ->
+      case Text.JSON.decode header of
+        Text.JSON.Ok (JSObject obj) -> isJust . lookup "base" $ fromJSObject obj
+        _ -> False
+
+-- | Reads the journal of a live job; if there is none, or if it lacks
+-- a header, the result is empty.
+readJobJournalFromDisk :: FilePath -> JobId -> IO String
+readJobJournalFromDisk rootdir jid = do
+  let path = liveJobJournalFile rootdir jid
+  journal <- (readFile path >>= \str -> length str `seq` return str)
+               `Control.Exception.catch`
+               ignoreIOError "" True ("Failed to read job journal " ++ path)
+  if journalHasHeader journal
+    then return journal
+    else do
+      logWarning $ "Ignoring job journal without header " ++ path
+      return ""
+
+-- | Runs an action while holding the lock of a job journal, if the
+-- journal exists. Job processes only append to a journal while holding
+-- this lock, and after checking that it wasn't removed in the meantime,
+-- so no change is lost when the journal is removed under the lock.
+withJobJournalLock :: FilePath -> IO a -> IO a
+withJobJournalLock journal action = do
+  mfd <- liftM Just (openFd journal WriteOnly Nothing defaultFileFlags)
+           `Control.Exception.catch`
+           ignoreIOError Nothing True ("Failed to lock " ++ journal)
+  case mfd of
+    Nothing -> action
+    Just fd -> (waitToSetLock fd (WriteLock, AbsoluteSeek, 0, 0) >> action)
+                 `finally` closeFd fd
+
+-- | Removes the journal of a live job.
+removeJobJournal :: FilePath -> IO ()
+removeJobJournal journal =
+  withJobJournalLock journal (removeFile journal)
+    `Control.Exception.catch`
+    ignoreIOError () True ("Failed to remove " ++ journal)
+
+-- | Computes the fingerprint of the contents of a job file, which ties
+-- a journal to the version of the job file it applies to.
+jobFingerprint :: String -> String
+jobFingerprint = computeMac [] Nothing
+
+-- | Overrides fields of a JSON object.
+setJSFields :: [(String, JSValue)] -> JSObject JSValue -> JSObject JSValue
+setJSFields new obj =
+  toJSObject $ new ++ filter ((`notElem` map fst new) . fst) (fromJSObject obj)
+
+-- | Applies a single journal entry to a serialized job. An entry
+-- contains the changed job fields, the changed fields of opcodes and
+-- the new log entries of opcodes, the latter two indexed by the
+-- position of the opcode.
+applyJournalEntry :: JSObject JSValue -> JSObject JSValue
+                  -> Result (JSObject JSValue)
+applyJournalEntry job entry = do
+  let fields = fromJSObject entry
+  jobFields <- fromObjWithDefault fields "job" (toJSObject [])
+  opFields <- fromObjWithDefault fields "ops" []
+  opLogs <- fromObjWithDefault fields "log" []
+  ops <- fromObj (fromJSObject job) "ops"
+  let updateOp (idx, op) = do
+        let op' = maybe op (\new -> setJSFields (fromJSObject new) op)
+                    $ lookup idx opFields
+        case lookup idx opLogs of
+          Nothing -> return op'
+          Just new -> do
+            old <- fromObj (fromJSObject op') "log"
+            return $ setJSFields [("log", JSArray (old ++ new))] op'
+  ops' <- mapM updateOp $ zip [(0 :: Int)..] ops
+  return $ setJSFields (("ops", Text.JSON.showJSON ops')
+                        : fromJSObject jobFields) job
+
+-- | Applies the journal of a live job to its serialized form. The first
+-- line of a journal contains the fingerprint of the job file, every
+-- following line is one entry. Journals for a different version of the
+-- job file, as well as an incomplete last entry, are ignored.
+applyJobJournal :: String -> String -> JSValue -> Result JSValue
+applyJobJournal base journal job =
+  let entries = lines journal
+      complete = if "\n" `isSuffixOf` journal
+                   then entries
+                   else take (length entries - 1) entries
+  in case (complete, job) of
+       ([], _) -> return job
+       (header : rest, JSObject obj) -> do
+         hdr <- fromJResult "Parsing job journal header" $
+                  Text.JSON.decode header
+         fingerprint <- fromObj (fromJSObject hdr) "base"
+         if fingerprint /= jobFingerprint base
+           then return job
+           else do
+             updates <- mapM (fromJResult "Parsing job journal" .
+                              Text.JSON.decode) rest
+             liftM JSObject $ foldM applyJournalEntry obj updates
+       _ -> Bad "Job file doesn't contain a JSON object"
 
 -- | Failed to load job error.
 noSuchJob :: Result (QueuedJob, Bool)
 noSuchJob = Bad "Can't load job file"
 
--- | Loads a job from disk.
+-- | Loads a job from disk. For live jobs, the journal written by
+-- a running job process is taken into account.
 loadJobFromDisk :: FilePath -> Bool -> JobId -> IO (Result (QueuedJob, Bool))
 loadJobFromDisk rootdir archived jid = do
   raw <- readJobDataFromDisk rootdir archived jid
+  journal <- case raw of
+               Just (_, False) -> readJobJournalFromDisk rootdir jid
+               _ -> return ""
   -- note: we need some stricness below, otherwise the wrapping in a
   -- Result will create too much lazyness, and not close the file
   -- descriptors for the individual jobs
   return $! case raw of
              Nothing -> noSuchJob
              Just (str, arch) ->
-               liftM (\qj -> (qj, arch)) .
-               fromJResult "Parsing job file" $ Text.JSON.decode str
+               liftM (\qj -> (qj, arch)) $
+               fromJResult "Parsing job file" (Text.JSON.decode str)
+               >>= applyJobJournal str journal
+               >>= fromJResult "Parsing job file" . Text.JSON.readJSON
 
 -- | Write a job to disk.
 writeJobToDisk :: FilePath -> QueuedJob -> IO (Result ())
 writeJobToDisk rootdir job = do
   let filename = liveJobFile rootdir . qjId $ job
+      journal = liveJobJournalFile rootdir . qjId $ job
       content = Text.JSON.encode . Text.JSON.showJSON $ job
-  tryAndLogIOError (atomicWriteFile filename content)
-                   ("Failed to write " ++ filename) Ok
+  -- a journal refers to the previous version of the job file; the lock
+  -- keeps job processes from appending to it while it is replaced
+  withJobJournalLock journal $ do
+    result <- tryAndLogIOError (atomicWriteFile filename content)
+                               ("Failed to write " ++ filename) Ok
+    when (isOk result) $
+      removeFile journal `Control.Exception.catch`
+        ignoreIOError () True ("Failed to remove " ++ journal)
+    return result
 
 -- | Replicate a job to all master candidates.
 replicateJob :: FilePath -> [Node] -> QueuedJob -> IO [(Node, ERpcError ())]
@@ -694,6 +981,8 @@ archiveSomeJobsUntil replicateFn qDir endt cutt arch torepl (jid:jids) = do
                                  ++ " failed unexpectedly: " ++ s
                   continue
                 Ok () -> do
+                  -- master candidates remove it when renaming the job
+                  removeJobJournal $ liveJobJournalFile qDir jid
                   let torepl' = jid:torepl
                   if length torepl' >= 10
                     then do
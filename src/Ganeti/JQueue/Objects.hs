@@ -96,5 +96,7 @@ $(buildObject "QueuedJob" "qj"
   , optionalField $
     simpleField "livelock"           [t| FilePath      |]
   , optionalField $ processIdField "process_id"
+  , optionalField $
+    simpleField "replication"        [t| JSValue       |]
   ])
 
@@ -146,6 +146,12 @@ $(genLuxiOp "LuxiOp"
      , simpleField "prev_log" [t| JSValue |]
      , simpleField "tmout"    [t| Int     |]
      ])
+  , (luxiReqWatchJob,
+     [ simpleField "job"      [t| JobId   |]
+     , simpleField "fields"   [t| [String]|]
+     , simpleField "prev_job" [t| JSValue |]
+     , simpleField "prev_log" [t| JSValue |]
+     ])
   , (luxiReqPickupJob,
      [ simpleField "job" [t| JobId |] ]
     )
@@ -267,6 +273,9 @@ decodeLuxiCall method args = do
                     J.readJSON e
                   _ -> J.Error "Not enough values"
               return $ WaitForJobChange jid fields pinfo pidx wtmout
+    ReqWatchJob -> do
+              (jid, fields, pinfo, pidx) <- fromJVal args
+              return $ WatchJob jid fields pinfo pidx
     ReqPickupJob -> do
               [jid] <- fromJVal args
               return $ PickupJob jid
@@ -84,6 +84,7 @@ module Ganeti.Objects
   , ClusterOsParams
   , ClusterOsParamsPrivate
   , ClusterNicParams
+  , JobClassLimits
   , UidPool
   , formatUidRange
   , UidRange
@@ -793,6 +794,10 @@ type IAllocatorParams = Container JSValue
 -- | The master candidate client certificate digests
 type CandidateCertificates = Container String
 
+-- | Maximal number of jobs running at the same time per opcode class
+-- (the @OP_ID@ of an opcode).
+type JobClassLimits = Container Int
+
 -- | Disk state parameters.
 --
 -- As according to the documentation this option is unused by Ganeti,
@@ -856,6 +861,8 @@ $(buildObject "Cluster" "cluster" $
   , simpleField "candidate_certs"                [t| CandidateCertificates  |]
   , simpleField "max_running_jobs"               [t| Int                    |]
   , simpleField "max_tracked_jobs"               [t| Int                    |]
+  , defaultField [| emptyContainer |] $
+    simpleField "max_running_jobs_per_opcode"    [t| JobClassLimits         |]
   , simpleField "install_image"                  [t| String                 |]
   , simpleField "instance_communication_network" [t| String                 |]
   , simpleField "zeroing_image"                  [t| String                 |]
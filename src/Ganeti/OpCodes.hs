@@ -227,6 +227,7 @@ $(genOpCode "OpCode"
      , pCandidatePoolSize
      , pMaxRunningJobs
      , pMaxTrackedJobs
+     , pMaxRunningJobsPerOpCode
      , pUidPool
      , pAddUids
      , pRemoveUids
@@ -139,6 +139,7 @@ module Ganeti.OpParams
   , pCandidatePoolSize
   , pMaxRunningJobs
   , pMaxTrackedJobs
+  , pMaxRunningJobsPerOpCode
   , pUidPool
   , pAddUids
   , pRemoveUids
@@ -710,6 +711,13 @@ pMaxTrackedJobs =
   withDoc "Maximal number of jobs tracked in the job queue" .
   optionalField $ simpleField "max_tracked_jobs" [t| Positive Int |]
 
+pMaxRunningJobsPerOpCode :: Field
+pMaxRunningJobsPerOpCode =
+  withDoc "Maximal number of jobs to run simultaneously per opcode class" .
+  optionalField $
+  simpleField "max_running_jobs_per_opcode"
+              [t| GenericContainer String (Positive Int) |]
+
 
 pUidPool :: Field
 pUidPool =
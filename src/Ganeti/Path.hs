@@ -43,6 +43,7 @@ module Ganeti.Path
   , defaultQuerySocket
   , defaultWConfdSocket
   , defaultMetadSocket
+  , jobZygoteSocket
   , confdHmacKey
   , clusterConfFile
   , lockStatusFile
@@ -128,6 +129,10 @@ defaultWConfdSocket = socketDir `pjoin` "ganeti-wconfd"
 defaultMetadSocket :: IO FilePath
 defaultMetadSocket = socketDir `pjoin` "ganeti-metad"
 
+-- | The socket of the job zygote, which forks job processes for luxid.
+jobZygoteSocket :: IO FilePath
+jobZygoteSocket = socketDir `pjoin` "ganeti-job-zygote"
+
 -- | Path to file containing confd's HMAC key.
 confdHmacKey :: IO FilePath
 confdHmacKey = dataDirP "hmac.key"
@@ -58,22 +58,24 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 module Ganeti.Query.Exec
   ( isForkSupported
   , forkJobProcess
+  , startJobZygote
   ) where
 
 import Control.Concurrent (rtsSupportsBoundThreads)
 import Control.Concurrent.Lifted (threadDelay)
-import Control.Exception (finally)
+import Control.Exception (finally, onException)
 import Control.Monad
 import Control.Monad.Error
 import Data.Functor
 import qualified Data.Map as M
-import Data.Maybe (listToMaybe, mapMaybe)
-import System.Directory (getDirectoryContents)
+import Data.Maybe (isNothing, listToMaybe, mapMaybe)
+import System.Directory (doesFileExist, getDirectoryContents)
 import System.Environment
 import System.IO.Error (tryIOError, annotateIOError, modifyIOError)
 import System.Posix.Process
 import System.Posix.IO
-import System.Posix.Signals (sigABRT, sigKILL, sigTERM, signalProcess)
+import System.Posix.Signals (nullSignal, sigABRT, sigKILL, sigTERM,
+                             signalProcess)
 import System.Posix.Types (Fd, ProcessID)
 import System.Time
 import Text.Printf
@@ -122,6 +124,16 @@ rethrowAnnotateIOError :: String -> IO a -> IO a
 rethrowAnnotateIOError desc =
   modifyIOError (\e -> annotateIOError e desc Nothing Nothing)
 
+-- | The environment for the Python job processes.
+jobProcessEnvironment :: IO [(String, String)]
+jobProcessEnvironment = do
+  use_debug <- isDebugMode
+  (M.toList
+   . M.insert "GNT_DEBUG" (if use_debug then "1" else "0")
+   . M.insert "PYTHONPATH" AC.versionedsharedir
+   . M.fromList)
+   `liftM` getEnvironment
+
 -- Code that is executed in a @fork@-ed process and that the replaces iteself
 -- with the actual job process
 runJobProcess :: JobId -> Client -> IO ()
@@ -174,20 +186,66 @@ runJobProcess jid s = withErrorLogAt CRITICAL (show jid) $
     -- we pass the job id as the first argument to the process;
     -- while the process never uses it, it's very convenient when listing
     -- job processes
-    use_debug <- isDebugMode
-    env <- (M.insert "GNT_DEBUG" (if use_debug then "1" else "0")
-            . M.insert "PYTHONPATH" AC.versionedsharedir
-            . M.fromList)
-           `liftM` getEnvironment
+    env <- jobProcessEnvironment
     execPy <- P.jqueueExecutorPy
     logLater $ "Executing " ++ AC.pythonPath ++ " " ++ execPy
                ++ " with PYTHONPATH=" ++ AC.versionedsharedir
     () <- executeFile AC.pythonPath True [execPy, show (fromJobId jid)]
-                      (Just $ M.toList env)
+                      (Just env)
 
     failError $ "Failed to execute " ++ AC.pythonPath ++ " " ++ execPy
 
 
+-- | Starts the job zygote, a Python process that has all the modules
+-- needed for executing jobs already loaded and forks a new job process
+-- for every connection to its socket. This avoids the cost of starting
+-- a fresh Python interpreter for every job. The zygote exits as soon
+-- as its standard input, a pipe from the calling process, is closed,
+-- i.e., when the calling process exits.
+startJobZygote :: IO ()
+startJobZygote = do
+  socketPath <- P.jobZygoteSocket
+  env <- jobProcessEnvironment
+  execPy <- P.jqueueExecutorPy
+  (readFd, writeFd) <- createPipe
+  -- the write end is kept open, but never used, as long as we live
+  setFdOption writeFd CloseOnExec True
+  pid <- forkProcess . withErrorLogAt CRITICAL "job zygote" $ do
+    closeFd stdError
+    _ <- dupTo readFd stdInput
+    fds <- filter (> 2) <$> toErrorBase listOpenFds
+    mapM_ (tryIOError . closeFd) fds
+    () <- executeFile AC.pythonPath True [execPy, "--zygote", socketPath]
+                      (Just env)
+    failError $ "Failed to execute " ++ AC.pythonPath ++ " " ++ execPy
+  closeFd readFd
+  logInfo $ "Started the job zygote with process ID " ++ show pid
+
+-- | Asks the job zygote to fork a new process for the given job. Returns
+-- the ID of the new process and the communication channel to it, or
+-- 'Nothing' if the zygote isn't available, in which case the caller
+-- falls back to starting a new Python process.
+connectJobZygote :: JobId -> IO (Maybe (ProcessID, Client))
+connectJobZygote jid = do
+  socketPath <- P.jobZygoteSocket
+  result <- tryIOError $ do
+    exists <- doesFileExist socketPath
+    unless exists . ioError $ userError "The socket doesn't exist"
+    client <- connectClient connectConfig zygoteConnectTimeout socketPath
+    flip onException (closeClient client) $ do
+      sendMsg client . show $ fromJobId jid
+      pidStr <- recvMsg client
+      case tryRead "process ID" pidStr of
+        Ok pid -> return (fromIntegral (pid :: Int), client)
+        Bad msg -> ioError $ userError msg
+  case result of
+    Left e -> do
+      logDebug $ "Job zygote not available, starting a new process: "
+                 ++ show e
+      return Nothing
+    Right r -> return $ Just r
+  where zygoteConnectTimeout = 5
+
 -- | Forks a child POSIX process, creating a bi-directional communication
 -- channel between the master and the child processes.
 -- Supplies the child action with its part of the pipe and returns
@@ -226,21 +284,35 @@ forkJobProcess jid luxiLivelock update = do
     let maxWaitUS = 2^(tryNo - 1) * C.luxidRetryForkStepUS
     when (tryNo >= 2) . liftIO $ delayRandom (0, maxWaitUS)
 
-    (pid, master) <- liftIO $ forkWithPipe connectConfig (runJobProcess jid)
+    -- processes forked by the zygote aren't our children, they are reaped
+    -- by the zygote
+    zygote <- liftIO $ connectJobZygote jid
+    (pid, master) <- liftIO $ maybe
+                       (forkWithPipe connectConfig (runJobProcess jid))
+                       return zygote
 
     let jobLogPrefix = "[start:job-" ++ jidStr ++ ",pid=" ++ show pid ++ "] "
         logDebugJob = logDebug . (jobLogPrefix ++)
 
     logDebugJob "Forked a new process"
 
-    let killIfAlive [] = return ()
+    let isRunning
+          | isNothing zygote = do
+              status <- liftIO $ getProcessStatus False True pid
+              case status of
+                Just s -> do
+                  logDebugJob $ "Child process status: " ++ show s
+                  return False
+                Nothing -> return True
+          | otherwise = True <$ liftIO (signalProcess nullSignal pid)
+        killIfAlive [] = return ()
         killIfAlive (sig : sigs) = do
           logDebugJob "Getting the status of the process"
-          status <- tryError . liftIO $ getProcessStatus False True pid
-          case status of
+          running <- tryError isRunning
+          case running of
             Left e -> logDebugJob $ "Job process already gone: " ++ show e
-            Right (Just s) -> logDebugJob $ "Child process status: " ++ show s
-            Right Nothing -> do
+            Right False -> return ()
+            Right True -> do
                 logDebugJob $ "Child process running, killing by " ++ show sig
                 liftIO $ signalProcess sig pid
                 unless (null sigs) $ do
@@ -36,6 +36,7 @@ module Ganeti.Query.Job
   ( RuntimeData
   , fieldsMap
   , wantArchived
+  , answeredByPackedIndex
   ) where
 
 import qualified Text.JSON as J
@@ -48,8 +49,9 @@ import Ganeti.Query.Language
 import Ganeti.Query.Types
 import Ganeti.Types
 
--- | The runtime data for a job.
-type RuntimeData = Result (QueuedJob, Bool)
+-- | The runtime data for a job: either the job itself and whether it
+-- is archived, or the index entry of a packed archived job.
+type RuntimeData = Result (Either PackedJobInfo (QueuedJob, Bool))
 
 -- | Job priority explanation.
 jobPrioDoc :: String
@@ -63,16 +65,29 @@ tsDoc = (++ " (tuple containing seconds and microseconds)")
 -- | Wrapper for unavailable job.
 maybeJob :: (J.JSON a) =>
             (QueuedJob -> a) -> RuntimeData -> JobId -> ResultEntry
-maybeJob _ (Bad _) _      = rsUnavail
-maybeJob f (Ok (v, _))  _ = rsNormal $ f v
+maybeJob f (Ok (Right (v, _))) _ = rsNormal $ f v
+maybeJob _ _ _                   = rsUnavail
 
 -- | Wrapper for optional fields that should become unavailable.
 maybeJobOpt :: (J.JSON a) =>
             (QueuedJob -> Maybe a) -> RuntimeData -> JobId -> ResultEntry
-maybeJobOpt _ (Bad _) _      = rsUnavail
-maybeJobOpt f (Ok (v, _))  _ = case f v of
-                                 Nothing -> rsUnavail
-                                 Just w -> rsNormal w
+maybeJobOpt f (Ok (Right (v, _))) _ = case f v of
+                                        Nothing -> rsUnavail
+                                        Just w -> rsNormal w
+maybeJobOpt _ _ _                   = rsUnavail
+
+-- | Wrapper for fields which are also kept in the packed index.
+maybeIndexed :: (J.JSON a) => (PackedJobInfo -> a) -> (QueuedJob -> a)
+             -> RuntimeData -> JobId -> ResultEntry
+maybeIndexed f _ (Ok (Left info)) _ = rsNormal $ f info
+maybeIndexed _ g jinfo jid          = maybeJob g jinfo jid
+
+-- | Wrapper for optional fields which are also kept in the packed index.
+maybeIndexedOpt :: (J.JSON a) =>
+                   (PackedJobInfo -> Maybe a) -> (QueuedJob -> Maybe a)
+                -> RuntimeData -> JobId -> ResultEntry
+maybeIndexedOpt f _ (Ok (Left info)) _ = maybe rsUnavail rsNormal $ f info
+maybeIndexedOpt _ g jinfo jid          = maybeJobOpt g jinfo jid
 
 -- | Simple helper for a job getter.
 jobGetter :: (J.JSON a) => (QueuedJob -> a) -> FieldGetter JobId RuntimeData
@@ -98,19 +113,33 @@ archivedField = "archived"
 wantArchived :: [FilterField] -> Bool
 wantArchived = (archivedField `elem`)
 
+-- | Fields which can be computed from the index of packed archived
+-- jobs, see 'PackedJobInfo'.
+indexedFields :: [FilterField]
+indexedFields =
+  [ "id", "status", archivedField, "summary", "received_ts", "start_ts"
+  , "end_ts"
+  ]
+
+-- | Check whether the given fields can be answered for packed archived
+-- jobs from their index entries, without loading the jobs.
+answeredByPackedIndex :: [FilterField] -> Bool
+answeredByPackedIndex = all (`elem` indexedFields)
+
 -- | List of all node fields. FIXME: QFF_JOB_ID on the id field.
 jobFields :: FieldList JobId RuntimeData
 jobFields =
   [ (FieldDefinition "id" "ID" QFTNumber "Job ID", FieldSimple rsNormal,
      QffNormal)
   , (FieldDefinition "status" "Status" QFTText "Job status",
-     jobGetter calcJobStatus, QffNormal)
+     FieldRuntime (maybeIndexed pjiStatus calcJobStatus), QffNormal)
   , (FieldDefinition "priority" "Priority" QFTNumber jobPrioDoc,
      jobGetter calcJobPriority, QffNormal)
   , (FieldDefinition archivedField "Archived" QFTBool
        "Whether job is archived",
      FieldRuntime (\jinfo _ -> case jinfo of
-                                 Ok (_, archive) -> rsNormal archive
+                                 Ok (Left _) -> rsNormal True
+                                 Ok (Right (_, archive)) -> rsNormal archive
                                  _ -> rsUnavail), QffNormal)
   , (FieldDefinition "ops" "OpCodes" QFTOther "List of all opcodes",
      opsGetter qoInput, QffNormal)
@@ -133,16 +162,24 @@ jobFields =
        "List of opcode priorities", opsGetter qoPriority, QffNormal)
   , (FieldDefinition "summary" "Summary" QFTOther
        "List of per-opcode summaries",
-     opsGetter (extractOpSummary . qoInput), QffNormal)
+     FieldRuntime (maybeIndexed pjiSummary
+                     (map (extractOpSummary . qoInput) . qjOps)), QffNormal)
+  , (FieldDefinition "replication" "Replication" QFTOther
+       "Counters of the replication of the job queue to the master\
+       \ candidates, recorded by the job process when the job was finalized",
+     FieldRuntime (maybeJobOpt qjReplication), QffNormal)
   , (FieldDefinition "received_ts" "Received" QFTOther
        (tsDoc "Timestamp of when job was received"),
-     FieldRuntime (maybeJobOpt qjReceivedTimestamp), QffTimestamp)
+     FieldRuntime (maybeIndexedOpt pjiReceivedTimestamp qjReceivedTimestamp),
+     QffTimestamp)
   , (FieldDefinition "start_ts" "Start" QFTOther
        (tsDoc "Timestamp of job start"),
-     FieldRuntime (maybeJobOpt qjStartTimestamp), QffTimestamp)
+     FieldRuntime (maybeIndexedOpt pjiStartTimestamp qjStartTimestamp),
+     QffTimestamp)
   , (FieldDefinition "end_ts" "End" QFTOther
        (tsDoc "Timestamp of job end"),
-     FieldRuntime (maybeJobOpt qjEndTimestamp), QffTimestamp)
+     FieldRuntime (maybeIndexedOpt pjiEndTimestamp qjEndTimestamp),
+     QffTimestamp)
   ]
 
 -- | The node fields map.
@@ -356,6 +356,10 @@ queryJobs cfg live fields qfilter = runResultT $ do
       (_, filtergetters, _) = unzip3 . getSelectedFields Query.Job.fieldsMap
                                 $ Foldable.toList qfilter
       live' = live && needsLiveData (fgetters ++ filtergetters)
+      -- packed archived jobs are served from their index entries, if
+      -- all the requested fields are kept there
+      from_index = Query.Job.answeredByPackedIndex $
+                     fields ++ Foldable.toList qfilter
       disabled_data = Bad "live data disabled"
   -- runs first pass of the filter, without a runtime context; this
   -- will limit the jobs that we'll load from disk
@@ -366,12 +370,18 @@ queryJobs cfg live fields qfilter = runResultT $ do
   -- than we need; we can't be fully lazy due to the multiple monad
   -- wrapping across different steps
   qdir <- lift queueDir
+  packed <- lift $ if live' && from_index
+                     then readPackedJobInfos qdir jids
+                     else return Map.empty
   fdata <- foldM
            -- big lambda, but we use many variables from outside it...
            (\lst jid -> do
-              job <- lift $ if live'
-                              then loadJobFromDisk qdir True jid
-                              else return disabled_data
+              job <- lift $ case Map.lookup jid packed of
+                       Just info -> return . Ok $ Left info
+                       Nothing | live' ->
+                                   liftM (fmap Right) $
+                                     loadJobFromDisk qdir True jid
+                               | otherwise -> return disabled_data
               pass <- toError $ evaluateFilter cfg (Just job) jid cfilter
               let nlst = if pass
                            then let row = map (execGetter cfg job jid) fgetters
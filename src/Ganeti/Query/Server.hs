@@ -54,6 +54,7 @@ import Text.JSON (encode, showJSON, JSValue(..))
 import System.Info (arch)
 import System.Directory
 import System.Posix.Signals as P
+import System.Posix.Types (UserID)
 
 import qualified Ganeti.Constants as C
 import qualified Ganeti.ConstantUtils as ConstantUtils (unFrozenSet)
@@ -78,7 +79,7 @@ import qualified Ganeti.Query.Exec as Exec
 import Ganeti.Query.Query
 import Ganeti.Query.Filter (makeSimpleFilter)
 import Ganeti.Types
-import qualified Ganeti.UDSServer as U (Handler(..), listener)
+import qualified Ganeti.UDSServer as U (Handler(..), peerListener)
 import Ganeti.Utils ( lockFile, exitIfBad, exitUnless, watchFile
                     , safeRenameFile )
 import Ganeti.Utils.MVarLock
@@ -101,18 +102,19 @@ handleClassicQuery cfg qkind names fields _ = do
   return $ showJSON <$> (qr >>= queryCompat)
 
 -- | Minimal wrapper to handle the missing config case.
-handleCallWrapper :: Lock -> JQStatus ->  Result ConfigData
+handleCallWrapper :: Lock -> JQStatus -> Maybe UserID -> Result ConfigData
                      -> LuxiOp -> IO (ErrorResult JSValue)
-handleCallWrapper _ _ (Bad msg) _ =
+handleCallWrapper _ _ _ (Bad msg) _ =
   return . Bad . ConfigurationError $
            "I do not have access to a valid configuration, cannot\
            \ process queries: " ++ msg
-handleCallWrapper qlock qstat (Ok config) op = handleCall qlock qstat config op
+handleCallWrapper qlock qstat peer (Ok config) op =
+  handleCall qlock qstat peer config op
 
 -- | Actual luxi operation handler.
-handleCall :: Lock -> JQStatus
+handleCall :: Lock -> JQStatus -> Maybe UserID
               -> ConfigData -> LuxiOp -> IO (ErrorResult JSValue)
-handleCall _ _ cdata QueryClusterInfo =
+handleCall _ _ _ cdata QueryClusterInfo =
   let cluster = configCluster cdata
       master = QCluster.clusterMasterNodeName cdata
       hypervisors = clusterEnabledHypervisors cluster
@@ -151,6 +153,8 @@ handleCall _ _ cdata QueryClusterInfo =
                showJSON $ clusterMaxRunningJobs cluster)
             , ("max_tracked_jobs",
                showJSON $ clusterMaxTrackedJobs cluster)
+            , ("max_running_jobs_per_opcode",
+               showJSON $ clusterMaxRunningJobsPerOpcode cluster)
             , ("mac_prefix",  showJSON $ clusterMacPrefix cluster)
             , ("master_netdev",  showJSON $ clusterMasterNetdev cluster)
             , ("master_netmask", showJSON $ clusterMasterNetmask cluster)
@@ -198,7 +202,7 @@ handleCall _ _ cdata QueryClusterInfo =
     Ok _ -> return . Ok . J.makeObj $ obj
     Bad ex -> return $ Bad ex
 
-handleCall _ _ cfg (QueryTags kind name) = do
+handleCall _ _ _ cfg (QueryTags kind name) = do
   let tags = case kind of
                TagKindCluster  -> Ok . clusterTags $ configCluster cfg
                TagKindGroup    -> groupTags   <$> Config.getGroup    cfg name
@@ -207,35 +211,35 @@ handleCall _ _ cfg (QueryTags kind name) = do
                TagKindNetwork  -> networkTags <$> Config.getNetwork  cfg name
   return (J.showJSON <$> tags)
 
-handleCall _ _ cfg (Query qkind qfields qfilter) = do
+handleCall _ _ _ cfg (Query qkind qfields qfilter) = do
   result <- query cfg True (Qlang.Query qkind qfields qfilter)
   return $ J.showJSON <$> result
 
-handleCall _ _ _ (QueryFields qkind qfields) = do
+handleCall _ _ _ _ (QueryFields qkind qfields) = do
   let result = queryFields (Qlang.QueryFields qkind qfields)
   return $ J.showJSON <$> result
 
-handleCall _ _ cfg (QueryNodes names fields lock) =
+handleCall _ _ _ cfg (QueryNodes names fields lock) =
   handleClassicQuery cfg (Qlang.ItemTypeOpCode Qlang.QRNode)
     (map Left names) fields lock
 
-handleCall _ _ cfg (QueryInstances names fields lock) =
+handleCall _ _ _ cfg (QueryInstances names fields lock) =
   handleClassicQuery cfg (Qlang.ItemTypeOpCode Qlang.QRInstance)
     (map Left names) fields lock
 
-handleCall _ _ cfg (QueryGroups names fields lock) =
+handleCall _ _ _ cfg (QueryGroups names fields lock) =
   handleClassicQuery cfg (Qlang.ItemTypeOpCode Qlang.QRGroup)
     (map Left names) fields lock
 
-handleCall _ _ cfg (QueryJobs names fields) =
+handleCall _ _ _ cfg (QueryJobs names fields) =
   handleClassicQuery cfg (Qlang.ItemTypeLuxi Qlang.QRJob)
     (map (Right . fromIntegral . fromJobId) names)  fields False
 
-handleCall _ _ cfg (QueryNetworks names fields lock) =
+handleCall _ _ _ cfg (QueryNetworks names fields lock) =
   handleClassicQuery cfg (Qlang.ItemTypeOpCode Qlang.QRNetwork)
     (map Left names) fields lock
 
-handleCall _ _ cfg (QueryConfigValues fields) = do
+handleCall _ _ _ cfg (QueryConfigValues fields) = do
   let params = [ ("cluster_name", return . showJSON . clusterClusterName
                                     . configCluster $ cfg)
                , ("watcher_pause", liftM (maybe JSNull showJSON)
@@ -248,28 +252,29 @@ handleCall _ _ cfg (QueryConfigValues fields) = do
   answerEval <- sequence answer
   return . Ok . showJSON $ answerEval
 
-handleCall _ _ cfg (QueryExports nodes lock) =
+handleCall _ _ _ cfg (QueryExports nodes lock) =
   handleClassicQuery cfg (Qlang.ItemTypeOpCode Qlang.QRExport)
     (map Left nodes) ["node", "export"] lock
 
-handleCall qlock qstat cfg (SubmitJobToDrainedQueue ops) = runResultT $ do
+handleCall qlock qstat peer cfg (SubmitJobToDrainedQueue ops) =
+  runResultT $ do
     jid <- mkResultT $ allocateJobId (Config.getMasterCandidates cfg) qlock
     ts <- liftIO currentTimestamp
     job <- liftM (extendJobReasonTrail . setReceivedTimestamp ts)
              $ queuedJobFromOpCodes jid ops
     qDir <- liftIO queueDir
     _ <- writeAndReplicateJob cfg qDir job
-    _ <- liftIO . forkIO $ enqueueNewJobs qstat [job]
+    _ <- liftIO . forkIO $ enqueueNewJobs qstat peer [job]
     return . showJSON . fromJobId $ jid
 
-handleCall qlock qstat cfg (SubmitJob ops) =
+handleCall qlock qstat peer cfg (SubmitJob ops) =
   do
     open <- isQueueOpen
     if not open
        then return . Bad . GenericError $ "Queue drained"
-       else handleCall qlock qstat cfg (SubmitJobToDrainedQueue ops)
+       else handleCall qlock qstat peer cfg (SubmitJobToDrainedQueue ops)
 
-handleCall qlock qstat cfg (SubmitManyJobs lops) =
+handleCall qlock qstat peer cfg (SubmitManyJobs lops) =
   do
     open <- isQueueOpen
     if not open
@@ -290,7 +295,7 @@ handleCall qlock qstat cfg (SubmitManyJobs lops) =
             when (any isBad write_results) . logWarning
               $ "Writing some jobs failed " ++ show annotated_results
             replicateManyJobs qDir mcs succeeded
-            _ <- forkIO $ enqueueNewJobs qstat succeeded
+            _ <- forkIO $ enqueueNewJobs qstat peer succeeded
             return . Ok . JSArray
               . map (\(res, job) ->
                       if isOk res
@@ -298,7 +303,8 @@ handleCall qlock qstat cfg (SubmitManyJobs lops) =
                         else showJSON (False, genericResult id (const "") res))
               $ annotated_results
 
-handleCall _ _ cfg (WaitForJobChange jid fields prev_job prev_log tmout) = do
+handleCall _ _ _ cfg
+           (WaitForJobChange jid fields prev_job prev_log tmout) = do
   let compute_fn = computeJobUpdate cfg jid fields prev_log
   qDir <- queueDir
   -- verify if the job is finalized, and return immediately in this case
@@ -306,18 +312,28 @@ handleCall _ _ cfg (WaitForJobChange jid fields prev_job prev_log tmout) = do
   case jobresult of
     Bad s -> return . Bad $ JobLost s
     Ok (job, _) | not (jobFinalized job) -> do
+      -- a running job process appends its changes to the journal and
+      -- only rewrites the job file when the job is finalized
       let jobfile = liveJobFile qDir jid
-      answer <- watchFile jobfile (min tmout C.luxiWfjcTimeout)
-                  (prev_job, JSArray []) compute_fn
+          journal = liveJobJournalFile qDir jid
+          watch path = watchFile path (min tmout C.luxiWfjcTimeout)
+                         (prev_job, JSArray []) compute_fn
+          -- the journal is removed once the job is finalized
+          watchJobFile :: IOException -> IO (JSValue, JSValue)
+          watchJobFile _ = watch jobfile
+      hasJournal <- doesFileExist journal
+      answer <- if hasJournal
+                  then watch journal `Control.Exception.catch` watchJobFile
+                  else watch jobfile
       return . Ok $ showJSON answer
     _ -> liftM (Ok . showJSON) compute_fn
 
-handleCall _ _ cfg (SetWatcherPause time) = do
+handleCall _ _ _ cfg (SetWatcherPause time) = do
   let mcs = Config.getMasterOrCandidates cfg
   _ <- executeRpcCall mcs $ RpcCallSetWatcherPause time
   return . Ok . maybe JSNull showJSON $ fmap TimeAsDoubleJSON time
 
-handleCall _ _ cfg (SetDrainFlag value) = do
+handleCall _ _ _ cfg (SetDrainFlag value) = do
   let mcs = Config.getMasterCandidates cfg
   fpath <- jobQueueDrainFile
   if value
@@ -326,7 +342,7 @@ handleCall _ _ cfg (SetDrainFlag value) = do
   _ <- executeRpcCall mcs $ RpcCallSetDrainFlag value
   return . Ok . showJSON $ True
 
-handleCall _ qstat cfg (ChangeJobPriority jid prio) = do
+handleCall _ qstat _ cfg (ChangeJobPriority jid prio) = do
   let jName = (++) "job " . show $ fromJobId jid
   maybeJob <- setJobPriority qstat jid prio
   case maybeJob of
@@ -342,7 +358,7 @@ handleCall _ qstat cfg (ChangeJobPriority jid prio) = do
       logDebug $ jName ++ " started, will signal"
       fmap showJSON <$> tellJobPriority (jqLivelock qstat) jid prio
 
-handleCall _ qstat  cfg (CancelJob jid) = do
+handleCall _ qstat _ cfg (CancelJob jid) = do
   let jName = (++) "job " . show $ fromJobId jid
   dequeueResult <- dequeueJob qstat jid
   case dequeueResult of
@@ -364,7 +380,7 @@ handleCall _ qstat  cfg (CancelJob jid) = do
       fmap showJSON <$> cancelJob (jqLivelock qstat) jid
     Bad s -> return . Ok . showJSON $ (False, s)
 
-handleCall qlock _ cfg (ArchiveJob jid) =
+handleCall qlock _ _ cfg (ArchiveJob jid) =
   -- By adding a layer of MaybeT, we can prematurely end a computation
   -- using 'mzero' or other 'MonadPlus' primitive and return 'Ok False'.
   runResultT . liftM (showJSON . fromMaybe False) . runMaybeT $ do
@@ -383,7 +399,7 @@ handleCall qlock _ cfg (ArchiveJob jid) =
                 $ RpcCallJobqueueRename [(live, archive)]
     return True
 
-handleCall qlock _ cfg (AutoArchiveJobs age timeout) = do
+handleCall qlock _ _ cfg (AutoArchiveJobs age timeout) = do
   qDir <- queueDir
   resultJids <- getJobIDs [qDir]
   case resultJids of
@@ -394,10 +410,14 @@ handleCall qlock _ cfg (AutoArchiveJobs age timeout) = do
                   $ sortJobIDs jids
       return . Ok $ showJSON result
 
-handleCall _ _ _ (PickupJob _) =
+handleCall _ _ _ _ (PickupJob _) =
   return . Bad
     $ GenericError "Luxi call 'PickupJob' is for internal use only"
 
+handleCall _ _ _ _ WatchJob{} =
+  return . Bad
+    $ GenericError "Luxi call 'WatchJob' can only be answered as a stream"
+
 {-# ANN handleCall "HLint: ignore Too strict if" #-}
 
 -- | Query the status of a job and return the requested fields
@@ -427,19 +447,73 @@ type LuxiConfig = (Lock, JQStatus, ConfigReader)
 
 luxiExec
     :: LuxiConfig
+    -> Maybe UserID
     -> LuxiOp
     -> IO (Bool, GenericResult GanetiException JSValue)
-luxiExec (qlock, qstat, creader) args = do
+luxiExec (qlock, qstat, creader) peer args = do
   cfg <- creader
-  result <- handleCallWrapper qlock qstat cfg args
+  result <- handleCallWrapper qlock qstat peer cfg args
   return (True, result)
 
-luxiHandler :: LuxiConfig -> U.Handler LuxiOp IO JSValue
-luxiHandler cfg = U.Handler { U.hParse         = decodeLuxiCall
-                            , U.hInputLogShort = strOfOp
-                            , U.hInputLogLong  = show
-                            , U.hExec          = luxiExec cfg
-                            }
+-- | Streams the changes of a job to a client until the job is finalized.
+--
+-- Every response is a pair of an update and whether it is the last one.
+-- An update is either 'C.jobNotchanged' or the requested fields together
+-- with the new log entries, just like the answer to 'WaitForJobChange'.
+-- An update is sent at least every 'C.luxiWfjcTimeout' seconds so that
+-- the client doesn't time out; the last one is sent once the job has been
+-- finalized and always contains the fields.
+watchJob :: LuxiConfig -> (JSValue -> IO ()) -> JobId -> [String]
+            -> JSValue -> JSValue
+            -> IO (Bool, GenericResult GanetiException JSValue)
+watchJob (qlock, qstat, creader) send jid fields = loop
+  where
+    loop prev_job prev_log = do
+      qDir <- queueDir
+      -- the update computed after observing a finalized job is complete
+      finalized <- liftM (genericResult (const False) (jobFinalized . fst))
+                     $ loadJobFromDisk qDir False jid
+      cfg <- creader
+      result <- handleCallWrapper qlock qstat Nothing cfg
+                  (WaitForJobChange jid fields prev_job prev_log
+                     C.luxiWfjcTimeout)
+      case result of
+        Ok (JSArray [job, JSArray logs]) -> do
+          let update = JSArray [job, JSArray logs]
+              changed = job /= prev_job || not (null logs)
+              prev_log' = case reverse logs of
+                            JSArray (serial:_) : _ -> serial
+                            _ -> prev_log
+          if finalized
+            then return (True, Ok $ showJSON (update, True))
+            else do
+              send . showJSON $ if changed
+                                  then (update, False)
+                                  else (showJSON C.jobNotchanged, False)
+              loop job prev_log'
+        Ok v -> return (True, Bad . GenericError
+                                $ "Unexpected job update " ++ encode v)
+        Bad err -> return (True, Bad err)
+
+-- | Returns the handler of the Luxi calls answered as a stream.
+luxiStream
+    :: LuxiConfig
+    -> LuxiOp
+    -> Maybe ((JSValue -> IO ())
+              -> IO (Bool, GenericResult GanetiException JSValue))
+luxiStream cfg (WatchJob jid fields prev_job prev_log) =
+  Just $ \send -> watchJob cfg send jid fields prev_job prev_log
+luxiStream _ _ = Nothing
+
+-- | Returns the handler of the Luxi calls of a client, given the user of
+-- the client process, if known, to whom submitted jobs are attributed.
+luxiHandler :: LuxiConfig -> Maybe UserID -> U.Handler LuxiOp IO JSValue
+luxiHandler cfg peer = U.Handler { U.hParse         = decodeLuxiCall
+                                 , U.hInputLogShort = strOfOp
+                                 , U.hInputLogLong  = show
+                                 , U.hExec          = luxiExec cfg peer
+                                 , U.hStream        = luxiStream cfg
+                                 }
 
 -- | Type alias for prepMain results
 type PrepResult = (Server, IORef (Result ConfigData), JQStatus)
@@ -489,10 +563,12 @@ main _ _ (server, cref, jq) = do
 
   _ <- P.installHandler P.sigCHLD P.Ignore Nothing
 
+  Exec.startJobZygote
+
   _ <- forkIO . void $ activateMasterIP
 
   initJQScheduler jq
 
   finally
-    (forever $ U.listener (luxiHandler (qlock, jq, creader)) server)
+    (forever $ U.peerListener (luxiHandler (qlock, jq, creader)) server)
     (closeServer server >> removeFile qlockFile)
@@ -76,6 +76,7 @@ dispatch fs =
              , US.hInputLogShort = rMethod
              , US.hInputLogLong  = rMethod
              , US.hExec          = liftToHandler . exec
+             , US.hStream        = const Nothing
              }
   where
     orError :: (MonadError e m, Error e) => Maybe a -> e -> m a
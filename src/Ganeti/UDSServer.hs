@@ -68,9 +68,11 @@ module Ganeti.UDSServer
   , Handler(..)
   , HandlerResult
   , listener
+  , peerListener
   ) where
 
 import Control.Applicative
+import Control.Arrow (second)
 import Control.Concurrent.Lifted (fork, yield)
 import Control.Monad.Base
 import Control.Monad.Trans.Control
@@ -87,7 +89,7 @@ import qualified Network.Socket as S
 import System.Directory (removeFile)
 import System.IO (hClose, hFlush, hWaitForInput, Handle, IOMode(..))
 import System.IO.Error (isEOFError)
-import System.Posix.Types (Fd)
+import System.Posix.Types (Fd, UserID)
 import System.Posix.IO (createPipe, fdToHandle, handleToFd)
 import System.Timeout
 import Text.JSON (encodeStrict, decodeStrict)
@@ -161,6 +163,8 @@ data Client = Client { rsocket :: Handle          -- ^ The read part of
                                                   -- the client socket
                      , rbuf :: IORef B.ByteString -- ^ Already received buffer
                      , clientConfig :: ConnectConfig
+                     , clientPeer :: Maybe UserID -- ^ The user of the peer
+                                                  -- process, if known
                      }
 
 -- | A server encapsulation.
@@ -203,10 +207,20 @@ closeServerSocket sock path = do
   removeFile path
 
 acceptSocket :: S.Socket -> IO Handle
-acceptSocket sock = do
+acceptSocket = liftM fst . acceptPeerSocket
+
+-- | Accepts a connection and returns it together with the user of the
+-- peer process, as recorded by the kernel when the connection was made.
+acceptPeerSocket :: S.Socket -> IO (Handle, Maybe UserID)
+acceptPeerSocket sock = do
   -- ignore client socket address
   (clientSock, _) <- S.accept sock
-  S.socketToHandle clientSock ReadWriteMode
+  peer <- Control.Exception.catch
+            (liftM (\(_, uid, _) -> Just $ fromIntegral uid)
+               $ S.getPeerCred clientSock)
+            (\e -> const (return Nothing) (e :: IOError))
+  handle <- S.socketToHandle clientSock ReadWriteMode
+  return (handle, peer)
 
 -- * Client and server
 
@@ -219,7 +233,8 @@ connectClient
 connectClient conf tmo path = do
   h <- openClientSocket tmo path
   rf <- newIORef B.empty
-  return Client { rsocket=h, wsocket=h, rbuf=rf, clientConfig=conf }
+  return Client { rsocket=h, wsocket=h, rbuf=rf, clientConfig=conf
+                , clientPeer=Nothing }
 
 -- | Creates and returns a server endpoint.
 connectServer :: ServerConfig -> Bool -> FilePath -> IO Server
@@ -241,7 +256,8 @@ pipeClient conf =
         rh <- fdToHandle r
         wh <- fdToHandle w
         return Client { rsocket = rh, wsocket = wh
-                      , rbuf = rf, clientConfig = conf }
+                      , rbuf = rf, clientConfig = conf
+                      , clientPeer = Nothing }
   in do
     (r1, w1) <- createPipe
     (r2, w2) <- createPipe
@@ -255,12 +271,13 @@ closeServer server =
 -- | Accepts a client
 acceptClient :: Server -> IO Client
 acceptClient s = do
-  handle <- acceptSocket (sSocket s)
+  (handle, peer) <- acceptPeerSocket (sSocket s)
   new_buffer <- newIORef B.empty
   return Client { rsocket=handle
                 , wsocket=handle
                 , rbuf=new_buffer
                 , clientConfig=serverConfig s
+                , clientPeer=peer
                 }
 
 -- | Closes the client socket.
@@ -424,6 +441,10 @@ data Handler i m o = Handler
     -- ^ long description of an input, for the DEBUG logging level
   , hExec          :: i -> HandlerResult m o
     -- ^ executes the handler on an input
+  , hStream        :: i -> Maybe ((o -> m ()) -> HandlerResult m o)
+    -- ^ for inputs answered by a stream of responses, executes the handler
+    -- on the input; it is given a function sending a successful response
+    -- and returns the last one, like 'hExec'
   }
 
 
@@ -441,9 +462,10 @@ handleJsonMessage handler req = do
 handleRawMessage
     :: (J.JSON o, MonadLog m)
     => Handler i m o            -- ^ handler
+    -> (String -> m ())         -- ^ sends a message before the response
     -> String                   -- ^ raw unparsed input
     -> m (Bool, String)
-handleRawMessage handler payload =
+handleRawMessage handler send payload =
   case parseCall payload >>= uncurry (hParse handler) of
     Bad err -> do
          let errmsg = "Failed to parse request: " ++ err
@@ -451,7 +473,11 @@ handleRawMessage handler payload =
          return (False, buildResponse False (J.showJSON errmsg))
     Ok req -> do
         logDebug $ "Request: " ++ hInputLogLong handler req
-        (close, call_result_json) <- handleJsonMessage handler req
+        (close, call_result_json) <- case hStream handler req of
+          Nothing -> handleJsonMessage handler req
+          Just stream ->
+            liftM (second $ fmap J.showJSON)
+              . stream $ send . buildResponse True . J.showJSON
         logMsg handler req call_result_json
         let (status, response) = prepareMsg call_result_json
         return (close, buildResponse status response)
@@ -484,7 +510,8 @@ handleClient handler client = do
     RecvError err -> logWarning ("Error during message receiving: " ++ err) >>
                      return False
     RecvOk payload -> do
-      (close, outMsg) <- handleRawMessage handler payload
+      (close, outMsg) <- handleRawMessage handler
+                           (liftBase . sendMsg client) payload
       liftBase $ sendMsg client outMsg
       return close
 
@@ -515,7 +542,16 @@ listener
     => Handler i m o
     -> Server
     -> m ()
-listener handler server = do
+listener handler = peerListener (const handler)
+
+-- | Like 'listener', but the handler of each client is chosen by the user
+-- of the peer process, if known.
+peerListener
+    :: (J.JSON o, MonadBaseControl IO m, MonadLog m)
+    => (Maybe UserID -> Handler i m o)
+    -> Server
+    -> m ()
+peerListener handler server = do
   client <- liftBase $ acceptClient server
-  _ <- fork $ clientLoop handler client
+  _ <- fork $ clientLoop (handler $ clientPeer client) client
   return ()
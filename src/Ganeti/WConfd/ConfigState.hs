@@ -1,4 +1,4 @@
-{-# LANGUAGE TemplateHaskell #-}
+{-# LANGUAGE RankNTypes #-}
 
 {-| Pure functions for manipulating the configuration state.
 
@@ -38,37 +38,88 @@ module Ganeti.WConfd.ConfigState
   ( ConfigState
   , csConfigData
   , csConfigDataL
+  , csDRBDMinors
   , mkConfigState
+  , updateConfigData
   , bumpSerial
+  , bumpConfigSerial
   , needsFullDist
   ) where
 
 import Control.Applicative
 import Data.Function (on)
+import qualified Data.Map as M
 import System.Time (ClockTime(..))
 
 import Ganeti.Config
+import Ganeti.JSON (Container, fromContainer)
 import Ganeti.Lens
 import Ganeti.Objects
 import Ganeti.Objects.Lens
+import Ganeti.WConfd.TempRes (DRBDMinorIndex, mkDRBDMinorIndex,
+                              updateDRBDMinorIndex)
 
 -- | In future this data type will include the current configuration
 -- ('ConfigData') and the last 'FStat' of its file.
+--
+-- Besides the configuration, it keeps the indexes derived from it, which
+-- are updated whenever the configuration is modified.
 data ConfigState = ConfigState
   { csConfigData :: ConfigData
+  , csDRBDMinors :: DRBDMinorIndex
   }
-  deriving (Eq, Show)
-
-$(makeCustomLenses ''ConfigState)
+  deriving (Show)
+
+-- | The indexes are derived from the configuration, so they are ignored.
+instance Eq ConfigState where
+  (==) = (==) `on` csConfigData
+
+-- | A lens for the configuration data.
+--
+-- As the lens can modify any part of the configuration, the indexes are
+-- updated for the instances and disks that differ from the previous
+-- version. If the modified objects are known, 'updateConfigData' is
+-- cheaper.
+csConfigDataL :: Lens' ConfigState ConfigData
+csConfigDataL = lensWith csConfigData setData
+  where
+    setData cs old new =
+      updateConfigData (changedKeys configInstances old new)
+                       (changedKeys configDisks old new) (const new) cs
+
+-- | Lists the keys of the objects of a container that are different in two
+-- versions of the configuration, including the added and removed ones.
+changedKeys :: (Eq a) => (ConfigData -> Container a)
+            -> ConfigData -> ConfigData -> [String]
+changedKeys field old new =
+  let (oldMap, newMap) = (fromContainer $ field old, fromContainer $ field new)
+  in M.keys (M.differenceWith (\a b -> if a == b then Nothing else Just a)
+                              oldMap newMap)
+     ++ M.keys (newMap `M.difference` oldMap)
 
 -- | Creates a new configuration state.
 -- This method will expand as more fields are added to 'ConfigState'.
 mkConfigState :: ConfigData -> ConfigState
-mkConfigState = ConfigState
+mkConfigState cd = ConfigState cd (mkDRBDMinorIndex cd)
+
+-- | Modifies the configuration data, updating the indexes only for the
+-- given instances and disks, which must include every instance and disk
+-- added, modified or removed by the modification.
+updateConfigData :: [String] -- ^ The UUIDs of the modified instances
+                 -> [String] -- ^ The UUIDs of the modified disks
+                 -> (ConfigData -> ConfigData) -> ConfigState -> ConfigState
+updateConfigData insts disks f cs =
+  let cd = f $ csConfigData cs
+  in ConfigState cd (updateDRBDMinorIndex cd insts disks $ csDRBDMinors cs)
 
 bumpSerial :: (SerialNoObjectL a, TimeStampObjectL a) => ClockTime -> a -> a
 bumpSerial now = set mTimeL now . over serialL succ
 
+-- | Bumps the serial number of the configuration. No instances or disks are
+-- modified, so the indexes are kept as they are.
+bumpConfigSerial :: ClockTime -> ConfigState -> ConfigState
+bumpConfigSerial now = updateConfigData [] [] (bumpSerial now)
+
 -- | Given two versions of the configuration, determine if its distribution
 -- needs to be fully commited before returning the corresponding call to
 -- WConfD.
@@ -65,21 +65,23 @@ import Ganeti.WConfd.Monad
 import Ganeti.WConfd.Ssconf
 
 -- | Loads the configuration from the file, if it hasn't been loaded yet.
+-- Returns also the format of the file, which is kept when writing it.
 -- The function is internal and isn't thread safe.
 loadConfigFromFile :: FilePath
-                   -> ResultG (ConfigData, FStat)
+                   -> ResultG (ConfigData, FStat, ConfigFormat)
 loadConfigFromFile path = withLockedFile path $ \_ -> do
     stat <- liftBase $ getFStat path
-    cd <- mkResultT (loadConfig path)
-    return (cd, stat)
+    (cd, fmt) <- mkResultT (loadConfigWithFormat path)
+    logInfo $ "Loaded the configuration file in format " ++ show fmt
+    return (cd, stat, fmt)
 
--- | Writes the current configuration to the file. The function isn't thread
--- safe.
+-- | Writes the current configuration to the file in the given format.
+-- The function isn't thread safe.
 -- Neither distributes the configuration (to nodes and ssconf) nor
 -- updates the serial number.
 writeConfigToFile :: (MonadBase IO m, MonadError GanetiException m, MonadLog m)
-                  => ConfigData -> FilePath -> FStat -> m FStat
-writeConfigToFile cfg path oldstat = do
+                  => ConfigFormat -> ConfigData -> FilePath -> FStat -> m FStat
+writeConfigToFile fmt cfg path oldstat = do
     logDebug $ "Async. config. writer: Commencing write\
                \ serial no " ++ show (serialOf cfg)
     r <- toErrorBase $ atomicUpdateLockedFile_ path oldstat doWrite
@@ -90,7 +92,7 @@ writeConfigToFile cfg path oldstat = do
       setOwnerAndGroupFromNames fname GanetiWConfd
                                 (DaemonGroup GanetiConfd)
       setOwnerWGroupR fname
-      saveConfig fh cfg
+      saveConfigAs fmt fh cfg
 
 -- Reads the current configuration state in the 'WConfdMonad'.
 readConfig :: WConfdMonad ConfigData
@@ -139,23 +141,26 @@ mkStatefulAsyncTask logPrio logPrefix start action =
 -- configuration to the master file.
 -- The worker's action reads the configuration using the given @IO@ action
 -- and uses 'FStat' to check if the configuration hasn't been modified by
--- another process.
+-- another process. The file is always written in the given format, which is
+-- the one it was loaded in, so that a conversion done by @cfgupgrade@
+-- persists.
 --
 -- If 'Any' of the input requests is true, given additional worker
 -- will be executed synchronously after sucessfully writing the configuration
 -- file. Otherwise, they'll be just triggered asynchronously.
 saveConfigAsyncTask :: FilePath -- ^ Path to the config file
+                    -> ConfigFormat -- ^ The format of the config. file
                     -> FStat  -- ^ The initial state of the config. file
                     -> IO ConfigState -- ^ An action to read the current config
                     -> [AsyncWorker () ()] -- ^ Workers to be triggered
                                            -- afterwards
                     -> ResultG (AsyncWorker Any ())
-saveConfigAsyncTask fpath fstat cdRef workers =
+saveConfigAsyncTask fpath fmt fstat cdRef workers =
   lift . mkStatefulAsyncTask
            EMERGENCY "Can't write the master configuration file" fstat
        $ \oldstat (Any flush) -> do
             cd <- liftBase (csConfigData `liftM` cdRef)
-            writeConfigToFile cd fpath oldstat
+            writeConfigToFile fmt cd fpath oldstat
               <* if flush then logDebug "Running distribution synchronously"
                                >> triggerAndWaitMany_ workers
                           else logDebug "Running distribution asynchronously"
@@ -60,9 +60,14 @@ import Ganeti.Locking.Locks ( GanetiLocks(ConfigLock, BGL)
                             , lockLevel, LockLevel
                             , ClientType(ClientOther), ClientId(..) )
 import qualified Ganeti.Locking.Waiting as LW
-import Ganeti.Objects (ConfigData, DRBDSecret, LogicalVolume, Ip4Address)
-import Ganeti.Objects.Lens (configClusterL, clusterMasterNodeL)
-import Ganeti.WConfd.ConfigState (csConfigDataL)
+import Ganeti.Objects ( ConfigData, DRBDSecret, LogicalVolume, Ip4Address
+                      , Cluster, Node, NodeGroup, Instance, Network, Disk )
+import Ganeti.Objects.Lens ( configClusterL, clusterMasterNodeL
+                           , configNodesL, configNodegroupsL
+                           , configInstancesL, configNetworksL
+                           , configDisksL )
+import Ganeti.WConfd.ConfigState ( csConfigData, csConfigDataL, csDRBDMinors
+                                 , updateConfigData )
 import qualified Ganeti.WConfd.ConfigVerify as V
 import Ganeti.WConfd.Language
 import Ganeti.WConfd.Monad
@@ -96,6 +101,36 @@ writeConfig ident cdata = do
   -- V.verifyConfigErr cdata
   CW.writeConfig cdata
 
+-- | Write a partial update of the configuration, checking that an exclusive
+-- lock is held. If not, the call fails.
+--
+-- The cluster object is replaced only if given. For each of the containers,
+-- the listed objects replace (or add) the objects with the same UUID, and
+-- UUIDs given without an object are removed. This way a client holding the
+-- lock doesn't need to send the whole configuration if only a few objects
+-- have been changed.
+writeConfigUpdate :: ClientId
+                  -> J.MaybeForJSON Cluster
+                  -> [(String, J.MaybeForJSON Node)]
+                  -> [(String, J.MaybeForJSON NodeGroup)]
+                  -> [(String, J.MaybeForJSON Instance)]
+                  -> [(String, J.MaybeForJSON Network)]
+                  -> [(String, J.MaybeForJSON Disk)]
+                  -> WConfdMonad ()
+writeConfigUpdate ident cluster nodes nodegroups instances networks disks = do
+  checkConfigLock ident L.OwnExclusive
+  let alterAll l objs cd =
+        foldr (\(uuid, J.MaybeForJSON obj) ->
+                 set (l . J.alterContainerL uuid) obj) cd objs
+      update = alterAll configDisksL disks
+               . alterAll configNetworksL networks
+               . alterAll configInstancesL instances
+               . alterAll configNodegroupsL nodegroups
+               . alterAll configNodesL nodes
+               . maybe id (set configClusterL) (J.unMaybeForJSON cluster)
+  modifyConfigState $ (,) ()
+    . updateConfigData (map fst instances) (map fst disks) update
+
 -- | Explicitly run verification of the configuration.
 -- The caller doesn't need to hold the configuration lock.
 verifyConfig :: WConfdMonad ()
@@ -144,7 +179,9 @@ dropAllReservations cid =
 -- *** DRBD
 
 computeDRBDMap :: WConfdMonad T.DRBDMap
-computeDRBDMap = uncurry T.computeDRBDMap =<< readTempResState
+computeDRBDMap = do
+  (cs, trs) <- readTempResStateWithConfig
+  T.computeDRBDMap (csConfigData cs) (csDRBDMinors cs) trs
 
 -- Allocate a drbd minor.
 --
@@ -154,7 +191,8 @@ computeDRBDMap = uncurry T.computeDRBDMap =<< readTempResState
 allocateDRBDMinor
   :: T.InstanceUUID -> [T.NodeUUID] -> WConfdMonad [T.DRBDMinor]
 allocateDRBDMinor inst nodes =
-  modifyTempResStateErr (\cfg -> T.allocateDRBDMinor cfg inst nodes)
+  modifyTempResStateWithConfigErr
+    (\cs -> T.allocateDRBDMinor (csDRBDMinors cs) inst nodes)
 
 -- Release temporary drbd minors allocated for a given instance using
 -- 'allocateDRBDMinor'.
@@ -359,6 +397,7 @@ exportedFunctions = [ 'echo
                     -- config
                     , 'readConfig
                     , 'writeConfig
+                    , 'writeConfigUpdate
                     , 'verifyConfig
                     , 'lockConfig
                     , 'unlockConfig
@@ -62,7 +62,9 @@ module Ganeti.WConfd.Monad
   , readLockAllocation
   , modifyTempResState
   , modifyTempResStateErr
+  , modifyTempResStateWithConfigErr
   , readTempResState
+  , readTempResStateWithConfig
   ) where
 
 -- The following macro is just a temporary solution for 2.12 and 2.13.
@@ -251,7 +253,7 @@ modifyConfigStateErr f = do
   -- as well as if it needs to be distributed synchronously.
   let unpackResult cs (r, cs')
                     | cs /= cs' = ( (r, True, needsFullDist cs cs')
-                                  , over csConfigDataL (bumpSerial now) cs' )
+                                  , bumpConfigSerial now cs' )
                     | otherwise = ((r, False, False), cs')
   let modCS ds@(DaemonState { dsTempRes = tr }) =
         mapMOf2 dsConfigStateL (\cs -> liftM (unpackResult cs) (f tr cs)) ds
@@ -304,13 +306,16 @@ modifyConfigDataErr_ f =
 
 -- | Atomically modifies the state of temporary reservations in
 -- WConfdMonad in the presence of possible errors.
-modifyTempResStateErr
-  :: (ConfigData -> StateT TempResState ErrorResult a) -> WConfdMonad a
-modifyTempResStateErr f = do
+--
+-- The computation gets the whole configuration state, including the
+-- indexes derived from the configuration.
+modifyTempResStateWithConfigErr
+  :: (ConfigState -> StateT TempResState ErrorResult a) -> WConfdMonad a
+modifyTempResStateWithConfigErr f = do
   -- we use Compose to traverse the composition of applicative functors
   -- @ErrorResult@ and @(,) a@
   let f' ds = traverseOf2 dsTempResL
-              (runStateT (f (csConfigData . dsConfigState $ ds))) ds
+              (runStateT (f (dsConfigState ds))) ds
   dh <- daemonHandle
   r <- toErrorBase $ atomicModifyIORefErr (dhDaemonState dh)
                                           (liftM swap . f')
@@ -320,18 +325,30 @@ modifyTempResStateErr f = do
   logDebug "Temporary reservations write finished"
   return r
 
+-- | Atomically modifies the state of temporary reservations in
+-- WConfdMonad in the presence of possible errors.
+modifyTempResStateErr
+  :: (ConfigData -> StateT TempResState ErrorResult a) -> WConfdMonad a
+modifyTempResStateErr f = modifyTempResStateWithConfigErr (f . csConfigData)
+
 -- | Atomically modifies the state of temporary reservations in
 -- WConfdMonad.
 modifyTempResState :: (ConfigData -> State TempResState a) -> WConfdMonad a
 modifyTempResState f =
   modifyTempResStateErr (mapStateT (return . runIdentity) . f)
 
+-- | Reads the state of of the configuration, including its indexes, and
+-- temporary reservations in WConfdMonad.
+readTempResStateWithConfig :: WConfdMonad (ConfigState, TempResState)
+readTempResStateWithConfig = liftM (dsConfigState &&& dsTempRes)
+                               . readIORef . dhDaemonState
+                             =<< daemonHandle
+
 -- | Reads the state of of the configuration and temporary reservations
 -- in WConfdMonad.
 readTempResState :: WConfdMonad (ConfigData, TempResState)
-readTempResState = liftM (csConfigData . dsConfigState &&& dsTempRes)
-                     . readIORef . dhDaemonState
-                   =<< daemonHandle
+readTempResState = liftM (\(cs, trs) -> (csConfigData cs, trs))
+                         readTempResStateWithConfig
 
 -- | Atomically modifies the lock waiting state in WConfdMonad.
 modifyLockWaiting :: (GanetiLockWaiting -> ( GanetiLockWaiting
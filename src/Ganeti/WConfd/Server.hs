@@ -91,7 +91,7 @@ prepMain _ _ = do
         . withErrorT (strMsg . ("Initialization of the daemon failed" ++)
                              . formatError) $ do
     ents <- getEnts
-    (cdata, cstat) <- loadConfigFromFile conf_file
+    (cdata, cstat, cformat) <- loadConfigFromFile conf_file
     verifyConfigErr cdata
     lock <- readPersistent persistentLocks
     tempres <- readPersistent persistentTempRes
@@ -100,7 +100,7 @@ prepMain _ _ = do
                    (mkConfigState cdata)
                    lock
                    tempres
-                   (saveConfigAsyncTask conf_file cstat)
+                   (saveConfigAsyncTask conf_file cformat cstat)
                    (distMCsAsyncTask ents conf_file)
                    distSSConfAsyncTask
                    (writePersistentAsyncTask persistentLocks)
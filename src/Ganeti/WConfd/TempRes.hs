@@ -48,6 +48,9 @@ module Ganeti.WConfd.TempRes
   , DRBDMinor
   , DRBDMap
   , trsDRBDL
+  , DRBDMinorIndex
+  , mkDRBDMinorIndex
+  , updateDRBDMinorIndex
   , computeDRBDMap
   , computeDRBDMap'
   , allocateDRBDMinor
@@ -78,6 +81,7 @@ import Control.Monad.Error
 import Control.Monad.State
 import Control.Monad.Trans.Maybe
 import qualified Data.Foldable as F
+import Data.List (delete, foldl')
 import Data.Maybe
 import Data.Map (Map)
 import qualified Data.Map as M
@@ -210,36 +214,98 @@ maybeLens l f = l (fmap (mfilter (/= mempty) . Just) . f . fromMaybe mempty)
 
 -- * DRBD functions
 
+-- ** The index of the used DRBD minors
+
+-- | An index of the DRBD minors used by the disks of the instances in the
+-- configuration.
+--
+-- The index is kept in the configuration state and updated only for the
+-- instances whose objects or disks changed, so that computing the DRBD map
+-- or allocating a minor doesn't need to look at every disk in the cluster.
+data DRBDMinorIndex = DRBDMinorIndex
+  { dmiInstances :: Map InstanceUUID ([String], [(DRBDMinor, NodeUUID)])
+    -- ^ The disks of every instance and the minors they use
+  , dmiErrors :: Map InstanceUUID GanetiException
+    -- ^ The errors encountered computing the minors of an instance, for
+    -- example because a disk is missing
+  , dmiDiskOwners :: Map String InstanceUUID
+    -- ^ The instance every disk is attached to
+  , dmiUsage :: DRBDMap'
+    -- ^ The instances using every minor of every node, an instance being
+    -- listed once for every use
+  } deriving (Eq, Show)
+
+-- | Builds the index of the DRBD minors used by all the instances.
+mkDRBDMinorIndex :: ConfigData -> DRBDMinorIndex
+mkDRBDMinorIndex cfg =
+  updateDRBDMinorIndex cfg (M.keys . J.fromContainer . configInstances $ cfg)
+                       [] (DRBDMinorIndex M.empty M.empty M.empty M.empty)
+
+-- | Updates the index after the given instances and disks have been added,
+-- modified or removed. The configuration is the one after the change.
+updateDRBDMinorIndex :: ConfigData
+                     -> [InstanceUUID] -- ^ The changed instances
+                     -> [String] -- ^ The changed disks
+                     -> DRBDMinorIndex -> DRBDMinorIndex
+updateDRBDMinorIndex cfg insts disks idx =
+  foldl' (flip $ reindexInstance cfg) idx . S.toList . S.fromList
+    $ insts ++ mapMaybe (`M.lookup` dmiDiskOwners idx) disks
+
+-- | Recomputes the DRBD minors of a single instance in the index.
+reindexInstance :: ConfigData -> InstanceUUID -> DRBDMinorIndex
+                -> DRBDMinorIndex
+reindexInstance cfg uuid (DRBDMinorIndex insts errs owners usage) =
+  DRBDMinorIndex (M.alter (const $ fmap (\i -> (instDisks i, newMinors)) inst)
+                          uuid insts)
+                 (M.alter (const newError) uuid errs)
+                 (foldl' (\m d -> M.insert d uuid m)
+                         (foldl' (flip $ M.update dropOwner) owners oldDisks)
+                         (maybe [] instDisks inst))
+                 (foldl' addUse (foldl' delUse usage oldMinors) newMinors)
+  where
+    (oldDisks, oldMinors) = M.findWithDefault ([], []) uuid insts
+    inst = M.lookup uuid . J.fromContainer . configInstances $ cfg
+    minors = maybe (Ok []) (getDrbdMinorsForInstance cfg) inst
+    newMinors = genericResult (const []) id minors
+    newError = genericResult Just (const Nothing) minors
+    dropOwner owner = if owner == uuid then Nothing else Just owner
+    addUse m (minor, node) =
+      M.insertWith (M.unionWith (++)) node (M.singleton minor [uuid]) m
+    delUse m (minor, node) =
+      M.update (mfilter (not . M.null) . Just
+                . M.update (mfilter (not . null) . Just . delete uuid) minor)
+               node m
+
+-- ** Using the DRBD minors
+
 -- | Compute the map of used DRBD minor/nodes, including possible
 -- duplicates.
 -- An error is returned if the configuration isn't consistent
 -- (for example if a referenced disk is missing etc.).
 computeDRBDMap' :: (MonadError GanetiException m)
-                => ConfigData -> TempResState -> m DRBDMap'
-computeDRBDMap' cfg trs =
-    flip execStateT (fmap (fmap (: [])) (trsDRBD trs))
-    $ F.forM_ (configInstances cfg) addDisks
-  where
-    -- | Creates a lens for modifying the list of instances
-    nodeMinor :: NodeUUID -> DRBDMinor -> Lens' DRBDMap' [InstanceUUID]
-    nodeMinor node minor = maybeLens (at node) . maybeLens (at minor)
-    -- | Adds disks of an instance within the state monad
-    addDisks inst = do
-                      disks <- toError $ getDrbdMinorsForInstance cfg inst
-                      forM_ disks $ \(minor, node) -> nodeMinor node minor
-                                                          %= (uuidOf inst :)
+                => DRBDMinorIndex -> TempResState -> m DRBDMap'
+computeDRBDMap' idx trs = do
+  checkDRBDMinorIndex idx
+  return $ M.unionWith (M.unionWith (++)) (dmiUsage idx)
+                       (fmap (fmap (: [])) (trsDRBD trs))
+
+-- | Fails with the first error found when indexing the minors of the
+-- instances.
+checkDRBDMinorIndex :: (MonadError GanetiException m)
+                    => DRBDMinorIndex -> m ()
+checkDRBDMinorIndex = F.mapM_ throwError . listToMaybe . M.elems . dmiErrors
 
 -- | Compute the map of used DRBD minor/nodes.
 -- Report any duplicate entries as an error.
 --
 -- Unlike 'computeDRBDMap'', includes entries for all nodes, even if empty.
 computeDRBDMap :: (MonadError GanetiException m)
-               => ConfigData -> TempResState -> m DRBDMap
-computeDRBDMap cfg trs = do
-  m <- computeDRBDMap' cfg trs
+               => ConfigData -> DRBDMinorIndex -> TempResState -> m DRBDMap
+computeDRBDMap cfg idx trs = do
+  m <- computeDRBDMap' idx trs
   let dups = filterNested ((>= 2) . length) m
   unless (M.null dups) . resError
-    $ "Duplicate DRBD ports detected: " ++ show (M.toList $ fmap M.toList dups)
+    $ "Duplicate DRBD minors detected: " ++ show (M.toList $ fmap M.toList dups)
   return $ fmap (fmap head . M.filter ((== 1) . length)) m
            `M.union` (fmap (const mempty) . J.fromContainer . configNodes $ cfg)
 
@@ -248,18 +314,21 @@ computeDRBDMap cfg trs = do
 -- The free minor will be automatically computed from the existing devices.
 -- A node can be given multiple times in order to allocate multiple minors.
 -- The result is the list of minors, in the same order as the passed nodes.
+--
+-- Only the minors of the given nodes are looked up in the index.
 allocateDRBDMinor :: (MonadError GanetiException m, MonadState TempResState m)
-                  => ConfigData -> InstanceUUID -> [NodeUUID]
+                  => DRBDMinorIndex -> InstanceUUID -> [NodeUUID]
                   -> m [DRBDMinor]
-allocateDRBDMinor cfg inst nodes = do
-  dMap <- computeDRBDMap' cfg =<< get
-  let usedMap = fmap M.keysSet dMap
+allocateDRBDMinor idx inst nodes = do
+  checkDRBDMinorIndex idx
+  let used node = M.keysSet . M.findWithDefault mempty node $ dmiUsage idx
   let alloc :: S.Set DRBDMinor -> Map DRBDMinor InstanceUUID
             -> (DRBDMinor, Map DRBDMinor InstanceUUID)
-      alloc used m = let k = findFirst 0 (M.keysSet m `S.union` used)
-                      in (k, M.insert k inst m)
+      alloc usedMinors m = let k = findFirst 0 (M.keysSet m
+                                                `S.union` usedMinors)
+                            in (k, M.insert k inst m)
   forM nodes $ \node -> trsDRBDL . maybeLens (at node)
-                        %%= alloc (M.findWithDefault mempty node usedMap)
+                        %%= alloc (used node)
 
 -- Release temporary drbd minors allocated for a given instance using
 -- 'allocateDRBDMinor'.
@@ -0,0 +1,184 @@
+{-# LANGUAGE TemplateHaskell #-}
+
+{-| Unittests for the job scheduler of luxid.
+
+-}
+
+{-
+
+Copyright (C) 2014 Google Inc.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+1. Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in the
+documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+-}
+module Test.Ganeti.JQScheduler (testJQScheduler) where
+
+import Data.List (sort)
+import qualified Data.Map as M
+import Data.Maybe (fromMaybe)
+import qualified Data.Set as S
+import Test.HUnit
+import Text.JSON (JSValue(JSNull))
+
+import Test.Ganeti.TestHelper
+
+import Ganeti.JQScheduler
+import Ganeti.JQScheduler.Policy
+import Ganeti.JQueue.Objects
+import Ganeti.OpCodes
+import Ganeti.Types
+
+{-# ANN module "HLint: ignore Use camelCase" #-}
+
+-- * Helpers
+
+-- | A policy without aging and without limits.
+plainPolicy :: SchedulingPolicy
+plainPolicy = SchedulingPolicy { spNow = (0, 0)
+                               , spAgingInterval = 0
+                               , spClassLimits = M.empty
+                               }
+
+-- | Builds a job ID.
+mkJobId :: Int -> JobId
+mkJobId = fromMaybe (error "Invalid job ID") . makeJobId
+
+-- | Builds a queued job depending on the successful completion of the
+-- given jobs.
+mkJob :: Int -> [Int] -> JobWithStat
+mkJob jid deps =
+  let dep d = JobDependency (JobDepAbsolute $ mkJobId d) [JobStatusSuccessful]
+      depends = if null deps then Nothing else Just $ map dep deps
+      qop = QueuedOpCode
+              { qoInput = ValidOpCode $ MetaOpCode
+                            defOpParams { opDepends = depends } OpClusterQuery
+              , qoStatus = OP_STATUS_QUEUED
+              , qoResult = JSNull
+              , qoLog = []
+              , qoPriority = 0
+              , qoStartTimestamp = Nothing
+              , qoExecTimestamp = Nothing
+              , qoEndTimestamp = Nothing
+              }
+  in unreadJob QueuedJob { qjId = mkJobId jid
+                         , qjOps = [qop]
+                         , qjReceivedTimestamp = Just (0, 0)
+                         , qjStartTimestamp = Nothing
+                         , qjEndTimestamp = Nothing
+                         , qjLivelock = Nothing
+                         , qjProcessId = Nothing
+                         , qjReplication = Nothing
+                         }
+
+-- | Builds a queue from its enqueued, running and manipulated jobs.
+mkQueue :: [JobWithStat] -> [JobWithStat] -> [JobWithStat] -> Queue
+mkQueue enqueued running manipulated =
+  Queue { qEnqueued = enqueued, qRunning = running
+        , qManipulated = manipulated }
+
+-- | The sorted IDs of some jobs.
+jobIds :: [JobWithStat] -> [Int]
+jobIds = sort . map (fromJobId . qjId . jJob)
+
+-- | The IDs of the jobs chosen to run from a queue, with plenty of job
+-- slots.
+selectIds :: Queue -> [Int]
+selectIds = jobIds . snd . selectJobsToRun plainPolicy 1000
+
+-- | Runs all enqueued jobs, where the jobs started in a round finish
+-- before the next round, and returns the IDs of the jobs started in each
+-- round. If no job can be started, the last round is empty.
+runRounds :: Queue -> [[Int]]
+runRounds queue
+  | null (qEnqueued queue) = []
+  | null chosen = [[]]
+  | otherwise = jobIds chosen : runRounds queue' { qRunning = [] }
+  where (queue', chosen) = selectJobsToRun plainPolicy 1000 queue
+
+-- * Test cases
+
+-- | Tests which jobs count as unfinished.
+case_UnfinishedJobIds :: Assertion
+case_UnfinishedJobIds =
+  assertEqual "unfinished jobs" (S.fromList $ map mkJobId [1, 3])
+    . unfinishedJobIds $ mkQueue [mkJob 3 []] [mkJob 1 []] [mkJob 2 []]
+
+-- | Tests the eligibility of jobs with dependencies.
+case_JobEligible :: Assertion
+case_JobEligible = do
+  let unfinished = S.fromList $ map mkJobId [1, 2]
+  assertBool "job without dependencies" . jobEligible unfinished $ mkJob 5 []
+  assertBool "job depending on finished jobs" . jobEligible unfinished
+    $ mkJob 5 [0, 3]
+  assertBool "job depending on an unfinished job" . not
+    . jobEligible unfinished $ mkJob 5 [0, 2]
+
+-- | Tests that in a chain, every job waits for its predecessor.
+case_SelectChain :: Assertion
+case_SelectChain = do
+  let chain = mkJob 0 [] : [ mkJob i [i - 1] | i <- [1..4] ]
+  assertEqual "rounds" [[0], [1], [2], [3], [4]]
+    . runRounds $ mkQueue chain [] []
+  assertEqual "predecessor running" []
+    . selectIds $ mkQueue (drop 2 chain) [chain !! 1] []
+
+-- | Tests that a job waits for all the jobs it depends on.
+case_SelectFanIn :: Assertion
+case_SelectFanIn = do
+  let fanin = map (`mkJob` []) [0..3] ++ [mkJob 4 [0..3]]
+  assertEqual "rounds" [[0, 1, 2, 3], [4]] . runRounds $ mkQueue fanin [] []
+  assertEqual "one dependency running" []
+    . selectIds $ mkQueue [last fanin] [head fanin] []
+  assertEqual "one dependency enqueued" [0]
+    . selectIds $ mkQueue [head fanin, last fanin] [] []
+  assertEqual "dependencies finished" [4]
+    . selectIds $ mkQueue [last fanin] [] []
+
+-- | Tests that jobs being manipulated don't block the jobs depending on
+-- them, but still take up job slots.
+case_SelectManipulated :: Assertion
+case_SelectManipulated = do
+  let queue = mkQueue [mkJob 1 [0], mkJob 2 []] [] [mkJob 0 []]
+  assertEqual "dependency manipulated" [1, 2] $ selectIds queue
+  assertEqual "job slots" [1] . jobIds . snd
+    $ selectJobsToRun plainPolicy 2 queue
+
+-- | Tests that the job slots are shared among the users submitting jobs.
+case_SelectSubmitter :: Assertion
+case_SelectSubmitter = do
+  let submitted uid job = job { jSubmitter = Just uid }
+      queue = mkQueue (map (submitted 0 . (`mkJob` [])) [1, 2]
+                         ++ [submitted 1000 $ mkJob 3 []]) [] []
+  assertEqual "one job per user" [1, 3] . jobIds . snd
+    $ selectJobsToRun plainPolicy 2 queue
+
+testSuite "JQScheduler"
+            [ 'case_UnfinishedJobIds
+            , 'case_JobEligible
+            , 'case_SelectChain
+            , 'case_SelectFanIn
+            , 'case_SelectManipulated
+            , 'case_SelectSubmitter
+            ]
@@ -0,0 +1,194 @@
+{-# LANGUAGE TemplateHaskell #-}
+
+{-| Unittests for the job scheduling policy.
+
+-}
+
+{-
+
+Copyright (C) 2014 Google Inc.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+1. Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in the
+documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+-}
+
+module Test.Ganeti.JQScheduler.Policy (testJQScheduler_Policy) where
+
+import Control.Applicative
+import Data.List (nub)
+import qualified Data.Map as M
+import Test.HUnit
+import Test.QuickCheck
+import Text.JSON (JSValue(JSNull))
+
+import Test.Ganeti.TestCommon
+import Test.Ganeti.TestHelper
+
+import qualified Ganeti.Constants as C
+import Ganeti.JQScheduler.Policy
+import Ganeti.JQueue.Objects
+import Ganeti.OpCodes
+import Ganeti.Types
+
+{-# ANN module "HLint: ignore Use camelCase" #-}
+
+-- * Helpers
+
+-- | A policy without limits, at 1000 seconds after the epoch.
+defPolicy :: SchedulingPolicy
+defPolicy = SchedulingPolicy { spNow = (1000, 0)
+                             , spAgingInterval = 60
+                             , spClassLimits = M.empty
+                             }
+
+-- | A job together with the user who submitted it.
+type SubmittedJob = (String, QueuedJob)
+
+-- | Builds a queued job with a single opcode, submitted by the given user.
+mkJob :: (Monad m) => Int -> Int -> Int -> String -> OpCode
+      -> m SubmittedJob
+mkJob jid prio received submitter op = do
+  jobid <- makeJobId jid
+  let qop = QueuedOpCode
+              { qoInput = ValidOpCode $ MetaOpCode defOpParams op
+              , qoStatus = OP_STATUS_QUEUED
+              , qoResult = JSNull
+              , qoLog = []
+              , qoPriority = prio
+              , qoStartTimestamp = Nothing
+              , qoExecTimestamp = Nothing
+              , qoEndTimestamp = Nothing
+              }
+  return ( submitter
+         , QueuedJob { qjId = jobid
+                     , qjOps = [qop]
+                     , qjReceivedTimestamp = Just (received, 0)
+                     , qjStartTimestamp = Nothing
+                     , qjEndTimestamp = Nothing
+                     , qjLivelock = Nothing
+                     , qjProcessId = Nothing
+                     , qjReplication = Nothing
+                     } )
+
+-- | The IDs of the jobs chosen to run.
+selectIds :: SchedulingPolicy -> Int -> [SubmittedJob] -> [SubmittedJob]
+          -> [Int]
+selectIds policy count running =
+  map (fromJobId . qjId . snd)
+    . selectJobsByPolicy policy snd fst count running
+
+-- | Generates queued jobs with distinct IDs.
+genJobs :: Gen [SubmittedJob]
+genJobs = do
+  specs <- listOf $ (,,) <$> choose (C.opPrioHighest, C.opPrioLowest)
+                         <*> choose (0, 1000)
+                         <*> elements ["root", "alice", "bob"]
+  sequence [ mkJob jid prio received submitter OpClusterQuery
+           | (jid, (prio, received, submitter)) <- zip [0..] specs ]
+
+-- * Test cases
+
+-- | Tests that the priority of waiting jobs increases over time.
+case_AgedPriority :: Assertion
+case_AgedPriority = do
+  (_, job) <- mkJob 1 C.opPrioNormal 870 "" OpClusterQuery
+  assertEqual "after two intervals" (C.opPrioNormal - 2)
+    $ agedJobPriority defPolicy job
+  assertEqual "without aging" C.opPrioNormal
+    $ agedJobPriority defPolicy { spAgingInterval = 0 } job
+  (_, old) <- mkJob 2 C.opPrioHigh 0 "" OpClusterQuery
+  assertEqual "for a very old job" C.opPrioHighest
+    $ agedJobPriority defPolicy old
+
+-- | Tests that jobs are chosen by priority, then in submission order.
+case_Priority :: Assertion
+case_Priority = do
+  low <- mkJob 1 C.opPrioLow 1000 "" OpClusterQuery
+  normal <- mkJob 2 C.opPrioNormal 1000 "" OpClusterQuery
+  high <- mkJob 3 C.opPrioHigh 1000 "" OpClusterQuery
+  normal' <- mkJob 4 C.opPrioNormal 1000 "" OpClusterQuery
+  assertEqual "for the order of jobs" [3, 2, 4, 1]
+    $ selectIds defPolicy 4 [] [low, normal, high, normal']
+
+-- | Tests that a job with a low priority is not starved.
+case_Aging :: Assertion
+case_Aging = do
+  low <- mkJob 1 C.opPrioLow 0 "" OpClusterQuery
+  normal <- mkJob 2 C.opPrioNormal 990 "" OpClusterQuery
+  assertEqual "for an old job with low priority" [1]
+    $ selectIds defPolicy 1 [] [normal, low]
+
+-- | Tests that jobs of the same priority are shared among submitters.
+case_FairShare :: Assertion
+case_FairShare = do
+  bulk <- mapM (\jid -> mkJob jid 0 1000 "gnt-rapi" OpClusterQuery) [1..3]
+  interactive <- mkJob 4 0 1000 "root" OpClusterQuery
+  assertEqual "for alternating submitters" [1, 4, 2]
+    $ selectIds defPolicy 3 [] (bulk ++ [interactive])
+  running <- mkJob 5 0 1000 "gnt-rapi" OpClusterQuery
+  assertEqual "for a submitter with running jobs" [4]
+    $ selectIds defPolicy 1 [running] (bulk ++ [interactive])
+
+-- | Tests the limits on the number of running jobs per opcode class.
+case_ClassLimits :: Assertion
+case_ClassLimits = do
+  let policy = defPolicy { spClassLimits =
+                             M.singleton (opID OpClusterVerifyDisks) 1 }
+  verify <- mkJob 1 0 1000 "" OpClusterVerifyDisks
+  verify' <- mkJob 2 C.opPrioHigh 1000 "" OpClusterVerifyDisks
+  query <- mkJob 3 0 1000 "" OpClusterQuery
+  assertEqual "for a class without running jobs" [2, 3]
+    $ selectIds policy 3 [] [verify, verify', query]
+  assertEqual "for a class at its limit" [3]
+    $ selectIds policy 3 [verify] [verify', query]
+
+-- | Tests that the requested number of distinct jobs is chosen.
+prop_SelectCount :: Property
+prop_SelectCount =
+  forAll (choose (0, 10)) $ \count ->
+  forAll genJobs $ \jobs ->
+  let chosen = selectIds defPolicy count [] jobs
+  in conjoin [ length chosen ==? min count (length jobs)
+             , nub chosen ==? chosen
+             ]
+
+-- | Tests that the limit of an opcode class is never exceeded.
+prop_SelectLimit :: Property
+prop_SelectLimit =
+  forAll (choose (1, 5)) $ \limit ->
+  forAll genJobs $ \jobs ->
+  let policy = defPolicy { spClassLimits =
+                             M.singleton (opID OpClusterQuery) limit }
+  in length (selectIds policy 10 [] jobs) ==? min limit (length jobs)
+
+testSuite "JQScheduler/Policy"
+  [ 'case_AgedPriority
+  , 'case_Priority
+  , 'case_Aging
+  , 'case_FairShare
+  , 'case_ClassLimits
+  , 'prop_SelectCount
+  , 'prop_SelectLimit
+  ]
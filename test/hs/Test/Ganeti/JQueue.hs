@@ -40,6 +40,7 @@ import Control.Applicative
 import Control.Monad (when)
 import Data.Char (isAscii)
 import Data.List (nub, sort)
+import qualified Data.Map as Map
 import System.Directory
 import System.FilePath
 import System.IO.Temp
@@ -81,7 +82,7 @@ genQueuedOpCode =
 emptyJob :: (Monad m) => m QueuedJob
 emptyJob = do
   jid0 <- makeJobId 0
-  return $ QueuedJob jid0 [] justNoTs justNoTs justNoTs Nothing Nothing
+  return $ QueuedJob jid0 [] justNoTs justNoTs justNoTs Nothing Nothing Nothing
 
 -- | Generates a job ID.
 genJobId :: Gen JobId
@@ -89,6 +90,13 @@ genJobId = do
   p <- arbitrary::Gen (Types.NonNegative Int)
   makeJobId $ fromNonNegative p
 
+-- | Generates the index entry of a packed job.
+genPackedJobInfo :: JobId -> Gen PackedJobInfo
+genPackedJobInfo jid =
+  PackedJobInfo jid "packed" <$> choose (0, 1000000) <*> choose (1, 1000) <*>
+    arbitrary <*> genMaybe arbitrary <*> genMaybe arbitrary <*>
+    genMaybe arbitrary <*> listOf genName
+
 -- * Test cases
 
 -- | Tests default priority value.
@@ -104,6 +112,7 @@ prop_JobPriority =
                    (not . opStatusFinalized . qoStatus))) $ \ops -> do
   jid0 <- makeJobId 0
   let job = QueuedJob jid0 ops justNoTs justNoTs justNoTs Nothing Nothing
+                Nothing
   calcJobPriority job ==? minimum (map qoPriority ops)
 
 -- | Tests default job status.
@@ -118,6 +127,7 @@ prop_JobStatus =
   forAll genJobId $ \jid ->
   forAll genQueuedOpCode $ \op ->
   let job1 = QueuedJob jid [op] justNoTs justNoTs justNoTs Nothing Nothing
+                 Nothing
       st1 = calcJobStatus job1
       op_succ = op { qoStatus = OP_STATUS_SUCCESS }
       op_err  = op { qoStatus = OP_STATUS_ERROR }
@@ -149,7 +159,7 @@ case_JobStatusPri_py_equiv = do
                        ops <- vectorOf num_ops genQueuedOpCode
                        jid <- genJobId
                        return $ QueuedJob jid ops justNoTs justNoTs justNoTs
-                                          Nothing Nothing)
+                                          Nothing Nothing Nothing)
   let serialized = encode jobs
   -- check for non-ASCII fields, usually due to 'arbitrary :: String'
   mapM_ (\job -> when (any (not . isAscii) (encode job)) .
@@ -208,6 +218,7 @@ prop_LoadJobs = monadicIO $ do
   ops <- pick $ resize 5 (listOf1 genQueuedOpCode)
   jid <- pick genJobId
   let job = QueuedJob jid ops justNoTs justNoTs justNoTs Nothing Nothing
+                Nothing
       job_s = encode job
   -- check that jobs in the right directories are parsed correctly
   (missing, current, archived, missing_current, broken) <-
@@ -239,6 +250,36 @@ prop_LoadJobs = monadicIO $ do
                  , printTestCase "broken job" (isBad broken)
                  ]
 
+-- | Tests reading the index of a packed archive directory.
+prop_ReadPackedIndex :: Property
+prop_ReadPackedIndex = monadicIO $ do
+  count <- pick $ choose (2, 10)
+  nums <- pick . genUniquesList count $
+            choose (0, C.jstoreJobsPerArchiveDirectory - 1)
+  jids <- mapM makeJobId nums
+  infos <- pick $ mapM genPackedJobInfo jids
+  other <- makeJobId C.jstoreJobsPerArchiveDirectory
+  (entries, wanted, missing) <-
+    run . withSystemTempDirectory "jqueue-test." $ \tempdir -> do
+    let dir = takeDirectory . archivedJobFile tempdir $ head jids
+        index = dir </> packedIndexFile
+    missing <- readPackedIndex dir
+    createDirectory $ tempdir </> jobQueueArchiveSubDir
+    createDirectory dir
+    writeFile index $ concatMap ((++ "\n") . encode) infos
+    -- an interrupted append leaves an incomplete last line
+    appendFile index $ take 10 (encode $ head infos)
+    entries <- readPackedIndex dir
+    -- jobs in the live queue are not looked up in the index
+    writeFile (liveJobFile tempdir $ jids !! 1) ""
+    wanted <- readPackedJobInfos tempdir [head jids, jids !! 1, other]
+    return (entries, wanted, missing)
+  stop $ conjoin [ printTestCase "missing index" $ missing ==? []
+                 , printTestCase "complete entries" $ entries ==? infos
+                 , printTestCase "wanted entries" $
+                   wanted ==? Map.singleton (head jids) (head infos)
+                 ]
+
 -- | Tests computing job directories. Creates random directories,
 -- files and stale symlinks in a directory, and checks that we return
 -- \"the right thing\".
@@ -306,6 +347,7 @@ testSuite "JQueue"
             , 'case_JobStatusPri_py_equiv
             , 'prop_ListJobIDs
             , 'prop_LoadJobs
+            , 'prop_ReadPackedIndex
             , 'prop_DetermineDirs
             , 'prop_InputOpCode
             , 'prop_extractOpSummary
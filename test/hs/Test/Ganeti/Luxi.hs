@@ -92,6 +92,8 @@ instance Arbitrary Luxi.LuxiOp where
       Luxi.ReqWaitForJobChange -> Luxi.WaitForJobChange <$> arbitrary <*>
                                   genFields <*> pure J.JSNull <*>
                                   pure J.JSNull <*> arbitrary
+      Luxi.ReqWatchJob -> Luxi.WatchJob <$> arbitrary <*> genFields <*>
+                          pure J.JSNull <*> pure J.JSNull
       Luxi.ReqPickupJob -> Luxi.PickupJob <$> arbitrary
       Luxi.ReqArchiveJob -> Luxi.ArchiveJob <$> arbitrary
       Luxi.ReqAutoArchiveJobs -> Luxi.AutoArchiveJobs <$> arbitrary <*>
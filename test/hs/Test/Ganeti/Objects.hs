@@ -264,6 +264,9 @@ instance Arbitrary ClusterOsParams where
 instance Arbitrary ClusterBeParams where
   arbitrary = (GenericContainer . Map.fromList) <$> arbitrary
 
+instance Arbitrary JobClassLimits where
+  arbitrary = (GenericContainer . Map.fromList) <$> arbitrary
+
 instance Arbitrary TagSet where
   arbitrary = Set.fromList <$> genTags
 
@@ -195,6 +195,7 @@ instance Arbitrary OpCodes.OpCode where
           <*> genMaybe arbitrary           -- candidate_pool_size
           <*> genMaybe arbitrary           -- max_running_jobs
           <*> genMaybe arbitrary           -- max_tracked_jobs
+          <*> genMaybe genEmptyContainer   -- max_running_jobs_per_opcode
           <*> arbitrary                    -- uid_pool
           <*> arbitrary                    -- add_uids
           <*> arbitrary                    -- remove_uids
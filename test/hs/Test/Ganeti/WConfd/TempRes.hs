@@ -38,16 +38,24 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 module Test.Ganeti.WConfd.TempRes (testWConfd_TempRes) where
 
 import Control.Applicative
+import Control.Monad
+import Control.Monad.State (runStateT)
+import Data.List (sort)
+import qualified Data.Map as M
 
 import Test.QuickCheck
 
-import Test.Ganeti.Objects ()
+import Test.Ganeti.Objects (genDiskWithChildren, genEmptyCluster)
 import Test.Ganeti.TestCommon
 import Test.Ganeti.TestHelper
 
 import Test.Ganeti.Locking.Locks () -- the JSON ClientId instance
 import Test.Ganeti.Utils.MultiMap ()
 
+import Ganeti.BasicTypes
+import Ganeti.Errors
+import Ganeti.JSON (GenericContainer(..))
+import Ganeti.Objects
 import Ganeti.WConfd.TempRes
 
 -- * Instances
@@ -69,8 +77,83 @@ instance Arbitrary TempResState where
                            <*> arbitrary
                            <*> arbitrary
 
+-- | Generates a configuration whose instances use DRBD disks with random
+-- minors on a few nodes.
+genDRBDConfig :: Gen ConfigData
+genDRBDConfig = do
+  cfg <- genEmptyCluster 3
+  let nodes = M.keys . fromContainer $ configNodes cfg
+      genDrbdDisk uuid = do
+        disk <- genDiskWithChildren 0
+        (nodeA, nodeB) <- (,) <$> elements nodes <*> elements nodes
+        (minorA, minorB) <- (,) <$> choose (0, 15) <*> choose (0, 15)
+        return disk { diskUuid = uuid
+                    , diskLogicalId = LIDDrbd8 nodeA nodeB 11000
+                                               minorA minorB "secret" }
+  count <- choose (0, 10)
+  insts <- forM [1..count] $ \idx -> do
+    ndisks <- choose (0, 3)
+    disks <- mapM (\d -> genDrbdDisk ("disk-" ++ show idx ++ "-" ++ show d))
+                  [1..ndisks :: Int]
+    inst <- arbitrary
+    return (inst { instUuid = "inst-" ++ show (idx :: Int)
+                 , instDisks = map diskUuid disks }, disks)
+  return cfg
+    { configInstances = GenericContainer . M.fromList
+                        $ map (\(i, _) -> (instUuid i, i)) insts
+    , configDisks = GenericContainer . M.fromList
+                    $ map (\d -> (diskUuid d, d)) (concatMap snd insts)
+    }
+
+-- | The DRBD minors in use according to an index, independent of the order
+-- in which they were added to it.
+drbdUsage :: DRBDMinorIndex -> ErrorResult (M.Map String (M.Map Int [String]))
+drbdUsage idx = fmap (fmap (fmap sort)) $ computeDRBDMap' idx emptyTempResState
+
 -- * Tests
 
+-- | Checks that an index updated for added, removed and modified objects
+-- matches an index built from scratch.
+prop_DRBDMinorIndex_update :: Property
+prop_DRBDMinorIndex_update =
+  forAll genDRBDConfig $ \cfg ->
+  let instances = fromContainer $ configInstances cfg
+      disks = fromContainer $ configDisks cfg
+      emptyCfg = cfg { configInstances = GenericContainer M.empty
+                     , configDisks = GenericContainer M.empty }
+      added = updateDRBDMinorIndex cfg (M.keys instances) (M.keys disks)
+                                   (mkDRBDMinorIndex emptyCfg)
+  in forAll (filterM (const arbitrary) (M.keys instances)) $ \removed ->
+     forAll (filterM (const arbitrary) (M.keys disks)) $ \changed ->
+     let moveMinors d = case diskLogicalId d of
+           LIDDrbd8 nA nB port mA mB secret ->
+             d { diskLogicalId = LIDDrbd8 nA nB port (mA + 16) (mB + 16)
+                                          secret }
+           _ -> d
+         cfg' = cfg { configInstances = GenericContainer
+                                        $ foldr M.delete instances removed
+                    , configDisks = GenericContainer
+                                    $ foldr (M.adjust moveMinors) disks changed
+                    }
+         updated = updateDRBDMinorIndex cfg' removed changed added
+     in drbdUsage added ==? drbdUsage (mkDRBDMinorIndex cfg) .&&.
+        drbdUsage updated ==? drbdUsage (mkDRBDMinorIndex cfg')
+
+-- | Checks that allocated minors aren't used by any instance.
+prop_allocateDRBDMinor_free :: Property
+prop_allocateDRBDMinor_free =
+  forAll genDRBDConfig $ \cfg ->
+  let idx = mkDRBDMinorIndex cfg
+  in forAll (elements . M.keys . fromContainer $ configNodes cfg) $ \node ->
+     case (runStateT (allocateDRBDMinor idx "new-inst" [node, node])
+                     emptyTempResState, drbdUsage idx) of
+       (Ok ([minorA, minorB], _), Ok usage) ->
+         let used = M.findWithDefault M.empty node usage
+         in printTestCase ("Allocated used minors " ++ show (minorA, minorB))
+              $ minorA /= minorB && M.notMember minorA used
+                && M.notMember minorB used
+       (result, _) -> failTest $ "Allocation failed: " ++ show result
+
 prop_IPv4Reservation_serialisation :: IPv4Reservation -> Property
 prop_IPv4Reservation_serialisation = testSerialisation
 
@@ -82,4 +165,6 @@ prop_TempRes_serialisation = testSerialisation
 testSuite "WConfd/TempRes"
  [ 'prop_IPv4Reservation_serialisation
  , 'prop_TempRes_serialisation
+ , 'prop_DRBDMinorIndex_update
+ , 'prop_allocateDRBDMinor_free
  ]
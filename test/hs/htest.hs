@@ -63,6 +63,8 @@ import Test.Ganeti.HTools.Types
 import Test.Ganeti.Hypervisor.Xen.XmParser
 import Test.Ganeti.JSON
 import Test.Ganeti.Jobs
+import Test.Ganeti.JQScheduler
+import Test.Ganeti.JQScheduler.Policy
 import Test.Ganeti.JQueue
 import Test.Ganeti.Kvmd
 import Test.Ganeti.Locking.Allocation
@@ -135,6 +137,8 @@ allTests =
   , testHypervisor_Xen_XmParser
   , testJSON
   , testJobs
+  , testJQScheduler
+  , testJQScheduler_Policy
   , testJQueue
   , testKvmd
   , testLocking_Allocation
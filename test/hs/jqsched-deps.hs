@@ -0,0 +1,161 @@
+{-| Benchmark of the job dependency checks of the luxid scheduler.
+
+A queue of jobs is filled either with a chain, where every job depends
+on its predecessor, or with a fan-in, where the last job depends on all
+others. For each pattern, the time to check the eligibility of all
+enqueued jobs is reported, both for the check luxid used before, which
+compared every dependency with every enqueued and running job, and for
+the current one, which uses the set of unfinished jobs. Finally the
+time to run all jobs through 'selectJobsToRun' is reported, with the
+jobs started in a round finishing before the next one.
+
+The optional argument is the number of jobs.
+
+-}
+
+{-
+
+Copyright (C) 2014 Google Inc.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+1. Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in the
+documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+-}
+
+module Main (main) where
+
+import Control.Exception (evaluate)
+import Control.Monad (when)
+import qualified Data.Map as M
+import Data.Maybe
+import System.CPUTime
+import System.Environment
+import Text.JSON (JSValue(JSNull))
+import Text.Printf
+
+import qualified Ganeti.Constants as C
+import Ganeti.JQScheduler
+import Ganeti.JQScheduler.Policy
+import Ganeti.JQueue (getJobDependencies)
+import Ganeti.JQueue.Objects
+import Ganeti.OpCodes
+import Ganeti.Types
+
+-- | Builds a job ID.
+mkJobId :: Int -> JobId
+mkJobId = fromMaybe (error "Invalid job ID") . makeJobId
+
+-- | Builds a queued job depending on the successful completion of the
+-- given jobs.
+mkJob :: Int -> [Int] -> JobWithStat
+mkJob jid deps =
+  let dep d = JobDependency (JobDepAbsolute $ mkJobId d) [JobStatusSuccessful]
+      depends = if null deps then Nothing else Just $ map dep deps
+      qop = QueuedOpCode
+              { qoInput = ValidOpCode $ MetaOpCode
+                            defOpParams { opDepends = depends } OpClusterQuery
+              , qoStatus = OP_STATUS_QUEUED
+              , qoResult = JSNull
+              , qoLog = []
+              , qoPriority = C.opPrioDefault
+              , qoStartTimestamp = Nothing
+              , qoExecTimestamp = Nothing
+              , qoEndTimestamp = Nothing
+              }
+  in unreadJob QueuedJob { qjId = mkJobId jid
+                         , qjOps = [qop]
+                         , qjReceivedTimestamp = Just (0, 0)
+                         , qjStartTimestamp = Nothing
+                         , qjEndTimestamp = Nothing
+                         , qjLivelock = Nothing
+                         , qjProcessId = Nothing
+                         , qjReplication = Nothing
+                         }
+
+-- | The jobs of a dependency pattern.
+mkJobs :: String -> Int -> [JobWithStat]
+mkJobs "chain" n = mkJob 0 [] : [ mkJob i [i - 1] | i <- [1 .. n - 1] ]
+mkJobs "fanin" n = map (`mkJob` []) [0 .. n - 2] ++ [mkJob (n - 1) [0 .. n - 2]]
+mkJobs mode _ = error $ "Unknown dependency pattern " ++ mode
+
+-- | The eligibility check luxid used before, comparing the dependencies
+-- of a job with every enqueued and running job.
+listEligible :: Queue -> JobWithStat -> Bool
+listEligible queue jWS =
+  let jdeps = getJobDependencies $ jJob jWS
+      blocks = flip elem jdeps . qjId . jJob
+  in not . any blocks $ qRunning queue ++ qEnqueued queue
+
+-- | Runs all enqueued jobs, where the jobs started in a round finish
+-- before the next round, and returns the number of rounds.
+runRounds :: SchedulingPolicy -> Int -> Queue -> Int
+runRounds policy slots = go 0
+  where
+    go rounds queue
+      | null (qEnqueued queue) = rounds
+      | null chosen = error "No job can be started"
+      | otherwise = rounds `seq` go (rounds + 1) queue' { qRunning = [] }
+      where (queue', chosen) = selectJobsToRun policy slots queue
+
+-- | Runs an action and returns its result and the CPU time it took, in
+-- seconds.
+timed :: IO a -> IO (a, Double)
+timed action = do
+  start <- getCPUTime
+  result <- action
+  end <- getCPUTime
+  return (result, fromIntegral (end - start) / 1e12)
+
+-- | Benchmarks the scheduler on the jobs of a dependency pattern.
+benchmark :: Int -> String -> IO ()
+benchmark n mode = do
+  let jobs = mkJobs mode n
+      queue = Queue { qEnqueued = jobs, qRunning = [], qManipulated = [] }
+      policy = SchedulingPolicy { spNow = (0, 0)
+                                , spAgingInterval = C.luxidJobAgingInterval
+                                , spClassLimits = M.empty
+                                }
+  _ <- evaluate . sum $ map (length . getJobDependencies . jJob) jobs
+  (eligible, t_list) <- timed . evaluate . length
+                          . filter (listEligible queue) $ qEnqueued queue
+  (eligible', t_set) <- timed . evaluate . length
+                          . filter (jobEligible $ unfinishedJobIds queue)
+                          $ qEnqueued queue
+  (rounds, t_run) <- timed . evaluate
+                       $ runRounds policy C.luxidMaximalRunningJobsDefault queue
+  putStrLn $ printf "%-6s %6d %8d %9.3f %9.3f %7d %9.3f" mode n eligible
+    t_list t_set rounds t_run
+  when (eligible /= eligible') $
+    error "The eligibility checks disagree"
+
+-- | Main function.
+main :: IO ()
+main = do
+  args <- getArgs
+  let n = case args of
+            [count] -> read count
+            _ -> 2000
+  putStrLn $ printf "%-6s %6s %8s %9s %9s %7s %9s" "mode" "jobs" "eligible"
+    "list(s)" "set(s)" "rounds" "run(s)"
+  mapM_ (benchmark n) ["chain", "fanin"]
@@ -0,0 +1,180 @@
+{-| Simulation of the job scheduling policy of luxid.
+
+Bulk jobs submitted through RAPI, interactive jobs submitted from the
+command line and watcher jobs with a low priority compete for the job
+slots of a simulated cluster. For first-come first-served scheduling, as
+luxid did before, and for the scheduling policy of luxid, the median,
+the 95th and 99th percentile and the maximum of the time the jobs of
+each opcode class wait before they are started are reported.
+
+The optional argument is the number of jobs that may run simultaneously.
+
+-}
+
+{-
+
+Copyright (C) 2014 Google Inc.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+1. Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in the
+documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+-}
+
+module Main (main) where
+
+import Control.Monad
+import Data.Function (on)
+import Data.List
+import qualified Data.Map as M
+import Data.Maybe
+import Data.Ord (comparing)
+import System.Environment
+import Text.JSON (JSValue(JSNull))
+import Text.Printf
+
+import qualified Ganeti.Constants as C
+import Ganeti.JQScheduler.Policy
+import Ganeti.JQueue.Objects
+import Ganeti.OpCodes
+import Ganeti.Types
+
+-- | A simulated job.
+data SimJob = SimJob { sjArrival :: Int      -- ^ time of submission
+                     , sjDuration :: Int     -- ^ running time
+                     , sjSubmitter :: String -- ^ user submitting the job
+                     , sjJob :: QueuedJob
+                     }
+
+-- | A scheduler chooses, given the number of free job slots, the current
+-- time and the running jobs, which of the queued jobs to start.
+type Scheduler = Int -> Timestamp -> [SimJob] -> [SimJob] -> [SimJob]
+
+-- | First-come first-served scheduling.
+fifoScheduler :: Scheduler
+fifoScheduler n _ _ = take n
+
+-- | Scheduling by the policy of luxid, with the given limits per opcode
+-- class.
+policyScheduler :: M.Map String Int -> Scheduler
+policyScheduler limits n now =
+  let policy = SchedulingPolicy { spNow = now
+                                , spAgingInterval = C.luxidJobAgingInterval
+                                , spClassLimits = limits
+                                }
+  in selectJobsByPolicy policy sjJob sjSubmitter n
+
+-- | Builds a simulated job from its ID, time of submission, running time,
+-- priority, submitting user and opcode.
+mkSimJob :: Int -> (Int, Int, Int, String, OpCode) -> SimJob
+mkSimJob jid (arrival, duration, prio, submitter, op) =
+  let qop = QueuedOpCode
+              { qoInput = ValidOpCode $ MetaOpCode defOpParams op
+              , qoStatus = OP_STATUS_QUEUED
+              , qoResult = JSNull
+              , qoLog = []
+              , qoPriority = prio
+              , qoStartTimestamp = Nothing
+              , qoExecTimestamp = Nothing
+              , qoEndTimestamp = Nothing
+              }
+      job = QueuedJob { qjId = fromMaybe (error "Invalid job ID")
+                                 $ makeJobId jid
+                      , qjOps = [qop]
+                      , qjReceivedTimestamp = Just (arrival, 0)
+                      , qjStartTimestamp = Nothing
+                      , qjEndTimestamp = Nothing
+                      , qjLivelock = Nothing
+                      , qjProcessId = Nothing
+                      , qjReplication = Nothing
+                      }
+  in SimJob { sjArrival = arrival, sjDuration = duration
+            , sjSubmitter = submitter, sjJob = job }
+
+-- | The simulated jobs of one hour: two bursts of bulk jobs submitted
+-- through RAPI, i.e., by the RAPI daemon's user, and an interactive job
+-- every 15 seconds and a watcher job every 5 minutes, both submitted by
+-- root.
+workload :: [SimJob]
+workload =
+  let bulk = [ (t, 120, C.opPrioNormal, "gnt-rapi", OpClusterRedistConf)
+             | t <- replicate 200 0 ++ replicate 200 1800 ]
+      interactive = [ (t, 20, C.opPrioNormal, "root", OpClusterQuery)
+                    | t <- [5, 20 .. 3600] ]
+      watcher = [ (t, 30, C.opPrioLow, "root", OpClusterVerifyDisks)
+                | t <- [0, 300 .. 3600] ]
+      arrival (t, _, _, _, _) = t
+  in zipWith mkSimJob [0..] . sortBy (comparing arrival)
+       $ bulk ++ interactive ++ watcher
+
+-- | The opcode class of a simulated job.
+jobClass :: SimJob -> String
+jobClass = intercalate "," . jobOpCodeClasses . sjJob
+
+-- | Runs the jobs with the given number of job slots and returns the
+-- waiting times of the jobs per opcode class.
+simulate :: Int -> Scheduler -> [SimJob] -> M.Map String [Int]
+simulate slots sched = run 0 [] [] M.empty
+  where
+    run t queued running waits arrivals =
+      let (arrived, later) = span ((<= t) . sjArrival) arrivals
+          running' = filter ((> t) . fst) running
+          queued' = queued ++ arrived
+          chosen = sched (slots - length running') (t, 0)
+                     (map snd running') queued'
+          queued'' = deleteFirstsBy ((==) `on` (qjId . sjJob)) queued' chosen
+          running'' = running' ++ [ (t + sjDuration j, j) | j <- chosen ]
+          waits' = foldl' (\m j -> M.insertWith (++) (jobClass j)
+                                     [t - sjArrival j] m) waits chosen
+          next = map sjArrival (take 1 later) ++ map fst running''
+      in if null next
+           then waits'
+           else run (minimum next) queued'' running'' waits' later
+
+-- | The nearest-rank percentile of a non-empty list.
+percentile :: Int -> [Int] -> Int
+percentile p xs =
+  let sorted = sort xs
+      rank = (p * length sorted + 99) `div` 100
+  in sorted !! max 0 (rank - 1)
+
+-- | Prints the waiting times per opcode class.
+report :: String -> M.Map String [Int] -> IO ()
+report name waits =
+  forM_ (M.toList waits) $ \(cls, ws) ->
+    putStrLn $ printf "%-8s %-26s %5d %6d %6d %6d %6d" name cls (length ws)
+      (percentile 50 ws) (percentile 95 ws) (percentile 99 ws)
+      (maximum ws)
+
+-- | Main function.
+main :: IO ()
+main = do
+  args <- getArgs
+  let slots = case args of
+                [n] -> read n
+                _ -> C.luxidMaximalRunningJobsDefault
+      limits = M.singleton (opID OpClusterRedistConf) (max 1 $ slots `div` 2)
+  putStrLn $ printf "%-8s %-26s %5s %6s %6s %6s %6s" "policy" "class" "jobs"
+    "p50" "p95" "p99" "max"
+  report "fifo" $ simulate slots fifoScheduler workload
+  report "luxid" $ simulate slots (policyScheduler limits) workload
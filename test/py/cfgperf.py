@@ -0,0 +1,648 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing the performance of configuration handling"""
+
+import os
+import sys
+import copy
+import time
+import random
+import optparse
+import resource
+import tempfile
+import threading
+
+from ganeti import config
+from ganeti import constants
+from ganeti import objects
+from ganeti import pathutils
+from ganeti import serializer
+from ganeti import utils
+from ganeti import wconfd
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser(usage="%%prog [options] {%s}" %
+                                 "|".join(sorted(BENCHMARKS)))
+  parser.add_option("-i", dest="instance_counts", default="100,1000,10000",
+                    help="Comma-separated list of instance counts",
+                    metavar="NUM,...")
+  parser.add_option("-n", dest="nodes", default=40, type="int",
+                    help="Number of nodes", metavar="NUM")
+  parser.add_option("-r", dest="repeat", default=20, type="int",
+                    help="Number of repetitions", metavar="NUM")
+  parser.add_option("-j", dest="job_counts", default="1,10,50",
+                    help=("Comma-separated list of numbers of concurrent"
+                          " jobs (lock benchmark only)"),
+                    metavar="NUM,...")
+
+  (opts, args) = parser.parse_args()
+
+  if not args or [name for name in args if name not in BENCHMARKS]:
+    parser.error("Invalid benchmark name")
+
+  try:
+    opts.instance_counts = [int(i) for i in opts.instance_counts.split(",")]
+  except ValueError:
+    parser.error("Invalid instance count")
+
+  try:
+    opts.job_counts = [int(i) for i in opts.job_counts.split(",")]
+  except ValueError:
+    parser.error("Invalid job count")
+
+  return (opts, args)
+
+
+def BuildConfigData(instance_count, node_count):
+  """Builds a synthetic configuration.
+
+  Every instance is a DRBD instance with one disk and one NIC; the
+  primary and secondary nodes are assigned round-robin. The returned
+  configuration is already upgraded, so loading it doesn't modify it.
+
+  @rtype: L{objects.ConfigData}
+
+  """
+  now = time.time()
+  group = objects.NodeGroup(uuid="group-uuid", name="default", members=[],
+                            diskparams={}, serial_no=1, ctime=now, mtime=now)
+  nodes = {}
+  for idx in range(node_count):
+    uuid = "node%d-uuid" % idx
+    nodes[uuid] = objects.Node(uuid=uuid, name="node%d.example.com" % idx,
+                               primary_ip="192.0.2.%d" % (idx % 250 + 1),
+                               secondary_ip="198.51.100.%d" % (idx % 250 + 1),
+                               group=group.uuid, ndparams={},
+                               master_candidate=(idx < 10), serial_no=1,
+                               ctime=now, mtime=now)
+  node_uuids = sorted(nodes.keys())
+
+  instances = {}
+  disks = {}
+  for idx in range(instance_count):
+    uuid = "inst%d-uuid" % idx
+    pnode = node_uuids[idx % node_count]
+    snode = node_uuids[(idx + 1) % node_count]
+    port = constants.FIRST_DRBD_PORT + idx
+    children = [
+      objects.Disk(dev_type=constants.DT_PLAIN, size=10240,
+                   logical_id=("xenvg", "%s.disk0_data" % uuid)),
+      objects.Disk(dev_type=constants.DT_PLAIN, size=128,
+                   logical_id=("xenvg", "%s.disk0_meta" % uuid)),
+      ]
+    disk = objects.Disk(uuid="disk%d-uuid" % idx, dev_type=constants.DT_DRBD8,
+                        size=10240, iv_name="disk/0", children=children,
+                        mode=constants.DISK_RDWR, params={},
+                        logical_id=(pnode, snode, port, idx % 1000,
+                                    idx % 1000, "secret%d" % idx),
+                        serial_no=1, ctime=now, mtime=now)
+    disks[disk.uuid] = disk
+    nic = objects.NIC(uuid="nic%d-uuid" % idx, nicparams={},
+                      mac="aa:00:00:%02x:%02x:%02x" %
+                        ((idx >> 16) & 0xff, (idx >> 8) & 0xff, idx & 0xff))
+    instances[uuid] = \
+      objects.Instance(uuid=uuid, name="inst%d.example.com" % idx,
+                       primary_node=pnode, os="debian-image",
+                       hypervisor=constants.HT_FAKE, hvparams={},
+                       beparams={}, osparams={},
+                       osparams_private=serializer.PrivateDict(),
+                       admin_state=constants.ADMINST_DOWN,
+                       admin_state_source=constants.ADMIN_SOURCE,
+                       disks_active=False, nics=[nic], disks=[disk.uuid],
+                       disk_template=constants.DT_DRBD8, network_port=None,
+                       serial_no=1, ctime=now, mtime=now)
+
+  cluster = objects.Cluster(
+    uuid="cluster-uuid",
+    serial_no=1,
+    rsahostkeypub="",
+    dsahostkeypub="",
+    highest_used_port=(constants.FIRST_DRBD_PORT + instance_count),
+    mac_prefix="aa:00:00",
+    volume_group_name="xenvg",
+    drbd_usermode_helper="/bin/true",
+    nicparams={constants.PP_DEFAULT: constants.NICC_DEFAULTS},
+    ndparams=constants.NDC_DEFAULTS,
+    tcpudp_port_pool=set(),
+    enabled_hypervisors=[constants.HT_FAKE],
+    master_node=node_uuids[0],
+    master_ip="192.0.2.254",
+    master_netdev=constants.DEFAULT_BRIDGE,
+    cluster_name="cluster.example.com",
+    file_storage_dir="/tmp",
+    uid_pool=[],
+    ctime=now, mtime=now)
+
+  data = objects.ConfigData(version=constants.CONFIG_VERSION,
+                            cluster=cluster, nodegroups={group.uuid: group},
+                            nodes=nodes, instances=instances, networks={},
+                            disks=disks, serial_no=1, ctime=now, mtime=now)
+  data.UpgradeConfig()
+  return data
+
+
+class _FakeWConfdClient(object):
+  """WConfd client keeping the configuration as a serialized string.
+
+  Written configurations are discarded, only their size is recorded.
+
+  """
+  def __init__(self, data):
+    self._text = serializer.DumpJson(data.ToDict())
+    self.bytes_written = 0
+
+  def ReadConfig(self):
+    return serializer.LoadJson(self._text)
+
+  def LockConfig(self, _ctx, _shared):
+    return self.ReadConfig()
+
+  def UnlockConfig(self, _ctx):
+    pass
+
+  def WriteConfig(self, *args):
+    self.bytes_written += len(serializer.DumpJson(args))
+
+  def WriteConfigUpdate(self, *args):
+    self.bytes_written += len(serializer.DumpJson(args))
+
+
+class _TimedConfigWriter(config.ConfigWriter):
+  """Configuration writer measuring the time spent in writing.
+
+  """
+  def __init__(self, *args, **kwargs):
+    config.ConfigWriter.__init__(self, *args, **kwargs)
+    self.write_time = 0.0
+    self.force_full = False
+
+  def _WriteConfig(self, destination=None):
+    if self.force_full:
+      self._MarkAllModified()
+    start = time.time()
+    try:
+      return config.ConfigWriter._WriteConfig(self, destination=destination)
+    finally:
+      self.write_time += time.time() - start
+
+
+def BenchmarkWrite(opts):
+  """Measures the cost of writing a small modification to WConfd.
+
+  """
+  print "%10s %6s %14s %14s %14s" % ("Instances", "Mode", "Write time",
+                                      "Total time", "Bytes/write")
+  for count in opts.instance_counts:
+    data = BuildConfigData(count, opts.nodes)
+    inst_uuids = sorted(data.instances.keys())
+    for force_full in [True, False]:
+      wconfd = _FakeWConfdClient(data)
+      cfg = _TimedConfigWriter(wconfdcontext=("cfgperf", "livelock", 0),
+                               wconfd=wconfd)
+      cfg.force_full = force_full
+      start = time.time()
+      for i in range(opts.repeat):
+        cfg.MarkInstanceUp(inst_uuids[i % len(inst_uuids)])
+      total = time.time() - start
+      print ("%10d %6s %12.2fms %12.2fms %14d" %
+             (count, "full" if force_full else "update",
+              1000.0 * cfg.write_time / opts.repeat,
+              1000.0 * total / opts.repeat,
+              wconfd.bytes_written / opts.repeat))
+      sys.stdout.flush()
+
+
+def _TimeIt(fn, repeat):
+  """Returns the average run time of a function in milliseconds.
+
+  """
+  start = time.time()
+  for _ in range(repeat):
+    fn()
+  return 1000.0 * (time.time() - start) / repeat
+
+
+def BenchmarkCopy(opts):
+  """Compares copying and comparing a configuration through dicts and slots.
+
+  The "dict" column measures the previous implementations, which converted
+  the objects to dicts (C{FromDict(ToDict())}, comparing C{ToDict()}
+  results and using C{copy.deepcopy(ToDict())} to detect changes made by
+  configuration upgrades), the "slots" column the current ones.
+
+  """
+  print "%10s %12s %14s %14s" % ("Instances", "Operation", "dict", "slots")
+  for count in opts.instance_counts:
+    data = BuildConfigData(count, opts.nodes)
+    other = data.Copy()
+
+    def _DictUpgradeCheck():
+      old = copy.deepcopy(data.ToDict())
+      return old != data.ToDict()
+
+    def _SlotsUpgradeCheck():
+      old = data.Copy()
+      return old != data
+
+    for (name, dict_fn, slots_fn) in [
+      ("copy", lambda: objects.ConfigData.FromDict(data.ToDict()), data.Copy),
+      ("equality", lambda: data.ToDict() == other.ToDict(),
+       lambda: data == other),
+      ("upgrade", _DictUpgradeCheck, _SlotsUpgradeCheck),
+      ]:
+      print ("%10d %12s %12.2fms %12.2fms" %
+             (count, name, _TimeIt(dict_fn, opts.repeat),
+              _TimeIt(slots_fn, opts.repeat)))
+      sys.stdout.flush()
+
+
+def BenchmarkFill(opts):
+  """Compares filling the instance parameters as an instance query does.
+
+  The "copy" column uses L{objects.Cluster.FillHV} and friends, which build
+  new dicts for every instance, the "view" column the cached read-only
+  views returned by L{objects.Cluster.FillHVView} and friends.
+
+  """
+  print "%10s %14s %14s" % ("Instances", "copy", "view")
+  for count in opts.instance_counts:
+    data = BuildConfigData(count, opts.nodes)
+    cluster = data.cluster
+    instances = data.instances.values()
+
+    def _Copy():
+      for inst in instances:
+        cluster.FillHV(inst, skip_globals=True)
+        cluster.FillBE(inst)
+        cluster.SimpleFillOS(inst.os, inst.osparams)
+
+    def _View():
+      for inst in instances:
+        cluster.FillHVView(inst, skip_globals=True)
+        cluster.FillBEView(inst)
+        cluster.FillOSView(inst)
+
+    print ("%10d %12.2fms %12.2fms" %
+           (count, _TimeIt(_Copy, opts.repeat), _TimeIt(_View, opts.repeat)))
+    sys.stdout.flush()
+
+
+class _ContendedWConfd(object):
+  """WConfd client holding the configuration lock for concurrent jobs.
+
+  Waiting jobs are granted the lock in order and woken up through their
+  notifiers, the way WConfd signals job processes.
+
+  """
+  def __init__(self, data):
+    self._text = serializer.DumpJson(data.ToDict())
+    self._lock = threading.Lock()
+    self._owner = None
+    self._queue = []
+    self.notifiers = {}
+
+  def ReadConfig(self):
+    return serializer.LoadJson(self._text)
+
+  def LockConfig(self, cid, _shared):
+    self._lock.acquire()
+    try:
+      if self._owner is not None:
+        return None
+      self._owner = cid
+    finally:
+      self._lock.release()
+    return self.ReadConfig()
+
+  def UpdateLocksWaiting(self, cid, _prio, _request):
+    self._lock.acquire()
+    try:
+      if self._owner is None:
+        self._owner = cid
+      else:
+        self._queue.append(cid)
+    finally:
+      self._lock.release()
+
+  def HasPendingRequest(self, cid):
+    self._lock.acquire()
+    try:
+      return cid in self._queue
+    finally:
+      self._lock.release()
+
+  def UnlockConfig(self, cid):
+    self._lock.acquire()
+    try:
+      if self._owner != cid:
+        if cid in self._queue:
+          self._queue.remove(cid)
+        return
+      if self._queue:
+        self._owner = self._queue.pop(0)
+        notifier = self.notifiers.get(self._owner)
+      else:
+        self._owner = None
+        notifier = None
+    finally:
+      self._lock.release()
+    if notifier:
+      notifier.Notify()
+
+  def WriteConfig(self, *args):
+    pass
+
+  def WriteConfigUpdate(self, *args):
+    pass
+
+
+class _RandomSleepConfigWriter(config.ConfigWriter):
+  """Configuration writer acquiring the lock the way it used to.
+
+  The lock was polled for, sleeping a random time of up to a second
+  between attempts.
+
+  """
+  def _LockConfigExclusive(self):
+    while True:
+      dict_data = self._wconfd.LockConfig(self._GetWConfdContext(), False)
+      if dict_data is not None:
+        return dict_data
+      time.sleep(random.random())
+
+
+def _RunLockJobs(data, job_count, repeat, mode):
+  """Runs concurrent jobs modifying the configuration.
+
+  Every job is a thread with its own configuration writer and lock
+  notifier. Returns the total run time and the mean and maximum time of
+  a single modification, in seconds.
+
+  """
+  fake = _ContendedWConfd(data)
+  inst_uuids = sorted(data.instances.keys())
+  local = threading.local()
+  durations = []
+  durations_lock = threading.Lock()
+
+  if mode == "random":
+    cls = _RandomSleepConfigWriter
+  else:
+    cls = config.ConfigWriter
+  wconfd._lock_notifications[0] = (mode == "queue")
+
+  def _Job(idx):
+    cid = ("job%d" % idx, "livelock", 0)
+    local.notifier = wconfd.LockNotifier()
+    fake.notifiers[cid] = local.notifier
+    cfg = cls(wconfdcontext=cid, wconfd=fake)
+    for i in range(repeat):
+      start = time.time()
+      cfg.MarkInstanceUp(inst_uuids[(idx + i) % len(inst_uuids)])
+      duration = time.time() - start
+      durations_lock.acquire()
+      try:
+        durations.append(duration)
+      finally:
+        durations_lock.release()
+
+  orig_get_notifier = wconfd.GetLockNotifier
+  wconfd.GetLockNotifier = lambda: local.notifier
+  try:
+    threads = [threading.Thread(target=_Job, args=(idx, ))
+               for idx in range(job_count)]
+    start = time.time()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    total = time.time() - start
+  finally:
+    wconfd.GetLockNotifier = orig_get_notifier
+    wconfd._lock_notifications[0] = False
+
+  return (total, sum(durations) / len(durations), max(durations))
+
+
+def BenchmarkLock(opts):
+  """Measures the exclusive configuration lock under contention.
+
+  The "random" mode is the previous implementation, "poll" polls with an
+  increasing delay, as done by processes not notified by WConfd, and
+  "queue" waits in the lock's queue for a notification, as done by jobs.
+  Only the smallest instance count is used.
+
+  """
+  data = BuildConfigData(min(opts.instance_counts), opts.nodes)
+  print "%6s %8s %12s %14s %14s" % ("Jobs", "Mode", "Total time",
+                                     "Mean latency", "Max latency")
+  for job_count in opts.job_counts:
+    for mode in ["random", "poll", "queue"]:
+      (total, mean, maximum) = _RunLockJobs(data, job_count, opts.repeat,
+                                            mode)
+      print ("%6d %8s %11.2fs %12.2fms %12.2fms" %
+             (job_count, mode, total, 1000.0 * mean, 1000.0 * maximum))
+      sys.stdout.flush()
+
+
+def _RunInChild(fn, *args):
+  """Runs a function in a child process and returns its result.
+
+  This keeps the memory used by the function, and by the benchmark
+  before, from influencing other measurements. The result must be
+  serializable to JSON.
+
+  """
+  (read_fd, write_fd) = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    status = 1
+    try:
+      os.close(read_fd)
+      write_file = os.fdopen(write_fd, "w")
+      write_file.write(serializer.DumpJson(fn(*args)))
+      write_file.close()
+      status = 0
+    finally:
+      os._exit(status) # pylint: disable=W0212
+  os.close(write_fd)
+  read_file = os.fdopen(read_fd)
+  try:
+    data = read_file.read()
+  finally:
+    read_file.close()
+  (_, status) = os.waitpid(pid, 0)
+  if status != 0:
+    raise Exception("Benchmark process failed with status %s" % status)
+  return serializer.LoadJson(data)
+
+
+def _WriteConfigFile(path, instance_count, node_count):
+  """Writes a synthetic configuration to a file.
+
+  """
+  data = BuildConfigData(instance_count, node_count)
+  utils.WriteFile(path, data=serializer.DumpJson(data.ToDict()))
+
+
+def _MeasureLoad(path, mode, repeat):
+  """Loads a configuration file and looks up one instance.
+
+  @return: the average time in milliseconds and the increase of the peak
+      RSS in KiB
+
+  """
+  start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start = time.time()
+  for _ in range(repeat):
+    if mode == "writer":
+      cfg = config.ConfigWriter(cfg_file=path, offline=True,
+                                accept_foreign=True, lazy=True)
+      with cfg.GetConfigManager(shared=True):
+        cfg.GetInstanceInfo(cfg.GetInstanceList()[0])
+      del cfg
+    else:
+      data = objects.ConfigData.FromDict(
+        serializer.LoadConfig(utils.ReadFile(path)), lazy=(mode == "lazy"))
+      data.instances[data.instances.keys()[0]].UpgradeConfig()
+      del data
+  total = time.time() - start
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+  return (1000.0 * total / repeat, rss)
+
+
+def BenchmarkLoad(opts):
+  """Measures loading a configuration file to look at a single instance.
+
+  "eager" converts the whole configuration to objects, "lazy" converts only
+  the instance, and "writer" uses a lazy offline L{config.ConfigWriter},
+  whose read-only access converts the configuration lazily.
+
+  """
+  print "%10s %8s %14s %14s" % ("Instances", "Mode", "Load time", "Peak RSS")
+  (fd, path) = tempfile.mkstemp(prefix="cfgperf")
+  os.close(fd)
+  try:
+    for count in opts.instance_counts:
+      _RunInChild(_WriteConfigFile, path, count, opts.nodes)
+      for mode in ["eager", "lazy", "writer"]:
+        (load_time, rss) = _RunInChild(_MeasureLoad, path, mode, opts.repeat)
+        print "%10d %8s %12.2fms %11dKiB" % (count, mode, load_time, rss)
+        sys.stdout.flush()
+  finally:
+    utils.RemoveFile(path)
+
+
+def BenchmarkSave(opts):
+  """Measures saving and reading the configuration file in each format.
+
+  Saving serializes the configuration like an offline
+  L{config.ConfigWriter} does and writes it atomically; reading parses the
+  file back into dicts.
+
+  """
+  print "%10s %8s %14s %14s %14s" % ("Instances", "Format", "Save time",
+                                     "Bytes/save", "Read time")
+  (fd, path) = tempfile.mkstemp(prefix="cfgperf")
+  os.close(fd)
+  try:
+    for count in opts.instance_counts:
+      data = BuildConfigData(count, opts.nodes)
+      for fmt in sorted(serializer.CONFIG_FORMATS):
+        sizes = []
+
+        def _Save():
+          raw = serializer.DumpConfig(
+            data.ToDict(_with_private=True), fmt=fmt,
+            private_encoder=serializer.EncodeWithPrivateFields)
+          utils.WriteFile(path, data=raw)
+          sizes.append(len(raw))
+
+        def _Read():
+          serializer.LoadConfig(utils.ReadFile(path))
+
+        save_time = _TimeIt(_Save, opts.repeat)
+        read_time = _TimeIt(_Read, opts.repeat)
+        print ("%10d %8s %12.2fms %14d %12.2fms" %
+               (count, fmt, save_time, sizes[-1], read_time))
+        sys.stdout.flush()
+  finally:
+    utils.RemoveFile(path)
+
+
+def BenchmarkWConfdSave(opts):
+  """Measures the configuration file saves done by a running WConfd.
+
+  This has to be run on the master node of a test cluster. Each flush makes
+  WConfd write the configuration file, in the format it was loaded in, and
+  distribute it to the master candidates synchronously. Convert the file
+  with C{cfgupgrade --config-format} while the daemons are stopped to
+  compare the formats.
+
+  """
+  raw = utils.ReadFile(pathutils.CLUSTER_CONF_FILE)
+  client = wconfd.Client()
+  flush_time = _TimeIt(client.FlushConfig, opts.repeat)
+  print "%8s %14s %14s" % ("Format", "Bytes/save", "Save time")
+  print ("%8s %14d %12.2fms" %
+         (serializer.GetConfigFormat(raw), len(raw), flush_time))
+
+
+BENCHMARKS = {
+  "copy": BenchmarkCopy,
+  "fill": BenchmarkFill,
+  "load": BenchmarkLoad,
+  "lock": BenchmarkLock,
+  "save": BenchmarkSave,
+  "wconfd-save": BenchmarkWConfdSave,
+  "write": BenchmarkWrite,
+  }
+
+
+def main():
+  (opts, args) = ParseOptions()
+
+  for name in args:
+    print "Benchmark '%s':" % name
+    BENCHMARKS[name](opts)
+
+
+if __name__ == "__main__":
+  main()
@@ -77,7 +77,7 @@ def GetMinimalConfig():
 
 
 def _RunUpgrade(path, dry_run, no_verify, ignore_hostname=True,
-                downgrade=False):
+                downgrade=False, config_format=None):
   cmd = [sys.executable, "%s/tools/cfgupgrade" % testutils.GetSourceDir(),
          "--debug", "--force", "--path=%s" % path, "--confdir=%s" % path]
 
@@ -89,6 +89,8 @@ def _RunUpgrade(path, dry_run, no_verify, ignore_hostname=True,
     cmd.append("--no-verify")
   if downgrade:
     cmd.append("--downgrade")
+  if config_format:
+    cmd.append("--config-format=%s" % config_format)
 
   result = utils.RunCmd(cmd, cwd=os.getcwd())
   if result.failed:
@@ -115,7 +117,10 @@ class TestCfgupgrade(unittest.TestCase):
     shutil.rmtree(self.tmpdir)
 
   def _LoadConfig(self):
-    return serializer.LoadJson(utils.ReadFile(self.config_path))
+    return serializer.LoadConfig(utils.ReadFile(self.config_path))
+
+  def _GetConfigFormat(self):
+    return serializer.GetConfigFormat(utils.ReadFile(self.config_path))
 
   def _LoadTestDataConfig(self, filename):
     return serializer.LoadJson(testutils.ReadTestData(filename))
@@ -406,6 +411,25 @@ class TestCfgupgrade(unittest.TestCase):
     newconf = self._LoadConfig()
     self.assertEqual(oldconf, newconf)
 
+  def testConfigFormat(self):
+    self._TestSimpleUpgrade(constants.CONFIG_VERSION, False)
+    oldconf = self._LoadConfig()
+    self.assertEqual(self._GetConfigFormat(), serializer.CONFIG_FORMAT_JSON)
+
+    _RunUpgrade(self.tmpdir, False, True,
+                config_format=serializer.CONFIG_FORMAT_ZLIB1)
+    self.assertEqual(self._GetConfigFormat(), serializer.CONFIG_FORMAT_ZLIB1)
+    self.assertEqual(self._LoadConfig(), oldconf)
+
+    # The format is kept unless requested otherwise
+    _RunUpgrade(self.tmpdir, False, True)
+    self.assertEqual(self._GetConfigFormat(), serializer.CONFIG_FORMAT_ZLIB1)
+    self.assertEqual(self._LoadConfig(), oldconf)
+
+    # The previous version can only read JSON
+    _RunUpgrade(self.tmpdir, False, True, downgrade=True)
+    self.assertEqual(self._GetConfigFormat(), serializer.CONFIG_FORMAT_JSON)
+
   def testDowngrade(self):
     self._TestSimpleUpgrade(constants.CONFIG_VERSION, False)
     self._RunDowngradeUpgrade()
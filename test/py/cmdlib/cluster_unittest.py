@@ -432,6 +432,20 @@ class TestLUClusterSetParams(CmdlibTestCase):
     op = opcodes.OpClusterSetParams(mac_prefix=mac_prefix)
     self.ExecOpCodeExpectOpPrereqError(op, "Invalid MAC address prefix")
 
+  def testJobClassLimits(self):
+    limits = {
+      opcodes.OpClusterVerifyDisks.OP_ID: 1,
+      opcodes.OpInstanceCreate.OP_ID: 5,
+      }
+    op = opcodes.OpClusterSetParams(max_running_jobs_per_opcode=limits)
+    self.ExecOpCode(op)
+    self.assertEqual(limits, self.cluster.max_running_jobs_per_opcode)
+
+  def testUnknownJobClass(self):
+    op = opcodes.OpClusterSetParams(
+      max_running_jobs_per_opcode={"OP_NO_SUCH_OPCODE": 1})
+    self.ExecOpCodeExpectOpPrereqError(op, "Unknown opcode")
+
   def testMasterNetmask(self):
     op = opcodes.OpClusterSetParams(master_netmask=26)
     self.ExecOpCode(op)
@@ -2162,8 +2176,8 @@ class TestLUClusterVerifyGroupCollectDiskInfo(TestLUClusterVerifyGroupMethods):
         .AddSuccessfulNode(self.node3, [(True, "")]) \
         .Build()
 
-    lu._CollectDiskInfo(self.node_uuids, self.node_images,
-                        self.cfg.GetAllInstancesInfo())
+    lu._CollectDiskInfo(lu.rpc.GetAsync(), self.node_uuids, self.node_images,
+                        self.cfg.GetAllInstancesInfo()).GetResult()
 
     self.mcpu.assertLogIsEmpty()
 
@@ -2175,8 +2189,8 @@ class TestLUClusterVerifyGroupCollectDiskInfo(TestLUClusterVerifyGroupMethods):
         .AddFailedNode(self.node3) \
         .Build()
 
-    lu._CollectDiskInfo(self.node_uuids, self.node_images,
-                        self.cfg.GetAllInstancesInfo())
+    lu._CollectDiskInfo(lu.rpc.GetAsync(), self.node_uuids, self.node_images,
+                        self.cfg.GetAllInstancesInfo()).GetResult()
 
     self.mcpu.assertLogContainsRegex("while getting disk information")
 
@@ -2188,8 +2202,8 @@ class TestLUClusterVerifyGroupCollectDiskInfo(TestLUClusterVerifyGroupMethods):
         .AddSuccessfulNode(self.node3, [""]) \
         .Build()
 
-    lu._CollectDiskInfo(self.node_uuids, self.node_images,
-                        self.cfg.GetAllInstancesInfo())
+    lu._CollectDiskInfo(lu.rpc.GetAsync(), self.node_uuids, self.node_images,
+                        self.cfg.GetAllInstancesInfo()).GetResult()
     # logging is not performed through mcpu
     self.mcpu.assertLogIsEmpty()
 
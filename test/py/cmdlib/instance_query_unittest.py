@@ -32,10 +32,101 @@
 
 """
 
+from ganeti import constants
+from ganeti import errors
+from ganeti import objects
+from ganeti import opcodes
+
 from testsupport import *
 
 import testutils
 
 
+class TestLUInstanceQueryData(CmdlibTestCase):
+  def setUp(self):
+    super(TestLUInstanceQueryData, self).setUp()
+
+    self.snode = self.cfg.AddNewNode()
+    self.inst = self.cfg.AddNewInstance(disk_template=constants.DT_DRBD8,
+                                        secondary_node=self.snode)
+    self.op = opcodes.OpInstanceQueryData(instances=[self.inst.name],
+                                          static=False, use_locking=True)
+
+    self.status = objects.BlockDevStatus(dev_path="/dev/mock", major=1,
+                                         minor=2, sync_percent=None,
+                                         estimated_time=None,
+                                         is_degraded=False,
+                                         ldisk_status=constants.LDS_OKAY)
+    self.failing = {}
+    self.rpc.call_batch.side_effect = self._CallBatch
+
+  def _CallBatch(self, node_uuid, calls, fail_fast=False):
+    self.assertFalse(fail_fast)
+
+    results = []
+    for (idx, (procedure, _)) in enumerate(calls):
+      self.assertEqual(procedure, "blockdev_find")
+      if self.failing.get(node_uuid) == idx:
+        results.append(self.RpcResultsBuilder()
+                         .CreateErrorNodeResult(node_uuid, "find failed"))
+      else:
+        results.append(self.RpcResultsBuilder()
+                         .CreateSuccessfulNodeResult(node_uuid, self.status))
+    return results
+
+  def _ComputeDiskStatus(self, lu):
+    return lu._ComputeDiskStatus(self.inst, lambda uuid: uuid)
+
+  @withLockedLU
+  def testOneBatchPerNode(self, lu):
+    (disk, ) = self._ComputeDiskStatus(lu)
+
+    self.assertEqual(sorted(args[0] for (args, _) in
+                            self.rpc.call_batch.call_args_list),
+                     sorted([self.master.uuid, self.snode.uuid]))
+    for (args, _) in self.rpc.call_batch.call_args_list:
+      # the DRBD device and its two children
+      self.assertEqual(len(args[1]), 3)
+
+    expected = ("/dev/mock", 1, 2, None, None, False, constants.LDS_OKAY)
+    self.assertEqual(disk["pstatus"], expected)
+    self.assertEqual(disk["sstatus"], expected)
+    self.assertEqual(len(disk["children"]), 2)
+    for child in disk["children"]:
+      self.assertEqual(child["pstatus"], expected)
+      self.assertEqual(child["sstatus"], expected)
+    self.assertFalse(self.rpc.call_blockdev_find.called)
+
+  @withLockedLU
+  def testFailedLookup(self, lu):
+    # a failure for a child on the secondary node raises, like the
+    # individual call did
+    self.failing[self.snode.uuid] = 2
+    self.assertRaises(errors.OpExecError, self._ComputeDiskStatus, lu)
+
+  @withLockedLU
+  def testOfflineNode(self, lu):
+    def _CallBatch(node_uuid, calls, fail_fast=False):
+      if node_uuid == self.snode.uuid:
+        return [self.RpcResultsBuilder()
+                  .CreateOfflineNodeResult(node_uuid)
+                for _ in calls]
+      return self._CallBatch(node_uuid, calls, fail_fast=fail_fast)
+
+    self.rpc.call_batch.side_effect = _CallBatch
+
+    (disk, ) = self._ComputeDiskStatus(lu)
+    self.assertTrue(disk["pstatus"] is not None)
+    self.assertTrue(disk["sstatus"] is None)
+
+  @withLockedLU
+  def testStatic(self, lu):
+    lu.op.static = True
+    (disk, ) = self._ComputeDiskStatus(lu)
+    self.assertTrue(disk["pstatus"] is None)
+    self.assertTrue(disk["sstatus"] is None)
+    self.assertFalse(self.rpc.call_batch.called)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -36,6 +36,7 @@ import unittest
 from ganeti import constants
 from ganeti.cmdlib import instance_storage
 from ganeti import errors
+from ganeti.rpc import node as rpc
 
 import testutils
 import mock
@@ -121,5 +122,38 @@ class TestCheckNodesFreeDiskOnVG(unittest.TestCase):
         self.node_name, node_info, self.vg, NotImplemented)
 
 
+class TestTLReplaceDisksRemoveOldStorage(unittest.TestCase):
+
+  def setUp(self):
+    self.lu = mock.Mock()
+    self.lu.rpc.call_batch.return_value = [
+      rpc.RpcResult(data=(True, None)),
+      rpc.RpcResult(data=(False, "LV busy")),
+      rpc.RpcResult(data=(True, None)),
+      ]
+
+    self.tl = instance_storage.TLReplaceDisks(self.lu, "inst-uuid",
+                                              "inst.example.com",
+                                              constants.REPLACE_DISK_PRI,
+                                              None, None, [], False, False)
+    self.tl.instance = mock.Mock()
+
+    self.old_lvs = [mock.Mock(), mock.Mock(), mock.Mock()]
+
+  def testFailedRemoval(self):
+    self.tl._RemoveOldStorage("node-uuid",
+                              {"disk/0": (None, self.old_lvs, None)})
+
+    self.lu.rpc.call_batch.assert_called_once_with(
+      "node-uuid", [("blockdev_remove", [(lv, self.tl.instance)])
+                    for lv in self.old_lvs])
+    self.assertFalse(self.lu.rpc.call_blockdev_remove.called)
+
+    # only the failed removal is reported, the others are not affected
+    self.lu.LogWarning.assert_called_once_with(
+      "Can't remove old LV: %s", "LV busy",
+      hint="remove unused LVs manually")
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -602,14 +602,14 @@ class ConfigMock(config.ConfigWriter):
     ipolicy_dict[category][field] = value
 
   def _CreateConfig(self):
-    self._config_data = objects.ConfigData(
+    self._SetConfigData(objects.ConfigData(
       version=constants.CONFIG_VERSION,
       cluster=None,
       nodegroups={},
       nodes={},
       instances={},
       networks={},
-      disks={})
+      disks={}))
 
     master_node_uuid = self._GetUuid()
 
@@ -661,7 +661,7 @@ class ConfigMock(config.ConfigWriter):
     self._master_node = self.AddNewNode(uuid=master_node_uuid)
 
   def _OpenConfig(self, _accept_foreign):
-    self._config_data = self._mocked_config_store
+    self._SetConfigData(self._mocked_config_store)
 
   def _WriteConfig(self, destination=None):
     self._mocked_config_store = self._ConfigData()
@@ -39,11 +39,36 @@ from ganeti.rpc import node as rpc
 from cmdlib.testsupport.util import patchModule
 
 
+class _AsyncRpcRunnerMock(object):
+  """Asynchronous view of an RPC runner mock, see L{rpc.RpcRunner.GetAsync}.
+
+  The calls are made on the runner mock when they are started and their
+  results are returned as futures, so that results can be configured on
+  the runner mock for both synchronous and asynchronous calls.
+
+  """
+  def __init__(self, runner):
+    self._runner = runner
+
+  def __getattr__(self, name):
+    fn = getattr(self._runner, name)
+
+    if not name.startswith("call_"):
+      return fn
+
+    def _Call(*args, **kwargs):
+      result = fn(*args, **kwargs)
+      return rpc.RpcFuture(lambda: result)
+
+    return _Call
+
+
 def CreateRpcRunnerMock():
   """Creates a new L{mock.MagicMock} tailored for L{rpc.RpcRunner}
 
   """
   ret = mock.MagicMock(spec=rpc.RpcRunner)
+  ret.GetAsync.return_value = _AsyncRpcRunnerMock(ret)
   return ret
 
 
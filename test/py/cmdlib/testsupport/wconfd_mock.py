@@ -94,3 +94,6 @@ class WConfdMock(object):
 
   def Client(self):
     return MockClient(self)
+
+  def GetClient(self):
+    return MockClient(self)
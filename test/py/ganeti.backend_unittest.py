@@ -645,6 +645,40 @@ class TestSetWatcherPause(unittest.TestCase):
       self.assertEqual(os.stat(self.filename).st_mode & 0777, 0644)
 
 
+class TestJobQueueUpdateBatch(unittest.TestCase):
+  def testUnknownOperation(self):
+    # Nothing is applied if any of the operations is unknown
+    self.assertRaises(backend.RPCFail, backend.JobQueueUpdateBatch, [
+      (constants.JQ_REPL_REMOVE, "/no/such/queue/file", None),
+      ("rename", "/no/such/queue/file", None),
+      ])
+
+  def testOutsideQueue(self):
+    self.assertRaises(backend.RPCFail, backend.JobQueueUpdateBatch, [
+      (constants.JQ_REPL_REMOVE, "/etc/passwd", None),
+      ])
+
+
+class TestRemoveJobJournal(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test(self):
+    for name in ["job-12", "job-12.journal", "serial", "serial.journal"]:
+      utils.WriteFile(utils.PathJoin(self.tmpdir, name), data="")
+
+    backend._RemoveJobJournal(utils.PathJoin(self.tmpdir, "job-12"))
+    backend._RemoveJobJournal(utils.PathJoin(self.tmpdir, "serial"))
+    self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                     ["job-12", "serial", "serial.journal"])
+
+    # Jobs without a journal are fine
+    backend._RemoveJobJournal(utils.PathJoin(self.tmpdir, "job-12"))
+
+
 class TestGetBlockDevSymlinkPath(unittest.TestCase):
   def setUp(self):
     self.tmpdir = tempfile.mkdtemp()
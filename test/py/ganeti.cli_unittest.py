@@ -670,6 +670,20 @@ class _MockJobPollCb(cli.JobPollCbBase, cli.JobPollReportCbBase):
     self._expect_notchanged = False
 
 
+class _MockStreamJobPollCb(_MockJobPollCb):
+  """Reports all changes of a job over a single stream.
+
+  """
+  def __init__(self, tc, job_id):
+    _MockJobPollCb.__init__(self, tc, job_id)
+    self.watch_calls = 0
+
+  def WatchJob(self, job_id, fields, prev_job_info, prev_log_serial):
+    self.watch_calls += 1
+    while self._wfjcr:
+      yield self.WaitForJobChangeOnce(job_id, fields, None, None)
+
+
 class TestGenericPollJob(testutils.GanetiTestCase):
   def testSuccessWithLog(self):
     job_id = 29609
@@ -777,6 +791,27 @@ class TestGenericPollJob(testutils.GanetiTestCase):
     self.assertRaises(errors.OpExecError, cli.GenericPollJob, job_id, cbs, cbs)
     cbs.CheckEmpty()
 
+  def testStream(self):
+    job_id = 8301
+
+    cbs = _MockStreamJobPollCb(self, job_id)
+    cbs.AddWfjcResult(None, None, constants.JOB_NOTCHANGED)
+    cbs.AddWfjcResult(None, None,
+                      ((constants.JOB_STATUS_RUNNING, ),
+                       [(1, utils.SplitTime(1273491611.0),
+                         constants.ELOG_MESSAGE, "Step 1")]))
+    cbs.AddWfjcResult(None, None, constants.JOB_NOTCHANGED)
+    cbs.AddWfjcResult(None, None,
+                      ((constants.JOB_STATUS_SUCCESS, ),
+                       [(2, utils.SplitTime(1273491615.9),
+                         constants.ELOG_MESSAGE, "Step 2")]))
+    cbs.AddQueryJobsResult(constants.JOB_STATUS_SUCCESS,
+                           [constants.OP_STATUS_SUCCESS], ["Hello World"])
+
+    self.assertEqual(["Hello World"], cli.GenericPollJob(job_id, cbs, cbs))
+    cbs.CheckEmpty()
+    self.assertEqual(cbs.watch_calls, 1)
+
 
 class TestFormatLogMessage(unittest.TestCase):
   def test(self):
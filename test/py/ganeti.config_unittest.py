@@ -35,6 +35,8 @@ import unittest
 import os
 import tempfile
 import operator
+import random
+import time
 
 from ganeti import bootstrap
 from ganeti import config
@@ -42,9 +44,11 @@ from ganeti import constants
 from ganeti import errors
 from ganeti import objects
 from ganeti import utils
+from ganeti import outils
 from ganeti import netutils
 from ganeti import compat
 from ganeti import serializer
+import ganeti.wconfd as wc
 
 from ganeti.config import TemporaryReservationManager
 
@@ -58,6 +62,86 @@ def _StubGetEntResolver():
   return mocks.FakeGetentResolver()
 
 
+class _FakeWConfdClient(object):
+  """A fake WConfd client keeping the configuration as a dict.
+
+  Incremental updates are applied the same way WConfd does it.
+
+  """
+  def __init__(self, data):
+    self.data = data
+    self.writes = []
+
+  def ReadConfig(self):
+    return serializer.LoadJson(serializer.DumpJson(self.data))
+
+  def LockConfig(self, _ctx, _shared):
+    return self.ReadConfig()
+
+  def UnlockConfig(self, _ctx):
+    pass
+
+  def WriteConfig(self, _ctx, data):
+    self.writes.append(("full", data))
+    self.data = serializer.LoadJson(serializer.DumpJson(data))
+
+  def WriteConfigUpdate(self, _ctx, cluster, *containers):
+    self.writes.append(("update", (cluster, ) + containers))
+    if cluster is not None:
+      self.data["cluster"] = cluster
+    for (name, objs) in zip(config._CONFIG_CONTAINERS, containers):
+      for (uuid, obj) in objs:
+        if obj is None:
+          del self.data[name][uuid]
+        else:
+          self.data[name][uuid] = obj
+    self.data = serializer.LoadJson(serializer.DumpJson(self.data))
+
+  def VerifyConfig(self):
+    pass
+
+  def ListReservedIps(self, _ctx):
+    return []
+
+  def ReleaseDRBDMinors(self, _inst_uuid):
+    pass
+
+
+class _BusyWConfdClient(_FakeWConfdClient):
+  """A fake WConfd client whose configuration lock is held by another job.
+
+  The lock is granted only after it has been asked for C{busy} times,
+  either by polling or by checking a queued request.
+
+  """
+  def __init__(self, data, busy):
+    _FakeWConfdClient.__init__(self, data)
+    self.busy = busy
+    self.calls = []
+
+  def LockConfig(self, ctx, shared):
+    self.calls.append("LockConfig")
+    if self.busy:
+      self.busy -= 1
+      return None
+    return _FakeWConfdClient.LockConfig(self, ctx, shared)
+
+  def UpdateLocksWaiting(self, _ctx, prio, request):
+    self.calls.append(("UpdateLocksWaiting", prio, request))
+
+  def HasPendingRequest(self, _ctx):
+    self.calls.append("HasPendingRequest")
+    if self.busy:
+      self.busy -= 1
+      # WConfd signals the job process, whose handler does this
+      wc.NotifyLockWaiters()
+      return True
+    return False
+
+  def UnlockConfig(self, _ctx):
+    self.calls.append("UnlockConfig")
+
+
 class TestConfigRunner(unittest.TestCase):
   """Testing case for HooksRunner"""
   def setUp(self):
@@ -82,6 +166,26 @@ class TestConfigRunner(unittest.TestCase):
     cfg = ConfigMock(cfg_file=self.cfg_file)
     return cfg
 
+  def _get_object_online(self):
+    """Returns a ConfigWriter connected to a fake WConfd"""
+    wconfd = _FakeWConfdClient(
+      serializer.LoadJson(utils.ReadFile(self.cfg_file)))
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file,
+                              _getents=_StubGetEntResolver,
+                              wconfdcontext=("job", "livelock", 0),
+                              wconfd=wconfd)
+    return (cfg, wconfd)
+
+  def _get_object_busy(self, busy, lock_timeout=None):
+    """Returns a ConfigWriter whose configuration lock is contended"""
+    wconfd = _BusyWConfdClient(
+      serializer.LoadJson(utils.ReadFile(self.cfg_file)), busy)
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file,
+                              _getents=_StubGetEntResolver,
+                              wconfdcontext=("job", "livelock", 0),
+                              wconfd=wconfd, lock_timeout=lock_timeout)
+    return (cfg, wconfd)
+
   def _init_cluster(self, cfg):
     """Initializes the cfg object"""
     me = netutils.Hostname()
@@ -232,6 +336,462 @@ class TestConfigRunner(unittest.TestCase):
       node2.uuid: ["myxenvg/disk0", "myxenvg/meta0"],
       })
 
+  @staticmethod
+  def _CreateDrbdDisk(idx, nodes, minors):
+    return objects.Disk(dev_type=constants.DT_DRBD8, size=128,
+                        logical_id=(nodes[0], nodes[1], 12300 + idx,
+                                    minors[0], minors[1], "secret%d" % idx),
+                        children=[
+                          objects.Disk(dev_type=constants.DT_PLAIN, size=128,
+                                       logical_id=("myxenvg", "data%d" % idx),
+                                       uuid="data%d" % idx),
+                          objects.Disk(dev_type=constants.DT_PLAIN, size=128,
+                                       logical_id=("myxenvg", "meta%d" % idx),
+                                       uuid="meta%d" % idx),
+                          ],
+                        iv_name="disk/%d" % idx, uuid="disk%d" % idx)
+
+  @staticmethod
+  def _GetDrbdErrors(cfg):
+    return [msg for msg in cfg.VerifyConfig() if "DRBD minor" in msg]
+
+  def testDRBDMinorAllocation(self):
+    cfg = self._get_object()
+    master_uuid = cfg.GetMasterNode()
+    node2 = objects.Node(name="node2.example.com",
+                         group=cfg.LookupNodeGroup(None), ndparams={},
+                         uuid="node2-uuid")
+    cfg.AddNode(node2, "my-job")
+    nodes = (master_uuid, node2.uuid)
+    inst = self._create_instance(cfg)
+    cfg.AddInstance(inst, "my-job")
+
+    # a node can be given several times
+    self.assertEqual(
+      cfg.AllocateDRBDMinor([master_uuid, node2.uuid, master_uuid], inst.uuid),
+      [0, 0, 1])
+    self.assertEqual(cfg.ComputeDRBDMap(), {
+      master_uuid: {0: inst.uuid, 1: inst.uuid},
+      node2.uuid: {0: inst.uuid},
+      })
+
+    # attaching disks records their minors, releasing the allocation keeps
+    # them
+    cfg.AddInstanceDisk(inst.uuid, self._CreateDrbdDisk(0, nodes, (0, 0)))
+    cfg.ReleaseDRBDMinors(inst.uuid)
+    self.assertEqual(cfg.ComputeDRBDMap(), {
+      master_uuid: {0: inst.uuid},
+      node2.uuid: {0: inst.uuid},
+      })
+    self.assertEqual(cfg.AllocateDRBDMinor(nodes, inst.uuid), [1, 1])
+    cfg.ReleaseDRBDMinors(inst.uuid)
+    self.assertEqual(self._GetDrbdErrors(cfg), [])
+
+    # duplicates are reported
+    cfg.AddInstanceDisk(inst.uuid, self._CreateDrbdDisk(1, nodes, (1, 0)))
+    self.assertRaises(errors.ConfigurationError, cfg.ComputeDRBDMap)
+    self.assertRaises(errors.ConfigurationError, cfg.AllocateDRBDMinor,
+                      nodes, inst.uuid)
+    errs = self._GetDrbdErrors(cfg)
+    self.assertEqual(len(errs), 1)
+    self.assertTrue("DRBD minor 0 on node node2.example.com" in errs[0])
+
+    # changing a disk updates its minors
+    disk = cfg.GetDiskInfo("disk1")
+    disk.logical_id = (master_uuid, node2.uuid, 12301, 1, 2, "secret1")
+    cfg.Update(disk, None)
+    self.assertEqual(self._GetDrbdErrors(cfg), [])
+    self.assertEqual(cfg.AllocateDRBDMinor(nodes, inst.uuid), [2, 1])
+    cfg.ReleaseDRBDMinors(inst.uuid)
+
+    # removing disks frees their minors
+    cfg.RemoveInstanceDisk(inst.uuid, "disk0")
+    self.assertEqual(cfg.AllocateDRBDMinor(nodes, inst.uuid), [0, 0])
+    cfg.ReleaseDRBDMinors(inst.uuid)
+    cfg.RemoveInstance(inst.uuid)
+    self.assertEqual(cfg.ComputeDRBDMap(), {master_uuid: {}, node2.uuid: {}})
+
+  def testNodeInstances(self):
+    cfg = self._get_object_mock()
+    default_group = cfg.LookupNodeGroup(None)
+    master_uuid = cfg.GetMasterNode()
+    group2 = objects.NodeGroup(name="group2", uuid="group2-uuid", members=[])
+    cfg.AddNodeGroup(group2, "my-job")
+    for (uuid, group) in [("node2-uuid", default_group),
+                          ("node3-uuid", group2.uuid)]:
+      cfg.AddNode(objects.Node(name=uuid, group=group, ndparams={},
+                               uuid=uuid), "my-job")
+
+    inst = self._create_instance(cfg)
+    cfg.AddInstance(inst, "my-job")
+    # build the index before modifying the placement of the instance
+    self.assertEqual(cfg.GetNodeInstances(master_uuid), ([inst.uuid], []))
+    self.assertEqual(cfg.GetNodeInstances("node3-uuid"), ([], []))
+
+    disk = objects.Disk(dev_type=constants.DT_DRBD8, size=128,
+                        logical_id=(master_uuid, "node3-uuid",
+                                    12300, 0, 0, "secret"),
+                        children=[], iv_name="disk/0", uuid="disk0")
+    cfg.AddInstanceDisk(inst.uuid, disk)
+    self.assertEqual(cfg.GetNodeInstances("node3-uuid"), ([], [inst.uuid]))
+    self.assertEqual(cfg.GetNodeGroupInstances(group2.uuid),
+                     frozenset([inst.uuid]))
+    self.assertEqual(cfg.GetNodeGroupInstances(group2.uuid,
+                                               primary_only=True),
+                     frozenset())
+    self.assertEqual(cfg.GetNodeGroupInstances(default_group,
+                                               primary_only=True),
+                     frozenset([inst.uuid]))
+
+    disk = cfg.GetDiskInfo("disk0")
+    disk.logical_id = (master_uuid, "node2-uuid", 12300, 0, 0, "secret")
+    cfg.Update(disk, None)
+    self.assertEqual(cfg.GetNodeInstances("node3-uuid"), ([], []))
+    self.assertEqual(cfg.GetNodeInstances("node2-uuid"), ([], [inst.uuid]))
+    self.assertEqual(cfg.GetNodeGroupInstances(group2.uuid), frozenset())
+
+    inst_serial = cfg.GetInstanceInfo(inst.uuid).serial_no
+    cfg.SetInstancePrimaryNode(inst.uuid, "node2-uuid")
+    self.assertEqual(cfg.GetInstanceInfo(inst.uuid).serial_no,
+                     inst_serial + 1)
+    self.assertEqual(cfg.GetNodeInstances(master_uuid), ([], [inst.uuid]))
+    self.assertEqual(cfg.GetNodeInstances("node2-uuid"), ([inst.uuid], []))
+
+    cfg.RemoveInstanceDisk(inst.uuid, "disk0")
+    self.assertEqual(cfg.GetNodeInstances(master_uuid), ([], []))
+    cfg.RemoveInstance(inst.uuid)
+    self.assertEqual(cfg.GetNodeInstances("node2-uuid"), ([], []))
+    self.assertEqual(cfg.GetNodeGroupInstances(default_group), frozenset())
+
+    # the instances of a node are returned in a stable order
+    inst_uuids = ["inst%d-uuid" % i for i in [3, 1, 4, 0, 2]]
+    for inst_uuid in inst_uuids:
+      inst = self._create_instance(cfg)
+      inst.name = "%s.example.com" % inst_uuid
+      inst.uuid = inst_uuid
+      cfg.AddInstance(inst, "my-job")
+    self.assertEqual(cfg.GetNodeInstances(master_uuid),
+                     (sorted(inst_uuids), []))
+
+  def testUniqueResources(self):
+    cfg = self._get_object_mock()
+    inst = self._create_instance(cfg)
+    inst.nics = [objects.NIC(mac="aa:00:00:00:00:01", uuid="nic1-uuid",
+                             nicparams={})]
+    cfg.AddInstance(inst, "my-job")
+    disk = objects.Disk(dev_type=constants.DT_PLAIN, size=128,
+                        logical_id=("myxenvg", "disk0"), uuid="disk0")
+    cfg.AddInstanceDisk(inst.uuid, disk)
+
+    self.assertRaises(errors.ReservationError, cfg.ReserveMAC,
+                      "aa:00:00:00:00:01", "my-job")
+    self.assertRaises(errors.ReservationError, cfg.ReserveLV,
+                      "myxenvg/disk0", "my-job")
+    for uuid in [inst.uuid, "nic1-uuid", "disk0", cfg.GetMasterNode()]:
+      other = objects.NodeGroup(name="group-%s" % uuid, uuid=uuid, members=[])
+      self.assertRaises(errors.ConfigurationError, cfg.AddNodeGroup, other,
+                        "my-job")
+
+    # changes of the instance and its disks are picked up
+    inst = cfg.GetInstanceInfo(inst.uuid)
+    inst.nics[0].mac = "aa:00:00:00:00:02"
+    cfg.Update(inst, None)
+    cfg.ReserveMAC("aa:00:00:00:00:01", "my-job")
+    self.assertRaises(errors.ReservationError, cfg.ReserveMAC,
+                      "aa:00:00:00:00:02", "my-job")
+
+    disk = cfg.GetDiskInfo("disk0")
+    disk.logical_id = ("myxenvg", "disk1")
+    cfg.Update(disk, None)
+    cfg.ReserveLV("myxenvg/disk0", "my-job")
+    self.assertRaises(errors.ReservationError, cfg.ReserveLV,
+                      "myxenvg/disk1", "my-job")
+
+    cfg.RemoveInstanceDisk(inst.uuid, "disk0")
+    cfg.RemoveInstance(inst.uuid)
+    cfg.ReserveMAC("aa:00:00:00:00:02", "other-job")
+    cfg.ReserveLV("myxenvg/disk1", "other-job")
+    cfg.AddNodeGroup(objects.NodeGroup(name="group2", uuid=inst.uuid,
+                                       members=[]), "my-job")
+
+  def testIncrementalVerify(self):
+    (cfg, _) = self._get_object_online()
+    rnd = random.Random(42)
+    counter = [0]
+
+    def _NextId(prefix):
+      counter[0] += 1
+      return "%s%d" % (prefix, counter[0])
+
+    def _NodeUuids():
+      return sorted(cfg.GetNodeList())
+
+    def _AddInstance():
+      uuid = _NextId("inst")
+      nics = [objects.NIC(mac="aa:00:00:00:%02x:%02x" % divmod(counter[0], 256),
+                          uuid=_NextId("nic"),
+                          ip=rnd.choice([None, "192.0.2.1", "192.0.2.2"]),
+                          nicparams=rnd.choice([{}, {
+                            constants.NIC_MODE: constants.NIC_MODE_ROUTED,
+                            constants.NIC_LINK: "rt",
+                            }]))]
+      template = rnd.choice([constants.DT_DISKLESS, constants.DT_DRBD8])
+      inst = objects.Instance(name="%s.example.com" % uuid, uuid=uuid,
+                              disks=[], nics=nics, disk_template=template,
+                              primary_node=rnd.choice(_NodeUuids()),
+                              network_port=rnd.choice([None, 11000, 11001]),
+                              osparams_private=serializer.PrivateDict(),
+                              beparams={})
+      inst.UpgradeConfig()
+      cfg.AddInstance(inst, "my-job")
+      if template == constants.DT_DRBD8:
+        disk = objects.Disk(dev_type=constants.DT_DRBD8, size=128,
+                            logical_id=(inst.primary_node,
+                                        rnd.choice(_NodeUuids() + ["gone"]),
+                                        rnd.choice([11001, 11002]), 0, 0,
+                                        _NextId("secret")),
+                            children=[],
+                            iv_name=rnd.choice(["disk/0", "disk/9"]),
+                            uuid=_NextId("disk"))
+        cfg.AddInstanceDisk(uuid, disk)
+        # keep the possibly wrong name of the disk
+        disk = cfg.GetDiskInfo(disk.uuid)
+        disk.iv_name = rnd.choice(["disk/0", "disk/9"])
+        cfg.Update(disk, None)
+
+    def _RemoveInstance():
+      inst_uuids = sorted(cfg.GetInstanceList())
+      if inst_uuids:
+        inst_uuid = rnd.choice(inst_uuids)
+        if rnd.choice([True, False]):
+          for disk_uuid in cfg.GetInstanceInfo(inst_uuid).disks[:]:
+            cfg.RemoveInstanceDisk(inst_uuid, disk_uuid)
+        cfg.RemoveInstance(inst_uuid)
+
+    def _ModifyInstance():
+      inst_uuids = sorted(cfg.GetInstanceList())
+      if not inst_uuids:
+        return
+      inst = cfg.GetInstanceInfo(rnd.choice(inst_uuids))
+      change = rnd.randint(0, 3)
+      if change == 0:
+        inst.nics[0].mac = "aa:00:00:ff:00:%02x" % rnd.randint(1, 4)
+      elif change == 1:
+        inst.beparams = rnd.choice([{}, {constants.BE_VCPUS: "many"}])
+      elif change == 2:
+        cfg.RenameInstance(inst.uuid, _NextId("renamed"))
+        return
+      else:
+        inst.primary_node = rnd.choice(_NodeUuids() + ["gone"])
+      cfg.Update(inst, None)
+
+    def _ModifyDisk():
+      disk_uuids = sorted(cfg._ConfigData().disks.keys())
+      if disk_uuids:
+        disk = cfg.GetDiskInfo(rnd.choice(disk_uuids))
+        (pnode, snode, _, pminor, sminor, secret) = disk.logical_id
+        disk.logical_id = (pnode, snode, rnd.choice([11000, 11003]), pminor,
+                           sminor, secret)
+        disk.iv_name = rnd.choice(["disk/0", "disk/1"])
+        cfg.Update(disk, None)
+
+    def _AddNode():
+      uuid = _NextId("node")
+      cfg.AddNode(objects.Node(name="%s.example.com" % uuid, uuid=uuid,
+                               group=rnd.choice(sorted(cfg.GetNodeGroupList())),
+                               primary_ip="192.0.2.%d" % rnd.randint(1, 4),
+                               secondary_ip="198.51.100.1",
+                               ndparams={}), "my-job")
+
+    def _ModifyNode():
+      node_uuids = [uuid for uuid in _NodeUuids()
+                    if uuid != cfg.GetMasterNode()]
+      if not node_uuids:
+        return
+      node = cfg.GetNodeInfo(rnd.choice(node_uuids))
+      change = rnd.randint(0, 2)
+      if change == 0:
+        cfg.RemoveNode(node.uuid)
+        return
+      elif change == 1:
+        node.offline = rnd.choice([True, False])
+        node.master_candidate = rnd.choice([True, False])
+      else:
+        node.ndparams = rnd.choice([{}, {list(constants.NDC_GLOBALS)[0]: 1}])
+      cfg.Update(node, None)
+
+    def _AddNodeGroup():
+      uuid = _NextId("group")
+      cfg.AddNodeGroup(objects.NodeGroup(name=uuid, uuid=uuid, members=[]),
+                       "my-job")
+
+    def _ModifyNodeGroup():
+      group = cfg.GetNodeGroup(rnd.choice(sorted(cfg.GetNodeGroupList())))
+      change = rnd.randint(0, 2)
+      if change == 0:
+        if not group.members and len(cfg.GetNodeGroupList()) > 1:
+          cfg.RemoveNodeGroup(group.uuid)
+        return
+      elif change == 1:
+        group.ndparams = rnd.choice([{}, {
+          constants.ND_EXCLUSIVE_STORAGE: "maybe",
+          }])
+      else:
+        group.name = rnd.choice(["duplicate", "duplicate2",
+                                 "4f4d6d85-4e10-4b1e-a48d-5dbb6e4e7c6c"])
+      cfg.Update(group, None)
+
+    def _ModifyCluster():
+      cluster = cfg.GetClusterInfo()
+      nicparams = cluster.nicparams[constants.PP_DEFAULT]
+      if rnd.choice([True, False]):
+        nicparams[constants.NIC_MODE] = rnd.choice([constants.NIC_MODE_BRIDGED,
+                                                    constants.NIC_MODE_ROUTED])
+      else:
+        cluster.beparams[constants.PP_DEFAULT][constants.BE_VCPUS] = \
+          rnd.choice([1, "many"])
+      cfg.Update(cluster, None)
+
+    mutations = [_AddInstance, _AddInstance, _RemoveInstance,
+                 _ModifyInstance, _ModifyDisk, _AddNode, _ModifyNode,
+                 _AddNodeGroup, _ModifyNodeGroup, _ModifyCluster]
+
+    with cfg.GetConfigManager():
+      for _ in range(300):
+        rnd.choice(mutations)()
+        incremental = cfg._UnlockedVerifyConfig(incremental=True)
+        self.assertEqual(incremental, cfg._UnlockedVerifyConfig())
+
+  def testVerifyCacheKeptOnReload(self):
+    (cfg, wconfd) = self._get_object_online()
+
+    with cfg.GetConfigManager():
+      for idx in range(3):
+        inst = objects.Instance(name="inst%d.example.com" % idx,
+                                uuid="inst%d" % idx, disks=[], nics=[],
+                                disk_template=constants.DT_DISKLESS,
+                                primary_node=cfg.GetMasterNode(),
+                                osparams_private=serializer.PrivateDict(),
+                                beparams={})
+        inst.UpgradeConfig()
+        cfg.AddInstance(inst, "my-job")
+      self.assertEqual(cfg._UnlockedVerifyConfig(), [])
+
+    # another job modifies an instance in the meantime
+    wconfd.data["instances"]["inst1"]["beparams"] = {
+      constants.BE_VCPUS: "many",
+      }
+    wconfd.data["instances"]["inst1"]["serial_no"] += 1
+
+    # and another one renames an instance
+    other = config.ConfigWriter(cfg_file=self.cfg_file,
+                                _getents=_StubGetEntResolver,
+                                wconfdcontext=("other-job", "livelock", 0),
+                                wconfd=wconfd)
+    with other.GetConfigManager():
+      other.RenameInstance("inst0", "renamed.example.com")
+
+    verified = []
+    compute_fn = cfg._ComputeInstanceVerifyEntry
+
+    def _ComputeInstanceVerifyEntry(uuid, instance):
+      verified.append(uuid)
+      return compute_fn(uuid, instance)
+
+    cfg._ComputeInstanceVerifyEntry = _ComputeInstanceVerifyEntry
+
+    feedback = []
+    with cfg.GetConfigManager():
+      cfg.Update(cfg.GetInstanceInfo("inst2"), feedback.append)
+
+    # only the instances modified by the other jobs and the updated one are
+    # verified again after the configuration has been reloaded
+    self.assertEqual(sorted(verified), ["inst0", "inst1", "inst2"])
+    self.assertEqual(len(feedback), 1)
+    self.assertTrue("inst1.example.com" in feedback[0])
+
+  def testLazyOfflineRead(self):
+    inst = self._create_instance(self._get_object())
+    data = serializer.LoadJson(utils.ReadFile(self.cfg_file))
+    data["cluster"]["enabled_disk_templates"] = [constants.DT_DISKLESS]
+    data["instances"][inst.uuid] = inst.ToDict(_with_private=True)
+    utils.WriteFile(self.cfg_file, data=serializer.DumpJson(data))
+    saved = utils.ReadFile(self.cfg_file)
+
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file, offline=True,
+                              _getents=_StubGetEntResolver, lazy=True)
+    with cfg.GetConfigManager(shared=True):
+      instances = cfg._ConfigData().instances
+      self.assertEqual(cfg.GetInstanceList(), [inst.uuid])
+      self.assertFalse(instances.IsLoaded(inst.uuid))
+      inst = cfg.GetInstanceInfo(inst.uuid)
+      self.assertTrue(instances.IsLoaded(inst.uuid))
+      # objects are upgraded when they're loaded
+      self.assertEqual(inst.admin_state_source, constants.ADMIN_SOURCE)
+    self.assertEqual(utils.ReadFile(self.cfg_file), saved)
+
+    # exclusive access loads and upgrades the whole configuration
+    cfg.SetVGName("newvg")
+    self.assertEqual(cfg.GetInstanceInfo(inst.uuid).admin_state_source,
+                     constants.ADMIN_SOURCE)
+    self.assertNotEqual(utils.ReadFile(self.cfg_file), saved)
+
+  def testEagerOfflineRead(self):
+    inst = self._create_instance(self._get_object())
+    data = serializer.LoadJson(utils.ReadFile(self.cfg_file))
+    data["cluster"]["enabled_disk_templates"] = [constants.DT_DISKLESS]
+    data["instances"][inst.uuid] = inst.ToDict(_with_private=True)
+    utils.WriteFile(self.cfg_file, data=serializer.DumpJson(data))
+    saved = utils.ReadFile(self.cfg_file)
+
+    # without lazy loading, read-only access also verifies the configuration
+    # and writes the upgrades back
+    cfg = self._get_object()
+    verified = []
+    cfg._UnlockedVerifyConfigAndLog = lambda: verified.append(True)
+    with cfg.GetConfigManager(shared=True):
+      self.assertFalse(isinstance(cfg._ConfigData().instances,
+                                  outils.LazyObjectDict))
+      self.assertEqual(cfg.GetInstanceInfo(inst.uuid).admin_state_source,
+                       constants.ADMIN_SOURCE)
+    self.assertNotEqual(utils.ReadFile(self.cfg_file), saved)
+
+    with cfg.GetConfigManager(shared=True):
+      pass
+    self.assertEqual(verified, [True])
+
+  def testCompressedConfigFile(self):
+    raw = utils.ReadFile(self.cfg_file)
+    self.assertEqual(serializer.GetConfigFormat(raw),
+                     serializer.CONFIG_FORMAT_JSON)
+    utils.WriteFile(self.cfg_file,
+                    data=serializer.DumpConfig(
+                      serializer.LoadConfig(raw),
+                      fmt=serializer.CONFIG_FORMAT_ZLIB1))
+
+    # the format is detected when reading and kept when writing
+    cfg = self._get_object()
+    self.assertEqual(cfg.GetClusterName(), "cluster.local")
+    cfg.SetVGName("newvg")
+    raw = utils.ReadFile(self.cfg_file)
+    self.assertEqual(serializer.GetConfigFormat(raw),
+                     serializer.CONFIG_FORMAT_ZLIB1)
+    self.assertEqual(serializer.LoadConfig(raw)["cluster"]["volume_group_name"],
+                     "newvg")
+
+    # an explicitly requested format takes precedence
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file, offline=True,
+                              _getents=_StubGetEntResolver,
+                              cfg_format=serializer.CONFIG_FORMAT_JSON)
+    cfg.SetVGName("othervg")
+    self.assertEqual(
+      serializer.GetConfigFormat(utils.ReadFile(self.cfg_file)),
+      serializer.CONFIG_FORMAT_JSON)
+    self.assertEqual(self._get_object().GetVGName(), "othervg")
+
+    self.assertRaises(errors.ProgrammerError, config.ConfigWriter,
+                      cfg_file=self.cfg_file, offline=True, cfg_format="xz")
+
   def testUpdateCluster(self):
     """Test updates on the cluster object"""
     cfg = self._get_object()
@@ -324,6 +884,103 @@ class TestConfigRunner(unittest.TestCase):
     newsaved = utils.ReadFile(self.cfg_file)
     self.assertEqual(oldsaved, newsaved)
 
+  def _CheckWConfdData(self, cfg, wconfd):
+    """Checks that the data in WConfd matches the full configuration"""
+    with cfg.GetConfigManager(shared=True):
+      full = cfg._ConfigData().ToDict()
+    full = serializer.LoadJson(serializer.DumpJson(full))
+    for key in ["cluster"] + config._CONFIG_CONTAINERS:
+      self.assertEqual(wconfd.data[key], full[key])
+
+  def testWriteConfigUpdate(self):
+    (cfg, wconfd) = self._get_object_online()
+    inst = self._create_instance(cfg)
+    inst.UpgradeConfig()
+    cfg.AddInstance(inst, "my-job")
+    cfg.MarkInstanceDown(inst.uuid)
+    self._CheckWConfdData(cfg, wconfd)
+
+    # Changing a single instance must only send that instance
+    wconfd.writes = []
+    cfg.MarkInstanceUp(inst.uuid)
+    self.assertEqual(len(wconfd.writes), 1)
+    (kind, (cluster, nodes, nodegroups, instances, networks, disks)) = \
+      wconfd.writes[0]
+    self.assertEqual(kind, "update")
+    self.assertTrue(cluster is None)
+    self.assertEqual(nodes + nodegroups + networks + disks, [])
+    self.assertEqual([uuid for (uuid, _) in instances], [inst.uuid])
+    self.assertEqual(instances[0][1]["admin_state"], constants.ADMINST_UP)
+    self._CheckWConfdData(cfg, wconfd)
+
+    # Nothing to send if nothing was changed
+    wconfd.writes = []
+    cfg.MarkInstanceUp(inst.uuid)
+    self.assertEqual(wconfd.writes, [])
+
+    # Removed objects are sent without a value
+    cfg.RemoveInstance(inst.uuid)
+    (kind, (cluster, _, _, instances, _, _)) = wconfd.writes[-1]
+    self.assertEqual(kind, "update")
+    self.assertTrue(cluster is not None)
+    self.assertEqual(instances, [(inst.uuid, None)])
+    self._CheckWConfdData(cfg, wconfd)
+
+  def testWriteConfigUpgraded(self):
+    (cfg, wconfd) = self._get_object_online()
+    node_uuid = cfg.GetNodeList()[0]
+    del wconfd.data["nodes"][node_uuid]["ndparams"]
+
+    # Upgrades aren't tracked, so the whole configuration must be sent
+    cfg.SetVGName("newvg")
+    self.assertEqual(len(wconfd.writes), 1)
+    self.assertEqual(wconfd.writes[0][0], "full")
+    self.assertTrue(wconfd.data["nodes"][node_uuid]["ndparams"])
+    self._CheckWConfdData(cfg, wconfd)
+
+  def testLockConfigPolling(self):
+    (cfg, wconfd) = self._get_object_busy(3)
+    cfg.SetVGName("newvg")
+    self.assertEqual(wconfd.calls, ["LockConfig"] * 4 + ["UnlockConfig"])
+    self.assertEqual(len(wconfd.writes), 1)
+
+  def testLockConfigPollingTimeout(self):
+    (cfg, wconfd) = self._get_object_busy(1000, lock_timeout=0.05)
+    self.assertRaises(errors.LockError, cfg.SetVGName, "newvg")
+    self.assertEqual(wconfd.calls[-1], "UnlockConfig")
+    self.assertEqual(wconfd.writes, [])
+
+  @mock.patch("ganeti.wconfd.LockNotificationsEnabled")
+  def testLockConfigQueued(self, notifications_enabled):
+    notifications_enabled.return_value = True
+    (cfg, wconfd) = self._get_object_busy(2)
+    cfg.SetLockPriorityFn(lambda: constants.OP_PRIO_HIGH)
+    start = time.time()
+    cfg.SetVGName("newvg")
+    # Each notification wakes up the job immediately
+    self.assertTrue(time.time() - start < wc.LOCK_NOTIFICATION_TIMEOUT)
+    self.assertEqual(wconfd.calls, [
+      ("UpdateLocksWaiting", constants.OP_PRIO_HIGH,
+       [[config._CONFIG_LOCK, "exclusive"]]),
+      "HasPendingRequest",
+      "HasPendingRequest",
+      "HasPendingRequest",
+      "UnlockConfig",
+      ])
+    self.assertEqual(len(wconfd.writes), 1)
+
+  @mock.patch("ganeti.wconfd.LockNotificationsEnabled")
+  def testLockConfigQueuedTimeout(self, notifications_enabled):
+    notifications_enabled.return_value = True
+    (cfg, wconfd) = self._get_object_busy(100000, lock_timeout=0.05)
+    self.assertRaises(errors.LockError, cfg.SetVGName, "newvg")
+    self.assertEqual(wconfd.calls[0],
+                     ("UpdateLocksWaiting", constants.OP_PRIO_DEFAULT,
+                      [[config._CONFIG_LOCK, "exclusive"]]))
+    # The pending request is dropped
+    self.assertEqual(wconfd.calls[-1], "UnlockConfig")
+    self.assertEqual(wconfd.writes, [])
+
   def testNICParameterSyntaxCheck(self):
     """Test the NIC's CheckParameterSyntax function"""
     mode = constants.NIC_MODE
@@ -605,6 +1262,43 @@ class TestConfigRunner(unittest.TestCase):
     cfg.RemoveNodeFromCandidateCerts(node_uuid, warn_fn=None)
     self.assertEqual(0, len(cfg.GetCandidateCerts()))
 
+  def testNameIndexes(self):
+    cfg = self._get_object_mock()
+    inst = self._create_instance(cfg)
+    cfg.AddInstance(inst, "my-job")
+
+    self.assertEqual(cfg.ExpandInstanceName("test"),
+                     (inst.uuid, "test.example.com"))
+    self.assertEqual(cfg.GetInstanceInfoByName("test.example.com").uuid,
+                     inst.uuid)
+    self.assertEqual(cfg.GetInstanceInfoByName("test"), None)
+
+    cfg.RenameInstance(inst.uuid, "other.example.com")
+    self.assertEqual(cfg.ExpandInstanceName("test"), (None, None))
+    self.assertEqual(cfg.ExpandInstanceName("OTHER"),
+                     (inst.uuid, "other.example.com"))
+    self.assertEqual(cfg.GetInstanceInfoByName("test.example.com"), None)
+
+    cfg.RemoveInstance(inst.uuid)
+    self.assertEqual(cfg.ExpandInstanceName("other"), (None, None))
+
+    node_group = cfg.LookupNodeGroup(None)
+    node = objects.Node(name="node2.example.com", group=node_group,
+                        ndparams={}, uuid="node2-uuid")
+    cfg.AddNode(node, "my-job")
+    self.assertEqual(cfg.ExpandNodeName("node2"),
+                     ("node2-uuid", "node2.example.com"))
+    self.assertEqual(cfg.GetNodeInfoByName("node2.example.com").uuid,
+                     "node2-uuid")
+    cfg.RemoveNode("node2-uuid")
+    self.assertEqual(cfg.ExpandNodeName("node2"), (None, None))
+
+    group = cfg.GetNodeGroup(node_group)
+    group.name = "renamed"
+    cfg.Update(group, None)
+    self.assertEqual(cfg.LookupNodeGroup("renamed"), node_group)
+    self.assertRaises(errors.OpPrereqError, cfg.LookupNodeGroup, "default")
+
 
 def _IsErrorInList(err_str, err_list):
   return any(map(lambda e: err_str in e, err_list))
@@ -627,6 +1321,129 @@ class TestTRM(unittest.TestCase):
     t.DropECReservations(self.EC_ID)
     self.assertFalse(t.Reserved("a"))
 
+  def testGenerate(self):
+    t = TemporaryReservationManager()
+    t.Reserve(self.EC_ID, "a")
+    candidates = iter(["a", "b", None, "c"])
+    self.assertEqual(t.Generate(set(["b"]), candidates.next, 2), "c")
+    self.assertTrue(t.Reserved("c"))
+    self.assertEqual(t.GetECReserved(2), set(["c"]))
+    self.assertEqual(t.GetReserved(), set(["a", "c"]))
+    t.DropECReservations(2)
+    self.assertEqual(t.GetReserved(), set(["a"]))
+
+  def testGenerateExhausted(self):
+    t = TemporaryReservationManager()
+    self.assertRaises(errors.ConfigurationError, t.Generate, set(["a"]),
+                      lambda: "a", self.EC_ID)
+
+
+class TestResourceIndex(unittest.TestCase):
+  def test(self):
+    index = config._ResourceIndex()
+    index.SetOwned("o1", ["a", "b"])
+    index.SetOwned("o2", ["b", "c"])
+    self.assertEqual(sorted(index), ["a", "b", "c"])
+    index.SetOwned("o1", ["d"])
+    self.assertEqual(sorted(index), ["b", "c", "d"])
+    index.RemoveOwner("o2")
+    self.assertFalse("b" in index)
+    self.assertTrue("d" in index)
+    index.RemoveOwner("o1")
+    index.RemoveOwner("o3")
+    self.assertEqual(len(index), 0)
+
+
+class TestDRBDMinorIndex(unittest.TestCase):
+  def test(self):
+    index = config._DRBDMinorIndex()
+    self.assertEqual(index.FindFree("node1"), 0)
+    index.SetOwned("i1", [("node1", 0, "d1"), ("node2", 0, "d1"),
+                          ("node1", 1, "d2"), ("node2", 5, "d2")])
+    index.SetOwned("i2", [("node1", 3, "d3"), ("node2", 0, "d3")])
+    self.assertEqual(index.FindFree("node1"), 2)
+    self.assertEqual(index.FindFree("node1", reserved=[2, 4]), 5)
+    self.assertEqual(index.FindFree("node2"), 1)
+    self.assertEqual(index.FindFree("node3"), 0)
+    self.assertEqual(index.GetDuplicates(), [("node2", 0)])
+    self.assertEqual(index.GetOwners(("node2", 0, "d3")), ["i2"])
+    self.assertEqual(index.GetUsage(), {
+      "node1": {0: ["i1"], 1: ["i1"], 3: ["i2"]},
+      "node2": {0: ["i1", "i2"], 5: ["i1"]},
+      })
+
+    index.RemoveOwner("i2")
+    self.assertEqual(index.GetDuplicates(), [])
+    self.assertEqual(index.FindFree("node1", reserved=[2]), 3)
+    index.SetOwned("i1", [("node1", 0, "d1"), ("node1", 0, "d2")])
+    self.assertEqual(index.GetDuplicates(), [("node1", 0)])
+    self.assertEqual(index.FindFree("node1"), 1)
+    self.assertEqual(index.FindFree("node2"), 0)
+    index.RemoveOwner("i1")
+    self.assertEqual(index.GetDuplicates(), [])
+    self.assertEqual(index.GetUsage(), {})
+
+  def testLargeMinors(self):
+    index = config._DRBDMinorIndex()
+    index.SetOwned("i1", [("node1", minor, "d%d" % minor)
+                          for minor in range(200)])
+    self.assertEqual(index.FindFree("node1"), 200)
+    index.SetOwned("i2", [("node1", 1000, "d1000")])
+    self.assertEqual(index.FindFree("node1"), 200)
+
+
+class TestNameIndex(unittest.TestCase):
+  _NAMES = [
+    "node1.example.com",
+    "node10.example.com",
+    "node1.example.net",
+    "Node2.example.com",
+    "node2.example.org",
+    "node3",
+    "node3.example.com",
+    ]
+
+  def _Build(self, names):
+    index = config._NameIndex()
+    for (idx, name) in enumerate(names):
+      index.Add("uuid%d" % idx, name)
+    return index
+
+  def _Check(self, index, names, key):
+    uuid = index.Expand(key)
+    expected = config._MatchNameComponentIgnoreCase(key, names)
+    if expected is None:
+      self.assertEqual(uuid, None, msg="Expanding %r" % key)
+    else:
+      self.assertEqual(names[int(uuid[len("uuid"):])], expected,
+                       msg="Expanding %r" % key)
+
+  def testExpand(self):
+    index = self._Build(self._NAMES)
+    for key in ["node1", "node1.example", "NODE1.EXAMPLE.COM", "node10",
+                "node2", "node2.example", "node2.example.com", "node3",
+                "node3.example", "node", "node4", "", "example.com"]:
+      self._Check(index, self._NAMES, key)
+
+  def testExactCase(self):
+    names = ["node1.example.com", "NODE1.example.com"]
+    index = self._Build(names)
+    self.assertEqual(index.Expand("NODE1.example.com"), "uuid1")
+    self.assertEqual(index.Expand("node1.EXAMPLE.com"), None)
+    self.assertEqual(index.Expand("node1"), None)
+
+  def testRenameAndRemove(self):
+    index = self._Build(self._NAMES)
+    self.assertEqual(index.Lookup("node3"), "uuid5")
+    index.Add("uuid5", "node4.example.com")
+    self.assertEqual(index.Lookup("node3"), None)
+    self.assertEqual(index.Expand("node3"), "uuid6")
+    self.assertEqual(index.Expand("node4"), "uuid5")
+    index.Remove("uuid5")
+    index.Remove("uuid5")
+    self.assertEqual(index.Expand("node4"), None)
+    self.assertEqual(index.Lookup("node4.example.com"), None)
+
 
 class TestCheckInstanceDiskIvNames(unittest.TestCase):
   @staticmethod
@@ -37,6 +37,7 @@ import time
 import tempfile
 import pycurl
 import itertools
+import socket
 import threading
 from cStringIO import StringIO
 
@@ -756,5 +757,623 @@ class TestProcessRequests(unittest.TestCase):
                       _curl_multi=NotImplemented, _curl_process=NotImplemented)
 
 
+class _PooledFakeCurl(object):
+  def __init__(self):
+    self.opts = {}
+    self.info = {
+      pycurl.RESPONSE_CODE: http.HTTP_OK,
+      }
+    self.closed = False
+
+  def setopt(self, opt, value):
+    self.opts[opt] = value
+
+  def getinfo(self, info):
+    return self.info[info]
+
+  def close(self):
+    assert not self.closed
+    self.closed = True
+
+
+class _FakeCurlShare(object):
+  def __init__(self):
+    self.shared = set()
+    self.closed = False
+
+  def setopt(self, opt, value):
+    assert opt == pycurl.SH_SHARE
+    self.shared.add(value)
+
+  def close(self):
+    self.closed = True
+
+
+class _FakePoolMulti(object):
+  def __init__(self):
+    self.opts = {}
+    self.closed = False
+    self.removed = []
+
+  def setopt(self, opt, value):
+    self.opts[opt] = value
+
+  def remove_handle(self, curl):
+    self.removed.append(curl)
+
+  def close(self):
+    self.closed = True
+
+
+class TestCurlPool(unittest.TestCase):
+  def setUp(self):
+    self.pool = http.client.CurlPool(_curl=_PooledFakeCurl,
+                                     _curl_multi=_FakePoolMulti,
+                                     _curl_share=_FakeCurlShare)
+    self.configured = []
+
+  def _ConfigCurl(self, curl):
+    self.configured.append(curl)
+
+  def _Start(self, host="node1", port=1811, config_fn=NotImplemented):
+    if config_fn is NotImplemented:
+      config_fn = self._ConfigCurl
+    req = http.client.HttpClientRequest(host, port, "POST", "/version",
+                                        curl_config_fn=config_fn)
+    return (req, self.pool.StartRequest(req))
+
+  def testReuse(self):
+    (req, pending) = self._Start()
+    curl = pending.GetCurlHandle()
+    self.assertEqual(self.configured, [curl])
+    if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
+      self.assertTrue(curl.opts[pycurl.SSL_SESSIONID_CACHE])
+    pending.Done(None)
+    self.assertTrue(req.success)
+    self.pool.ReleaseHandle(req, curl, True)
+
+    (_, pending) = self._Start()
+    self.assertTrue(pending.GetCurlHandle() is curl)
+    # The configuration function is only called once per handle
+    self.assertEqual(self.configured, [curl])
+    self.assertFalse(curl.closed)
+
+  def testShare(self):
+    (_, pending) = self._Start()
+    share = pending.GetCurlHandle().opts[pycurl.SHARE]
+    (_, pending) = self._Start(host="node2")
+    self.assertTrue(pending.GetCurlHandle().opts[pycurl.SHARE] is share)
+    if hasattr(pycurl, "LOCK_DATA_SSL_SESSION"):
+      self.assertTrue(pycurl.LOCK_DATA_SSL_SESSION in share.shared)
+
+  def testNoShare(self):
+    pool = http.client.CurlPool(_curl=_PooledFakeCurl,
+                                _curl_multi=_FakePoolMulti,
+                                _curl_share=None)
+    req = http.client.HttpClientRequest("node1", 1811, "POST", "/version")
+    pending = pool.StartRequest(req)
+    self.assertFalse(pycurl.SHARE in pending.GetCurlHandle().opts)
+
+  def testDifferentHosts(self):
+    (req, pending) = self._Start()
+    curl = pending.GetCurlHandle()
+    self.pool.ReleaseHandle(req, curl, True)
+
+    for (host, port, config_fn) in [("node2", 1811, self._ConfigCurl),
+                                    ("node1", 1812, self._ConfigCurl),
+                                    ("node1", 1811, None)]:
+      (_, pending) = self._Start(host=host, port=port, config_fn=config_fn)
+      self.assertFalse(pending.GetCurlHandle() is curl)
+
+  def testNotReusable(self):
+    (req, pending) = self._Start()
+    curl = pending.GetCurlHandle()
+    self.pool.ReleaseHandle(req, curl, False)
+    self.assertTrue(curl.closed)
+
+    (_, pending) = self._Start()
+    self.assertFalse(pending.GetCurlHandle() is curl)
+
+  def testMaxIdle(self):
+    started = [self._Start()
+               for _ in range(http.client.CurlPool.MAX_IDLE_PER_HOST + 2)]
+    for (req, pending) in started:
+      self.pool.ReleaseHandle(req, pending.GetCurlHandle(), True)
+
+    closed = [pending.GetCurlHandle().closed for (_, pending) in started]
+    self.assertEqual(closed.count(True), 2)
+
+  def testMulti(self):
+    multi = self.pool.GetMulti()
+    if hasattr(pycurl, "M_MAXCONNECTS"):
+      self.assertEqual(multi.opts[pycurl.M_MAXCONNECTS],
+                       http.client.CurlPool.MAX_CONNECTIONS)
+    self.pool.ReleaseMulti(multi)
+    self.assertTrue(self.pool.GetMulti() is multi)
+    self.assertFalse(self.pool.GetMulti() is multi)
+
+  def testClear(self):
+    (req, pending) = self._Start()
+    curl = pending.GetCurlHandle()
+    share = curl.opts[pycurl.SHARE]
+    self.pool.ReleaseHandle(req, curl, True)
+    multi = self.pool.GetMulti()
+    self.pool.ReleaseMulti(multi)
+
+    self.pool.Clear()
+    self.assertTrue(curl.closed)
+    self.assertTrue(multi.closed)
+    self.assertTrue(share.closed)
+
+    (_, pending) = self._Start()
+    self.assertFalse(pending.GetCurlHandle() is curl)
+
+  def testForked(self):
+    (req, pending) = self._Start()
+    curl = pending.GetCurlHandle()
+    self.pool.ReleaseHandle(req, curl, True)
+
+    # Pretend to be running in a forked child
+    self.pool._pid = -1
+
+    (_, pending) = self._Start()
+    self.assertFalse(pending.GetCurlHandle() is curl)
+    self.pool.Clear()
+    # Connections of the parent must not be closed
+    self.assertFalse(curl.closed)
+
+  def testProcessRequests(self):
+    requests = [http.client.HttpClientRequest("node%s" % (i % 3), 1811,
+                                              "POST", "/version",
+                                              curl_config_fn=self._ConfigCurl)
+                for i in range(6)]
+
+    def _ProcessRequests(multi, handles):
+      self.assertTrue(isinstance(multi, _FakePoolMulti))
+      for (idx, curl) in enumerate(handles):
+        if idx == 0:
+          yield (curl, "test error")
+        else:
+          yield (curl, None)
+
+    for _ in range(2):
+      for req in requests:
+        req.success = req.error = None
+        req.resp_status_code = req.resp_body = None
+      http.client.ProcessRequests(requests, curl_pool=self.pool,
+                                  _curl=NotImplemented,
+                                  _curl_multi=NotImplemented,
+                                  _curl_process=_ProcessRequests)
+      self.assertEqual(len([req for req in requests if req.success]), 5)
+
+    # The five handles returned after the first round were reused in the
+    # second one, only the handle of the failed request had to be replaced
+    self.assertEqual(len(self.configured), 6 + 1)
+    self.assertEqual(len(self.pool._multis), 1)
+
+  def testProcessRequestsFailure(self):
+    requests = [http.client.HttpClientRequest("node1", 1811, "POST",
+                                              "/version",
+                                              curl_config_fn=self._ConfigCurl)
+                for _ in range(3)]
+    multis = []
+
+    def _ProcessRequests(multi, handles):
+      multis.append(multi)
+      yield (handles[0], None)
+      raise pycurl.error("test error")
+
+    self.assertRaises(pycurl.error, http.client.ProcessRequests, requests,
+                      curl_pool=self.pool, _curl=NotImplemented,
+                      _curl_multi=NotImplemented,
+                      _curl_process=_ProcessRequests)
+
+    self.assertEqual([req.success for req in requests], [True, False, False])
+    self.assertTrue(compat.all(req.error for req in requests[1:]))
+
+    # The finished handle is kept, the others and the multi object are
+    # closed
+    (multi, ) = multis
+    self.assertTrue(multi.closed)
+    self.assertEqual(len(multi.removed), 2)
+    self.assertTrue(compat.all(curl.closed for curl in multi.removed))
+    self.assertFalse(self.pool._multis)
+    self.assertEqual(len(self.pool._idle[("node1", 1811)]), 1)
+
+  def testFilesChanged(self):
+    tmpfile = tempfile.NamedTemporaryFile()
+    tmpfile.write("certificate")
+    tmpfile.flush()
+
+    pool = http.client.CurlPool(files_fn=lambda: [tmpfile.name],
+                                _curl=_PooledFakeCurl,
+                                _curl_multi=_FakePoolMulti,
+                                _curl_share=_FakeCurlShare)
+    self.pool = pool
+
+    (req, pending) = self._Start()
+    idle_curl = pending.GetCurlHandle()
+    (busy_req, busy_pending) = self._Start()
+    busy_curl = busy_pending.GetCurlHandle()
+    pool.ReleaseHandle(req, idle_curl, True)
+    multi = pool.GetMulti()
+    pool.ReleaseMulti(multi)
+
+    # Nothing changed
+    self.assertTrue(pool.GetMulti() is multi)
+    pool.ReleaseMulti(multi)
+
+    tmpfile.write(" renewed")
+    tmpfile.flush()
+
+    new_multi = pool.GetMulti()
+    self.assertFalse(new_multi is multi)
+    self.assertTrue(multi.closed)
+    self.assertTrue(idle_curl.closed)
+
+    # Objects in use when the file changed are closed when returned
+    self.assertFalse(busy_curl.closed)
+    pool.ReleaseHandle(busy_req, busy_curl, True)
+    self.assertTrue(busy_curl.closed)
+
+    (req, pending) = self._Start()
+    curl = pending.GetCurlHandle()
+    self.assertFalse(curl is idle_curl)
+    pool.ReleaseHandle(req, curl, True)
+    self.assertFalse(curl.closed)
+    pool.ReleaseMulti(new_multi)
+    self.assertTrue(pool.GetMulti() is new_multi)
+
+
+class _FifoCurlMulti(object):
+  """Fake cURL multi object finishing one handle per call to C{perform}.
+
+  """
+  def __init__(self):
+    self.handles = []
+    self.opts = {}
+    self.closed = False
+    self._done = []
+
+  def setopt(self, opt, value):
+    self.opts[opt] = value
+
+  def add_handle(self, curl):
+    assert curl not in self.handles
+    self.handles.append(curl)
+
+  def remove_handle(self, curl):
+    self.handles.remove(curl)
+
+  def close(self):
+    self.closed = True
+
+  def perform(self):
+    active = [curl for curl in self.handles if curl not in self._done]
+    if active:
+      self._done.append(active[0])
+    return (pycurl.E_MULTI_OK, len(active))
+
+  def info_read(self):
+    (done, self._done) = (self._done, [])
+    return (0, done, [])
+
+  def select(self, timeout):
+    # Never compare floats for equality
+    assert timeout >= 0.95 and timeout <= 1.05
+
+
+class TestAsyncRequestProcessor(unittest.TestCase):
+  def setUp(self):
+    self.multis = []
+
+  def _NewMulti(self):
+    multi = _FifoCurlMulti()
+    self.multis.append(multi)
+    return multi
+
+  def _NewRequests(self, count):
+    return [http.client.HttpClientRequest("localhost", 1811, "POST",
+                                          "/version")
+            for _ in range(count)]
+
+  def test(self):
+    proc = http.client.AsyncRequestProcessor(_curl=_PooledFakeCurl,
+                                             _curl_multi=self._NewMulti)
+    first = self._NewRequests(3)
+    second = self._NewRequests(2)
+    proc.StartRequests(first)
+    proc.StartRequests(second)
+    self.assertEqual(len(self.multis), 1)
+    self.assertEqual(len(self.multis[0].handles), 5)
+
+    # Waiting for the second group of requests also finishes the first one,
+    # whose requests were started earlier
+    proc.WaitForRequests(second)
+    self.assertTrue(compat.all(req.success for req in first + second))
+    self.assertFalse(self.multis[0].handles)
+
+    # The first group is already done
+    proc.WaitForRequests(first)
+
+    # A new multi object is used once all requests are done
+    third = self._NewRequests(1)
+    proc.StartRequests(third)
+    proc.WaitForRequests(third)
+    self.assertTrue(third[0].success)
+    self.assertEqual(len(self.multis), 2)
+
+  def testPartial(self):
+    proc = http.client.AsyncRequestProcessor(_curl=_PooledFakeCurl,
+                                             _curl_multi=self._NewMulti)
+    first = self._NewRequests(2)
+    second = self._NewRequests(2)
+    proc.StartRequests(first)
+    proc.StartRequests(second)
+
+    proc.WaitForRequests(first)
+    self.assertTrue(compat.all(req.success for req in first))
+    self.assertFalse(compat.any(req.success for req in second))
+    self.assertEqual(len(self.multis[0].handles), 2)
+
+    proc.WaitForRequests(second)
+    self.assertTrue(compat.all(req.success for req in second))
+
+  def testFailure(self):
+    proc = http.client.AsyncRequestProcessor(_curl=_PooledFakeCurl,
+                                             _curl_multi=self._NewMulti)
+    first = self._NewRequests(2)
+    second = self._NewRequests(1)
+    proc.StartRequests(first)
+    proc.StartRequests(second)
+
+    def _Fail():
+      raise pycurl.error("test error")
+    self.multis[0].perform = _Fail
+
+    self.assertRaises(pycurl.error, proc.WaitForRequests, first)
+
+    # All pending requests were aborted and their objects closed
+    for req in first + second:
+      self.assertFalse(req.success)
+      self.assertTrue(req.error)
+    self.assertTrue(self.multis[0].closed)
+    self.assertFalse(self.multis[0].handles)
+
+    # Waiting for aborted requests returns immediately
+    proc.WaitForRequests(second)
+
+    third = self._NewRequests(1)
+    proc.StartRequests(third)
+    proc.WaitForRequests(third)
+    self.assertTrue(third[0].success)
+    self.assertEqual(len(self.multis), 2)
+
+  def testEmpty(self):
+    proc = http.client.AsyncRequestProcessor(_curl=NotImplemented,
+                                             _curl_multi=NotImplemented)
+    proc.StartRequests([])
+    proc.WaitForRequests([])
+
+  def testBadRequest(self):
+    proc = http.client.AsyncRequestProcessor(_curl=NotImplemented,
+                                             _curl_multi=NotImplemented)
+    (req, ) = self._NewRequests(1)
+    req.success = False
+    self.assertRaises(AssertionError, proc.StartRequests, [req])
+
+  def testPool(self):
+    pool = http.client.CurlPool(_curl=_PooledFakeCurl,
+                                _curl_multi=_FifoCurlMulti,
+                                _curl_share=None)
+    proc = http.client.AsyncRequestProcessor(curl_pool=pool,
+                                             _curl=NotImplemented,
+                                             _curl_multi=NotImplemented)
+    requests = self._NewRequests(2)
+    proc.StartRequests(requests)
+    proc.WaitForRequests(requests)
+    self.assertTrue(compat.all(req.success for req in requests))
+
+    # The handles and the multi object were returned to the pool
+    self.assertEqual(len(pool._multis), 1)
+    self.assertEqual(len(pool._idle[("localhost", 1811)]), 2)
+
+
+class _KeepAliveHandler(http.server.HttpServerHandler):
+  def HandleRequest(self, req):
+    return req.request_body.upper()
+
+
+class _FakeMessageReader(object):
+  def __init__(self, peer_will_close, content_length):
+    self.peer_will_close = peer_will_close
+    self.content_length = content_length
+
+
+class TestResponderKeepAlive(unittest.TestCase):
+  def _Respond(self, reader, keep_alive, version=http.HTTP_1_1,
+               body="hello"):
+    req_msg = http.HttpMessage()
+    req_msg.start_line = \
+      http.HttpClientToServerStartLine(http.HTTP_POST, "/version", version)
+    req_msg.headers = {
+      http.HTTP_HOST: "localhost",
+      }
+    req_msg.body = body
+
+    responder = http.server.HttpResponder(_KeepAliveHandler())
+    (_, _, force_close, resp_msg) = \
+      responder(lambda: (req_msg, reader), keep_alive=keep_alive)
+    self.assertFalse(force_close)
+    return resp_msg
+
+  def test(self):
+    resp_msg = self._Respond(_FakeMessageReader(False, 5), True)
+    self.assertEqual(resp_msg.body, "HELLO")
+    self.assertEqual(resp_msg.headers[http.HTTP_CONNECTION], "keep-alive")
+    self.assertEqual(resp_msg.headers[http.HTTP_CONTENT_LENGTH], 5)
+
+  def testEmptyBody(self):
+    resp_msg = self._Respond(_FakeMessageReader(False, 0), True, body="")
+    self.assertEqual(resp_msg.headers[http.HTTP_CONNECTION], "keep-alive")
+    self.assertEqual(resp_msg.headers[http.HTTP_CONTENT_LENGTH], 0)
+
+  def testClose(self):
+    for (reader, keep_alive) in [
+      (_FakeMessageReader(False, 5), False),
+      (_FakeMessageReader(True, 5), True),
+      # More data than announced was read
+      (_FakeMessageReader(False, 3), True),
+      (None, True),
+      ]:
+      resp_msg = self._Respond(reader, keep_alive)
+      self.assertEqual(resp_msg.headers[http.HTTP_CONNECTION], "close")
+      self.assertFalse(http.HTTP_CONTENT_LENGTH in resp_msg.headers)
+
+
+class TestIdleConnectionClosed(unittest.TestCase):
+  def _Read(self, data):
+    (server_sock, client_sock) = socket.socketpair()
+    try:
+      client_sock.sendall(data)
+      client_sock.close()
+      server_sock.setblocking(0)
+      http.server._HttpClientToServerMessageReader(server_sock,
+                                                   http.HttpMessage(), 10)
+    finally:
+      server_sock.close()
+
+  def testIdle(self):
+    self.assertRaises(http.HttpIdleConnectionClosed, self._Read, "")
+
+  def testPartialRequest(self):
+    try:
+      self._Read("POST /version HTTP/1.1\r\nHost: loc")
+    except http.HttpIdleConnectionClosed:
+      self.fail("Partial request was reported as idle connection")
+    except http.HttpError:
+      pass
+    else:
+      self.fail("Partial request was not detected")
+
+
+class _FakeKeepAliveServer(object):
+  using_ssl = False
+
+  def __init__(self, keep_alive):
+    self.keep_alive = keep_alive
+
+  def IsKeepAliveAllowed(self):
+    return self.keep_alive
+
+
+def _SendRequests(sock, bodies):
+  """Sends requests over one connection and reads the responses.
+
+  @return: list of tuples of the C{Connection} header and the body of the
+    responses received before the server closed the connection
+
+  """
+  responses = []
+
+  for body in bodies:
+    try:
+      sock.sendall("POST /version HTTP/1.1\r\n"
+                   "Host: localhost\r\n"
+                   "Content-Length: %s\r\n\r\n%s" % (len(body), body))
+    except socket.error:
+      break
+
+    data = ""
+    while "\r\n\r\n" not in data:
+      chunk = sock.recv(4096)
+      if not chunk:
+        return responses
+      data += chunk
+
+    (head, resp_body) = data.split("\r\n\r\n", 1)
+    headers = dict(line.split(": ", 1) for line in head.split("\r\n")[1:])
+    length = int(headers.get(http.HTTP_CONTENT_LENGTH, 0))
+    while len(resp_body) < length:
+      resp_body += sock.recv(4096)
+
+    responses.append((headers[http.HTTP_CONNECTION], resp_body))
+
+  return responses
+
+
+class TestExecutorKeepAlive(unittest.TestCase):
+  def _Run(self, keep_alive, bodies):
+    (server_sock, client_sock) = socket.socketpair()
+    thread = threading.Thread(target=http.server.HttpServerRequestExecutor,
+                              args=(_FakeKeepAliveServer(keep_alive),
+                                    _KeepAliveHandler(), server_sock,
+                                    ("127.0.0.1", 12345)))
+    thread.start()
+    try:
+      return _SendRequests(client_sock, bodies)
+    finally:
+      client_sock.close()
+      thread.join()
+
+  def test(self):
+    self.assertEqual(self._Run(True, ["a", "b", "c"]),
+                     [("keep-alive", "A"), ("keep-alive", "B"),
+                      ("keep-alive", "C")])
+
+  def testDisabled(self):
+    self.assertEqual(self._Run(False, ["a", "b"]), [("close", "A")])
+
+  def testMaxRequests(self):
+    executor_cls = http.server.HttpServerRequestExecutor
+    max_requests = executor_cls.KEEP_ALIVE_MAX_REQUESTS
+    executor_cls.KEEP_ALIVE_MAX_REQUESTS = 2
+    try:
+      self.assertEqual(self._Run(True, ["a", "b", "c"]),
+                       [("keep-alive", "A"), ("close", "B")])
+    finally:
+      executor_cls.KEEP_ALIVE_MAX_REQUESTS = max_requests
+
+
+class _FakeMainloop(object):
+  def RegisterSignal(self, owner):
+    pass
+
+
+class TestServerWorkerThreads(unittest.TestCase):
+  def setUp(self):
+    self.server = http.server.HttpServer(_FakeMainloop(), "127.0.0.1", 0,
+                                         _KeepAliveHandler(), keep_alive=True,
+                                         worker_threads=2)
+    self.server.Start()
+    self.clients = []
+
+  def tearDown(self):
+    for client in self.clients:
+      client.close()
+    self.server.Stop()
+
+  def _Connect(self):
+    port = self.server.socket.getsockname()[1]
+    client = socket.create_connection(("127.0.0.1", port))
+    self.clients.append(client)
+    self.server.handle_accept()
+    return client
+
+  def test(self):
+    self.assertEqual(_SendRequests(self._Connect(), ["a", "b"]),
+                     [("keep-alive", "A"), ("keep-alive", "B")])
+
+  def testBusy(self):
+    first = self._Connect()
+    self.assertEqual(_SendRequests(first, ["a"]), [("keep-alive", "A")])
+
+    # While the first connection is kept open, there are not enough idle
+    # threads left for the second one to be kept open as well
+    self.assertEqual(_SendRequests(self._Connect(), ["b", "c"]),
+                     [("close", "B")])
+    self.assertEqual(_SendRequests(first, ["d"]), [("keep-alive", "D")])
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
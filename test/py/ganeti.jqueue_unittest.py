@@ -39,6 +39,7 @@ import errno
 import itertools
 import random
 import operator
+import time
 
 try:
   # pylint: disable=E0611
@@ -54,6 +55,7 @@ from ganeti import opcodes
 from ganeti import compat
 from ganeti import mcpu
 from ganeti import query
+from ganeti import serializer
 from ganeti import workerpool
 
 import testutils
@@ -186,6 +188,20 @@ class TestQueuedJob(unittest.TestCase):
     newjob2 = jqueue._QueuedJob.Restore(None, newjob.Serialize(), True, False)
     self.assertFalse(newjob2.archived)
 
+  def testReplication(self):
+    job = jqueue._QueuedJob(None, 1, [opcodes.OpTestDelay()], True)
+    self.assertTrue(job.replication is None)
+
+    job.replication = {"batches": 3, "max_lag": 0.25}
+    newjob = jqueue._QueuedJob.Restore(None, job.Serialize(), True, False)
+    self.assertEqual(newjob.replication, {"batches": 3, "max_lag": 0.25})
+
+    # Jobs written by older versions don't have the counters
+    state = job.Serialize()
+    del state["replication"]
+    newjob = jqueue._QueuedJob.Restore(None, state, True, False)
+    self.assertTrue(newjob.replication is None)
+
   def testPriority(self):
     job_id = 4283
     ops = [
@@ -462,6 +478,212 @@ class TestQueuedJob(unittest.TestCase):
         self.assertEqual(job.CalcStatus(), status)
 
 
+class TestJobJournal(unittest.TestCase):
+  def setUp(self):
+    self.job = jqueue._QueuedJob(None, 4931,
+                                 [opcodes.OpTestDelay(), opcodes.OpTagsGet()],
+                                 True)
+    self.base = serializer.DumpJson(self.job.Serialize())
+
+  def _Replay(self, journal_data, base=None):
+    if base is None:
+      base = self.base
+    state = jqueue._ApplyJobJournal(serializer.LoadJson(self.base), base,
+                                    journal_data)
+    return jqueue._QueuedJob.Restore(None, state, True, False)
+
+  def _CheckEqual(self, job):
+    self.assertEqual(serializer.DumpJson(job.Serialize()),
+                     serializer.DumpJson(self.job.Serialize()))
+
+  def testNoChanges(self):
+    journal = jqueue._JobJournal(self.job, self.base, True)
+    self.assertTrue(journal.Update(self.job) is None)
+    self.assertEqual(journal.entries, 0)
+    self.assertEqual(journal.pending, [])
+    self._CheckEqual(self._Replay(""))
+    self._CheckEqual(self._Replay(journal.header))
+
+  def testReplay(self):
+    job = self.job
+    journal = jqueue._JobJournal(job, self.base, True)
+
+    job.start_timestamp = jqueue.TimeStampNow()
+    job.ops[0].status = constants.OP_STATUS_RUNNING
+    data = [journal.Update(job)]
+
+    for i in range(10):
+      job.log_serial += 1
+      job.ops[0].log.append((job.log_serial, jqueue.TimeStampNow(),
+                             constants.ELOG_MESSAGE, "message %s" % i))
+      data.append(journal.Update(job))
+
+    job.ops[0].status = constants.OP_STATUS_SUCCESS
+    job.ops[0].result = {"some": ["result"]}
+    job.ops[1].status = constants.OP_STATUS_WAITING
+    job.ops[1].priority -= 1
+    data.append(journal.Update(job))
+    self.assertTrue(journal.Update(job) is None)
+
+    self.assertEqual(journal.entries, len(data))
+    self.assertEqual(journal.pending, data)
+
+    # Every entry only contains the new log message
+    for entry in data[1:-1]:
+      self.assertEqual(entry.count("message "), 1)
+
+    journal_data = journal.header + "".join(data)
+    self.assertEqual(len(journal_data.splitlines()), len(data) + 1)
+    replayed = self._Replay(journal_data)
+    self._CheckEqual(replayed)
+    self.assertEqual(replayed.log_serial, 10)
+    self.assertEqual(replayed.CalcStatus(), constants.JOB_STATUS_WAITING)
+
+    # An incomplete last entry is ignored
+    replayed = self._Replay(journal_data[:-10])
+    self.assertEqual(replayed.CalcStatus(), constants.JOB_STATUS_RUNNING)
+    self.assertEqual(replayed.ops[1].priority, constants.OP_PRIO_DEFAULT)
+    self.assertEqual(len(replayed.ops[0].log), 10)
+
+  def testStaleJournal(self):
+    journal = jqueue._JobJournal(self.job, self.base, True)
+    self.job.ops[0].status = constants.OP_STATUS_RUNNING
+    journal_data = journal.header + journal.Update(self.job)
+
+    replayed = self._Replay(journal_data, base=self.base + " ")
+    self.assertEqual(replayed.ops[0].status, constants.OP_STATUS_QUEUED)
+
+  def testNoHeader(self):
+    # Appended to a journal which was removed in the meantime
+    journal = jqueue._JobJournal(self.job, self.base, True)
+    self.job.ops[0].status = constants.OP_STATUS_RUNNING
+    journal_data = journal.Update(self.job)
+
+    replayed = self._Replay(journal_data)
+    self.assertEqual(replayed.ops[0].status, constants.OP_STATUS_QUEUED)
+
+  def testNotReplicated(self):
+    journal = jqueue._JobJournal(self.job, self.base, False)
+    self.job.ops[0].status = constants.OP_STATUS_RUNNING
+    self.assertTrue(journal.Update(self.job))
+    self.assertEqual(journal.entries, 1)
+    self.assertEqual(journal.pending, [])
+
+
+class TestCoalesceReplication(unittest.TestCase):
+  def test(self):
+    fn = jqueue._CoalesceReplication
+    for old in [(constants.JQ_REPL_UPDATE, "a"),
+                (constants.JQ_REPL_APPEND, "a"),
+                (constants.JQ_REPL_REMOVE, None)]:
+      self.assertEqual(fn(old, (constants.JQ_REPL_UPDATE, "b")),
+                       (constants.JQ_REPL_UPDATE, "b"))
+      self.assertEqual(fn(old, (constants.JQ_REPL_REMOVE, None)),
+                       (constants.JQ_REPL_REMOVE, None))
+
+    self.assertEqual(fn((constants.JQ_REPL_UPDATE, "a"),
+                        (constants.JQ_REPL_APPEND, "b")),
+                     (constants.JQ_REPL_UPDATE, "ab"))
+    self.assertEqual(fn((constants.JQ_REPL_APPEND, "a"),
+                        (constants.JQ_REPL_APPEND, "b")),
+                     (constants.JQ_REPL_APPEND, "ab"))
+    self.assertEqual(fn((constants.JQ_REPL_REMOVE, None),
+                        (constants.JQ_REPL_APPEND, "b")),
+                     (constants.JQ_REPL_UPDATE, "b"))
+
+
+class TestJobQueueReplicator(unittest.TestCase):
+  def setUp(self):
+    self.batches = []
+    self.now = 100.0
+
+  def _Send(self, updates):
+    self.batches.append(updates)
+
+  def _Time(self):
+    return self.now
+
+  def testFlush(self):
+    repl = jqueue._JobQueueReplicator(self._Send, delay=3600,
+                                      _time_fn=self._Time)
+    repl.Flush()
+    self.assertEqual(self.batches, [])
+
+    repl.Add(constants.JQ_REPL_UPDATE, "/queue/job-1", "x")
+    self.now += 1
+    repl.Add(constants.JQ_REPL_UPDATE, "/queue/job-2", "y")
+    repl.Add(constants.JQ_REPL_APPEND, "/queue/job-1.journal", "1")
+    repl.Add(constants.JQ_REPL_APPEND, "/queue/job-1.journal", "2")
+    repl.Add(constants.JQ_REPL_UPDATE, "/queue/job-1", "z")
+    repl.Add(constants.JQ_REPL_REMOVE, "/queue/job-2")
+    self.now += 1
+    repl.Flush()
+
+    self.assertEqual(self.batches, [[
+      (constants.JQ_REPL_UPDATE, "/queue/job-1", "z"),
+      (constants.JQ_REPL_REMOVE, "/queue/job-2", None),
+      (constants.JQ_REPL_APPEND, "/queue/job-1.journal", "12"),
+      ]])
+
+    repl.Flush()
+    self.assertEqual(len(self.batches), 1)
+
+    stats = repl.GetStatistics()
+    self.assertEqual(stats["changes"], 6)
+    self.assertEqual(stats["coalesced"], 3)
+    self.assertEqual(stats["batches"], 1)
+    self.assertEqual(stats["files"], 3)
+    self.assertEqual(stats["max_batch_size"], 3)
+    self.assertEqual(stats["total_lag"], 4.0)
+    self.assertEqual(stats["max_lag"], 2.0)
+
+    repl.Stop()
+
+  def testLogStatistics(self):
+    logged = []
+
+    class _Replicator(jqueue._JobQueueReplicator):
+      @staticmethod
+      def _LogStatistics(stats):
+        logged.append(stats)
+
+    repl = _Replicator(self._Send, delay=3600, stats_interval=60,
+                       _time_fn=self._Time)
+    repl.Add(constants.JQ_REPL_UPDATE, "/queue/job-1", "x")
+    repl.Flush()
+    self.assertEqual(logged, [])
+
+    # the counters are logged once the interval has passed
+    self.now += 60
+    repl.Add(constants.JQ_REPL_UPDATE, "/queue/job-1", "y")
+    repl.Flush()
+    self.assertEqual(len(logged), 1)
+    self.assertEqual(logged[0]["batches"], 2)
+
+    self.now += 30
+    repl.Add(constants.JQ_REPL_UPDATE, "/queue/job-1", "z")
+    repl.Flush()
+    self.assertEqual(len(logged), 1)
+
+    repl.Stop()
+
+  def testBackground(self):
+    repl = jqueue._JobQueueReplicator(self._Send, delay=0.01)
+    repl.Add(constants.JQ_REPL_UPDATE, "/queue/job-1", "x")
+    for _ in range(500):
+      if self.batches:
+        break
+      time.sleep(0.01)
+    self.assertEqual(self.batches,
+                     [[(constants.JQ_REPL_UPDATE, "/queue/job-1", "x")]])
+
+    repl.Stop()
+    repl.Add(constants.JQ_REPL_APPEND, "/queue/job-1", "y")
+    repl.Flush()
+    self.assertEqual(self.batches[1:],
+                     [[(constants.JQ_REPL_APPEND, "/queue/job-1", "y")]])
+
+
 class _FakeDependencyManager:
   def __init__(self):
     self._checks = []
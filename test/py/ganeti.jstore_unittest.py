@@ -30,15 +30,21 @@
 
 """Script for testing ganeti.jstore"""
 
+import os
 import re
+import shutil
+import tempfile
 import unittest
 import random
+import zlib
 
 from ganeti import constants
 from ganeti import utils
 from ganeti import compat
 from ganeti import errors
 from ganeti import jstore
+from ganeti import opcodes
+from ganeti import serializer
 
 import testutils
 
@@ -106,5 +112,135 @@ class TestReadNumericFile(testutils.GanetiTestCase):
     self.assertRaises(errors.JobQueueError, jstore._ReadNumericFile, tmpfile)
 
 
+class TestCalcJobStatus(unittest.TestCase):
+  def test(self):
+    tests = [
+      ([], constants.JOB_STATUS_SUCCESS),
+      ([constants.OP_STATUS_QUEUED], constants.JOB_STATUS_QUEUED),
+      ([constants.OP_STATUS_SUCCESS, constants.OP_STATUS_SUCCESS],
+       constants.JOB_STATUS_SUCCESS),
+      ([constants.OP_STATUS_SUCCESS, constants.OP_STATUS_RUNNING,
+        constants.OP_STATUS_QUEUED], constants.JOB_STATUS_RUNNING),
+      ([constants.OP_STATUS_WAITING, constants.OP_STATUS_QUEUED],
+       constants.JOB_STATUS_WAITING),
+      ([constants.OP_STATUS_SUCCESS, constants.OP_STATUS_ERROR,
+        constants.OP_STATUS_ERROR], constants.JOB_STATUS_ERROR),
+      ([constants.OP_STATUS_CANCELING, constants.OP_STATUS_CANCELING],
+       constants.JOB_STATUS_CANCELING),
+      ([constants.OP_STATUS_CANCELED, constants.OP_STATUS_CANCELED],
+       constants.JOB_STATUS_CANCELED),
+      ]
+
+    for (op_statuses, exp) in tests:
+      self.assertEqual(jstore.CalcJobStatus(op_statuses), exp)
+
+
+class TestPackArchive(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.archive_dir = utils.PathJoin(self.tmpdir, "1")
+    os.mkdir(self.archive_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _WriteJob(self, job_id, status):
+    op = opcodes.OpTestDelay(duration=job_id % 7)
+    data = serializer.DumpJson({
+      "id": job_id,
+      "received_timestamp": [job_id, 1],
+      "start_timestamp": [job_id, 2],
+      "end_timestamp": [job_id, 3],
+      "ops": [{
+        "input": op.__getstate__(),
+        "status": status,
+        "result": None,
+        "log": [],
+        }],
+      })
+    utils.WriteFile(utils.PathJoin(self.archive_dir, "job-%s" % job_id),
+                    data=data)
+    return (data, op.Summary())
+
+  def test(self):
+    job1 = self._WriteJob(10003, constants.OP_STATUS_SUCCESS)
+    job2 = self._WriteJob(19999, constants.OP_STATUS_ERROR)
+    utils.WriteFile(utils.PathJoin(self.archive_dir, "job-10005"),
+                    data="{broken")
+
+    self.assertEqual(jstore.PackArchiveDirectory(self.archive_dir), 2)
+    self.assertEqual(sorted(os.listdir(self.archive_dir)),
+                     ["job-10005", jstore.PACKED_SEGMENT_FILE,
+                      jstore.PACKED_INDEX_FILE, jstore.PACKED_OFFSETS_FILE])
+
+    self.assertEqual(jstore.ReadPackedJob(10003, archive_dir=self.tmpdir),
+                     job1[0])
+    self.assertEqual(jstore.ReadPackedJob(19999, archive_dir=self.tmpdir),
+                     job2[0])
+    for job_id in [10000, 10004, 10005, 20003, 3]:
+      self.assertTrue(jstore.ReadPackedJob(job_id,
+                                           archive_dir=self.tmpdir) is None)
+
+    len1 = len(zlib.compress(job1[0]))
+    len2 = len(zlib.compress(job2[0]))
+    self.assertEqual(jstore.ReadPackedIndex(self.archive_dir), [
+      [10003, jstore.PACKED_SEGMENT_FILE, 0, len1,
+       constants.JOB_STATUS_SUCCESS, [10003, 1], [10003, 2], [10003, 3],
+       [job1[1]]],
+      [19999, jstore.PACKED_SEGMENT_FILE, len1, len2,
+       constants.JOB_STATUS_ERROR, [19999, 1], [19999, 2], [19999, 3],
+       [job2[1]]],
+      ])
+
+    # Packing more jobs appends to the existing files
+    job3 = self._WriteJob(10004, constants.OP_STATUS_CANCELED)
+    self.assertEqual(jstore.PackArchiveDirectory(self.archive_dir), 1)
+    self.assertEqual(jstore.ReadPackedJob(10004, archive_dir=self.tmpdir),
+                     job3[0])
+    self.assertEqual(jstore.ReadPackedJob(10003, archive_dir=self.tmpdir),
+                     job1[0])
+    self.assertEqual([entry[:4] for entry in
+                      jstore.ReadPackedIndex(self.archive_dir)], [
+      [10003, jstore.PACKED_SEGMENT_FILE, 0, len1],
+      [19999, jstore.PACKED_SEGMENT_FILE, len1, len2],
+      [10004, jstore.PACKED_SEGMENT_FILE, len1 + len2,
+       len(zlib.compress(job3[0]))],
+      ])
+
+  def testInterrupted(self):
+    job1 = self._WriteJob(10001, constants.OP_STATUS_SUCCESS)
+    self.assertEqual(jstore.PackArchiveDirectory(self.archive_dir), 1)
+
+    # The job file is left over and an index entry was cut short
+    self._WriteJob(10001, constants.OP_STATUS_SUCCESS)
+    utils.AppendFile(utils.PathJoin(self.archive_dir,
+                                    jstore.PACKED_INDEX_FILE),
+                     "[10002, ")
+
+    self.assertEqual(jstore.PackArchiveDirectory(self.archive_dir), 0)
+    self.assertFalse(os.path.exists(utils.PathJoin(self.archive_dir,
+                                                   "job-10001")))
+    self.assertEqual(jstore.ReadPackedJob(10001, archive_dir=self.tmpdir),
+                     job1[0])
+    self.assertEqual([entry[0] for entry in
+                      jstore.ReadPackedIndex(self.archive_dir)], [10001])
+
+    # The incomplete entry is dropped before appending
+    job2 = self._WriteJob(10002, constants.OP_STATUS_SUCCESS)
+    self.assertEqual(jstore.PackArchiveDirectory(self.archive_dir), 1)
+    self.assertEqual(jstore.ReadPackedJob(10002, archive_dir=self.tmpdir),
+                     job2[0])
+    self.assertEqual([entry[0] for entry in
+                      jstore.ReadPackedIndex(self.archive_dir)],
+                     [10001, 10002])
+
+  def testEmpty(self):
+    self.assertEqual(jstore.PackArchiveDirectory(self.archive_dir), 0)
+    self.assertEqual(os.listdir(self.archive_dir), [])
+    self.assertEqual(jstore.ReadPackedIndex(self.archive_dir), [])
+    self.assertTrue(jstore.ReadPackedJob(10000,
+                                         archive_dir=self.tmpdir) is None)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
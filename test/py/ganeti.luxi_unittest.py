@@ -30,7 +30,7 @@
 
 """Script for unittesting the luxi module.
 
-Currently empty (after all the tests moved to ganeti.rpc.client_unittest.py)."""
+The tests of the protocol itself are in ganeti.rpc.client_unittest.py."""
 
 
 import unittest
@@ -40,4 +40,88 @@ from ganeti import errors
 from ganeti import luxi
 from ganeti import serializer
 
+from ganeti.rpc import client as rpccl
+
 import testutils
+
+
+class _FakeStreamTransport(object):
+  """Transport answering a request with a sequence of responses.
+
+  """
+  def __init__(self, address, timeouts=None):
+    self.requests = []
+    self.responses = []
+    self.closed = False
+
+  def Send(self, msg):
+    self.requests.append(msg)
+
+  def Recv(self):
+    return self.responses.pop(0)
+
+  def Close(self):
+    self.closed = True
+
+
+class TestWatchJob(unittest.TestCase):
+  def setUp(self):
+    self.client = luxi.Client(address="/fake/luxi.sock",
+                              transport=_FakeStreamTransport)
+    self.transport = self.client.transport
+    self.updates = [
+      constants.JOB_NOTCHANGED,
+      [[constants.JOB_STATUS_RUNNING], [[1, [1273491611, 0],
+                                         constants.ELOG_MESSAGE, "Step 1"]]],
+      [[constants.JOB_STATUS_SUCCESS], []],
+      ]
+    for (idx, update) in enumerate(self.updates):
+      finished = idx == len(self.updates) - 1
+      self.transport.responses.append(
+        rpccl.FormatResponse(True, (update, finished),
+                             version=constants.LUXI_VERSION))
+
+  def test(self):
+    result = list(self.client.WatchJob("26591", ["status"], None, None))
+    self.assertEqual(result, self.updates)
+
+    # A single request was sent for the whole stream
+    self.assertEqual(len(self.transport.requests), 1)
+    (method, args, version) = rpccl.ParseRequest(self.transport.requests[0])
+    self.assertEqual(method, luxi.REQ_WATCH_JOB)
+    self.assertEqual(args, [26591, ["status"], None, None])
+    self.assertEqual(version, constants.LUXI_VERSION)
+
+    # The connection can be used for further requests
+    self.assertFalse(self.transport.closed)
+    self.assertTrue(self.client.transport is self.transport)
+
+  def testAbandoned(self):
+    stream = self.client.WatchJob(4420, ["status"], None, None)
+    self.assertEqual(stream.next(), constants.JOB_NOTCHANGED)
+    stream.close()
+
+    # The remaining responses must not be read as answers to other requests
+    self.assertTrue(self.transport.closed)
+    self.assertTrue(self.client.transport is None)
+
+  def testError(self):
+    del self.transport.responses[1:]
+    self.transport.responses.append(
+      rpccl.FormatResponse(False,
+                           errors.EncodeException(errors.JobLost("gone")),
+                           version=constants.LUXI_VERSION))
+
+    stream = self.client.WatchJob(4420, ["status"], None, None)
+    self.assertEqual(stream.next(), constants.JOB_NOTCHANGED)
+    self.assertRaises(errors.JobLost, stream.next)
+    self.assertTrue(self.transport.closed)
+
+  def testInvalidJobId(self):
+    stream = self.client.WatchJob("x", ["status"], None, None)
+    self.assertRaises(luxi.RequestError, stream.next)
+    self.assertFalse(self.transport.requests)
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
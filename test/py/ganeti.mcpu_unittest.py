@@ -33,6 +33,8 @@
 
 import unittest
 import itertools
+import threading
+import time
 
 from ganeti import compat
 from ganeti import mcpu
@@ -287,5 +289,112 @@ class TestVerifyLocks(unittest.TestCase):
       mcpu._VerifyLocks(lu, _mode_whitelist=[], _nal_whitelist=[])
 
 
+class _FakeConfig:
+  def OutDate(self):
+    pass
+
+  def SetLockPriorityFn(self, _fn):
+    pass
+
+
+class _FakeContext:
+  def GetConfig(self, _):
+    return _FakeConfig()
+
+  def GetRpc(self, _):
+    return None
+
+  def GetWConfdContext(self, ec_id):
+    return ec_id
+
+
+class _FakeWConfd:
+  """Fake lock manager, granting one exclusive lock in request order.
+
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.owner = None
+    self.waiting = []
+    self.clients = 0
+
+  def GetClient(self):
+    self.clients += 1
+    return self
+
+  def UpdateLocksWaiting(self, wconfdcontext, _, request):
+    assert len(request) == 1
+    with self._lock:
+      if self.owner is None:
+        self.owner = wconfdcontext
+      else:
+        self.waiting.append(wconfdcontext)
+
+  def HasPendingRequest(self, wconfdcontext):
+    with self._lock:
+      return wconfdcontext in self.waiting
+
+  def Release(self, wconfdcontext):
+    with self._lock:
+      assert self.owner == wconfdcontext
+      if self.waiting:
+        self.owner = self.waiting.pop(0)
+      else:
+        self.owner = None
+    # WConfD sends SIGHUP to the job process, whose handler does this
+    mcpu.NotifyLockWaiters()
+
+
+class TestLockHandoff(unittest.TestCase):
+  """Measures the time it takes a waiting job to get a released lock.
+
+  """
+  def _Acquire(self, proc):
+    return proc._AcquireLocks(locking.LEVEL_INSTANCE, ["inst1.example.com"],
+                              False, False, None)
+
+  def test(self):
+    wconfd = _FakeWConfd()
+    (proc1, proc2) = [mcpu.Processor(_FakeContext(), "job%s" % i)
+                      for i in [1, 2]]
+    proc1.wconfd = wconfd
+    proc2.wconfd = wconfd
+
+    self._Acquire(proc1)
+    self.assertEqual(wconfd.owner, "job1")
+
+    acquired = []
+
+    def _Wait():
+      self._Acquire(proc2)
+      acquired.append(time.time())
+
+    thread = threading.Thread(target=_Wait)
+    thread.start()
+    try:
+      for _ in range(1000):
+        if wconfd.waiting:
+          break
+        time.sleep(0.01)
+      self.assertEqual(wconfd.waiting, ["job2"])
+
+      # Let the second job block
+      time.sleep(0.1)
+      self.assertFalse(acquired)
+
+      released = time.time()
+      wconfd.Release("job1")
+    finally:
+      thread.join(60.0)
+
+    self.assertEqual(wconfd.owner, "job2")
+    self.assertEqual(len(acquired), 1)
+    # Without notifications, this could take up to 10 seconds
+    self.assertTrue(acquired[0] - released < 1.0,
+                    msg="Lock handoff took %.3fs" % (acquired[0] - released))
+    # The client is looked up once per lock acquisition
+    self.assertEqual(wconfd.clients, 2)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -62,6 +62,112 @@ class TestDictState(unittest.TestCase):
     self.assertEquals(o1.ToDict(), {"a": 2, "b": 5})
 
 
+class TestCopyAndEquality(unittest.TestCase):
+  def _MakeInstance(self):
+    return objects.Instance(name="inst1.example.com", uuid="inst1-uuid",
+                            hvparams={"a": [1, 2]}, beparams={},
+                            tags=set(["tag1"]),
+                            nics=[objects.NIC(mac="aa:00:00:00:00:01",
+                                              nicparams={"mode": "bridged"})],
+                            disks=["disk1-uuid"],
+                            osparams_private=serializer.PrivateDict({"x": 1}))
+
+  def testSimpleObject(self):
+    o1 = SimpleObject(a=1)
+    o2 = o1.Copy()
+    self.assertEqual(o1, o2)
+    self.assertFalse(o1 != o2)
+    self.assertEqual(o2.ToDict(), {"a": 1})
+    self.assertEqual(SimpleObject(a=1, b=None), o1)
+    o2.b = 2
+    self.assertNotEqual(o1, o2)
+    self.assertFalse(o1 == o2)
+    self.assertNotEqual(o1, o1.ToDict())
+
+  def testDeepCopy(self):
+    inst = self._MakeInstance()
+    clone = inst.Copy()
+    self.assertEqual(inst, clone)
+    self.assertEqual(inst.ToDict(), clone.ToDict())
+    self.assertTrue(isinstance(clone.nics[0], objects.NIC))
+    self.assertTrue(isinstance(clone.osparams_private, serializer.PrivateDict))
+    self.assertEqual(clone.osparams_private.GetPrivate("x"), 1)
+
+    clone.hvparams["a"].append(3)
+    clone.nics[0].nicparams["mode"] = "routed"
+    clone.tags.add("tag2")
+    self.assertEqual(inst.hvparams, {"a": [1, 2]})
+    self.assertEqual(inst.nics[0].nicparams, {"mode": "bridged"})
+    self.assertEqual(inst.tags, set(["tag1"]))
+    self.assertNotEqual(inst, clone)
+
+  def testNestedEquality(self):
+    inst = self._MakeInstance()
+    clone = inst.Copy()
+    clone.nics[0].mac = "aa:00:00:00:00:02"
+    self.assertNotEqual(inst, clone)
+    self.assertEqual(inst.ToDict() == clone.ToDict(), inst == clone)
+
+  def testVolatileSlots(self):
+    group = objects.NodeGroup(name="group1", members=["node1"])
+    clone = group.Copy()
+    self.assertEqual(clone.members, ["node1"])
+    clone.members = []
+    self.assertEqual(group, clone)
+
+    disk = objects.Disk(dev_type=constants.DT_PLAIN, size=128,
+                        children=[objects.Disk(size=128)])
+    clone = disk.Copy()
+    clone.dynamic_params = {"foo": "bar"}
+    self.assertEqual(disk, clone)
+    clone.children[0].size = 256
+    self.assertNotEqual(disk, clone)
+    self.assertEqual(disk.children[0].size, 128)
+
+
+class TestLazyConfigData(unittest.TestCase):
+  def _MakeConfigDict(self):
+    inst = objects.Instance(name="inst1.example.com", uuid="inst1-uuid",
+                            hvparams={}, beparams={}, nics=[],
+                            disks=["disk1-uuid"],
+                            osparams_private=serializer.PrivateDict())
+    disk = objects.Disk(uuid="disk1-uuid", dev_type=constants.DT_PLAIN,
+                        size=128, logical_id=("xenvg", "disk1"))
+    data = objects.ConfigData(version=constants.CONFIG_VERSION,
+                              cluster=objects.Cluster(
+                                tcpudp_port_pool=set(),
+                                enabled_disk_templates=[constants.DT_PLAIN]),
+                              nodes={}, nodegroups={}, networks={},
+                              instances={inst.uuid: inst},
+                              disks={disk.uuid: disk})
+    return data.ToDict()
+
+  def testFromDict(self):
+    eager = objects.ConfigData.FromDict(self._MakeConfigDict())
+    lazy = objects.ConfigData.FromDict(self._MakeConfigDict(), lazy=True)
+    self.assertFalse(lazy.instances.IsLoaded("inst1-uuid"))
+    self.assertEqual(lazy.instances.GetAttribute("inst1-uuid", "name"),
+                     "inst1.example.com")
+    self.assertFalse(lazy.instances.IsLoaded("inst1-uuid"))
+
+    self.assertEqual(eager, lazy)
+    self.assertTrue(isinstance(lazy.instances["inst1-uuid"], objects.Instance))
+    self.assertEqual(lazy.ToDict(), eager.ToDict())
+
+  def testUpgradeAndCopy(self):
+    lazy = objects.ConfigData.FromDict(self._MakeConfigDict(), lazy=True)
+    clone = lazy.Copy()
+    self.assertEqual(lazy, clone)
+    self.assertFalse(clone.disks.IsLoaded("disk1-uuid"))
+
+    lazy.UpgradeConfig()
+    self.assertFalse(lazy.instances.IsLoaded("inst1-uuid"))
+    self.assertEqual(lazy.instances["inst1-uuid"].admin_state_source,
+                     constants.ADMIN_SOURCE)
+    self.assertTrue(clone.instances["inst1-uuid"].admin_state_source is None)
+    self.assertNotEqual(lazy, clone)
+
+
 class TestClusterObject(unittest.TestCase):
   """Tests done on a L{objects.Cluster}"""
 
@@ -284,6 +390,68 @@ class TestClusterObject(unittest.TestCase):
     self.assertEqual(set([instance1.disk_template]),
                      set(cfg.cluster.ipolicy[constants.IPOLICY_DTS]))
 
+  def testFilledViews(self):
+    cl = self.fake_cl
+    cl.uuid = "cluster-uuid"
+    cl.serial_no = 1
+    inst = objects.Instance(name="foobar", os="lenny-image",
+                            hypervisor=constants.HT_FAKE,
+                            hvparams={"blah": "blubb"},
+                            beparams={constants.BE_VCPUS: 2},
+                            osparams={})
+    node = objects.Node(name="node1", ndparams={})
+    group = objects.NodeGroup(name="group1",
+                              ndparams={constants.ND_SPINDLE_COUNT: 4})
+
+    hvp = cl.FillHVView(inst)
+    self.assertEqual(hvp, cl.FillHV(inst))
+    self.assertEqual(cl.FillHVView(inst, skip_globals=True),
+                     cl.FillHV(inst, skip_globals=True))
+    self.assertEqual(cl.FillBEView(inst), cl.FillBE(inst))
+    self.assertEqual(cl.FillOSView(inst),
+                     cl.SimpleFillOS(inst.os, inst.osparams))
+    self.assertEqual(cl.FillNDView(node, group), cl.FillND(node, group))
+
+    # Views are read-only and shared as long as nothing changes
+    self.assertRaises(TypeError, hvp.__setitem__, "blah", "x")
+    self.assertRaises(TypeError, hvp.update, {})
+    self.assertTrue(cl.FillHVView(inst) is hvp)
+    self.assertTrue(cl.FillHVView(inst.Copy()) is hvp)
+
+    # Changes to the instance are picked up even without a new serial
+    inst.hvparams["blah"] = "other"
+    self.assertEqual(cl.FillHVView(inst)["blah"], "other")
+    group.ndparams[constants.ND_SPINDLE_COUNT] = 8
+    self.assertEqual(cl.FillNDView(node, group)[constants.ND_SPINDLE_COUNT], 8)
+
+    # Changes to the cluster need a new serial
+    cl.hvparams[constants.HT_FAKE]["foo"] = "new"
+    cl.serial_no += 1
+    self.assertEqual(cl.FillHVView(inst)["foo"], "new")
+
+    # ... or the cached views to be dropped
+    cl.hvparams[constants.HT_FAKE]["foo"] = "newer"
+    self.assertEqual(cl.FillHVView(inst)["foo"], "new")
+    objects.ForgetFilledViews()
+    self.assertEqual(cl.FillHVView(inst)["foo"], "newer")
+
+  def testFilledViewsUncached(self):
+    cl = self.fake_cl
+    inst = objects.Instance(name="foobar", os="lenny-image",
+                            hypervisor=constants.HT_FAKE, hvparams={})
+    self.assertTrue(cl.uuid is None)
+    first = cl.FillHVView(inst)
+    self.assertEqual(first, cl.FillHV(inst))
+    self.assertFalse(cl.FillHVView(inst) is first)
+
+    # Unhashable parameter values disable caching
+    cl.uuid = "cluster-uuid"
+    cl.serial_no = 1
+    inst.hvparams = {"list": [1, 2]}
+    first = cl.FillHVView(inst)
+    self.assertEqual(first["list"], [1, 2])
+    self.assertFalse(cl.FillHVView(inst) is first)
+
 
 class TestClusterObjectTcpUdpPortPool(unittest.TestCase):
   def testNewCluster(self):
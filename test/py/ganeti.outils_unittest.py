@@ -112,5 +112,95 @@ class TestContainerFromDicts(unittest.TestCase):
                        cls())
 
 
+class _Loaded(object):
+  def __init__(self, value):
+    self.value = value
+    self.upgraded = 0
+
+  def __eq__(self, other):
+    return (self.value, self.upgraded) == (other.value, other.upgraded)
+
+  @classmethod
+  def FromDict(cls, value):
+    return cls(value)
+
+  def ToDict(self):
+    return self.value
+
+  def Copy(self):
+    other = _Loaded(dict(self.value))
+    other.upgraded = self.upgraded
+    return other
+
+
+def _Upgrade(obj):
+  obj.upgraded += 1
+
+
+class TestLazyObjectDict(unittest.TestCase):
+  def setUp(self):
+    self.source = {
+      "a": {"name": "a", "list": [1, 2]},
+      "b": {"name": "b"},
+      }
+    self.lazy = outils.LazyObjectDict(self.source, _Loaded.FromDict)
+
+  def testLoadOnAccess(self):
+    lazy = self.lazy
+    self.assertEqual(len(lazy), 2)
+    self.assertEqual(sorted(lazy), ["a", "b"])
+    self.assertTrue("a" in lazy)
+    self.assertFalse("c" in lazy)
+    self.assertEqual(lazy.GetAttribute("a", "name"), "a")
+    self.assertFalse(lazy.IsLoaded("a"))
+
+    self.assertEqual(lazy["a"].value["name"], "a")
+    self.assertTrue(lazy.IsLoaded("a"))
+    self.assertFalse(lazy.IsLoaded("b"))
+    self.assertTrue(lazy.get("c") is None)
+    self.assertRaises(KeyError, lambda: lazy["c"])
+
+    # the source isn't modified through the converted objects
+    lazy["a"].value["list"].append(3)
+    self.assertEqual(self.source["a"]["list"], [1, 2])
+
+  def testModifications(self):
+    lazy = self.lazy
+    lazy["c"] = _Loaded({"name": "c"})
+    del lazy["b"]
+    self.assertEqual(sorted(lazy.keys()), ["a", "c"])
+    self.assertEqual(lazy.pop("a").value["name"], "a")
+    self.assertTrue(lazy.pop("a", None) is None)
+    self.assertRaises(KeyError, lazy.__delitem__, "b")
+    self.assertEqual(outils.ContainerToDicts(lazy), {"c": {"name": "c"}})
+    lazy.clear()
+    self.assertEqual(len(lazy), 0)
+
+  def testApplyToAll(self):
+    lazy = self.lazy
+    self.assertEqual(lazy["a"].upgraded, 0)
+    lazy.ApplyToAll(_Upgrade)
+    self.assertEqual(lazy["a"].upgraded, 1)
+    self.assertEqual(lazy["b"].upgraded, 1)
+    self.assertEqual(lazy["b"].upgraded, 1)
+
+  def testCopyAndEquality(self):
+    lazy = self.lazy
+    lazy["a"].value["name"] = "x"
+    other = lazy.Copy(lambda obj: obj.Copy())
+    self.assertFalse(other.IsLoaded("b"))
+    self.assertEqual(lazy, other)
+    self.assertFalse(other.IsLoaded("b"))
+
+    other["a"].value["name"] = "y"
+    self.assertEqual(lazy["a"].value["name"], "x")
+    self.assertNotEqual(lazy, other)
+
+    other = lazy.Copy(lambda obj: obj.Copy())
+    other.ApplyToAll(_Upgrade)
+    self.assertNotEqual(lazy, other)
+    self.assertEqual(lazy, dict(lazy.items()))
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
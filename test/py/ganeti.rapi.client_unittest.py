@@ -1518,6 +1518,46 @@ class GanetiRapiClientTests(testutils.GanetiTestCase):
 
         self.assertEqual(self.rapi.CountPending(), 0)
 
+  def testWaitForJobCompletionLongPoll(self):
+    for (success, end_status) in [(False, constants.JOB_STATUS_ERROR),
+                                  (True, constants.JOB_STATUS_SUCCESS)]:
+      self.rapi.AddResponse(serializer.DumpJson({
+        "job_info": [constants.JOB_STATUS_RUNNING],
+        "log_entries": [[4, [1, 0], "message", "Starting"]],
+        }))
+      self.rapi.AddResponse(serializer.DumpJson(None))
+      self.rapi.AddResponse(serializer.DumpJson({
+        "job_info": [end_status],
+        "log_entries": [],
+        }))
+
+      result = self.client.WaitForJobCompletion(9260, period=None,
+                                                long_poll=True)
+      self.assertEqual(result, success)
+      self.assertHandler(rlib2.R_2_jobs_id_wait)
+      self.assertItems(["9260"])
+      self.assertEqual(serializer.LoadJson(self.rapi.GetLastRequestData()), {
+        "fields": ["status"],
+        "previous_job_info": [constants.JOB_STATUS_RUNNING],
+        "previous_log_serial": 4,
+        })
+
+      self.assertEqual(self.rapi.CountPending(), 0)
+
+  def testWaitForJobCompletionLongPollForbidden(self):
+    self.rapi.AddResponse(None, code=403)
+    self.rapi.AddResponse(serializer.DumpJson({
+      "status": constants.JOB_STATUS_SUCCESS,
+      }))
+
+    self.assertTrue(self.client.WaitForJobCompletion(1862, period=None,
+                                                     retries=1,
+                                                     long_poll=True))
+    self.assertHandler(rlib2.R_2_jobs_id)
+    self.assertItems(["1862"])
+
+    self.assertEqual(self.rapi.CountPending(), 0)
+
 
 class RapiTestRunner(unittest.TextTestRunner):
   def run(self, *args):
@@ -35,6 +35,7 @@ import sys
 import unittest
 import random
 import tempfile
+import time
 
 from ganeti import constants
 from ganeti import compat
@@ -602,6 +603,87 @@ class TestRpcClientBase(unittest.TestCase):
         self.assertEqual(serializer.LoadJson(res.payload),
                          ["foo", hex(num), hash("Hello%s" % num)])
 
+  def _CallEncoding(self, kind, encoder, prep_fn=None):
+    resolver = rpc._StaticResolver([
+      "192.0.2.7",
+      "192.0.2.8",
+      "192.0.2.9",
+      ])
+
+    nodes = [
+      "node7.example.com",
+      "node8.example.com",
+      "node9.example.com",
+      ]
+
+    cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL, [
+      ("arg0", None, NotImplemented),
+      ("arg1", kind, NotImplemented),
+      ], prep_fn, None, NotImplemented)
+
+    bodies = []
+
+    def _VerifyRequest(req):
+      bodies.append(req.post_data)
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, req.post_data))
+
+    http_proc = _FakeRequestProcessor(_VerifyRequest)
+
+    rpc._encoding_stats.clear()
+    client = rpc._RpcClientBase(resolver, {kind: encoder}.get,
+                                _req_process_fn=http_proc)
+    result = client._Call(cdef, nodes, ["foo", "bar"])
+    self.assertEqual(len(result), len(nodes))
+    self.assertEqual(http_proc.reqcount, len(nodes))
+    self.assertEqual(len(bodies), len(nodes))
+
+    return (result, bodies, rpc.GetEncodingStatistics()["test_call"])
+
+  def testSharedBody(self):
+    (result, bodies, stats) = \
+      self._CallEncoding(rpc_defs.ED_COMPRESS, lambda _, value: value.upper())
+
+    for res in result.values():
+      self.assertFalse(res.fail_msg)
+      self.assertEqual(serializer.LoadJson(res.payload), ["foo", "BAR"])
+
+    # The body is encoded only once and shared by all requests
+    self.assertTrue(compat.all(body is bodies[0] for body in bodies))
+    self.assertEqual(stats["calls"], 1)
+    self.assertEqual(stats["nodes"], 3)
+    self.assertEqual(stats["encoded"], 1)
+    self.assertEqual(stats["bytes_saved"], 2 * len(bodies[0]))
+    self.assertTrue(stats["total_time"] >= 0)
+
+  def testPerNodeBody(self):
+    (result, bodies, stats) = \
+      self._CallEncoding(rpc_defs.ED_INST_DICT,
+                         lambda node, value: "%s:%s" % (node, value))
+
+    for (node, res) in result.items():
+      self.assertFalse(res.fail_msg)
+      self.assertEqual(serializer.LoadJson(res.payload),
+                       ["foo", "%s:bar" % node])
+
+    self.assertEqual(len(set(bodies)), 3)
+    self.assertEqual(stats["nodes"], 3)
+    self.assertEqual(stats["encoded"], 3)
+    self.assertEqual(stats["bytes_saved"], 0)
+
+  def testPerNodeBodyWithPrepFn(self):
+    (result, _, stats) = \
+      self._CallEncoding(rpc_defs.ED_COMPRESS, lambda _, value: value,
+                         prep_fn=lambda node, args: args + [node])
+
+    for (node, res) in result.items():
+      self.assertFalse(res.fail_msg)
+      self.assertEqual(serializer.LoadJson(res.payload), ["foo", "bar", node])
+
+    self.assertEqual(stats["encoded"], 3)
+    self.assertEqual(stats["bytes_saved"], 0)
+
   def testPostProc(self):
     def _VerifyRequest(nums, req):
       req.success = True
@@ -720,6 +802,276 @@ class TestRpcClientBase(unittest.TestCase):
         self.assertFalse(res.fail_msg)
 
 
+class TestCallBatch(unittest.TestCase):
+  _NODE = "node40.example.com"
+
+  def _MakeClient(self, response_fn, encoders=None):
+    resolver = rpc._StaticResolver(["192.0.2.40"])
+    http_proc = _FakeRequestProcessor(response_fn)
+    client = rpc._RpcClientBase(resolver, (encoders or {}).get,
+                                _req_process_fn=http_proc)
+    return (client, http_proc)
+
+  @staticmethod
+  def _Respond(req, data, success=True):
+    req.success = success
+    if success:
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, data))
+    else:
+      req.error = data
+
+  def testBatch(self):
+    status = objects.BlockDevStatus(dev_path="/dev/disk0", major=8, minor=0,
+                                    sync_percent=None, estimated_time=None,
+                                    is_degraded=False,
+                                    ldisk_status=constants.LDS_OKAY)
+
+    def _ExecuteBatch(req):
+      self.assertEqual(req.path, "/batch")
+      self.assertEqual(req.read_timeout,
+                       2 * constants.RPC_TMO_URGENT + 10 +
+                       2 * constants.RPC_TMO_NORMAL)
+
+      (calls, fail_fast) = serializer.LoadJson(req.post_data)
+      self.assertFalse(fail_fast)
+      self.assertEqual(calls, [
+        ["version", []],
+        ["jobqueue_update", ["file", "DATA"]],
+        ["test_delay", [5]],
+        ["blockdev_find", ["disk0"]],
+        ["blockdev_getmirrorstatus_multi", [["disk1"]]],
+        ])
+
+      self._Respond(req, [
+        [True, 2090000],
+        [False, "Can't write file"],
+        [True, None],
+        [True, status.ToDict()],
+        [True, [[True, status.ToDict()]]],
+        ])
+
+    encoders = {
+      rpc_defs.ED_COMPRESS: lambda _, value: value.upper(),
+      rpc_defs.ED_SINGLE_DISK_DICT_DP: lambda _, (disk, _inst): disk,
+      rpc_defs.ED_NODE_TO_DISK_DICT_DP: lambda _, value: value,
+      }
+
+    (client, http_proc) = self._MakeClient(_ExecuteBatch, encoders=encoders)
+    results = client.call_batch(self._NODE, [
+      ("version", []),
+      ("jobqueue_update", ["file", "data"]),
+      ("test_delay", [5]),
+      ("blockdev_find", [("disk0", NotImplemented)]),
+      ("blockdev_getmirrorstatus_multi", [{
+        self._NODE: ["disk1"],
+        "node41.example.com": ["disk2"],
+        }]),
+      ])
+    self.assertEqual(http_proc.reqcount, 1)
+
+    self.assertEqual([res.call for res in results],
+                     ["version", "jobqueue_update", "test_delay",
+                      "blockdev_find", "blockdev_getmirrorstatus_multi"])
+    self.assertTrue(compat.all(res.node == self._NODE for res in results))
+
+    self.assertFalse(results[0].fail_msg)
+    self.assertEqual(results[0].payload, 2090000)
+    self.assertEqual(results[1].fail_msg, "Can't write file")
+    self.assertFalse(results[2].fail_msg)
+
+    # The results are post-processed
+    self.assertTrue(isinstance(results[3].payload, objects.BlockDevStatus))
+    self.assertEqual(results[3].payload.dev_path, "/dev/disk0")
+    self.assertTrue(isinstance(results[4].payload[0][1],
+                               objects.BlockDevStatus))
+
+  def testFailFast(self):
+    def _ExecuteBatch(req):
+      (calls, fail_fast) = serializer.LoadJson(req.post_data)
+      self.assertEqual(len(calls), 3)
+      self.assertTrue(fail_fast)
+      self._Respond(req, [[True, None], [False, "Failed"]])
+
+    (client, _) = self._MakeClient(_ExecuteBatch)
+    results = client.call_batch(self._NODE, [
+      ("test_delay", [1]),
+      ("test_delay", [2]),
+      ("test_delay", [3]),
+      ], fail_fast=True)
+
+    self.assertEqual(len(results), 3)
+    self.assertFalse(results[0].fail_msg)
+    self.assertEqual(results[1].fail_msg, "Failed")
+    self.assertTrue(results[2].fail_msg)
+    self.assertFalse(results[2].offline)
+
+  def testShortResult(self):
+    # Without fail-fast mode, all procedures must have a result
+    (client, _) = \
+      self._MakeClient(lambda req: self._Respond(req, [[False, "Failed"]]))
+    results = client.call_batch(self._NODE, [
+      ("test_delay", [1]),
+      ("test_delay", [2]),
+      ])
+
+    self.assertEqual(len(results), 2)
+    for res in results:
+      self.assertTrue(res.fail_msg.startswith("RPC layer error"))
+
+  def testFailedRequest(self):
+    (client, _) = \
+      self._MakeClient(lambda req: self._Respond(req, "Connection refused",
+                                                 success=False))
+    results = client.call_batch(self._NODE, [
+      ("version", []),
+      ("test_delay", [1]),
+      ], fail_fast=True)
+
+    self.assertEqual([res.call for res in results], ["version", "test_delay"])
+    for res in results:
+      self.assertEqual(res.fail_msg, "Connection refused")
+      self.assertFalse(res.offline)
+
+  def testEmpty(self):
+    (client, http_proc) = self._MakeClient(NotImplemented)
+    self.assertEqual(client.call_batch(self._NODE, []), [])
+    self.assertEqual(http_proc.reqcount, 0)
+
+  def testInvalidCalls(self):
+    (client, http_proc) = self._MakeClient(NotImplemented)
+    self.assertRaises(errors.ProgrammerError, client.call_batch, self._NODE,
+                      [("version", []), ("no_such_procedure", [])])
+    self.assertRaises(errors.ProgrammerError, client.call_batch, self._NODE,
+                      [("batch", [[], False])])
+    self.assertRaises(errors.ProgrammerError, client.call_batch, self._NODE,
+                      [("test_delay", [])])
+    self.assertEqual(http_proc.reqcount, 0)
+
+
+class TestGetAsync(unittest.TestCase):
+  _NODES = [
+    "node50.example.com",
+    "node51.example.com",
+    ]
+
+  def setUp(self):
+    self.calls = []
+
+  def _Respond(self, req):
+    self.calls.append(req.path)
+    req.success = True
+    req.resp_status_code = http.HTTP_OK
+    req.resp_body = serializer.DumpJson((True, req.path))
+
+  def _MakeClient(self):
+    resolver = rpc._StaticResolver(["192.0.2.50", "192.0.2.51"])
+    http_proc = _FakeRequestProcessor(self._Respond)
+    client = rpc._RpcClientBase(resolver, NotImplemented,
+                                _req_process_fn=http_proc)
+    return (client, http_proc)
+
+  @staticmethod
+  def _MakeCallDef(procedure, postproc_fn=None):
+    return (procedure, NotImplemented, None, constants.RPC_TMO_NORMAL, [],
+            None, postproc_fn, NotImplemented)
+
+  def test(self):
+    (client, http_proc) = self._MakeClient()
+    arpc = client.GetAsync()
+    self.assertFalse(arpc is client)
+
+    first = arpc._Call(self._MakeCallDef("first"), self._NODES, [])
+    second = arpc._Call(self._MakeCallDef("second"), self._NODES, [])
+    self.assertTrue(isinstance(first, rpc.RpcFuture))
+
+    # Requests are only processed when a result is waited for
+    self.assertEqual(http_proc.reqcount, 0)
+
+    result = second.GetResult()
+    self.assertEqual(sorted(result.keys()), self._NODES)
+    self.assertTrue(compat.all(res.payload == "/second"
+                               for res in result.values()))
+
+    # All outstanding requests were processed together
+    self.assertEqual(http_proc.reqcount, 4)
+    self.assertEqual(self.calls, 2 * ["/first"] + 2 * ["/second"])
+
+    # Results are only retrieved once
+    self.assertTrue(first.GetResult() is first.GetResult())
+    self.assertEqual(http_proc.reqcount, 4)
+
+    # The original client still waits for results
+    result = client._Call(self._MakeCallDef("third"), self._NODES[:1], [])
+    self.assertEqual(result[self._NODES[0]].payload, "/third")
+
+  def testPostProcessing(self):
+    (client, _) = self._MakeClient()
+    arpc = client.GetAsync()
+
+    def _PostProc(res):
+      res.payload = res.payload.upper()
+      return res
+
+    future = arpc._Call(self._MakeCallDef("upper", postproc_fn=_PostProc),
+                        self._NODES, [])
+    self.assertEqual(self.calls, [])
+
+    # Futures for the result of a single node, as used by the wrappers of
+    # calls to one node
+    single = future[self._NODES[1]]
+    self.assertTrue(isinstance(single, rpc.RpcFuture))
+    self.assertEqual(single.GetResult().payload, "/UPPER")
+    self.assertEqual(len(self.calls), 2)
+
+  def testEndTime(self):
+    (client, _) = self._MakeClient()
+    arpc = client.GetAsync()
+
+    postproc_times = []
+
+    def _PostProc(res):
+      postproc_times.append(time.time())
+      return res
+
+    future = arpc._Call(self._MakeCallDef("end", postproc_fn=_PostProc),
+                        self._NODES, [])
+    start_time = time.time()
+
+    # Waits for the call
+    end_time = future.GetEndTime()
+    self.assertEqual(len(self.calls), 2)
+
+    # The end time is taken before post-processing the results
+    self.assertEqual(len(postproc_times), 2)
+    self.assertTrue(start_time <= end_time <= min(postproc_times))
+    self.assertEqual(future.GetEndTime(), end_time)
+
+  def testBatch(self):
+    (client, http_proc) = self._MakeClient()
+    arpc = client.GetAsync()
+
+    def _Respond(req):
+      (calls, _) = serializer.LoadJson(req.post_data)
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, [[True, len(args)]
+                                                  for (_, args) in calls]))
+
+    http_proc._response_fn = _Respond
+
+    empty = arpc.call_batch(self._NODES[0], [])
+    future = arpc.call_batch(self._NODES[0], [
+      ("test_delay", [1]),
+      ("version", []),
+      ])
+    self.assertEqual(http_proc.reqcount, 0)
+
+    self.assertEqual(empty.GetResult(), [])
+    self.assertEqual([res.payload for res in future.GetResult()], [1, 0])
+    self.assertEqual(http_proc.reqcount, 1)
+
+
 class _FakeConfigForRpcRunner:
   GetAllNodesInfo = NotImplemented
 
@@ -152,6 +152,53 @@ class TestLoadAndVerifyJson(unittest.TestCase):
     self.assertEqual(serializer.LoadAndVerifyJson("\"Foo\"", ht.TAny), "Foo")
 
 
+class TestConfigFormats(unittest.TestCase):
+  _DATA = {
+    "version": 1,
+    "cluster": {"name": "cluster", "osparams_private_cluster": None},
+    "nodes": dict(("uuid%d" % i, {"name": "node%d" % i})
+                  for i in range(100)),
+    }
+
+  def testRoundTrip(self):
+    for fmt in serializer.CONFIG_FORMATS:
+      raw = serializer.DumpConfig(self._DATA, fmt=fmt)
+      self.assertEqual(serializer.GetConfigFormat(raw), fmt)
+      self.assertEqual(serializer.LoadConfig(raw), self._DATA)
+
+  def testJsonUnchanged(self):
+    self.assertEqual(serializer.DumpConfig(self._DATA),
+                     serializer.DumpJson(self._DATA))
+    self.assertEqual(serializer.GetConfigFormat(serializer.DumpJson([])),
+                     serializer.CONFIG_FORMAT_JSON)
+
+  def testCompressed(self):
+    raw = serializer.DumpConfig(self._DATA, fmt=serializer.CONFIG_FORMAT_ZLIB1)
+    self.assertTrue(len(raw) < len(serializer.DumpJson(self._DATA)))
+
+  def testPrivate(self):
+    data = {"osparams_private": serializer.PrivateDict({"foo": "bar"})}
+    raw = serializer.DumpConfig(data, fmt=serializer.CONFIG_FORMAT_ZLIB1,
+                                private_encoder=
+                                  serializer.EncodeWithPrivateFields)
+    result = serializer.LoadConfig(raw)["osparams_private"]
+    self.assertTrue(isinstance(result, serializer.PrivateDict))
+    self.assertEqual(result.Unprivate(), {"foo": "bar"})
+
+  def testUnknownFormat(self):
+    self.assertRaises(errors.ProgrammerError, serializer.DumpConfig,
+                      self._DATA, fmt="zlib0")
+    for raw in ["#ganeti-config zlib0\n...", "#ganeti-config json\n{}"]:
+      self.assertRaises(errors.ConfigurationError,
+                        serializer.GetConfigFormat, raw)
+      self.assertRaises(errors.ConfigurationError, serializer.LoadConfig, raw)
+
+  def testCorrupted(self):
+    raw = serializer.DumpConfig(self._DATA, fmt=serializer.CONFIG_FORMAT_ZLIB1)
+    self.assertRaises(errors.ConfigurationError, serializer.LoadConfig,
+                      raw[:-10])
+
+
 class TestPrivate(unittest.TestCase):
 
   def testEquality(self):
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing ganeti.server.noded"""
+
+import unittest
+
+from ganeti import backend
+from ganeti.server import noded
+
+import testutils
+
+
+class _TestHandler(noded.NodeRequestHandler):
+  """Request handler with procedures for testing batches.
+
+  """
+  def __init__(self):
+    noded.NodeRequestHandler.__init__(self)
+    self.calls = []
+
+  def perspective_test_echo(self, params):
+    self.calls.append(("echo", params))
+    return params
+
+  def perspective_test_fail(self, params):
+    self.calls.append(("fail", params))
+    raise backend.RPCFail("Failed with %s" % params)
+
+  def perspective_test_error(self, params):
+    self.calls.append(("error", params))
+    raise ValueError("Unexpected error")
+
+
+class TestBatch(unittest.TestCase):
+  def setUp(self):
+    self.handler = _TestHandler()
+
+  def testOrder(self):
+    calls = [("test_echo", [i]) for i in range(20)]
+    results = self.handler.perspective_batch((calls, False))
+    self.assertEqual(results, [(True, [i]) for i in range(20)])
+    self.assertEqual(self.handler.calls, [("echo", [i]) for i in range(20)])
+
+  def testEmpty(self):
+    self.assertEqual(self.handler.perspective_batch(([], False)), [])
+    self.assertEqual(self.handler.perspective_batch(([], True)), [])
+
+  def testUnknownProcedure(self):
+    calls = [
+      ("test_echo", [1]),
+      ("no_such_procedure", [2]),
+      ("batch", [[("test_echo", [3])], False]),
+      ("test_echo", [4]),
+      ]
+    results = self.handler.perspective_batch((calls, False))
+    self.assertEqual(len(results), 4)
+    self.assertEqual(results[0], (True, [1]))
+    self.assertFalse(results[1][0])
+    self.assertTrue("no_such_procedure" in results[1][1])
+    # Batches can't be nested
+    self.assertFalse(results[2][0])
+    self.assertTrue("batch" in results[2][1])
+    self.assertEqual(results[3], (True, [4]))
+    self.assertEqual(self.handler.calls, [("echo", [1]), ("echo", [4])])
+
+  def testFailureDoesNotAbort(self):
+    calls = [
+      ("test_echo", [1]),
+      ("test_fail", [2]),
+      ("test_error", [3]),
+      ("test_echo", [4]),
+      ]
+    results = self.handler.perspective_batch((calls, False))
+    self.assertEqual(len(results), 4)
+    self.assertEqual(results[0], (True, [1]))
+    self.assertEqual(results[1], (False, "Failed with [2]"))
+    self.assertFalse(results[2][0])
+    self.assertTrue("Unexpected error" in results[2][1])
+    self.assertEqual(results[3], (True, [4]))
+    self.assertEqual(self.handler.calls, [
+      ("echo", [1]),
+      ("fail", [2]),
+      ("error", [3]),
+      ("echo", [4]),
+      ])
+
+  def testFailFast(self):
+    calls = [
+      ("test_echo", [1]),
+      ("test_fail", [2]),
+      ("test_echo", [3]),
+      ]
+    results = self.handler.perspective_batch((calls, True))
+    self.assertEqual(results, [(True, [1]), (False, "Failed with [2]")])
+    self.assertEqual(self.handler.calls, [("echo", [1]), ("fail", [2])])
+
+  def testFailFastUnknownProcedure(self):
+    calls = [
+      ("no_such_procedure", []),
+      ("test_echo", [1]),
+      ]
+    results = self.handler.perspective_batch((calls, True))
+    self.assertEqual(len(results), 1)
+    self.assertFalse(results[0][0])
+    self.assertEqual(self.handler.calls, [])
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
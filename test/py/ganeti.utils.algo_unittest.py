@@ -30,6 +30,7 @@
 
 """Script for testing ganeti.utils.algo"""
 
+import copy
 import unittest
 import random
 import operator
@@ -377,5 +378,68 @@ class TestFlatToDict(unittest.TestCase):
     self.assertRaises(AssertionError, algo.FlatToDict, data)
 
 
+class TestFrozenDict(unittest.TestCase):
+  def testReadOnly(self):
+    fd = algo.FrozenDict({"a": 1, "b": 2})
+    self.assertEqual(fd, {"a": 1, "b": 2})
+    self.assertRaises(TypeError, fd.__setitem__, "a", 3)
+    self.assertRaises(TypeError, fd.__delitem__, "a")
+    self.assertRaises(TypeError, fd.update, {"c": 3})
+    self.assertRaises(TypeError, fd.pop, "a")
+    self.assertRaises(TypeError, fd.setdefault, "c", 3)
+    self.assertRaises(TypeError, fd.clear)
+    self.assertEqual(fd, {"a": 1, "b": 2})
+
+  def testCopy(self):
+    fd = algo.FrozenDict({"a": [1]})
+    for result in [copy.copy(fd), copy.deepcopy(fd), dict(fd)]:
+      self.assertEqual(type(result), dict)
+      result["b"] = 2
+    deep = copy.deepcopy(fd)
+    deep["a"].append(2)
+    self.assertEqual(fd["a"], [1])
+
+
+class TestLRUCache(unittest.TestCase):
+  def testGetSet(self):
+    cache = algo.LRUCache(10)
+    self.assertEqual(len(cache), 0)
+    self.assertTrue(cache.Get("a") is None)
+    self.assertEqual(cache.Get("a", default=1), 1)
+    cache.Set("a", 2)
+    self.assertEqual(cache.Get("a"), 2)
+    cache.Set("a", 3)
+    self.assertEqual(cache.Get("a"), 3)
+    self.assertEqual(len(cache), 1)
+    cache.Clear()
+    self.assertEqual(len(cache), 0)
+    self.assertTrue(cache.Get("a") is None)
+
+  def testEviction(self):
+    cache = algo.LRUCache(3)
+    for i in range(3):
+      cache.Set(i, i)
+    # Using an entry makes it the most recently used one
+    self.assertEqual(cache.Get(0), 0)
+    cache.Set(3, 3)
+    self.assertEqual(len(cache), 3)
+    self.assertTrue(cache.Get(1) is None)
+    self.assertEqual([cache.Get(i) for i in [0, 2, 3]], [0, 2, 3])
+
+  def testManyUses(self):
+    cache = algo.LRUCache(3)
+    for i in range(3):
+      cache.Set(i, i)
+    for _ in range(100):
+      self.assertEqual(cache.Get(1), 1)
+    cache.Set(3, 3)
+    cache.Set(4, 4)
+    self.assertEqual(len(cache), 3)
+    self.assertEqual([cache.Get(i) for i in range(5)], [None, 1, None, 3, 4])
+
+  def testInvalidSize(self):
+    self.assertRaises(ValueError, algo.LRUCache, 0)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
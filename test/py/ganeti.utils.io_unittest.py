@@ -474,6 +474,61 @@ class TestFileID(testutils.GanetiTestCase):
                       path=t.name, fd=t.fileno())
 
 
+class TestAppendFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testRelativePath(self):
+    self.assertRaises(errors.ProgrammerError, utils.AppendFile,
+                      "some/relative/path", "")
+
+  def testAppend(self):
+    name = utils.PathJoin(self.tmpdir, "journal")
+    utils.AppendFile(name, "first\n", mode=0640)
+    self.assertEqual(utils.ReadFile(name), "first\n")
+    self.assertEqual(os.stat(name).st_mode & 0777, 0640)
+
+    utils.AppendFile(name, "second\n", mode=0600)
+    utils.AppendFile(name, "")
+    self.assertEqual(utils.ReadFile(name), "first\nsecond\n")
+    # The mode is only set when the file is created
+    self.assertEqual(os.stat(name).st_mode & 0777, 0640)
+
+  def testNoCreate(self):
+    name = utils.PathJoin(self.tmpdir, "journal")
+    try:
+      utils.AppendFile(name, "data\n", create=False)
+    except EnvironmentError, err:
+      self.assertEqual(err.errno, errno.ENOENT)
+    else:
+      self.fail("Appending to a missing file didn't fail")
+    self.assertFalse(os.path.exists(name))
+
+    utils.WriteFile(name, data="header\n")
+    utils.AppendFile(name, "data\n", create=False)
+    self.assertEqual(utils.ReadFile(name), "header\ndata\n")
+
+
+class TestRemoveLockedFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test(self):
+    name = utils.PathJoin(self.tmpdir, "journal")
+    utils.WriteFile(name, data="header\n")
+    utils.RemoveLockedFile(name)
+    self.assertFalse(os.path.exists(name))
+
+    # Missing files are ignored
+    utils.RemoveLockedFile(name)
+
+
 class TestRemoveFile(unittest.TestCase):
   """Test case for the RemoveFile function"""
 
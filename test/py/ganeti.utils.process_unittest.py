@@ -694,6 +694,23 @@ class TestStartDaemon(testutils.GanetiTestCase):
       os.close(fd)
 
 
+class TestSetProcessTitle(unittest.TestCase):
+  @staticmethod
+  def _SetTitle(title):
+    utils.SetProcessTitle(title)
+    cmdline = utils.ReadFile("/proc/self/cmdline")
+    return cmdline.rstrip("\0") == title[:len(cmdline) - 1]
+
+  def test(self):
+    self.assertTrue(utils.RunInSeparateProcess(self._SetTitle, "job 42"))
+
+  def testLong(self):
+    self.assertTrue(utils.RunInSeparateProcess(self._SetTitle, "x" * 100000))
+
+  def testNoCtypes(self):
+    utils.SetProcessTitle("job 42", _ctypes=None)
+
+
 class RunInSeparateProcess(unittest.TestCase):
   def test(self):
     for exp in [True, False]:
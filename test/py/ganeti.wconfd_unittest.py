@@ -0,0 +1,194 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the wconfd module"""
+
+
+import threading
+import unittest
+
+import mock
+
+from ganeti import wconfd
+from ganeti.rpc import client
+from ganeti.rpc import errors
+
+import testutils
+
+
+class _FakeTransport(object):
+  """Transport answering every call with the name of the called method.
+
+  """
+  instances = []
+  fail_next = [False]
+
+  def __init__(self, address, timeouts=None):
+    self.address = address
+    self.timeouts = timeouts
+    self.calls = 0
+    self.instances.append(self)
+
+  def Call(self, data):
+    if self.fail_next[0]:
+      self.fail_next[0] = False
+      raise errors.ConnectionClosedError("Connection closed by peer")
+    self.calls += 1
+    (method, _, _) = client.ParseRequest(data)
+    return client.FormatResponse(True, method)
+
+  def Close(self):
+    pass
+
+
+class TestCallStatistics(unittest.TestCase):
+  def test(self):
+    stats = wconfd._CallStatistics()
+    for duration in [0.0005, 0.002, 0.002, 0.5, 100.0]:
+      stats.Add(duration)
+
+    result = stats.ToDict()
+    self.assertEqual(result["count"], 5)
+    self.assertAlmostEqual(result["total_time"], 100.5045)
+    self.assertEqual(result["histogram"], [
+      (0.001, 1),
+      (0.01, 2),
+      (0.1, 0),
+      (1.0, 1),
+      (10.0, 0),
+      (None, 1),
+      ])
+
+  def testEmpty(self):
+    result = wconfd._CallStatistics().ToDict()
+    self.assertEqual(result["count"], 0)
+    self.assertEqual(result["total_time"], 0.0)
+    self.assertEqual([count for (_, count) in result["histogram"]],
+                     [0] * (len(wconfd._LATENCY_BUCKETS) + 1))
+
+
+class TestSharedClient(unittest.TestCase):
+  def setUp(self):
+    _FakeTransport.instances = []
+    _FakeTransport.fail_next[0] = False
+    self.client = wconfd.SharedClient(transport=_FakeTransport)
+    self.client._GetAddress = lambda: "/fake/wconfd.sock"
+
+  def testStatistics(self):
+    self.assertEqual(self.client.CallMethod("ListLocks", []), "ListLocks")
+    self.assertEqual(self.client.CallMethod("ListLocks", []), "ListLocks")
+    self.assertEqual(self.client.CallMethod("FreeLocksLevel", ["x"]),
+                     "FreeLocksLevel")
+
+    stats = self.client.GetStatistics()
+    self.assertEqual(sorted(stats.keys()), ["FreeLocksLevel", "ListLocks"])
+    self.assertEqual(stats["ListLocks"]["count"], 2)
+    self.assertEqual(stats["FreeLocksLevel"]["count"], 1)
+
+    # All calls went over the same connection
+    self.assertEqual(len(_FakeTransport.instances), 1)
+    self.assertEqual(_FakeTransport.instances[0].calls, 3)
+
+  def testReconnect(self):
+    self.client.CallMethod("ListLocks", [])
+    _FakeTransport.fail_next[0] = True
+    self.assertEqual(self.client.CallMethod("ListLocks", []), "ListLocks")
+    self.assertEqual(len(_FakeTransport.instances), 2)
+    self.assertEqual(self.client.GetStatistics()["ListLocks"]["count"], 2)
+
+  def testThreads(self):
+    def _Call():
+      for _ in range(50):
+        self.client.CallMethod("ListLocks", [])
+
+    threads = [threading.Thread(target=_Call) for _ in range(5)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(self.client.GetStatistics()["ListLocks"]["count"], 250)
+    self.assertEqual(len(_FakeTransport.instances), 1)
+
+
+class TestLockNotifier(unittest.TestCase):
+  def test(self):
+    notifier = wconfd.LockNotifier()
+
+    self.assertFalse(notifier.Wait(0.01))
+
+    notifier.Notify()
+    notifier.Notify()
+    self.assertTrue(notifier.Wait(10.0))
+    # All pending notifications were consumed
+    self.assertFalse(notifier.Wait(0.01))
+
+    notifier.Notify()
+    notifier.Clear()
+    self.assertFalse(notifier.Wait(0.01))
+
+  def testManyNotifications(self):
+    notifier = wconfd.LockNotifier()
+    for _ in range(100000):
+      notifier.Notify()
+    self.assertTrue(notifier.Wait(10.0))
+    self.assertFalse(notifier.Wait(0.01))
+
+
+class TestGetClient(unittest.TestCase):
+  def setUp(self):
+    wconfd._shared_client[:] = [None, None]
+
+  def tearDown(self):
+    wconfd._shared_client[:] = [None, None]
+
+  @mock.patch("ganeti.wconfd.SharedClient")
+  def testReuse(self, shared_client):
+    client = wconfd.GetClient()
+    self.assertTrue(client is shared_client.return_value)
+    self.assertTrue(wconfd.GetClient() is client)
+    self.assertEqual(shared_client.call_count, 1)
+
+  @mock.patch("ganeti.wconfd.SharedClient")
+  @mock.patch("os.getpid")
+  def testForked(self, getpid, shared_client):
+    getpid.return_value = 100
+    wconfd.GetClient()
+    # A forked child must not reuse its parent's connection
+    getpid.return_value = 101
+    wconfd.GetClient()
+    self.assertEqual(shared_client.call_count, 2)
+
+  def testNoStatistics(self):
+    self.assertEqual(wconfd.GetClientStatistics(), {})
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
@@ -0,0 +1,194 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for load testing the HTTP server.
+
+An HTTP server is started on the local host, either forking a child
+process for every connection or with a pool of worker threads. A number
+of client threads then send requests to it, either over one persistent
+connection per client or over a new connection for every request.
+
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import httplib
+import optparse
+import threading
+
+from ganeti import daemon
+from ganeti import http
+
+import ganeti.http.server
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-w", dest="worker_threads", default=None, type="int",
+                    help=("Number of worker threads in the server (default:"
+                          " fork for every connection)"), metavar="NUM")
+  parser.add_option("-c", dest="client_count", default=10, type="int",
+                    help="Number of client threads", metavar="NUM")
+  parser.add_option("-n", dest="request_count", default=100, type="int",
+                    help="Number of requests per client", metavar="NUM")
+  parser.add_option("--new-connections", dest="keep_alive", default=True,
+                    action="store_false",
+                    help="Use a new connection for every request")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.worker_threads is not None and opts.worker_threads < 1:
+    parser.error("Number of worker threads must be at least 1")
+
+  if opts.client_count < 1 or opts.request_count < 1:
+    parser.error("Number of clients and requests must be at least 1")
+
+  return (opts, args)
+
+
+class _EchoHandler(http.server.HttpServerHandler):
+  """Request handler returning the request body.
+
+  """
+  def HandleRequest(self, req):
+    return req.request_body
+
+
+def _RunServer(sock, worker_threads):
+  """Runs the HTTP server until it is terminated.
+
+  """
+  port = sock.getsockname()[1]
+  sock.close()
+
+  mainloop = daemon.Mainloop()
+  server = http.server.HttpServer(mainloop, "127.0.0.1", port, _EchoHandler(),
+                                  keep_alive=True,
+                                  worker_threads=worker_threads)
+  server.Start()
+  try:
+    mainloop.Run()
+  finally:
+    server.Stop()
+
+
+def _Client(port, request_count, keep_alive, durations):
+  """Thread function sending requests.
+
+  """
+  conn = None
+
+  for i in range(request_count):
+    if conn is None:
+      conn = httplib.HTTPConnection("127.0.0.1", port)
+
+    body = "request %s" % i
+
+    start = time.time()
+    conn.request(http.HTTP_POST, "/echo", body)
+    resp = conn.getresponse()
+    data = resp.read()
+    durations.append(time.time() - start)
+
+    assert resp.status == http.HTTP_OK and data == body
+
+    if not keep_alive or resp.will_close:
+      conn.close()
+      conn = None
+
+  if conn is not None:
+    conn.close()
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  # Reserve a free port for the server
+  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  sock.bind(("127.0.0.1", 0))
+  port = sock.getsockname()[1]
+
+  pid = os.fork()
+  if pid == 0:
+    try:
+      _RunServer(sock, opts.worker_threads)
+    finally:
+      os._exit(0) # pylint: disable=W0212
+
+  sock.close()
+
+  try:
+    # Give the server some time to start
+    time.sleep(1)
+
+    durations = []
+    threads = [threading.Thread(target=_Client,
+                                args=(port, opts.request_count,
+                                      opts.keep_alive, durations))
+               for _ in range(opts.client_count)]
+
+    start = time.time()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    total = time.time() - start
+  finally:
+    os.kill(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+
+  durations.sort()
+
+  if opts.worker_threads is None:
+    print "Server: fork per connection"
+  else:
+    print "Server: %s worker threads" % opts.worker_threads
+  print "Requests: %s" % len(durations)
+  print "Total time: %0.3fs" % total
+  print "Requests per second: %0.1f" % (len(durations) / total)
+  print "Median latency: %0.3fms" % (1000.0 * durations[len(durations) / 2])
+  print ("99th percentile latency: %0.3fms" %
+         (1000.0 * durations[min(len(durations) - 1,
+                                 int(len(durations) * 0.99))]))
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""Script for measuring the latency of trivial jobs
+
+It must be run on the master node of a test cluster. Job processes are
+either forked by the job zygote or started as new Python processes; the
+latter is forced by temporarily hiding the zygote's socket from luxid.
+
+"""
+
+import os
+import time
+import optparse
+
+from ganeti import cli
+from ganeti import opcodes
+from ganeti import pathutils
+from ganeti import utils
+
+
+#: Job startup modes
+_MODE_ZYGOTE = "zygote"
+_MODE_EXEC = "exec"
+_MODES = [_MODE_ZYGOTE, _MODE_EXEC]
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser(usage="%%prog [options] [{%s}...]" %
+                                 "|".join(_MODES))
+  parser.add_option("-n", dest="job_count", default=1000, type="int",
+                    help="Number of jobs per mode", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.job_count < 1:
+    parser.error("Number of jobs must be at least 1")
+
+  if [mode for mode in args if mode not in _MODES]:
+    parser.error("Invalid mode")
+
+  return (opts, args or _MODES)
+
+
+def _TimestampDiff(start, end):
+  """Computes the difference between two job timestamps in seconds.
+
+  """
+  return utils.MergeTime(end) - utils.MergeTime(start)
+
+
+def _Percentile(values, fraction):
+  """Returns a percentile of a sorted list.
+
+  """
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _Report(name, values):
+  """Prints statistics for a list of latencies.
+
+  """
+  values = sorted(values)
+  print ("  %-10s mean %8.1f ms, median %8.1f ms, p99 %8.1f ms,"
+         " max %8.1f ms" %
+         (name, 1000.0 * sum(values) / len(values),
+          1000.0 * _Percentile(values, 0.5),
+          1000.0 * _Percentile(values, 0.99), 1000.0 * values[-1]))
+
+
+def RunJobs(job_count):
+  """Runs trivial jobs one after the other.
+
+  @rtype: tuple
+  @return: the end-to-end latencies and the delays between receiving and
+    starting the jobs, both in seconds
+
+  """
+  cl = cli.GetClient()
+  total = []
+  startup = []
+
+  for _ in range(job_count):
+    start = time.time()
+    job_id = cl.SubmitJob([opcodes.OpTestDelay(duration=0)])
+    cli.PollJob(job_id, cl=cl, feedback_fn=lambda _: None)
+    total.append(time.time() - start)
+
+    ((received_ts, start_ts), ) = \
+      cl.QueryJobs([job_id], ["received_ts", "start_ts"])
+    startup.append(_TimestampDiff(received_ts, start_ts))
+
+  return (total, startup)
+
+
+def main():
+  (opts, modes) = ParseOptions()
+
+  hidden_socket = pathutils.JOB_ZYGOTE_SOCKET + ".hidden"
+
+  for mode in modes:
+    if mode == _MODE_ZYGOTE and not os.path.exists(pathutils.JOB_ZYGOTE_SOCKET):
+      print "Job zygote isn't running, skipping mode '%s'" % mode
+      continue
+
+    if mode == _MODE_EXEC and os.path.exists(pathutils.JOB_ZYGOTE_SOCKET):
+      # The zygote keeps listening, but luxid won't find it
+      os.rename(pathutils.JOB_ZYGOTE_SOCKET, hidden_socket)
+      restore = True
+    else:
+      restore = False
+
+    try:
+      (total, startup) = RunJobs(opts.job_count)
+    finally:
+      if restore:
+        os.rename(hidden_socket, pathutils.JOB_ZYGOTE_SOCKET)
+
+    print "Mode '%s', %s jobs:" % (mode, opts.job_count)
+    _Report("end-to-end", total)
+    _Report("startup", startup)
+
+
+if __name__ == "__main__":
+  main()
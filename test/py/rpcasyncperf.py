@@ -0,0 +1,265 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing the performance of asynchronous node RPC calls.
+
+A stand-in for the node daemon, answering only the C{version} call after
+a fixed latency, is started on the local host. A simulated cluster, whose
+nodes all resolve to the local host, is then queried like cluster
+verification does: a number of calls are made to all nodes, once one
+after the other and once overlapping through L{rpc.RpcRunner.GetAsync}.
+
+"""
+
+import os
+import sys
+import time
+import signal
+import shutil
+import socket
+import optparse
+import tempfile
+
+from ganeti import constants
+from ganeti import daemon
+from ganeti import http
+from ganeti import pathutils
+from ganeti import serializer
+from ganeti import utils
+from ganeti import _generated_rpc
+
+import ganeti.http.server
+import ganeti.rpc.node as rpc
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-n", dest="node_count", default=200, type="int",
+                    help="Number of simulated nodes", metavar="NUM")
+  parser.add_option("-c", dest="call_count", default=3, type="int",
+                    help="Number of calls to all nodes per run",
+                    metavar="NUM")
+  parser.add_option("-r", dest="runs", default=5, type="int",
+                    help="Number of runs", metavar="NUM")
+  parser.add_option("-l", dest="latency", default=100, type="int",
+                    help="Latency of every node in milliseconds",
+                    metavar="MSEC")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.node_count < 1 or opts.call_count < 1 or opts.runs < 1:
+    parser.error("Number of nodes, calls and runs must be at least 1")
+
+  if opts.latency < 0:
+    parser.error("Latency must not be negative")
+
+  return (opts, args)
+
+
+class _SlowVersionHandler(http.server.HttpServerHandler):
+  """Request handler answering the C{version} call after a latency.
+
+  """
+  def __init__(self, latency):
+    """Initializes this class.
+
+    """
+    http.server.HttpServerHandler.__init__(self)
+    self._latency = latency
+
+  def HandleRequest(self, req):
+    if req.request_path != "/version":
+      raise http.HttpNotFound()
+
+    serializer.LoadJson(req.request_body)
+    time.sleep(self._latency)
+    return serializer.DumpJson((True, constants.PROTOCOL_VERSION))
+
+
+def _VerifyPeer(*_):
+  """Accepts every client certificate.
+
+  """
+  return True
+
+
+def _RunServer(sock, cert_file, latency):
+  """Runs the stand-in node daemon until it is terminated.
+
+  """
+  port = sock.getsockname()[1]
+  sock.close()
+
+  mainloop = daemon.Mainloop()
+  server = \
+    http.server.HttpServer(mainloop, "127.0.0.1", port,
+                           _SlowVersionHandler(latency),
+                           ssl_params=http.HttpSslParams(cert_file, cert_file),
+                           ssl_verify_peer=True,
+                           ssl_verify_callback=_VerifyPeer,
+                           keep_alive=True)
+  server.Start()
+  mainloop.Run()
+
+
+def _Resolver(hosts, _):
+  """Resolves all nodes to the local host.
+
+  """
+  return [(name, "127.0.0.1", name) for name in hosts]
+
+
+class _Runner(rpc._RpcClientBase, # pylint: disable=W0212
+              _generated_rpc.RpcClientDnsOnly):
+  """RPC client talking to the stand-in node daemon.
+
+  """
+  def __init__(self, port):
+    """Initializes this class.
+
+    """
+    # pylint: disable=W0212
+    rpc._RpcClientBase.__init__(self, _Resolver, rpc._ENCODERS.get)
+    _generated_rpc.RpcClientDnsOnly.__init__(self)
+
+    # Use the port of the stand-in instead of the node daemon's one
+    proc = rpc._RpcProcessor(_Resolver, port, None)
+    self._proc = proc
+    self._start = proc.Start
+
+
+def _CheckResult(result, nodes):
+  """Checks the result of a C{version} call to all nodes.
+
+  """
+  assert sorted(result.keys()) == sorted(nodes)
+
+  for res in result.values():
+    res.Raise("Version call failed")
+    assert res.payload == constants.PROTOCOL_VERSION
+
+
+def _RunSequential(runner, nodes, call_count):
+  """Makes the calls one after the other.
+
+  """
+  for _ in range(call_count):
+    _CheckResult(runner.call_version(nodes), nodes)
+
+
+def _RunOverlapping(runner, nodes, call_count):
+  """Starts all calls at once and waits for them afterwards.
+
+  """
+  arpc = runner.GetAsync()
+  futures = [arpc.call_version(nodes) for _ in range(call_count)]
+
+  for future in futures:
+    _CheckResult(future.GetResult(), nodes)
+
+
+def _Measure(name, fn, runner, nodes, opts):
+  """Runs the calls repeatedly and prints the wall time per run.
+
+  """
+  durations = []
+
+  for _ in range(opts.runs):
+    start = time.time()
+    fn(runner, nodes, opts.call_count)
+    durations.append(time.time() - start)
+
+  durations.sort()
+
+  print "%s:" % name
+  print "  Median time per run: %0.3fs" % durations[len(durations) / 2]
+  print "  Fastest run: %0.3fs" % durations[0]
+  print "  Slowest run: %0.3fs" % durations[-1]
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    cert_file = utils.PathJoin(tmpdir, "server.pem")
+    utils.GenerateSelfSignedSslCert(cert_file, 1)
+
+    # The RPC client reads its certificates from these paths
+    pathutils.NODED_CERT_FILE = cert_file
+    pathutils.NODED_CLIENT_CERT_FILE = cert_file
+
+    # Reserve a free port for the server
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    pid = os.fork()
+    if pid == 0:
+      try:
+        _RunServer(sock, cert_file, opts.latency / 1000.0)
+      finally:
+        os._exit(0) # pylint: disable=W0212
+
+    sock.close()
+
+    try:
+      # Give the server some time to start
+      time.sleep(1)
+
+      nodes = ["node%s.example.com" % i for i in range(opts.node_count)]
+
+      print ("%s calls to %s nodes with a latency of %sms" %
+             (opts.call_count, opts.node_count, opts.latency))
+
+      rpc.Init()
+      try:
+        runner = _Runner(port)
+        _Measure("Sequential", _RunSequential, runner, nodes, opts)
+        _Measure("Overlapping", _RunOverlapping, runner, nodes, opts)
+      finally:
+        rpc.Shutdown()
+    finally:
+      os.kill(pid, signal.SIGTERM)
+      os.waitpid(pid, 0)
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+  sys.exit(main())
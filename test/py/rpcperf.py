@@ -0,0 +1,256 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing the performance of node RPC calls.
+
+A stand-in for the node daemon, answering only the C{version} call, is
+started on the local host. The C{version} call is then made repeatedly,
+once with a new connection for every call, once with the connections
+kept open in a pool and once in batches of calls.
+
+"""
+
+import os
+import sys
+import time
+import signal
+import shutil
+import socket
+import optparse
+import tempfile
+
+from ganeti import constants
+from ganeti import compat
+from ganeti import daemon
+from ganeti import http
+from ganeti import pathutils
+from ganeti import serializer
+from ganeti import utils
+from ganeti import _generated_rpc
+
+import ganeti.http.client
+import ganeti.http.server
+import ganeti.rpc.node as rpc
+
+
+_NODE_NAME = "node1.example.com"
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-n", dest="count", default=1000, type="int",
+                    help="Number of calls per run", metavar="NUM")
+  parser.add_option("-b", dest="batch_size", default=10, type="int",
+                    help="Number of calls per batch", metavar="NUM")
+  parser.add_option("--no-keep-alive", dest="keep_alive", default=True,
+                    action="store_false",
+                    help="Don't let the server keep connections open")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.count < 1:
+    parser.error("Number of calls must be at least 1")
+
+  if opts.batch_size < 1:
+    parser.error("Number of calls per batch must be at least 1")
+
+  return (opts, args)
+
+
+class _VersionHandler(http.server.HttpServerHandler):
+  """Request handler answering the C{version} call like the node daemon.
+
+  """
+  def HandleRequest(self, req):
+    if req.request_path == "/version":
+      serializer.LoadJson(req.request_body)
+      return serializer.DumpJson((True, constants.PROTOCOL_VERSION))
+
+    if req.request_path == "/batch":
+      (calls, _) = serializer.LoadJson(req.request_body)
+      assert compat.all(procedure == "version" for (procedure, _) in calls)
+      return serializer.DumpJson((True, [(True, constants.PROTOCOL_VERSION)
+                                         for _ in calls]))
+
+    raise http.HttpNotFound()
+
+
+def _VerifyPeer(*_):
+  """Accepts every client certificate.
+
+  """
+  return True
+
+
+def _RunServer(sock, cert_file, keep_alive):
+  """Runs the stand-in node daemon until it is terminated.
+
+  """
+  port = sock.getsockname()[1]
+  sock.close()
+
+  mainloop = daemon.Mainloop()
+  server = \
+    http.server.HttpServer(mainloop, "127.0.0.1", port, _VersionHandler(),
+                           ssl_params=http.HttpSslParams(cert_file, cert_file),
+                           ssl_verify_peer=True,
+                           ssl_verify_callback=_VerifyPeer,
+                           keep_alive=keep_alive)
+  server.Start()
+  mainloop.Run()
+
+
+def _Resolver(hosts, _):
+  """Resolves all nodes to the local host.
+
+  """
+  return [(name, "127.0.0.1", name) for name in hosts]
+
+
+class _Runner(rpc._RpcClientBase, # pylint: disable=W0212
+              _generated_rpc.RpcClientDnsOnly):
+  """RPC client talking to the stand-in node daemon.
+
+  """
+  def __init__(self, port, req_process_fn):
+    """Initializes this class.
+
+    """
+    # pylint: disable=W0212
+    rpc._RpcClientBase.__init__(self, _Resolver, rpc._ENCODERS.get)
+    _generated_rpc.RpcClientDnsOnly.__init__(self)
+
+    # Use the port of the stand-in instead of the node daemon's one
+    proc = rpc._RpcProcessor(_Resolver, port, None)
+    self._proc = compat.partial(proc, _req_process_fn=req_process_fn)
+
+
+def _CallVersion(runner, batch_size):
+  """Makes the C{version} call, either on its own or in a batch.
+
+  """
+  if batch_size is None:
+    results = [runner.call_version([_NODE_NAME])[_NODE_NAME]]
+  else:
+    results = runner.call_batch(_NODE_NAME, [("version", [])] * batch_size)
+
+  for result in results:
+    result.Raise("Version call failed")
+    assert result.payload == constants.PROTOCOL_VERSION
+
+  return len(results)
+
+
+def _Measure(name, runner, count, batch_size=None):
+  """Makes the C{version} call repeatedly and prints the timings.
+
+  The timings are per call; for batches of calls, they are the time for
+  the batch divided by its size.
+
+  """
+  durations = []
+
+  while len(durations) < count:
+    start = time.time()
+    calls = _CallVersion(runner, batch_size)
+    durations.extend([(time.time() - start) / calls] * calls)
+
+  durations.sort()
+  total = sum(durations)
+
+  print "%s:" % name
+  print "  Total time: %0.3fs" % total
+  print "  Calls per second: %0.1f" % (len(durations) / total)
+  print ("  Median time per call: %0.3fms" %
+         (1000.0 * durations[len(durations) / 2]))
+  print ("  99th percentile: %0.3fms" %
+         (1000.0 * durations[min(len(durations) - 1,
+                                 int(len(durations) * 0.99))]))
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    cert_file = utils.PathJoin(tmpdir, "server.pem")
+    utils.GenerateSelfSignedSslCert(cert_file, 1)
+
+    # The RPC client reads its certificates from these paths
+    pathutils.NODED_CERT_FILE = cert_file
+    pathutils.NODED_CLIENT_CERT_FILE = cert_file
+
+    # Reserve a free port for the server
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    pid = os.fork()
+    if pid == 0:
+      try:
+        _RunServer(sock, cert_file, opts.keep_alive)
+      finally:
+        os._exit(0) # pylint: disable=W0212
+
+    sock.close()
+
+    try:
+      # Give the server some time to start
+      time.sleep(1)
+
+      rpc.Init()
+      try:
+        _Measure("Unpooled", _Runner(port, http.client.ProcessRequests),
+                 opts.count)
+        pooled_fn = compat.partial(http.client.ProcessRequests,
+                                   curl_pool=http.client.CurlPool())
+        _Measure("Pooled", _Runner(port, pooled_fn), opts.count)
+        _Measure("Pooled, batches of %s calls" % opts.batch_size,
+                 _Runner(port, pooled_fn), opts.count,
+                 batch_size=opts.batch_size)
+      finally:
+        rpc.Shutdown()
+    finally:
+      os.kill(pid, signal.SIGTERM)
+      os.waitpid(pid, 0)
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+  sys.exit(main())